@@ -0,0 +1,76 @@
+# benchmark_autocomplete.py
+#
+# Builds the typeahead trie (quickconnect/autocomplete.py) over a throwaway
+# test database and times lookups and the incremental updates signals make:
+#
+#     python benchmark_autocomplete.py            # 100k professionals
+#     python benchmark_autocomplete.py 20000
+#
+# Prefixes are what the search box sends keystroke by keystroke.
+import os
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'teleconnect.settings')
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+from benchmark_search import populate
+from quickconnect.autocomplete import TOP_K, autocomplete_index, professional_entry
+from quickconnect.models import Category, Professional, SubCategory
+
+PREFIXES = ['c', 'ca', 'car', 'card', 'cardiol', 'alice', 'alice car', 'fam', 'category 3 t', 'zz']
+LOOKUPS = 20_000
+
+
+def percentiles(func, repeat=LOOKUPS):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e6, timings[int(len(timings) * 0.99)] * 1e6
+
+
+def run(count):
+    populate(count)
+    for category in Category.objects.all():
+        SubCategory.objects.bulk_create([
+            SubCategory(category=category, name=f'{category.name} Topic {i}') for i in range(5)
+        ])
+
+    suggestions = autocomplete_index.build()
+    nodes, size = autocomplete_index.measure()
+    print(f"{count:>7} professionals  built in {autocomplete_index.build_ms / 1000:5.1f} s  "
+          f"{suggestions} suggestions, {nodes} nodes, ~{size / 2 ** 20:.1f} MB")
+
+    for prefix in PREFIXES:
+        p50, p99 = percentiles(lambda: autocomplete_index.suggest(prefix))
+        top = [s.text for s in autocomplete_index.suggest(prefix)[:3]]
+        print(f"  {prefix!r:<15} p50 {p50:6.1f} us  p99 {p99:6.1f} us   {top}")
+
+    # What a save costs the index once the transaction commits
+    professional = Professional.objects.filter(status='approved').order_by('id').first()
+    def rename():
+        professional.name = f'Renamed {time.perf_counter()}'
+        autocomplete_index.professional_changed(professional.id, professional_entry(professional))
+    p50, p99 = percentiles(rename, repeat=2000)
+    print(f"  rename            p50 {p50:6.1f} us  p99 {p99:6.1f} us")
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000]
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print(f"📊 Autocomplete benchmark (top {TOP_K} per prefix, {LOOKUPS} lookups each)")
+        for size in sizes:
+            run(size)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,141 @@
+# benchmark_channel_layer.py
+#
+# group_send fan-out through the channel layer backends: how long one group
+# message takes to reach every socket in the group, and how many deliveries
+# per second that is. Sockets are simulated as receive loops; with the Redis
+# layer they are spread over several layer instances, each standing in for
+# one ASGI worker process:
+#
+#     python benchmark_channel_layer.py                 # 1k, 10k and 50k sockets
+#     python benchmark_channel_layer.py 1000 5000 --workers 8
+#     python benchmark_channel_layer.py --url redis://localhost:6379/0
+#
+# Without --url the Redis layer runs against the in-process stand-in, which
+# is much slower than a real server; use it to compare backends, not to size
+# nodes. The in-memory layer cleans up expired entries across every channel
+# on each send, so its fan-out grows with the square of the group size; it
+# is skipped above --memory-max sockets.
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'teleconnect.settings')
+django.setup()
+
+from channels.layers import InMemoryChannelLayer
+
+from quickconnect.channel_layer import RedisChannelLayer
+from quickconnect.redis_standin import StandInRedisServer
+
+GROUP = 'benchmark'
+JOIN_CONCURRENCY = 100
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def fan_out(layers, sockets, rounds):
+    """Join ``sockets`` channels to one group and time ``rounds`` group_sends"""
+    channels = []
+    for i in range(sockets):
+        layer = layers[i % len(layers)]
+        channels.append((layer, await layer.new_channel()))
+
+    arrivals = []
+    delivered = asyncio.Event()
+
+    async def socket(layer, channel):
+        while True:
+            await layer.receive(channel)
+            arrivals.append(time.perf_counter())
+            if len(arrivals) == sockets:
+                delivered.set()
+
+    # Like consumers: receive loops first, then each socket joins the group,
+    # at most JOIN_CONCURRENCY at a time (and leaves the same way)
+    receivers = [asyncio.ensure_future(socket(layer, channel)) for layer, channel in channels]
+    await asyncio.sleep(0.1)
+    joining = asyncio.Semaphore(JOIN_CONCURRENCY)
+
+    async def join(layer, channel, leave=False):
+        async with joining:
+            if leave:
+                await layer.group_discard(GROUP, channel)
+            else:
+                await layer.group_add(GROUP, channel)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(join(layer, channel) for layer, channel in channels))
+    join_seconds = time.perf_counter() - started
+
+    latencies, spans = [], []
+    try:
+        for _ in range(rounds):
+            arrivals.clear()
+            delivered.clear()
+            sent_at = time.perf_counter()
+            await layers[0].group_send(GROUP, {'type': 'benchmark.event', 'text': 'x' * 200})
+            await asyncio.wait_for(delivered.wait(), timeout=120)
+            latencies.extend((arrival - sent_at) * 1000 for arrival in arrivals)
+            spans.append(max(arrivals) - sent_at)
+    finally:
+        for receiver in receivers:
+            receiver.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+        await asyncio.gather(*(join(layer, channel, leave=True) for layer, channel in channels))
+
+    latencies.sort()
+    return {
+        'join_per_s': sockets / join_seconds,
+        'p50_ms': _percentile(latencies, 0.50),
+        'p99_ms': _percentile(latencies, 0.99),
+        'all_ms': statistics.median(spans) * 1000,
+        'deliveries_per_s': sockets / statistics.median(spans),
+    }
+
+
+def report(name, sockets, result):
+    print(f"{name:<16} {sockets:>7} sockets  join {result['join_per_s']:9.0f}/s  "
+          f"latency p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+          f"all delivered {result['all_ms']:8.1f} ms  {result['deliveries_per_s']:10.0f} deliveries/s")
+
+
+async def run(sizes, workers, rounds, url, memory_max):
+    for sockets in sizes:
+        if sockets <= memory_max:
+            report('in-memory', sockets, await fan_out([InMemoryChannelLayer()], sockets, rounds))
+        else:
+            print(f"{'in-memory':<16} {sockets:>7} sockets  skipped (above --memory-max)")
+
+        layers = [RedisChannelLayer(url=url) for _ in range(workers)]
+        try:
+            report(f'redis x{workers} workers', sockets, await fan_out(layers, sockets, rounds))
+        finally:
+            await layers[0].flush()
+            for layer in layers:
+                await layer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sizes', nargs='*', type=int, default=[1_000, 10_000, 50_000])
+    parser.add_argument('--workers', type=int, default=4, help='Redis layer instances the sockets are spread over')
+    parser.add_argument('--rounds', type=int, default=5, help='group_sends timed per size')
+    parser.add_argument('--url', help='Redis server to use instead of the stand-in')
+    parser.add_argument('--memory-max', type=int, default=5_000, help='Largest group to try on the in-memory layer')
+    args = parser.parse_args()
+
+    server = None
+    if args.url is None:
+        server = StandInRedisServer().start()
+    try:
+        print(f"📊 Channel layer fan-out benchmark (median of {args.rounds} group_sends)")
+        asyncio.run(run(args.sizes, args.workers, args.rounds, args.url or server.url, args.memory_max))
+    finally:
+        if server is not None:
+            server.stop()
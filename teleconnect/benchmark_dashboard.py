@@ -0,0 +1,173 @@
+# benchmark_dashboard.py
+#
+# Query count and latency of admin_dashboard_stats before and after the
+# conditional-aggregation rewrite, on a throwaway test database:
+#
+#     python benchmark_dashboard.py            # 1,000,000 sessions
+#     python benchmark_dashboard.py 100000
+import os
+import random
+import sys
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'teleconnect.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.db import connection, reset_queries
+from django.db.models import Avg, Sum
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.utils import timezone
+
+from quickconnect.dashboard import compute_dashboard_stats, dashboard_snapshot
+from quickconnect.models import Category, Dispute, Professional, Session
+
+STATUSES = ['completed'] * 6 + ['active', 'pending', 'cancelled', 'expired']
+
+
+def legacy_dashboard_stats():
+    """admin_dashboard_stats as it was: one query per number"""
+    total_professionals = Professional.objects.count()
+    pending_approvals = Professional.objects.filter(status='pending').count()
+    approved_professionals = Professional.objects.filter(status='approved').count()
+    total_users = User.objects.count()
+    active_users = User.objects.filter(is_active=True).count()
+    completed_sessions = Session.objects.filter(status='completed').count()
+    total_sessions = Session.objects.count()
+    active_sessions = Session.objects.filter(status='active').count()
+    total_revenue = Session.objects.filter(status='completed').aggregate(total_revenue=Sum('cost'))['total_revenue'] or 0
+    monthly_revenue = Session.objects.filter(
+        status='completed', ended_at__gte=timezone.now() - timedelta(days=30)
+    ).aggregate(total_revenue=Sum('cost'))['total_revenue'] or 0
+    average_session_value = Session.objects.filter(status='completed').aggregate(avg_value=Avg('cost'))['avg_value'] or 0
+    active_disputes = Dispute.objects.filter(status='open').count()
+    total_disputes = Dispute.objects.count()
+    total_categories = Category.objects.count()
+    enabled_categories = Category.objects.filter(enabled=True).count()
+    last_month_revenue = Session.objects.filter(
+        status='completed',
+        ended_at__gte=timezone.now() - timedelta(days=60),
+        ended_at__lt=timezone.now() - timedelta(days=30)
+    ).aggregate(total_revenue=Sum('cost'))['total_revenue'] or 0
+    if last_month_revenue > 0:
+        monthly_growth = ((monthly_revenue - last_month_revenue) / last_month_revenue) * 100
+    else:
+        monthly_growth = 100 if monthly_revenue > 0 else 0
+    return {
+        'total_professionals': total_professionals,
+        'pending_approvals': pending_approvals,
+        'approved_professionals': approved_professionals,
+        'total_revenue': float(total_revenue),
+        'active_disputes': active_disputes,
+        'monthly_growth': round(float(monthly_growth), 2),
+        'completed_sessions': completed_sessions,
+        'total_users': total_users,
+        'active_users': active_users,
+        'monthly_revenue': float(monthly_revenue),
+        'average_session_value': float(average_session_value),
+        'total_sessions': total_sessions,
+        'active_sessions': active_sessions,
+        'total_disputes': total_disputes,
+        'total_categories': total_categories,
+        'enabled_categories': enabled_categories,
+    }
+
+
+def seed(session_count, seed=7):
+    rng = random.Random(seed)
+    now = timezone.now()
+    categories = Category.objects.bulk_create([Category(name=f'Category {i}', enabled=i % 4 != 0) for i in range(20)])
+    professionals = Professional.objects.bulk_create([
+        Professional(name=f'Pro {i}', specialization='Benchmark', primary_category=rng.choice(categories),
+                     status=rng.choice(['approved', 'approved', 'pending', 'rejected']))
+        for i in range(2000)
+    ])
+    User.objects.bulk_create([User(username=f'user{i}', is_active=i % 10 != 0) for i in range(5000)])
+
+    batch = []
+    for i in range(session_count):
+        status = rng.choice(STATUSES)
+        # Half a day away from the 30/60-day window edges, so both versions
+        # see the same sessions even though they read the clock separately
+        ended_at = now - timedelta(days=rng.randint(0, 119), hours=12) if status == 'completed' else None
+        batch.append(Session(
+            professional=rng.choice(professionals), client_id=rng.randint(1, 5000), status=status,
+            category_id=rng.choice(categories).id, cost=Decimal(rng.randint(100, 50000)) / 100, ended_at=ended_at,
+        ))
+        if len(batch) == 10000:
+            Session.objects.bulk_create(batch)
+            batch = []
+    Session.objects.bulk_create(batch)
+
+    sessions = list(Session.objects.values_list('id', flat=True)[:5000])
+    Dispute.objects.bulk_create([
+        Dispute(session_id=rng.choice(sessions), title='Benchmark', description='-', created_by='bench',
+                status=rng.choice(['open', 'resolved', 'closed']))
+        for _ in range(500)
+    ])
+
+
+def measure(func, repeat=5):
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        result = func()
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, len(queries), best
+
+
+def concurrent_polls(threads=50):
+    """Many admin screens polling at once after the snapshot expired"""
+    dashboard_snapshot.invalidate()
+    before = dashboard_snapshot.metrics()['computations']
+    barrier = threading.Barrier(threads)
+
+    def poll():
+        barrier.wait()
+        dashboard_snapshot.get()
+
+    workers = [threading.Thread(target=poll) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return dashboard_snapshot.metrics()['computations'] - before, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        started = time.perf_counter()
+        seed(count)
+        print(f"🌱 Seeded {count:,} sessions in {time.perf_counter() - started:.1f} s")
+
+        legacy, legacy_queries, legacy_time = measure(legacy_dashboard_stats)
+        rewritten, rewritten_queries, rewritten_time = measure(compute_dashboard_stats)
+        assert legacy == rewritten, f"results differ:\n{legacy}\n{rewritten}"
+
+        dashboard_snapshot.get(force=True)
+        _, cached_queries, cached_time = measure(dashboard_snapshot.get)
+
+        print("📊 admin_dashboard_stats")
+        print(f"   before     {legacy_queries:3d} queries  {legacy_time * 1000:9.1f} ms")
+        print(f"   after      {rewritten_queries:3d} queries  {rewritten_time * 1000:9.1f} ms")
+        print(f"   cached     {cached_queries:3d} queries  {cached_time * 1000:9.3f} ms")
+
+        computations, elapsed = concurrent_polls()
+        print(f"   50 concurrent polls on an expired snapshot: {computations} computation(s), {elapsed * 1000:.1f} ms")
+        print("✅ Rewritten statistics identical to the per-number queries")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
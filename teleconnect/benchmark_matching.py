@@ -0,0 +1,106 @@
+# benchmark_matching.py
+#
+# Compares the per-professional matching loop with the batch scorer on a
+# throwaway test database:
+#
+#     python benchmark_matching.py            # 10k and 100k candidates
+#     python benchmark_matching.py 50000
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'teleconnect.settings')
+django.setup()
+
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import setup_test_environment
+
+from quickconnect.matching import calculate_matching_score, feature_rows, rank_candidates
+from quickconnect.models import Category, Professional
+
+RESPONSE_TIMES = ['< 1 hour', '< 2 hours', '< 4 hours', '< 8 hours', '< 24 hours', '1 day', '']
+
+
+def populate(category, count, seed=42):
+    """Approved, available professionals with realistic value ranges"""
+    rng = random.Random(seed)
+    Professional.objects.bulk_create([
+        Professional(
+            name=f'Benchmark Pro {i:06d}',
+            specialization='Benchmark',
+            category=category,
+            primary_category=category,
+            status='approved',
+            available=True,
+            online_status=rng.random() < 0.6,
+            average_rating=Decimal(rng.choice([0, rng.randint(100, 500)])) / 100,
+            experience_years=rng.randint(0, 25),
+            avg_response_time=rng.choice(RESPONSE_TIMES),
+            rate=Decimal(rng.choice([0, rng.randint(500, 30000)])) / 100,
+        )
+        for i in range(count)
+    ], batch_size=2000)
+
+
+def candidates(category):
+    return Professional.objects.filter(
+        Q(primary_category=category) | Q(categories=category),
+        status='approved',
+        available=True
+    ).distinct()
+
+
+def scalar_top(category, preferences, k):
+    """The per-professional loop run_matching_algorithm used before"""
+    scored = []
+    for professional in candidates(category):
+        score = calculate_matching_score(professional, preferences)
+        score['professional_id'] = professional.id
+        scored.append(score)
+    scored.sort(key=lambda score: score['total_score'], reverse=True)
+    return scored[:k], len(scored)
+
+
+def batch_top(category, preferences, k):
+    return rank_candidates(feature_rows(candidates(category)), preferences, k=k)
+
+
+def timed(func, *args, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(count, k=10):
+    category = Category.objects.create(name=f'Benchmark {count}')
+    populate(category, count)
+    for preferences in ({}, {'max_rate': 150}):
+        scalar, expected = timed(scalar_top, category, preferences, k)
+        batch, actual = timed(batch_top, category, preferences, k)
+        assert actual == expected, f"results differ for preferences={preferences}"
+        print(f"{count:>7} candidates  max_rate={preferences.get('max_rate', '-'):>4}  "
+              f"loop {scalar * 1000:8.1f} ms  batch {batch * 1000:7.1f} ms  "
+              f"speedup {scalar / batch:5.1f}x")
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print("📊 Matching benchmark (top 10, best of 3)")
+        for size in sizes:
+            run(size)
+        print("✅ Batch results identical to the per-professional loop")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
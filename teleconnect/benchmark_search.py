@@ -0,0 +1,133 @@
+# benchmark_search.py
+#
+# Compares the icontains scan search_professionals used to run with the
+# full-text index (quickconnect/search.py) on a throwaway test database:
+#
+#     python benchmark_search.py            # 100k professionals
+#     python benchmark_search.py 20000
+#
+# Queries are typeahead prefixes, whole words and filtered searches; each is
+# timed for the first page of 20, as the mobile search box asks for it.
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'teleconnect.settings')
+django.setup()
+
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import setup_test_environment
+
+from quickconnect import search
+from quickconnect.models import Category, Professional
+
+FIRST_NAMES = ['Alice', 'Bruno', 'Carmen', 'Dmitri', 'Elena', 'Farid', 'Grace', 'Hiro', 'Ines', 'Jonas',
+               'Kemi', 'Lars', 'Maya', 'Nikhil', 'Olga', 'Pedro', 'Quinn', 'Rosa', 'Sami', 'Tariq']
+LAST_NAMES = ['Anders', 'Becker', 'Cardenas', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Haddad', 'Ivanova',
+              'Jensen', 'Kowalski', 'Lopez', 'Moreau', 'Novak', 'Okafor', 'Petrov', 'Rossi', 'Schmidt']
+SPECIALIZATIONS = ['Cardiologist', 'Family Lawyer', 'Tax Advisor', 'Psychologist', 'Nutritionist',
+                   'Software Mentor', 'Career Coach', 'Dermatologist', 'Immigration Lawyer', 'Physiotherapist']
+BIO_WORDS = ['experienced', 'certified', 'consulting', 'patients', 'clients', 'contracts', 'divorce',
+             'heart', 'skin', 'anxiety', 'startup', 'python', 'interviews', 'visa', 'rehabilitation',
+             'nutrition', 'audit', 'specialist', 'expert', 'advice']
+
+QUERIES = [
+    ('prefix, 2 letters', 'ca', {}),
+    ('prefix, 4 letters', 'card', {}),
+    ('whole word', 'lawyer', {}),
+    ('two words', 'maya lawyer', {}),
+    ('bio word', 'divorce', {}),
+    ('filtered', 'lawyer', {'min_rating': 4, 'max_rate': 100, 'available_only': True}),
+    ('category', 'coach', {'category': 'Category 3'}),
+    ('no match', 'zzzz', {}),
+]
+
+
+def populate(count, seed=42):
+    rng = random.Random(seed)
+    categories = [Category.objects.create(name=f'Category {i}') for i in range(10)]
+    Professional.objects.bulk_create([
+        Professional(
+            name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            specialization=rng.choice(SPECIALIZATIONS),
+            bio=' '.join(rng.choices(BIO_WORDS, k=12)),
+            primary_category=rng.choice(categories),
+            status='approved' if rng.random() < 0.9 else 'pending',
+            available=rng.random() < 0.7,
+            online_status=rng.random() < 0.4,
+            average_rating=Decimal(rng.randint(100, 500)) / 100,
+            rate=Decimal(rng.randint(500, 30000)) / 100,
+        )
+        for _ in range(count)
+    ], batch_size=2000)
+
+
+def scan(query, min_rating=0, max_rate=None, available_only=False, category=None, limit=search.PAGE_SIZE):
+    """The icontains filters search_professionals ran before"""
+    professionals = Professional.objects.filter(status='approved').filter(
+        Q(name__icontains=query) | Q(specialization__icontains=query) | Q(bio__icontains=query)
+    )
+    if category:
+        professionals = professionals.filter(
+            Q(primary_category__name__iexact=category) | Q(categories__name__iexact=category)
+        )
+    if min_rating:
+        professionals = professionals.filter(average_rating__gte=min_rating)
+    if max_rate is not None:
+        professionals = professionals.filter(rate__lte=max_rate)
+    if available_only:
+        professionals = professionals.filter(available=True)
+    return list(professionals.values_list('id', flat=True)[:limit]), professionals.count()
+
+
+def timed(func, *args, repeat=5, **kwargs):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(count):
+    populate(count)
+    started = time.perf_counter()
+    indexed = search.rebuild()
+    print(f"{count:>7} professionals  index built in {time.perf_counter() - started:6.1f} s ({indexed} documents)")
+
+    for label, query, filters in QUERIES:
+        before, (_, total) = timed(scan, query, **filters)
+        after, (hits, _) = timed(search.search, query, **filters)
+        print(f"  {label:<18} {query!r:<14} scan {before * 1000:8.1f} ms ({total:>6} matches)  "
+              f"index {after * 1000:7.2f} ms ({len(hits):>2} on page)  speedup {before / after:6.1f}x")
+
+    # Cost the signals add to a save that changes an indexed field
+    professional = Professional.objects.order_by('id').first()
+    def rename():
+        professional.name = f'Renamed {time.perf_counter()}'
+        professional.save()
+    def toggle():
+        professional.online_status = not professional.online_status
+        professional.save()
+    print(f"  save, indexed field changed {timed(rename)[0] * 1000:6.2f} ms   "
+          f"save, other field {timed(toggle)[0] * 1000:6.2f} ms")
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000]
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print(f"📊 Search benchmark ({search.backend().__class__.__name__}, first page of "
+              f"{search.PAGE_SIZE}, best of 5)")
+        for size in sizes:
+            run(size)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
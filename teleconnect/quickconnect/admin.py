@@ -3,8 +3,11 @@ from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
 from django.utils.html import format_html
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Count, Avg, Sum
 from .models import *
+from .stats import reconcile as reconcile_stats
+from .roster import publish_upsert
 
 # Inline Admin Classes
 class SubCategoryInline(admin.TabularInline):
@@ -130,10 +133,8 @@ class CategoryAdmin(admin.ModelAdmin):
     stats_preview.short_description = "Current Statistics"
 
     def update_statistics(self, request, queryset):
-        for category in queryset:
-            # Update any custom statistics logic here
-            pass
-        self.message_user(request, f"Updated statistics for {queryset.count()} categories.")
+        fixed, _ = reconcile_stats(category_ids=list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f"Updated statistics for {queryset.count()} categories ({fixed} had drifted).")
     update_statistics.short_description = "Update selected categories statistics"
 
     def enable_categories(self, request, queryset):
@@ -265,30 +266,39 @@ class ProfessionalAdmin(admin.ModelAdmin):
             return format_html('<span style="color: red;">● Busy</span>')
     availability_status.short_description = "Current Availability"
 
+    def _save_each(self, queryset, **fields):
+        """
+        Save the change row by row, not with queryset.update(), so the
+        counter, search and candidate index receivers see it; the roster
+        delta goes out in the same transaction (roster.py)
+        """
+        updated = 0
+        for professional in queryset:
+            for name, value in fields.items():
+                setattr(professional, name, value)
+            with transaction.atomic():
+                professional.save(update_fields=[*fields, 'updated_at'])
+                publish_upsert(professional.id)
+            updated += 1
+        return updated
+
     def approve_professionals(self, request, queryset):
-        updated = queryset.update(
-            status='approved', 
-            approved_at=timezone.now(),
-            rejection_reason=''
-        )
+        updated = self._save_each(queryset, status='approved', approved_at=timezone.now(), rejection_reason='')
         self.message_user(request, f"Approved {updated} professionals.")
     approve_professionals.short_description = "Approve selected professionals"
 
     def reject_professionals(self, request, queryset):
-        updated = queryset.update(
-            status='rejected',
-            rejected_at=timezone.now()
-        )
+        updated = self._save_each(queryset, status='rejected', rejected_at=timezone.now())
         self.message_user(request, f"Rejected {updated} professionals.")
     reject_professionals.short_description = "Reject selected professionals"
 
     def suspend_professionals(self, request, queryset):
-        updated = queryset.update(status='suspended')
+        updated = self._save_each(queryset, status='suspended')
         self.message_user(request, f"Suspended {updated} professionals.")
     suspend_professionals.short_description = "Suspend selected professionals"
 
     def update_online_status(self, request, queryset):
-        updated = queryset.update(online_status=True)
+        updated = self._save_each(queryset, online_status=True)
         self.message_user(request, f"Updated online status for {updated} professionals.")
     update_online_status.short_description = "Set selected professionals online"
 
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class QuickconnectConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quickconnect'
+
+    def ready(self):
+        if not getattr(settings, 'LOG_PROCESS_INFO', True):
+            from .logs import drop_process_info
+            drop_process_info()
@@ -0,0 +1,535 @@
+"""
+Typeahead suggestions from an in-process prefix trie.
+
+``api/autocomplete/?q=<prefix>`` answers every keystroke of the search box
+with a handful of completions instead of full professional rows. The
+suggestions are:
+
+- approved professionals' names, weighted by their session count
+- specializations, weighted by how many approved professionals list them
+- enabled categories and subcategories, weighted by how many approved
+  professionals are filed under them
+
+Each suggestion is inserted under every word it contains, so ``car`` finds
+both "Cardiologist" and "Alice Cardenas", and ``alice car`` the latter. Keys
+are lower-cased with accents and punctuation removed.
+
+The trie is path-compressed (one node per branch point, not per letter)
+and every node caches the ids of the best ``TOP_K`` suggestions below it,
+so a lookup walks at most ``len(prefix)`` nodes and reads one tuple. An
+update recomputes those caches on the path of each key it touches.
+
+It is built by ``start_autocomplete`` at startup, which logs the build time
+and an estimate of the memory used, and is kept current by model signals
+applied after the surrounding transaction commits. Session counts are
+bumped by stats.py without signals, so a name's weight is refreshed the
+next time the professional is saved.
+"""
+
+import logging
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+
+from .models import Category, Professional, ProfessionalCategory, SubCategory
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 10
+MAX_KEY_LENGTH = 60
+
+# Shown first when weights tie
+KIND_ORDER = {'category': 0, 'subcategory': 1, 'specialization': 2, 'professional': 3}
+
+Suggestion = namedtuple('Suggestion', ['text', 'kind', 'id', 'weight'])
+
+ProfessionalEntry = namedtuple('ProfessionalEntry', ['name', 'specialization', 'sessions', 'category_id'])
+
+
+def normalize(text):
+    """Lower-case, strip accents, and reduce everything else to single spaces"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'[^\W_]+', text.lower()))
+
+
+def keys_for(text):
+    """The normalized text from each of its words onwards"""
+    words = normalize(text).split()
+    return {' '.join(words[i:])[:MAX_KEY_LENGTH] for i in range(len(words))}
+
+
+def ranking(suggestions):
+    """Sort key for suggestion ids: heaviest first, then by kind and text"""
+    def rank(suggestion_id):
+        suggestion = suggestions[suggestion_id]
+        return -suggestion.weight, KIND_ORDER[suggestion.kind], suggestion.text
+    return rank
+
+
+class _Node:
+    __slots__ = ('label', 'children', 'entries', 'top')
+
+    def __init__(self, label):
+        self.label = label     # edge from the parent
+        self.children = None   # first letter -> node
+        self.entries = None    # ids of suggestions whose key ends here
+        self.top = ()          # best TOP_K suggestion ids in this subtree
+
+
+class PrefixTrie:
+    """Path-compressed trie mapping keys to suggestion ids, with a top-k cache per node"""
+
+    def __init__(self, rank):
+        self.root = _Node('')
+        self.rank = rank  # sort key for a suggestion id
+
+    def _path(self, key, create):
+        """Nodes from the root to ``key``'s node, splitting edges if ``create``"""
+        node, path, rest = self.root, [self.root], key
+        while rest:
+            child = node.children.get(rest[0]) if node.children else None
+            if child is None:
+                if not create:
+                    return None
+                child = _Node(rest)
+                if node.children is None:
+                    node.children = {}
+                node.children[rest[0]] = child
+                path.append(child)
+                return path
+
+            label = child.label
+            common = 0
+            limit = min(len(label), len(rest))
+            while common < limit and label[common] == rest[common]:
+                common += 1
+            if common < len(label):
+                if not create:
+                    return None
+                # Split the edge at the point where the key diverges
+                middle = _Node(label[:common])
+                middle.children = {label[common]: child}
+                middle.top = child.top
+                child.label = label[common:]
+                node.children[rest[0]] = middle
+                child = middle
+            node, rest = child, rest[common:]
+            path.append(node)
+        return path
+
+    def _recompute(self, node):
+        candidates = set(node.entries or ())
+        for child in (node.children or {}).values():
+            candidates.update(child.top)
+        node.top = tuple(sorted(candidates, key=self.rank)[:TOP_K])
+
+    def add(self, key, suggestion_id, deferred=False):
+        """Insert ``suggestion_id`` under ``key``; ``deferred`` leaves the caches to ``finish()``"""
+        path = self._path(key, create=True)
+        node = path[-1]
+        if node.entries is None:
+            node.entries = set()
+        node.entries.add(suggestion_id)
+        if deferred:
+            return
+        # A new id can only push others out; stop where it doesn't make the cut
+        rank = self.rank(suggestion_id)
+        for node in reversed(path):
+            if suggestion_id in node.top:
+                break
+            if len(node.top) >= TOP_K and rank >= self.rank(node.top[-1]):
+                break
+            node.top = tuple(sorted(node.top + (suggestion_id,), key=self.rank)[:TOP_K])
+
+    def discard(self, key, suggestion_id):
+        path = self._path(key, create=False)
+        if path is None or not path[-1].entries:
+            return
+        node = path[-1]
+        node.entries.discard(suggestion_id)
+        if not node.entries:
+            node.entries = None
+        # Drop leaves that no longer lead anywhere
+        while len(path) > 1 and node.entries is None and not node.children:
+            parent = path[-2]
+            del parent.children[node.label[0]]
+            if not parent.children:
+                parent.children = None
+            path.pop()
+            node = parent
+        # Only caches that listed the id need refilling
+        for node in reversed(path):
+            if suggestion_id not in node.top:
+                break
+            self._recompute(node)
+
+    def reranked(self, keys):
+        """Recompute the caches above ``keys`` after a weight changed"""
+        for key in keys:
+            path = self._path(key, create=False)
+            for node in reversed(path or ()):
+                self._recompute(node)
+
+    def finish(self):
+        """Fill every cache bottom-up after deferred inserts"""
+        order, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend((node.children or {}).values())
+        for node in reversed(order):
+            self._recompute(node)
+
+    def top(self, prefix):
+        """Best TOP_K ids under ``prefix``; the prefix may end inside an edge"""
+        node, rest = self.root, prefix
+        while rest:
+            child = node.children.get(rest[0]) if node.children else None
+            if child is None:
+                return ()
+            label = child.label
+            if len(rest) <= len(label):
+                return child.top if label.startswith(rest) else ()
+            if not rest.startswith(label):
+                return ()
+            node, rest = child, rest[len(label):]
+        return node.top
+
+    def stats(self):
+        """(nodes, approximate bytes) for the whole trie"""
+        nodes = size = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            size += sys.getsizeof(node) + sys.getsizeof(node.label) + sys.getsizeof(node.top)
+            if node.entries is not None:
+                size += sys.getsizeof(node.entries)
+            if node.children is not None:
+                size += sys.getsizeof(node.children)
+                stack.extend(node.children.values())
+        return nodes, size
+
+
+class AutocompleteIndex:
+    """Suggestions for the search box, held in memory"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        self.ready = False
+        self.loading = False
+        self._pending = []  # updates that arrived while a full build was running
+
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+        self.updates = 0
+        self.built_at = None
+        self.build_ms = None
+        self.memory_bytes = None
+        self.nodes = None
+
+    def _reset(self, suggestions=None, trie=None, professionals=None, specializations=None, spelling=None):
+        self._suggestions = suggestions if suggestions is not None else {}  # (kind, id) -> Suggestion
+        self._trie = trie or PrefixTrie(ranking(self._suggestions))
+        self._professionals = professionals or {}  # approved professional id -> ProfessionalEntry
+        self._specializations = specializations or Counter()  # normalized specialization -> professionals
+        self._spelling = spelling or defaultdict(Counter)  # normalized specialization -> spellings
+
+    # Suggestions --------------------------------------------------------
+
+    def _put(self, suggestion):
+        key = (suggestion.kind, suggestion.id)
+        old = self._suggestions.get(key)
+        if old == suggestion:
+            return
+        self._suggestions[key] = suggestion
+        if old is not None and old.text == suggestion.text:
+            self._trie.reranked(keys_for(suggestion.text))
+            return
+        if old is not None:
+            for word_key in keys_for(old.text):
+                self._trie.discard(word_key, key)
+        for word_key in keys_for(suggestion.text):
+            self._trie.add(word_key, key)
+
+    def _drop(self, kind, suggestion_id):
+        old = self._suggestions.get((kind, suggestion_id))
+        if old is None:
+            return
+        for word_key in keys_for(old.text):
+            self._trie.discard(word_key, (kind, suggestion_id))
+        del self._suggestions[(kind, suggestion_id)]
+
+    def _count_specialization(self, specialization, delta):
+        key = normalize(specialization)
+        if not key:
+            return
+        self._specializations[key] += delta
+        self._spelling[key][specialization.strip()] += delta
+        count = self._specializations[key]
+        if count <= 0:
+            del self._specializations[key], self._spelling[key]
+            self._drop('specialization', key)
+        else:
+            spelling = self._spelling[key].most_common(1)[0][0]
+            self._put(Suggestion(spelling, 'specialization', key, count))
+
+    def _set_professional(self, professional_id, entry):
+        old = self._professionals.pop(professional_id, None)
+        if entry is not None:
+            self._professionals[professional_id] = entry
+        if old is not None and (entry is None or old.specialization != entry.specialization):
+            self._count_specialization(old.specialization, -1)
+        if entry is not None and (old is None or old.specialization != entry.specialization):
+            self._count_specialization(entry.specialization, 1)
+        if entry is None:
+            self._drop('professional', professional_id)
+        else:
+            self._put(Suggestion(entry.name, 'professional', professional_id, entry.sessions))
+
+    # Loading ------------------------------------------------------------
+
+    def build(self):
+        """Load every suggestion from the database. Returns the number of suggestions"""
+        started = time.monotonic()
+        with self._lock:
+            self.loading = True
+            self._pending = []
+        try:
+            professionals = list(Professional.objects.filter(status='approved').values_list(
+                'id', 'name', 'specialization', 'total_sessions', 'primary_category_id'
+            ))
+            categories = _category_rows()
+            subcategories = _subcategory_rows()
+            suggestions, trie, entries, specializations, spelling = _assemble(professionals, categories + subcategories)
+        except Exception:
+            with self._lock:
+                self.loading = False
+            raise
+
+        with self._lock:
+            self._reset(suggestions, trie, entries, specializations, spelling)
+            self.loading = False
+            self.ready = True
+            pending, self._pending = self._pending, []
+            self.built_at = time.time()
+            self.build_ms = round((time.monotonic() - started) * 1000)
+            count = len(self._suggestions)
+
+        # Anything written while we were reading may have been missed
+        for method, args in pending:
+            method(*args)
+        return count
+
+    def measure(self):
+        """Walk the trie for its node count and approximate size"""
+        with self._lock:
+            nodes, size = self._trie.stats()
+            size += sum(sys.getsizeof(s) + sys.getsizeof(s.text) for s in self._suggestions.values())
+            self.nodes, self.memory_bytes = nodes, size
+        return nodes, size
+
+    def _tracking(self, method, *args):
+        """Whether an update should be applied now; queued while building"""
+        with self._lock:
+            if self.loading:
+                self._pending.append((method, args))
+                return False
+            return self.ready
+
+    def after_commit(self, method, *args):
+        """Run an update once the current transaction commits"""
+        if self.ready or self.loading:
+            transaction.on_commit(lambda: method(*args))
+
+    # Updates ------------------------------------------------------------
+
+    def professional_changed(self, professional_id, entry, subcategory_ids=None):
+        """
+        ``entry`` is the professional as saved, or None once deleted or no
+        longer approved. A deleted professional's subcategory links are gone,
+        so ``subcategory_ids`` passes them along.
+        """
+        if not self._tracking(self.professional_changed, professional_id, entry, subcategory_ids):
+            return
+        with self._lock:
+            old = self._professionals.get(professional_id)
+            if old == entry:
+                return
+            self._set_professional(professional_id, entry)
+            self.updates += 1
+        # Approval and primary category both move category weights
+        if (old is None) != (entry is None) or (old and entry and old.category_id != entry.category_id):
+            category_ids = {e.category_id for e in (old, entry) if e is not None and e.category_id}
+            category_ids |= set(ProfessionalCategory.objects.filter(
+                professional_id=professional_id
+            ).values_list('category_id', flat=True))
+            self.refresh_categories(category_ids)
+            if subcategory_ids is None:
+                subcategory_ids = SubCategory.objects.filter(professionals__id=professional_id).values_list('id', flat=True)
+            self.refresh_subcategories(subcategory_ids)
+
+    def refresh_categories(self, category_ids):
+        category_ids = set(category_ids)
+        if not category_ids or not self._tracking(self.refresh_categories, category_ids):
+            return
+        rows = _category_rows(category_ids)
+        with self._lock:
+            for suggestion in rows:
+                self._put(suggestion)
+            for category_id in category_ids - {suggestion.id for suggestion in rows}:
+                self._drop('category', category_id)
+            self.updates += len(category_ids)
+
+    def refresh_subcategories(self, subcategory_ids):
+        subcategory_ids = set(subcategory_ids)
+        if not subcategory_ids or not self._tracking(self.refresh_subcategories, subcategory_ids):
+            return
+        rows = _subcategory_rows(subcategory_ids)
+        with self._lock:
+            for suggestion in rows:
+                self._put(suggestion)
+            for subcategory_id in subcategory_ids - {suggestion.id for suggestion in rows}:
+                self._drop('subcategory', subcategory_id)
+            self.updates += len(subcategory_ids)
+
+    # Reads --------------------------------------------------------------
+
+    def suggest(self, query, limit=TOP_K):
+        """Up to ``limit`` suggestions completing ``query``, best first"""
+        if not self.ready and not self.loading:
+            # Nothing started the index (e.g. manage.py shell): build it now
+            self.build()
+        started = time.perf_counter()
+        prefix = normalize(query)[:MAX_KEY_LENGTH]
+        with self._lock:
+            ids = self._trie.top(prefix) if prefix else ()
+            suggestions = [self._suggestions[suggestion_id] for suggestion_id in ids[:limit]]
+            self.lookups += 1
+            self.lookup_seconds += time.perf_counter() - started
+        return suggestions
+
+    def metrics(self):
+        with self._lock:
+            kinds = Counter(kind for kind, _ in self._suggestions)
+            return {
+                'ready': self.ready,
+                'suggestions': dict(kinds),
+                'nodes': self.nodes,
+                'memory_bytes': self.memory_bytes,
+                'build_ms': self.build_ms,
+                'lookups': self.lookups,
+                'avg_lookup_us': round(self.lookup_seconds / self.lookups * 1e6, 2) if self.lookups else None,
+                'updates': self.updates,
+            }
+
+
+def _assemble(professionals, rows):
+    """A new trie and its bookkeeping, built off to the side while lookups use the old one"""
+    entries = {
+        professional_id: ProfessionalEntry(name, specialization, sessions, category_id)
+        for professional_id, name, specialization, sessions, category_id in professionals
+    }
+    specializations, spelling = Counter(), defaultdict(Counter)
+    for entry in entries.values():
+        key = normalize(entry.specialization)
+        if key:
+            specializations[key] += 1
+            spelling[key][entry.specialization.strip()] += 1
+    suggestions = {}
+    for professional_id, entry in entries.items():
+        suggestions['professional', professional_id] = Suggestion(entry.name, 'professional', professional_id, entry.sessions)
+    for key, count in specializations.items():
+        suggestions['specialization', key] = Suggestion(spelling[key].most_common(1)[0][0], 'specialization', key, count)
+    for suggestion in rows:
+        suggestions[suggestion.kind, suggestion.id] = suggestion
+    trie = PrefixTrie(ranking(suggestions))
+    for suggestion_id, suggestion in suggestions.items():
+        for word_key in keys_for(suggestion.text):
+            trie.add(word_key, suggestion_id, deferred=True)
+    trie.finish()
+    return suggestions, trie, entries, specializations, spelling
+
+
+def _category_rows(category_ids=None):
+    """Category suggestions weighted by approved professionals, primary or additional"""
+    categories = Category.objects.filter(enabled=True)
+    memberships = ProfessionalCategory.objects.filter(professional__status='approved')
+    primaries = Professional.objects.filter(status='approved', primary_category__isnull=False)
+    if category_ids is not None:
+        categories = categories.filter(id__in=category_ids)
+        memberships = memberships.filter(category_id__in=category_ids)
+        primaries = primaries.filter(primary_category_id__in=category_ids)
+
+    members = defaultdict(set)
+    for professional_id, category_id in memberships.values_list('professional_id', 'category_id'):
+        members[category_id].add(professional_id)
+    for professional_id, category_id in primaries.values_list('id', 'primary_category_id'):
+        members[category_id].add(professional_id)
+    return [
+        Suggestion(name, 'category', category_id, len(members[category_id]))
+        for category_id, name in categories.values_list('id', 'name')
+    ]
+
+
+def _subcategory_rows(subcategory_ids=None):
+    subcategories = SubCategory.objects.filter(enabled=True)
+    if subcategory_ids is not None:
+        subcategories = subcategories.filter(id__in=subcategory_ids)
+    return [
+        Suggestion(name, 'subcategory', subcategory_id, count)
+        for subcategory_id, name, count in subcategories.annotate(
+            approved=Count('professionals', filter=Q(professionals__status='approved'))
+        ).values_list('id', 'name', 'approved')
+    ]
+
+
+def professional_entry(professional):
+    """What the index keeps of a saved professional; None unless approved"""
+    if professional.status != 'approved':
+        return None
+    return ProfessionalEntry(
+        professional.name, professional.specialization, professional.total_sessions, professional.primary_category_id
+    )
+
+
+autocomplete_index = AutocompleteIndex()
+
+
+def _build():
+    try:
+        count = autocomplete_index.build()
+        nodes, size = autocomplete_index.measure()
+        logger.info("Autocomplete index built", extra={
+            "event": "autocomplete.built",
+            "suggestions": count,
+            "nodes": nodes,
+            "memory_mb": round(size / 2 ** 20, 1),
+            "elapsed_ms": autocomplete_index.build_ms,
+        })
+    except Exception:
+        logger.exception("Autocomplete index build failed", extra={"event": "autocomplete.error"})
+    finally:
+        close_old_connections()
+
+
+_builder = None
+_builder_lock = threading.Lock()
+
+
+def start_autocomplete():
+    """Build the process-wide index in the background"""
+    global _builder
+    with _builder_lock:
+        if _builder is None:
+            _builder = threading.Thread(target=_build, name='autocomplete', daemon=True)
+            _builder.start()
+    return _builder
@@ -0,0 +1,260 @@
+"""
+Content-addressed, deduplicated storage for professional documents.
+
+License uploads and ``ProfessionalDocument.file`` used to be saved under a
+fresh ``uuid4`` name each time, so a retried or repeated upload of the same
+PDF was another copy on disk. ``BlobStorage`` names every file by the
+SHA-256 of its bytes instead (license uploads only when they are attached
+to a document; see uploads.py):
+
+    blobs/3f/a2/3fa2...c9.pdf
+
+The upload is streamed to a temporary file while it is hashed. If a blob
+with that name already exists the temporary file is dropped and the
+existing blob is returned, so identical content is stored once.
+
+Each blob has a ``Blob`` row: its size, how many times it was written, and
+how many rows point at it. ``ProfessionalDocument.file`` and
+``CallRecording.file_path`` adjust ``ref_count`` from model signals, in the
+same transaction as the row. Blobs are never deleted by the storage itself
+(``delete()`` does nothing, since another row may share the file).
+``collect()`` removes blobs nobody has referenced for ``BLOB_ORPHAN_GRACE``
+seconds: documents that were replaced or deleted, and uploads refused after
+they were stored. It also repairs ref counts that drifted through updates that
+bypass signals. ``BlobCollector`` runs it in the background and logs what
+deduplication saved (``savings()``).
+
+A writer records its blob before checking whether the file exists. The
+collector deletes the row first and only deletes the file if no row has
+reappeared. Between them, a concurrent upload of the same content never
+loses its file.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BLOB_PREFIX = 'blobs/'
+TEMP_DIR = 'blobs/tmp'
+COPY_SIZE = 64 * 1024
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX) and not name.startswith(TEMP_DIR)
+
+
+class BlobStorage(FileSystemStorage):
+    """FileSystemStorage that names files by content and never overwrites or deletes them"""
+
+    def get_available_name(self, name, max_length=None):
+        # The name is decided by the content in _save()
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()[:10]
+        temp_dir = self.path(TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        descriptor, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            with os.fdopen(descriptor, 'wb') as temp:
+                for chunk in content.chunks(COPY_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    temp.write(chunk)
+
+            sha256 = digest.hexdigest()
+            blob_name = f'{BLOB_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+            # Record the write before looking for the file (see the module docstring)
+            record_write(blob_name, sha256, size)
+            path = self.path(blob_name)
+            if os.path.exists(path):
+                logger.info("Blob deduplicated", extra={"event": "blobs.dedup", "blob": blob_name, "size": size})
+                return blob_name
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, path)
+            return blob_name
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def delete(self, name):
+        # Shared by every row with the same content; only collect() removes blobs
+        if not is_blob(name):
+            super().delete(name)
+
+
+_blob_storage = None
+
+
+def blob_storage():
+    """The shared BlobStorage under MEDIA_ROOT (a callable, so FileField migrations stay stable)"""
+    global _blob_storage
+    if _blob_storage is None:
+        _blob_storage = BlobStorage()
+    return _blob_storage
+
+
+# Reference counting -----------------------------------------------------
+
+def record_write(name, sha256, size):
+    from .models import Blob
+
+    now = timezone.now()
+    written = dict(writes=F('writes') + 1, touched_at=now)
+    if Blob.objects.filter(name=name).update(**written):
+        return
+    try:
+        with transaction.atomic():
+            Blob.objects.create(name=name, sha256=sha256, size=size, touched_at=now)
+    except IntegrityError:
+        # Someone else stored the same content first
+        Blob.objects.filter(name=name).update(**written)
+
+
+def retain(name):
+    from .models import Blob
+    if is_blob(name):
+        Blob.objects.filter(name=name).update(ref_count=F('ref_count') + 1, touched_at=timezone.now())
+
+
+def release(name):
+    from .models import Blob
+    if is_blob(name):
+        Blob.objects.filter(name=name).update(ref_count=F('ref_count') - 1, touched_at=timezone.now())
+
+
+def references():
+    """How many rows point at each blob, counted from the referencing tables"""
+    from .models import CallRecording, ProfessionalDocument
+
+    counts = Counter()
+    for name in ProfessionalDocument.objects.filter(file__startswith=BLOB_PREFIX).values_list('file', flat=True):
+        counts[name] += 1
+    for name in CallRecording.objects.filter(file_path__startswith=BLOB_PREFIX).values_list('file_path', flat=True):
+        counts[name] += 1
+    return counts
+
+
+# Collection -------------------------------------------------------------
+
+def collect(grace=None):
+    """
+    Repair ref counts, then delete blobs unreferenced for ``grace`` seconds
+    and abandoned temporary files. Returns (blobs removed, bytes freed, counts repaired).
+    """
+    from .models import Blob
+
+    grace = settings.BLOB_ORPHAN_GRACE if grace is None else grace
+    storage = blob_storage()
+
+    # Counts before references: a reference added in between makes the
+    # conditional update below miss instead of undoing it
+    counts = list(Blob.objects.values_list('name', 'ref_count'))
+    expected = references()
+    repaired = 0
+    for name, ref_count in counts:
+        if ref_count != expected.get(name, 0):
+            # Only from the count we read, so a concurrent retain/release isn't lost
+            repaired += Blob.objects.filter(name=name, ref_count=ref_count).update(ref_count=expected.get(name, 0))
+
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    removed = freed = 0
+    for name, size in Blob.objects.filter(ref_count__lte=0, touched_at__lt=cutoff).values_list('name', 'size'):
+        deleted, _ = Blob.objects.filter(name=name, ref_count__lte=0, touched_at__lt=cutoff).delete()
+        if not deleted or Blob.objects.filter(name=name).exists():
+            continue
+        try:
+            os.remove(storage.path(name))
+        except FileNotFoundError:
+            pass
+        removed += 1
+        freed += size
+
+    temp_dir = storage.path(TEMP_DIR)
+    if os.path.isdir(temp_dir):
+        stale = time.time() - grace
+        for entry in os.scandir(temp_dir):
+            if entry.is_file() and entry.stat().st_mtime < stale:
+                os.remove(entry.path)
+
+    return removed, freed, repaired
+
+
+def savings():
+    """What deduplication saved: bytes uploaded vs bytes stored"""
+    from .models import Blob
+
+    blobs = list(Blob.objects.values_list('size', 'writes', 'ref_count'))
+    stored = sum(size for size, _, _ in blobs)
+    uploaded = sum(size * writes for size, writes, _ in blobs)
+    referenced = sum(size * max(ref_count, 0) for size, _, ref_count in blobs)
+    return {
+        'blobs': len(blobs),
+        'orphans': sum(1 for _, _, ref_count in blobs if ref_count <= 0),
+        'stored_bytes': stored,
+        'uploaded_bytes': uploaded,
+        'referenced_bytes': referenced,
+        'saved_bytes': uploaded - stored,
+        'dedup_ratio': round(uploaded / stored, 2) if stored else None,
+    }
+
+
+class BlobCollector(threading.Thread):
+    """Daemon thread that periodically collects orphaned blobs"""
+
+    def __init__(self, interval=None):
+        super().__init__(name='blob-collector', daemon=True)
+        self.interval = interval or settings.BLOB_GC_INTERVAL
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                removed, freed, repaired = collect()
+                logger.info("Collected blobs", extra={
+                    "event": "blobs.collected",
+                    "removed": removed,
+                    "freed_bytes": freed,
+                    "repaired": repaired,
+                    **savings(),
+                })
+            except Exception:
+                logger.exception("Blob collection failed", extra={"event": "blobs.error"})
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_collector = None
+_collector_lock = threading.Lock()
+
+
+def start_blob_collector():
+    """Start the process-wide collector once"""
+    global _collector
+    with _collector_lock:
+        if _collector is None or not _collector.is_alive():
+            _collector = BlobCollector()
+            _collector.start()
+    return _collector
@@ -0,0 +1,458 @@
+"""
+Process-local candidate index.
+
+Keeps a compact record of every approved professional, partitioned by
+category, so matching and category listings can be answered without a
+database round trip. The index is:
+
+- warmed once at startup by ``start_candidate_index`` (until then readers
+  fall back to the database and count a miss)
+- kept current by model signals and by the lock path (``locking.py``),
+  both applied after the surrounding transaction commits
+- checked against the database every ``CANDIDATE_INDEX_CHECK_INTERVAL``
+  seconds; writes made by other processes (or by ``QuerySet.update`` calls
+  that send no signals) are repaired there, which bounds staleness
+
+``metrics()`` reports hit rate, update counts and how stale the index was
+at the last consistency check.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Category, Professional, ProfessionalCategory
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL_SECONDS = getattr(settings, 'CANDIDATE_INDEX_CHECK_INTERVAL', 60)
+
+RECORD_FIELDS = (
+    'id', 'name', 'specialization', 'rate', 'available', 'online_status', 'locked_by',
+    'primary_category_id', 'category_name', 'average_rating', 'total_sessions', 'experience_years',
+    'email', 'phone', 'avg_response_time', 'success_rate', 'current_workload', 'max_workload',
+    'last_active', 'skills', 'category_ids',
+)
+
+# Attribute names match Professional, so scoring helpers accept either
+CandidateRecord = namedtuple('CandidateRecord', RECORD_FIELDS)
+CategoryEntry = namedtuple('CategoryEntry', ['id', 'name', 'enabled', 'icon', 'color', 'base_price', 'sort_order'])
+
+SKILL_KEYWORDS = ['consulting', 'advice', 'expert', 'specialist', 'professional']
+
+
+def professional_skills(specialization, bio):
+    """Extract skills from professional data"""
+    skills = []
+    if specialization:
+        skills.append(specialization)
+    if bio:
+        # Simple keyword extraction from bio
+        for keyword in SKILL_KEYWORDS:
+            if keyword in bio.lower():
+                skills.append(keyword.title())
+    return skills[:5]  # Return max 5 skills
+
+
+def load_records(queryset):
+    """Build records for a Professional queryset with two queries"""
+    rows = list(queryset.order_by().values(
+        'id', 'name', 'specialization', 'rate', 'available', 'online_status', 'locked_by',
+        'primary_category_id', 'primary_category__name', 'average_rating', 'total_sessions',
+        'experience_years', 'email', 'phone', 'avg_response_time', 'success_rate',
+        'current_workload', 'max_workload', 'last_active', 'bio',
+    ).distinct())
+
+    memberships = defaultdict(set)
+    for professional_id, category_id in ProfessionalCategory.objects.filter(
+        professional_id__in=queryset.order_by().values('id')
+    ).values_list('professional_id', 'category_id'):
+        memberships[professional_id].add(category_id)
+
+    records = []
+    for row in rows:
+        category_ids = memberships[row['id']]
+        if row['primary_category_id']:
+            category_ids.add(row['primary_category_id'])
+        records.append(CandidateRecord(
+            id=row['id'],
+            name=row['name'],
+            specialization=row['specialization'],
+            rate=float(row['rate']),
+            available=row['available'],
+            online_status=row['online_status'],
+            locked_by=row['locked_by'],
+            primary_category_id=row['primary_category_id'],
+            category_name=row['primary_category__name'],
+            average_rating=float(row['average_rating']),
+            total_sessions=row['total_sessions'],
+            experience_years=row['experience_years'],
+            email=row['email'],
+            phone=row['phone'],
+            avg_response_time=row['avg_response_time'],
+            success_rate=row['success_rate'],
+            current_workload=row['current_workload'],
+            max_workload=row['max_workload'],
+            last_active=row['last_active'],
+            skills=tuple(professional_skills(row['specialization'], row['bio'])),
+            category_ids=frozenset(category_ids),
+        ))
+    return sorted(records, key=_display_order)
+
+
+def load_categories(queryset=None):
+    queryset = Category.objects.all() if queryset is None else queryset
+    return [
+        CategoryEntry(**row) for row in queryset.values(
+            'id', 'name', 'enabled', 'icon', 'color', 'base_price', 'sort_order'
+        )
+    ]
+
+
+def feature_rows(records):
+    """Records as matching.FEATURE_FIELDS tuples"""
+    return [
+        (r.id, r.online_status, r.available, r.average_rating, r.experience_years, r.avg_response_time, r.rate)
+        for r in records
+    ]
+
+
+def _display_order(record):
+    # Professional.Meta.ordering is ['name']; id keeps equal names stable
+    return (record.name, record.id)
+
+
+def _approved():
+    return Professional.objects.filter(status='approved')
+
+
+class CandidateIndex:
+    """Approved professionals by category, held in memory"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._records = {}
+        self._members = defaultdict(set)  # category id -> professional ids
+        self._categories = {}
+        self._loading = False
+        self._dirty = set()  # professionals changed while a full load was running
+        self.ready = False
+
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+        self.warmed_at = None
+        self.synced_at = None
+        self.last_check = None
+
+    # Loading ------------------------------------------------------------
+
+    def warm(self):
+        """Load every approved professional and category. Returns (professionals, categories)"""
+        started = time.monotonic()
+        with self._lock:
+            self._loading = True
+            self._dirty.clear()
+        try:
+            records = load_records(_approved())
+            categories = load_categories()
+        except Exception:
+            with self._lock:
+                self._loading = False
+            raise
+
+        with self._lock:
+            self._loading = False
+            self._records = {}
+            self._members = defaultdict(set)
+            for record in records:
+                self._put(record)
+            self._categories = {entry.id: entry for entry in categories}
+            self.ready = True
+            self.warmed_at = self.synced_at = timezone.now()
+            dirty, self._dirty = self._dirty, set()
+
+        # Anything written while we were reading may have been missed
+        if dirty:
+            self.refresh(dirty)
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        logger.info("Candidate index warmed", extra={
+            "event": "candidate_index.warmed",
+            "professionals": len(records),
+            "categories": len(categories),
+            "elapsed_ms": round(elapsed_ms)
+        })
+        return len(records), len(categories)
+
+    def _put(self, record):
+        old = self._records.get(record.id)
+        if old is not None:
+            for category_id in old.category_ids - record.category_ids:
+                self._members[category_id].discard(record.id)
+        for category_id in record.category_ids:
+            self._members[category_id].add(record.id)
+        self._records[record.id] = record
+
+    def _drop(self, professional_id):
+        old = self._records.pop(professional_id, None)
+        if old is not None:
+            for category_id in old.category_ids:
+                self._members[category_id].discard(professional_id)
+
+    def _tracking(self):
+        return self.ready or self._loading
+
+    # Updates ------------------------------------------------------------
+
+    def refresh(self, professional_ids):
+        """Re-read professionals from the database; unapproved or deleted ones are dropped"""
+        professional_ids = set(professional_ids)
+        with self._lock:
+            if not professional_ids or not self._tracking():
+                return
+            if self._loading:
+                self._dirty |= professional_ids
+                return
+
+        records = load_records(_approved().filter(id__in=professional_ids))
+        with self._lock:
+            for record in records:
+                self._put(record)
+            for professional_id in professional_ids - {record.id for record in records}:
+                self._drop(professional_id)
+            self.updates += len(professional_ids)
+
+    def refresh_category_members(self, category_id):
+        """Re-read everyone filed under a category, e.g. after it was renamed or deleted"""
+        with self._lock:
+            members = set(self._members.get(category_id, ()))
+        self.refresh(members)
+
+    def remove(self, professional_id):
+        with self._lock:
+            if self._loading:
+                self._dirty.add(professional_id)
+            self._drop(professional_id)
+            self.updates += 1
+
+    def set_lock_state(self, professional_id, locked_by, available):
+        """Apply a lock change without reading the row back"""
+        with self._lock:
+            if self._loading:
+                self._dirty.add(professional_id)
+            record = self._records.get(professional_id)
+            if record is not None:
+                self._records[professional_id] = record._replace(locked_by=locked_by, available=available)
+                self.updates += 1
+
+    def refresh_categories(self, category_ids):
+        category_ids = set(category_ids)
+        with self._lock:
+            if not self.ready:
+                return
+        entries = load_categories(Category.objects.filter(id__in=category_ids))
+        with self._lock:
+            for entry in entries:
+                self._categories[entry.id] = entry
+            for category_id in category_ids - {entry.id for entry in entries}:
+                self._categories.pop(category_id, None)
+            self.updates += len(category_ids)
+
+    def after_commit(self, method, *args):
+        """Run an update once the current transaction commits"""
+        if self._tracking():
+            transaction.on_commit(lambda: method(*args))
+
+    # Reads --------------------------------------------------------------
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit
+
+    def _sorted(self, ids, available_only):
+        records = (self._records[i] for i in ids)
+        if available_only:
+            records = (r for r in records if r.available)
+        return sorted(records, key=_display_order)
+
+    def candidates_for_category(self, category_id, available_only=True):
+        """(CategoryEntry, records) for a category id, or None on a miss"""
+        with self._lock:
+            try:
+                category = self._categories.get(int(category_id)) if self.ready else None
+            except (TypeError, ValueError):
+                category = None
+            if not self._count(category is not None):
+                return None
+            return category, self._sorted(self._members.get(category.id, ()), available_only)
+
+    def candidates_for_name(self, name, available_only=True):
+        """
+        Records filed under a category name (case-insensitive) or whose
+        specialization contains it, or None on a miss
+        """
+        with self._lock:
+            if not self._count(self.ready):
+                return None
+            needle = name.lower()
+            ids = set()
+            for category in self._categories.values():
+                if category.name.lower() == needle:
+                    ids |= self._members.get(category.id, set())
+            ids.update(r.id for r in self._records.values() if needle in (r.specialization or '').lower())
+            return self._sorted(ids, available_only)
+
+    def category_counts(self, available_only=True):
+        """[(CategoryEntry, professional count)] for enabled categories, or None on a miss"""
+        with self._lock:
+            if not self._count(self.ready):
+                return None
+            counts = []
+            for category in sorted(self._categories.values(), key=lambda c: (c.sort_order, c.name)):
+                if not category.enabled:
+                    continue
+                members = (self._records[i] for i in self._members.get(category.id, ()))
+                counts.append((category, sum(1 for r in members if r.available or not available_only)))
+            return counts
+
+    # Consistency --------------------------------------------------------
+
+    def check(self, repair=True):
+        """
+        Compare the index with the database. Returns a report of missing,
+        extra and stale professionals and categories; repairs them by default
+        """
+        with self._lock:
+            if not self.ready:
+                return None
+            self._loading = True
+            self._dirty.clear()
+        try:
+            records = {record.id: record for record in load_records(_approved())}
+            categories = {entry.id: entry for entry in load_categories()}
+        except Exception:
+            with self._lock:
+                self._loading = False
+            raise
+
+        with self._lock:
+            self._loading = False
+            dirty, self._dirty = self._dirty, set()
+            # Rows touched during the check are refreshed below, not reported
+            indexed = {i: r for i, r in self._records.items() if i not in dirty}
+            records = {i: r for i, r in records.items() if i not in dirty}
+
+            missing = sorted(records.keys() - indexed.keys())
+            extra = sorted(indexed.keys() - records.keys())
+            stale = sorted(i for i in records.keys() & indexed.keys() if records[i] != indexed[i])
+            stale_categories = sorted(
+                i for i in categories.keys() | self._categories.keys()
+                if categories.get(i) != self._categories.get(i)
+            )
+
+            if repair:
+                for professional_id in extra:
+                    self._drop(professional_id)
+                for professional_id in missing + stale:
+                    self._put(records[professional_id])
+                self._categories = categories
+
+            checked_at = timezone.now()
+            self.last_check = {
+                'checked_at': checked_at.isoformat(),
+                'seconds_since_previous_sync': (checked_at - self.synced_at).total_seconds(),
+                'professionals': len(records),
+                'missing': missing,
+                'extra': extra,
+                'stale': stale,
+                'stale_categories': stale_categories,
+                'stale_ratio': round((len(missing) + len(extra) + len(stale)) / max(len(records), 1), 4),
+                'repaired': repair,
+            }
+            if repair:
+                self.synced_at = checked_at
+
+        if dirty:
+            self.refresh(dirty)
+        return self.last_check
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'ready': self.ready,
+                'professionals': len(self._records),
+                'categories': len(self._categories),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'updates': self.updates,
+                'warmed_at': self.warmed_at.isoformat() if self.warmed_at else None,
+                'seconds_since_sync': (timezone.now() - self.synced_at).total_seconds() if self.synced_at else None,
+                'check_interval': CHECK_INTERVAL_SECONDS,
+                'last_check': self.last_check,
+            }
+
+
+candidate_index = CandidateIndex()
+
+
+class CandidateIndexMaintainer(threading.Thread):
+    """Daemon thread that warms the index, then periodically checks it"""
+
+    def __init__(self, interval=CHECK_INTERVAL_SECONDS):
+        super().__init__(name='candidate-index', daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            candidate_index.warm()
+        except Exception:
+            logger.exception("Candidate index warm-up failed", extra={"event": "candidate_index.error"})
+        finally:
+            close_old_connections()
+
+        while not self._stopped.wait(self.interval):
+            try:
+                if not candidate_index.ready:
+                    candidate_index.warm()
+                    continue
+                report = candidate_index.check()
+                drift = len(report['missing']) + len(report['extra']) + len(report['stale'])
+                if drift or report['stale_categories']:
+                    logger.info("Candidate index repaired", extra={
+                        "event": "candidate_index.repaired",
+                        "professionals": drift,
+                        "categories": len(report['stale_categories'])
+                    })
+            except Exception:
+                logger.exception("Candidate index check failed", extra={"event": "candidate_index.error"})
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_maintainer = None
+_maintainer_lock = threading.Lock()
+
+
+def start_candidate_index():
+    """Warm the process-wide index in the background and keep checking it"""
+    global _maintainer
+    with _maintainer_lock:
+        if _maintainer is None or not _maintainer.is_alive():
+            _maintainer = CandidateIndexMaintainer()
+            _maintainer.start()
+    return _maintainer
@@ -0,0 +1,236 @@
+"""
+Channel layer over a Redis-protocol server.
+
+``InMemoryChannelLayer`` only reaches consumers in the same process, so with
+several ASGI workers a client's SessionConsumer and the professional's
+dashboard socket may never hear each other. Setting
+``CHANNEL_LAYER_REDIS_URL`` switches ``CHANNEL_LAYERS`` to this layer, which
+shares channels and groups through Redis (or the stand-in in
+redis_standin.py):
+
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'quickconnect.channel_layer.RedisChannelLayer',
+            'CONFIG': {'url': 'redis://localhost:6379/0'},
+        }
+    }
+
+Layout in Redis:
+
+- every worker process has one inbox list. Consumer channels are named
+  ``specific.<process id>!<local part>``; a message for one of them is pushed
+  onto the owning process's inbox and a single BLPOP loop per process hands
+  it to the right socket.
+- groups are sorted sets of channel names scored by when they joined.
+  Members older than ``group_expiry`` are dropped on the next send.
+- ``group_send`` pushes one copy of the message per worker process that has
+  members in the group, carrying the names of that process's channels,
+  rather than one copy per socket. Fanning out to 10k sockets spread over
+  4 workers costs 4 RPUSHes.
+
+Messages are encoded with msgpack. Inboxes expire ``expiry`` seconds after
+their last write, so the backlog of a dead worker does not pile up.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.core.exceptions import ImproperlyConfigured
+
+CHANNELS_KEY = '__asgi_channels__'
+
+
+class RedisChannelLayer(BaseChannelLayer):
+    """Channel layer shared by every process connected to one Redis server"""
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='quickconnect:channels:', expiry=60,
+                 group_expiry=86400, capacity=100, channel_capacity=None, blpop_timeout=1, **options):
+        try:
+            import msgpack
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured("RedisChannelLayer requires the 'redis' and 'msgpack' packages")
+        super().__init__(expiry=expiry, capacity=capacity)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self._msgpack = msgpack
+        self._redis = redis.asyncio
+        self.url = url
+        self.prefix = prefix
+        self.group_expiry = group_expiry
+        self.blpop_timeout = blpop_timeout
+        self.options = options
+        self.process_id = uuid.uuid4().hex[:12]
+
+        # State of the event loop consumers receive on
+        self._loop = None
+        self._client = None
+        self._reader = None
+        self._queues = {}  # channel -> asyncio.Queue, for every channel handed out here
+
+    # Helpers ------------------------------------------------------------
+
+    def _key(self, name):
+        return f'{self.prefix}{name}'
+
+    def _group_key(self, group):
+        return f'{self.prefix}group:{group}'
+
+    def _encode(self, message):
+        return self._msgpack.packb(message, use_bin_type=True)
+
+    def _decode(self, data):
+        return self._msgpack.unpackb(data, raw=False)
+
+    def _new_client(self):
+        return self._redis.Redis.from_url(self.url, **self.options)
+
+    @asynccontextmanager
+    async def _connection(self):
+        if asyncio.get_running_loop() is self._loop:
+            yield self._client
+            return
+        # A one-off loop, e.g. async_to_sync() from a worker thread: the
+        # connection can't outlive it
+        client = self._new_client()
+        try:
+            yield client
+        finally:
+            await client.aclose()
+
+    def _adopt_loop(self):
+        """Bind the receive side to the running loop"""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        if self._loop is not None and not self._loop.is_closed():
+            raise RuntimeError('RedisChannelLayer receives on one event loop per process')
+        if self._loop is not None:
+            # The previous loop is closed and its sockets with it
+            self._queues = {}
+        self._loop = loop
+        self._client = self._new_client()
+        self._reader = None
+
+    # Channels -----------------------------------------------------------
+
+    async def new_channel(self, prefix='specific'):
+        # Everything after the ! is local, so every channel lands in this process's inbox
+        channel = f'specific.{self.process_id}!{prefix}.{uuid.uuid4().hex}'
+        # Buffer from now on, even before the consumer first calls receive()
+        self._queues[channel] = asyncio.Queue()
+        return channel
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel)
+        inbox = self._key(self.non_local_name(channel))
+        async with self._connection() as client:
+            # Process inboxes are shared by all of a worker's sockets, so
+            # capacity only applies to plain named channels
+            if '!' not in channel and await client.llen(inbox) >= self.get_capacity(channel):
+                raise ChannelFull(channel)
+            await self._push(client, {inbox: [channel]}, message)
+
+    async def _push(self, client, targets, message):
+        """RPUSH one copy of message per inbox, naming the channels it is for"""
+        async with client.pipeline(transaction=False) as pipe:
+            for inbox, channels in targets.items():
+                pipe.rpush(inbox, self._encode({**message, CHANNELS_KEY: channels}))
+                pipe.expire(inbox, self.expiry)
+            await pipe.execute()
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        self._adopt_loop()
+        if '!' not in channel:
+            # Plain named channel: pop straight off its list
+            while True:
+                popped = await self._client.blpop([self._key(channel)], timeout=self.blpop_timeout)
+                if popped:
+                    message = self._decode(popped[1])
+                    message.pop(CHANNELS_KEY, None)
+                    return message
+
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = asyncio.Queue()
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.ensure_future(self._read_inbox())
+        try:
+            return await queue.get()
+        except asyncio.CancelledError:
+            # The consumer is gone; nothing more will be read for it
+            self._queues.pop(channel, None)
+            raise
+
+    async def _read_inbox(self):
+        """Move messages from this process's inbox to the sockets they are for"""
+        inbox = self._key(f'specific.{self.process_id}!')
+        while self._queues:
+            popped = await self._client.blpop([inbox], timeout=self.blpop_timeout)
+            if not popped:
+                continue
+            message = self._decode(popped[1])
+            for channel in message.pop(CHANNELS_KEY):
+                queue = self._queues.get(channel)
+                if queue is not None:
+                    queue.put_nowait(dict(message))
+
+    # Groups -------------------------------------------------------------
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group)
+        assert self.valid_channel_name(channel)
+        key = self._group_key(group)
+        async with self._connection() as client:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.zadd(key, {channel: time.time()})
+                pipe.expire(key, self.group_expiry)
+                await pipe.execute()
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group)
+        assert self.valid_channel_name(channel)
+        async with self._connection() as client:
+            await client.zrem(self._group_key(group), channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_group_name(group)
+        key = self._group_key(group)
+        async with self._connection() as client:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.zremrangebyscore(key, 0, time.time() - self.group_expiry)
+                pipe.zrange(key, 0, -1)
+                _, members = await pipe.execute()
+
+            # One copy per worker process (or plain channel) in the group
+            targets = defaultdict(list)
+            for member in members:
+                channel = member.decode()
+                targets[self._key(self.non_local_name(channel))].append(channel)
+            if targets:
+                await self._push(client, targets, message)
+
+    # Flush extension ----------------------------------------------------
+
+    async def flush(self):
+        async with self._connection() as client:
+            keys = await client.keys(f'{self.prefix}*')
+            if keys:
+                await client.delete(*keys)
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._loop = None
@@ -0,0 +1,192 @@
+"""
+Incremental chat message fetch for the polling endpoints.
+
+``api/sessions/<id>/messages/`` used to return the whole conversation on
+every poll. Messages are now read in pages keyed by message id:
+
+- ``?since=<cursor or ISO timestamp>``: messages after the cursor, oldest first
+- ``?before=<id>``: the page of messages just before ``before``, for
+  scrolling back through history
+- neither: the latest page
+
+Every page carries ``next_since`` / ``prev_before`` cursors for the next
+request; clients pass them back as they are. With ``?wait=<seconds>`` a
+``since`` request that finds nothing new is held open until a message
+arrives or the wait (capped at ``CHAT_LONG_POLL_MAX_WAIT``) runs out.
+Messages saved in this process wake the waiters immediately; messages saved
+by other processes are picked up by a re-check every ``RECHECK_INTERVAL``
+seconds. A held poll occupies a worker thread, so only
+``CHAT_LONG_POLL_MAX_WAITERS`` polls wait at once in a process; the rest get
+their page straight away.
+
+Ids are taken when a batch is inserted, not when it commits, so a batch
+from another process can become visible after a later batch with higher
+ids. An id cursor therefore isn't just the highest id delivered: it also
+lists the ids delivered among the last ``CURSOR_WINDOW`` ids
+(``<high>:<floor>:<id>,<id>,...``), and the next read returns any other
+message that has since appeared above ``floor``. Such late messages come
+first in the page, with ids lower than ones the client already has.
+"""
+
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatMessage
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+LONG_POLL_MAX_WAIT = getattr(settings, 'CHAT_LONG_POLL_MAX_WAIT', 25)
+LONG_POLL_MAX_WAITERS = getattr(settings, 'CHAT_LONG_POLL_MAX_WAITERS', 16)
+RECHECK_INTERVAL = 1.0
+CURSOR_WINDOW = 500
+
+ID_CURSOR = re.compile(r'^(\d+)(?::(\d+):([\d,]*))?$')
+
+MESSAGE_FIELDS = ('id', 'message', 'sender_type', 'created_at')
+
+
+def serialize_message(row):
+    """Client-facing message from a MESSAGE_FIELDS ``values()`` dict"""
+    return {
+        'id': row['id'],
+        'content': row['message'],
+        'sender': row['sender_type'],
+        'timestamp': row['created_at'].isoformat(),
+    }
+
+
+def parse_cursor(since):
+    """(floor, high, delivered ids) of an id cursor, or None for a timestamp"""
+    match = ID_CURSOR.match(since)
+    if match is None:
+        return None
+    high = int(match.group(1))
+    if match.group(2) is None:
+        # A bare id: everything up to it was delivered
+        return high, high, set()
+    return int(match.group(2)), high, {int(i) for i in match.group(3).split(',') if i}
+
+
+def since_filter(since):
+    """Q for messages after a ``since`` cursor: an id cursor or an ISO timestamp"""
+    cursor = parse_cursor(since)
+    if cursor is not None:
+        floor, _, delivered = cursor
+        return Q(id__gt=floor) & ~Q(id__in=delivered)
+    moment = parse_datetime(since)
+    if moment is None:
+        raise ValueError(f"Invalid since cursor '{since}'")
+    return Q(created_at__gt=moment)
+
+
+def page_size(value):
+    return min(max(int(value), 1), MAX_PAGE_SIZE) if value else PAGE_SIZE
+
+
+def fetch_page(session_id, since=None, before=None, limit=PAGE_SIZE):
+    """
+    One page of a session's messages in chronological order.
+
+    Returns (rows, has_more): with ``since`` ``has_more`` means newer
+    messages remain, otherwise that older ones do.
+    """
+    messages = ChatMessage.objects.filter(session_id=session_id).values(*MESSAGE_FIELDS)
+    if since is not None:
+        rows = list(messages.filter(since_filter(since)).order_by('id')[:limit + 1])
+        return rows[:limit], len(rows) > limit
+
+    if before is not None:
+        messages = messages.filter(id__lt=int(before))
+    rows = list(messages.order_by('-id')[:limit + 1])
+    return rows[:limit][::-1], len(rows) > limit
+
+
+def next_since(rows, since=None):
+    """The id cursor that follows a page read after ``since``"""
+    cursor = parse_cursor(since) if since is not None else None
+    if cursor is None:
+        if not rows:
+            return since
+        # Latest, ``before`` or timestamp page: the client has what precedes it
+        cursor = (rows[0]['id'] - 1, rows[0]['id'] - 1, set())
+    floor, high, delivered = cursor
+
+    ids = {row['id'] for row in rows}
+    high = max(high, *ids) if ids else high
+    floor = max(floor, high - CURSOR_WINDOW)
+    delivered = sorted(i for i in delivered | ids if i > floor)
+    if floor == high:
+        return str(high)
+    return f"{high}:{floor}:{','.join(map(str, delivered))}"
+
+
+def cursors(rows, since=None):
+    """``next_since`` / ``prev_before`` for a page"""
+    return {
+        'next_since': next_since(rows, since),
+        'prev_before': str(rows[0]['id']) if rows else None,
+    }
+
+
+class MessageSignal:
+    """Wakes long-polls waiting on a session when a message is saved"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}  # session id -> [event, waiters]
+
+    def subscribe(self, session_id):
+        with self._lock:
+            entry = self._events.setdefault(session_id, [threading.Event(), 0])
+            entry[1] += 1
+            return entry[0]
+
+    def unsubscribe(self, session_id, event):
+        with self._lock:
+            entry = self._events.get(session_id)
+            if entry is not None and entry[0] is event:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._events[session_id]
+
+    def notify(self, session_id):
+        # Waiters keep their reference to the old event; the next ones get a new one
+        with self._lock:
+            entry = self._events.pop(session_id, None)
+        if entry is not None:
+            entry[0].set()
+
+    def waiting(self):
+        with self._lock:
+            return sum(count for _, count in self._events.values())
+
+
+message_signal = MessageSignal()
+# Polls allowed to hold their worker thread at the same time
+waiter_slots = threading.BoundedSemaphore(LONG_POLL_MAX_WAITERS)
+
+
+def wait_for_page(session_id, since, limit=PAGE_SIZE, timeout=0):
+    """fetch_page(since=...) that waits up to ``timeout`` seconds for a non-empty page"""
+    if timeout <= 0 or not waiter_slots.acquire(blocking=False):
+        return fetch_page(session_id, since=since, limit=limit)
+    try:
+        deadline = time.monotonic() + min(timeout, LONG_POLL_MAX_WAIT)
+        while True:
+            # Subscribe before reading so a message saved in between still wakes us
+            event = message_signal.subscribe(session_id)
+            try:
+                rows, has_more = fetch_page(session_id, since=since, limit=limit)
+                remaining = deadline - time.monotonic()
+                if rows or remaining <= 0:
+                    return rows, has_more
+                event.wait(min(remaining, RECHECK_INTERVAL))
+            finally:
+                message_signal.unsubscribe(session_id, event)
+    finally:
+        waiter_slots.release()
@@ -0,0 +1,207 @@
+"""
+Write-behind persistence for chat messages.
+
+Chat sent over ``ws/session/...`` and through ``send_message_api`` is not
+INSERTed one row at a time. Writers hand messages to ``chat_writer``, which
+buffers them and stores everything pending with a single ``bulk_create``
+when ``CHAT_FLUSH_BATCH_SIZE`` messages are waiting or
+``CHAT_FLUSH_INTERVAL`` seconds after the first one arrived, whichever
+comes first:
+
+    stored = chat_writer.submit(session_id, 'hello', 'client')  # consumers: await asyncio.wrap_future(stored)
+    message_id = chat_writer.write_sync(session_id, 'hello', 'professional')  # views
+
+The Future resolves (and ``write_sync`` returns) only once the batch holding
+the message has committed, so a ``message_sent`` acknowledgement always
+means the message is stored. If the batch fails, the Future raises and
+nothing is acknowledged. If it is merely slow, ``write_sync`` gives up
+waiting after ``WRITE_TIMEOUT_SECONDS`` but the message stays queued and is
+stored with its batch.
+
+Flushes run one at a time in a process (the background thread, a
+disconnecting socket and exit can all ask for one), so batches commit in
+the order their ids were taken. Across processes they can't be ordered;
+``chat_feed`` cursors allow for that.
+
+Pending messages are flushed when a session socket disconnects and when the
+process exits. ``metrics()`` reports batch sizes and how long messages
+waited to become durable.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .chat_feed import message_signal
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = getattr(settings, 'CHAT_FLUSH_INTERVAL', 0.05)
+FLUSH_BATCH_SIZE = getattr(settings, 'CHAT_FLUSH_BATCH_SIZE', 100)
+WRITE_TIMEOUT_SECONDS = 10
+SAMPLES = 1000
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ChatWriter:
+    """Buffers chat messages and stores them in batches"""
+
+    def __init__(self, batch_size=FLUSH_BATCH_SIZE, interval=FLUSH_INTERVAL_SECONDS):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one batch in flight at a time
+        self._pending = []  # (ChatMessage, Future, enqueued at)
+        self._arrived = threading.Event()
+        self._full = threading.Event()
+        self._thread = None
+
+        # Counters and samples for metrics()
+        self.messages = 0
+        self.flushes = 0
+        self.failures = 0
+        self._batch_sizes = deque(maxlen=SAMPLES)
+        self._latencies = deque(maxlen=SAMPLES)  # enqueue -> durable, ms
+        self._flush_times = deque(maxlen=SAMPLES)  # bulk_create + commit, ms
+
+    # Writing ------------------------------------------------------------
+
+    def submit(self, session_id, message, sender_type, message_type='text', message_id=None):
+        """Queue a message; the returned Future resolves to its id once stored"""
+        chat_message = ChatMessage(
+            session_id=session_id,
+            message=message,
+            content=message,  # bulk_create skips ChatMessage.save()
+            sender_type=sender_type,
+            message_type=message_type,
+            message_id=message_id,
+        )
+        future = Future()
+        with self._lock:
+            self._pending.append((chat_message, future, time.monotonic()))
+            pending = len(self._pending)
+
+        # Flushing happens on the writer thread, never on the caller's event loop
+        self._ensure_thread()
+        self._arrived.set()
+        if pending >= self.batch_size:
+            self._full.set()
+        return future
+
+    def write_sync(self, session_id, message, sender_type, message_type='text', message_id=None):
+        """
+        Store a message from sync code; returns its id once durable. Raises
+        concurrent.futures.TimeoutError if its batch hasn't committed within
+        WRITE_TIMEOUT_SECONDS, although the message is still stored with it.
+        """
+        future = self.submit(session_id, message, sender_type, message_type, message_id)
+        return future.result(WRITE_TIMEOUT_SECONDS)
+
+    def flush(self):
+        """Store everything pending now. Returns the number of messages written"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._full.clear()
+        if not batch:
+            return 0
+
+        started = time.monotonic()
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create([message for message, _, _ in batch])
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            logger.error("Chat flush failed", extra={"event": "chat.flush_failed", "messages": len(batch), "error": str(e)})
+            return 0
+
+        durable = time.monotonic()
+        with self._lock:
+            self.messages += len(batch)
+            self.flushes += 1
+            self._batch_sizes.append(len(batch))
+            self._flush_times.append((durable - started) * 1000)
+            self._latencies.extend((durable - enqueued) * 1000 for _, _, enqueued in batch)
+
+        sessions = set()
+        for message, future, _ in batch:
+            sessions.add(message.session_id)
+            future.set_result(message.id)
+        # bulk_create sends no post_save, so wake the long-polls here
+        for session_id in sessions:
+            message_signal.notify(session_id)
+        return len(batch)
+
+    # Metrics ------------------------------------------------------------
+
+    def metrics(self):
+        with self._lock:
+            sizes = sorted(self._batch_sizes)
+            latencies = sorted(self._latencies)
+            flush_times = sorted(self._flush_times)
+            return {
+                'batch_size_limit': self.batch_size,
+                'flush_interval_ms': self.interval * 1000,
+                'pending': len(self._pending),
+                'messages': self.messages,
+                'flushes': self.flushes,
+                'failures': self.failures,
+                'batch_size': {
+                    'mean': round(sum(sizes) / len(sizes), 2) if sizes else None,
+                    'p50': _percentile(sizes, 0.50),
+                    'max': sizes[-1] if sizes else None,
+                },
+                'durable_latency_ms': {
+                    'p50': _percentile(latencies, 0.50),
+                    'p90': _percentile(latencies, 0.90),
+                    'p99': _percentile(latencies, 0.99),
+                },
+                'flush_ms': {
+                    'p50': _percentile(flush_times, 0.50),
+                    'p99': _percentile(flush_times, 0.99),
+                },
+            }
+
+    # Background flusher -------------------------------------------------
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='chat-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._arrived.wait()
+            # Give the batch until the interval ends or it fills up
+            self._full.wait(self.interval)
+            self._arrived.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Chat writer failed", extra={"event": "chat.error"})
+            finally:
+                close_old_connections()
+
+
+chat_writer = ChatWriter()
+# Don't lose messages still sitting in memory when the process exits
+atexit.register(chat_writer.flush)
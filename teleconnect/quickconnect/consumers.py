@@ -1,31 +1,45 @@
+import asyncio
 import json
+import logging
 import uuid
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.authtoken.models import Token
 from .models import Professional, Session
+from . import locking
+from .dispatch import Ticket, dispatcher
+from .chat_writer import WRITE_TIMEOUT_SECONDS, chat_writer
+from .professional_feed import pending_requests, professional_group, session_group
+from .roster import ROSTER_GROUP, build_snapshot, current_version
+from .session_lifecycle import LIVE_STATUSES, OPEN_STATUSES, InvalidTransition, can_transition, transition
+
+logger = logging.getLogger(__name__)
 
 
 class QuickConnectConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.client_id = None
+        self.roster_version = 0
+        self.leases = {}  # professional id -> fencing token
+        # Versioned snapshots and deltas; otherwise the original bare array
+        self.delta_protocol = False
 
     async def connect(self):
         await self.accept()
-        print("✅ WebSocket connected - QuickConnect")
-        
-        # Immediately send ALL professionals without any filtering
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.delta_protocol = query.get('protocol', [None])[0] == 'delta'
+        logger.info("QuickConnect socket connected", extra={"event": "ws.connect", "consumer": "quick_connect", "delta_protocol": self.delta_protocol})
+
+        if self.delta_protocol:
+            # Subscribe to roster deltas before taking the snapshot so nothing
+            # published in between is lost
+            await self.channel_layer.group_add(ROSTER_GROUP, self.channel_name)
+
         try:
-            professionals = await self.get_all_professionals()
-            if not professionals:
-                await self.send(text_data=json.dumps({
-                    "type": "error",
-                    "message": "No professionals found in database."
-                }))
-            else:
-                # Send as raw array to match frontend expectation
-                await self.send(text_data=json.dumps(professionals))
-                print(f"📨 Sent {len(professionals)} professionals to client")
+            await self.send_roster()
         except Exception as e:
             await self.send(text_data=json.dumps({
                 "type": "error", 
@@ -33,7 +47,9 @@ class QuickConnectConsumer(AsyncWebsocketConsumer):
             }))
 
     async def disconnect(self, close_code):
-        print(f"🔌 WebSocket disconnected - QuickConnect: {close_code}")
+        logger.info("QuickConnect socket disconnected", extra={"event": "ws.disconnect", "consumer": "quick_connect", "code": close_code, "client_id": self.client_id})
+        await self.channel_layer.group_discard(ROSTER_GROUP, self.channel_name)
+        dispatcher.cancel(channel_name=self.channel_name)
         if self.client_id:
             await self.release_professional_by_client(self.client_id)
 
@@ -41,9 +57,11 @@ class QuickConnectConsumer(AsyncWebsocketConsumer):
         try:
             data = json.loads(text_data)
             message_type = data.get("type")
-            self.client_id = data.get("client_id")
+            # Heartbeats and syncs may omit it; keep the client this socket already identified
+            if data.get("client_id"):
+                self.client_id = data["client_id"]
 
-            print(f"📨 Received: {message_type} from {self.client_id}")
+            logger.info("QuickConnect message received", extra={"event": "ws.receive", "consumer": "quick_connect", "type": message_type, "client_id": self.client_id})
 
             if message_type == "lock":
                 await self.handle_lock_professional(data)
@@ -51,10 +69,38 @@ class QuickConnectConsumer(AsyncWebsocketConsumer):
             elif message_type == "release":
                 await self.handle_release_professional(data)
                 
-            elif message_type == "get_available_professionals":
-                # Always return ALL professionals
-                professionals = await self.get_all_professionals()
-                await self.send(text_data=json.dumps(professionals))
+            elif message_type in ("get_available_professionals", "resync"):
+                # Client asked for a full refresh
+                await self.send_roster()
+                
+            elif message_type == "sync":
+                # Client reports the version it holds; only resend if stale
+                if data.get("version") == self.roster_version:
+                    await self.send(text_data=json.dumps({
+                        "type": "roster_in_sync",
+                        "version": self.roster_version
+                    }))
+                else:
+                    await self.send_roster_snapshot()
+                
+            elif message_type == "heartbeat":
+                renewed, lost = await self.renew_leases(self.client_id)
+                await self.send(text_data=json.dumps({
+                    "type": "heartbeat_ack",
+                    "renewed": renewed,
+                    "lost": lost
+                }))
+                
+            elif message_type == "request_match":
+                await self.handle_request_match(data)
+                
+            elif message_type == "cancel_match":
+                # Without a ticket_id every ticket of this connection is cancelled
+                cancelled = dispatcher.cancel(ticket_id=data.get("ticket_id"), channel_name=self.channel_name)
+                await self.send(text_data=json.dumps({
+                    "type": "match_cancelled",
+                    "tickets": cancelled
+                }))
                 
             elif message_type == "client_identification":
                 await self.send(text_data=json.dumps({
@@ -62,10 +108,15 @@ class QuickConnectConsumer(AsyncWebsocketConsumer):
                     "client_id": self.client_id
                 }))
                 
+            elif not self.delta_protocol:
+                # Original clients get the full list for anything else
+                await self.send_roster()
+                
             else:
-                # Default: send all professionals
-                professionals = await self.get_all_professionals()
-                await self.send(text_data=json.dumps(professionals))
+                await self.send(text_data=json.dumps({
+                    "type": "error",
+                    "message": f"Unknown message type: {message_type}"
+                }))
 
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
@@ -78,6 +129,42 @@ class QuickConnectConsumer(AsyncWebsocketConsumer):
                 "message": f"Server error: {str(e)}"
             }))
 
+    async def send_roster(self):
+        """Send the full roster in whichever format this client speaks"""
+        if self.delta_protocol:
+            await self.send_roster_snapshot()
+            return
+        snapshot = await self.get_roster_snapshot()
+        if not snapshot["professionals"]:
+            await self.send(text_data=json.dumps({
+                "type": "error",
+                "message": "No professionals found in database."
+            }))
+        else:
+            # Bare array, as the original mobile client expects
+            await self.send(text_data=json.dumps(snapshot["professionals"]))
+
+    async def send_roster_snapshot(self):
+        """Send the full roster and remember which version it covers"""
+        snapshot = await self.get_roster_snapshot()
+        self.roster_version = snapshot["version"]
+        await self.send(text_data=json.dumps(snapshot))
+        logger.info("Roster snapshot sent", extra={"event": "roster.snapshot", "professionals": len(snapshot["professionals"]), "version": self.roster_version})
+
+    async def roster_delta(self, event):
+        """Forward a roster change from the shared group"""
+        version = event["version"]
+        if version <= self.roster_version:
+            # Already covered by the snapshot this client holds
+            return
+        if version > self.roster_version + 1:
+            # Missed at least one delta - the client is behind, start over
+            logger.warning("Roster gap, resending snapshot", extra={"event": "roster.gap", "held": self.roster_version, "received": version})
+            await self.send_roster_snapshot()
+            return
+        self.roster_version = version
+        await self.send(text_data=json.dumps(event))
+
     async def handle_lock_professional(self, data):
         """Handle professional locking"""
         pro_id = data.get("professional_id")
@@ -89,83 +176,96 @@ class QuickConnectConsumer(AsyncWebsocketConsumer):
                 "type": "locked",
                 "professional": professional
             }))
-            print(f"🔒 Locked professional: {professional['name']}")
         else:
             await self.send(text_data=json.dumps({
                 "type": "error", 
                 "message": "Professional is not available or already locked."
             }))
 
+    async def handle_request_match(self, data):
+        """Queue this client for the next free professional in a category"""
+        try:
+            client_id = int(data.get("client_id"))
+            category_id = int(data.get("category_id"))
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({
+                "type": "error",
+                "message": "request_match needs a numeric client_id and category_id"
+            }))
+            return
+        
+        ticket = Ticket(
+            client_id=client_id,
+            category_id=category_id,
+            channel_name=self.channel_name,
+            session_type=data.get("session_type", "chat"),
+            urgency=data.get("urgency", "medium"),
+            preferences=data.get("preferences", {})
+        )
+        position = dispatcher.enqueue(ticket)
+        await self.send(text_data=json.dumps({
+            "type": "match_queued",
+            "ticket_id": ticket.ticket_id,
+            "category_id": category_id,
+            "urgency": ticket.urgency,
+            "position": position
+        }))
+        logger.info("Client queued for a match", extra={"event": "match.queued", "client_id": client_id, "category_id": category_id, "position": position})
+
+    async def dispatch_matched(self, event):
+        """The dispatcher locked a professional and opened a session for us"""
+        self.leases[event["professional"]["id"]] = event["token"]
+        await self.send(text_data=json.dumps({
+            "type": "matched",
+            "ticket_id": event["ticket_id"],
+            "session_id": event["session_id"],
+            "professional": event["professional"],
+            "matching_score": event["matching_score"],
+            "token": event["token"],
+            "expires_at": event["expires_at"],
+            "waited_ms": event["waited_ms"]
+        }))
+
     async def handle_release_professional(self, data):
         """Handle professional release"""
         pro_id = data.get("professional_id")
         client_id = data.get("client_id")
         
+        # Delta clients, including this one, learn about it via the roster group
         await self.release_professional(pro_id, client_id)
-        # Send updated list after release
-        professionals = await self.get_all_professionals()
-        await self.send(text_data=json.dumps(professionals))
+        if not self.delta_protocol:
+            await self.send_roster()
 
     @sync_to_async
-    def get_all_professionals(self):
+    def get_roster_snapshot(self):
         """Get ALL professionals from database with consistent status"""
         try:
-            # Get ALL professionals without any filtering
-            professionals = Professional.objects.all().values(
-                "id", "name", "specialization", "rate", "available", 
-                "average_rating", "total_sessions", "status", "locked_by"
-            )
-            
-            professional_list = []
-            for pro in professionals:
-                # Ensure consistency: if locked_by exists, available should be False
-                is_locked = pro["locked_by"] is not None and pro["locked_by"] != ""
-                is_available = pro["available"] and not is_locked
-                
-                professional_list.append({
-                    "id": str(pro["id"]),
-                    "name": pro["name"], 
-                    "specialization": pro["specialization"],
-                    "rate": float(pro["rate"]),
-                    "available": is_available,  # Override with consistent value
-                    "lockedBy": pro["locked_by"],
-                    "experience": pro.get("total_sessions", 0),
-                    "rating": float(pro.get("average_rating", 0.0)),
-                    "status": pro.get("status", "unknown")
-                })
-            
-            print(f"🔍 Found {len(professional_list)} total professionals in database")
+            snapshot = build_snapshot()
+            professional_list = snapshot["professionals"]
             
-            # Debug: Print each professional with ALL details
-            print("🔍 All professionals with details:")
-            for pro in professional_list:
-                print(f"   👨‍💼 {pro['name']} - {pro['specialization']} - KSH {pro['rate']}/min - Status: {pro['status']} - Available: {pro['available']} - Locked: {pro['lockedBy']}")
+            # Per-row dump for debugging roster state; off in production
+            if settings.ROSTER_DEBUG_DUMP:
+                for pro in professional_list:
+                    logger.info("Roster row", extra={"event": "roster.row", "professional": pro})
             
-            return professional_list
+            return snapshot
             
-        except Exception as e:
-            print(f"❌ Error getting professionals: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return []
+        except Exception:
+            logger.exception("Error building roster snapshot", extra={"event": "roster.error"})
+            return {"type": "roster_snapshot", "version": current_version(), "professionals": []}
 
     @sync_to_async
     def lock_professional(self, pro_id, client_id):
         """Lock a professional for a client - with validation"""
         try:
-            pro = Professional.objects.get(id=pro_id)
-            
-            # Check if professional is already locked by someone else
-            if pro.locked_by and pro.locked_by != client_id:
-                print(f"❌ Professional {pro_id} already locked by: {pro.locked_by}")
+            lease = locking.acquire(pro_id, client_id)
+            if lease is None:
+                logger.info("Professional not found or already locked", extra={"event": "lock.refused", "professional_id": pro_id, "client_id": client_id})
                 return None
-                
-            # Update the professional
-            pro.locked_by = client_id
-            pro.available = False
-            pro.save()
+            self.leases[str(pro_id)] = lease.token
             
-            print(f"🔒 Successfully locked {pro.name} for client {client_id}")
+            pro = Professional.objects.get(id=pro_id)
+            logger.info("Professional locked", extra={"event": "lock.acquired", "professional_id": pro.id, "client_id": client_id})
             
             return {
                 "id": str(pro.id),
@@ -175,80 +275,98 @@ class QuickConnectConsumer(AsyncWebsocketConsumer):
                 "available": False,
                 "lockedBy": client_id,
                 "experience": pro.total_sessions,
-                "rating": float(pro.average_rating)
+                "rating": float(pro.average_rating),
+                "token": lease.token,
+                "expires_at": lease.expires_at.isoformat()
             }
                 
         except Professional.DoesNotExist:
-            print(f"❌ Professional {pro_id} not found")
+            logger.info("Professional not found", extra={"event": "lock.refused", "professional_id": pro_id, "client_id": client_id})
             return None
-        except Exception as e:
-            print(f"❌ Error locking professional: {str(e)}")
+        except Exception:
+            logger.exception("Error locking professional", extra={"event": "lock.error", "professional_id": pro_id})
             return None
 
+    @sync_to_async
+    def renew_leases(self, client_id):
+        """Extend every lease this connection holds"""
+        renewed, lost = [], []
+        for pro_id, token in list(self.leases.items()):
+            expires_at = locking.renew(pro_id, client_id, token)
+            if expires_at:
+                renewed.append({"id": pro_id, "expires_at": expires_at.isoformat()})
+            else:
+                lost.append(pro_id)
+                del self.leases[pro_id]
+        return renewed, lost
+
     @sync_to_async
     def release_professional(self, pro_id, client_id):
         """Release a professional"""
         try:
-            pro = Professional.objects.get(id=pro_id)
             # Only release if locked by this client
-            if pro.locked_by == client_id:
-                pro.locked_by = None
-                pro.available = True
-                pro.save()
-                print(f"🔓 Released professional: {pro.name}")
+            token = self.leases.pop(str(pro_id), None)
+            if locking.release(pro_id, client_id, token):
+                logger.info("Professional released", extra={"event": "lock.released", "professional_id": pro_id, "client_id": client_id})
             else:
-                print(f"⚠️  Professional {pro.name} not locked by client {client_id}")
-        except Professional.DoesNotExist:
-            print(f"❌ Professional {pro_id} not found for release")
-        except Exception as e:
-            print(f"❌ Error releasing professional: {str(e)}")
+                logger.warning("Professional not locked by this client", extra={"event": "lock.release_refused", "professional_id": pro_id, "client_id": client_id})
+        except Exception:
+            logger.exception("Error releasing professional", extra={"event": "lock.error", "professional_id": pro_id})
 
     @sync_to_async
     def release_professional_by_client(self, client_id):
         """Release all professionals locked by a client"""
         if client_id:
             try:
-                # Clean up any invalid lock values
-                professionals_to_release = Professional.objects.filter(
-                    locked_by=client_id
-                )
-                
-                released_count = 0
-                for pro in professionals_to_release:
-                    pro.locked_by = None
-                    pro.available = True
-                    pro.save()
-                    released_count += 1
-                    print(f"🔓 Released professional: {pro.name}")
-                
-                print(f"🔓 Released {released_count} professionals for client: {client_id}")
-                
-                # Also clean up any professionals with invalid lock values
-                invalid_locked = Professional.objects.filter(
-                    locked_by="PROFESSION"
-                )
-                for pro in invalid_locked:
-                    pro.locked_by = None
-                    pro.available = True
-                    pro.save()
-                    print(f"🔓 Cleaned invalid lock for: {pro.name}")
-                    
-            except Exception as e:
-                print(f"❌ Error releasing professionals by client: {str(e)}")
+                released = locking.release_all(client_id)
+                self.leases.clear()
+                logger.info("Released professionals for client", extra={"event": "lock.released_all", "client_id": client_id, "released": len(released)})
+            except Exception:
+                logger.exception("Error releasing professionals by client", extra={"event": "lock.error", "client_id": client_id})
 
 
 class SessionConsumer(AsyncWebsocketConsumer):
+    """
+    Client socket for one session.
+
+    Connect to ``ws/session/<session_id>/``. The older
+    ``ws/session/<professional_id>/<client_id>/`` route takes the id from
+    ``?session_id=`` or reattaches to the pair's newest open session, and
+    only creates one when there is none. Either way the Session is loaded
+    once on connect and kept on the consumer, so messages need no lookup.
+    A dropped session resumes in the status it had: ``in_progress`` once
+    the professional accepted, ``active`` before.
+
+    The channel-layer group is still keyed by the (professional, client)
+    pair, not the session id: the professional's dashboard addresses
+    answers and chat by client id (see professional_feed.py).
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.professional_id = None
         self.client_id = None
         self.session_group_name = None
+        self.session_id = None
+        self.session = None
+        self.pending_acks = set()  # tasks acknowledging chat messages once stored
 
     async def connect(self):
         try:
-            self.professional_id = self.scope['url_route']['kwargs']['professional_id']
-            self.client_id = self.scope['url_route']['kwargs']['client_id']
-            self.session_group_name = f'session_{self.professional_id}_{self.client_id}'
+            route = self.scope['url_route']['kwargs']
+            session_id = route.get('session_id') or self.handshake_session_id()
+            self.session, resumed = await self.attach_session(
+                session_id, route.get('professional_id'), route.get('client_id')
+            )
+            if self.session is None:
+                logger.warning("No open session for socket", extra={"event": "ws.rejected", "consumer": "session", "session_id": session_id, "professional_id": route.get('professional_id'), "client_id": route.get('client_id')})
+                await self.close()
+                return
+            
+            self.session_id = self.session.id
+            self.professional_id = str(self.session.professional_id)
+            self.client_id = str(self.session.client_id)
+            self.session_group_name = session_group(self.professional_id, self.client_id)
             
             # Join session group
             await self.channel_layer.group_add(
@@ -258,22 +376,21 @@ class SessionConsumer(AsyncWebsocketConsumer):
             
             await self.accept()
             
-            # Create session record
-            await self.create_session()
-            
             # Send connection confirmation
             await self.send(text_data=json.dumps({
                 'type': 'session_connected',
-                'message': 'Session started successfully',
-                'session_id': f'{self.professional_id}_{self.client_id}',
+                'message': 'Session resumed' if resumed else 'Session started successfully',
+                'session_id': self.session_id,
+                'resumed': resumed,
+                'status': self.session.status,
                 'professional_id': self.professional_id,
                 'client_id': self.client_id
             }))
             
-            print(f"✅ Session started: {self.session_group_name}")
+            logger.info("Session socket connected", extra={"event": "ws.connect", "consumer": "session", "session_id": self.session_id, "resumed": resumed, "professional_id": self.professional_id, "client_id": self.client_id})
             
-        except Exception as e:
-            print(f"❌ Session connection error: {str(e)}")
+        except Exception:
+            logger.exception("Session connection error", extra={"event": "session.error"})
             await self.close()
 
     async def disconnect(self, close_code):
@@ -285,18 +402,23 @@ class SessionConsumer(AsyncWebsocketConsumer):
                     self.channel_name
                 )
             
+            # Store any chat still waiting for a batch before closing the session
+            await sync_to_async(chat_writer.flush)()
+            if self.pending_acks:
+                await asyncio.gather(*self.pending_acks, return_exceptions=True)
+            
             # End session
             await self.end_session()
-            print(f"🔌 Session ended: {self.session_group_name}, code: {close_code}")
+            logger.info("Session socket disconnected", extra={"event": "ws.disconnect", "consumer": "session", "session_id": self.session_id, "code": close_code})
             
-        except Exception as e:
-            print(f"❌ Session disconnect error: {str(e)}")
+        except Exception:
+            logger.exception("Session disconnect error", extra={"event": "session.error", "session_id": self.session_id})
 
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
-            print(f"📨 Session received {message_type} from {self.client_id}")
+            logger.info("Session message received", extra={"event": "ws.receive", "consumer": "session", "type": message_type, "client_id": self.client_id})
             
             # Route message to appropriate handler
             handlers = {
@@ -314,20 +436,19 @@ class SessionConsumer(AsyncWebsocketConsumer):
             if handler:
                 await handler(data)
             else:
-                print(f"❓ Unknown session message type: {message_type}")
                 await self.send(text_data=json.dumps({
                     'type': 'error',
                     'message': f'Unknown message type: {message_type}'
                 }))
 
         except json.JSONDecodeError as e:
-            print(f"❌ Invalid JSON in session: {text_data}")
+            logger.warning("Invalid JSON on session socket", extra={"event": "ws.bad_json", "consumer": "session", "client_id": self.client_id})
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': 'Invalid message format'
             }))
         except Exception as e:
-            print(f"❌ Session receive error: {str(e)}")
+            logger.exception("Session receive error", extra={"event": "session.error", "session_id": self.session_id})
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': f'Server error: {str(e)}'
@@ -343,7 +464,7 @@ class SessionConsumer(AsyncWebsocketConsumer):
         
         # Notify professional about session confirmation
         await self.channel_layer.group_send(
-            f'professional_{self.professional_id}',
+            professional_group(self.professional_id),
             {
                 'type': 'session_confirmed',
                 'client_id': self.client_id,
@@ -368,12 +489,31 @@ class SessionConsumer(AsyncWebsocketConsumer):
         message_id = data.get('message_id', str(uuid.uuid4()))
         timestamp = data.get('timestamp')
         
-        # Save message to database
-        await self.save_chat_message(message_text, message_id, timestamp)
+        if self.session_id is None:
+            await self.send_message_failed(message_id, timestamp)
+            return
+        
+        # Queue the write right away so messages are stored in the order they
+        # arrived, and keep reading while the batch fills; the message is
+        # delivered and acknowledged once it is stored
+        stored = chat_writer.submit(self.session_id, message_text, 'client', message_id=message_id)
+        task = asyncio.ensure_future(self.deliver_chat_message(stored, message_text, message_id, timestamp))
+        self.pending_acks.add(task)
+        task.add_done_callback(self.pending_acks.discard)
+
+    async def deliver_chat_message(self, stored, message_text, message_id, timestamp):
+        """Forward and acknowledge a chat message once its batch committed"""
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(stored), WRITE_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error("Error saving chat message", extra={"event": "chat.error", "session_id": self.session_id, "message_id": message_id, "error": str(e)})
+            await self.send_message_failed(message_id, timestamp)
+            return
+        logger.info("Chat message saved", extra={"event": "chat.saved", "session_id": self.session_id, "message_id": message_id})
         
         # Notify professional about new message
         await self.channel_layer.group_send(
-            f'professional_{self.professional_id}',
+            professional_group(self.professional_id),
             {
                 'type': 'professional_chat_message',
                 'message': message_text,
@@ -391,6 +531,14 @@ class SessionConsumer(AsyncWebsocketConsumer):
             'timestamp': timestamp
         }))
 
+    async def send_message_failed(self, message_id, timestamp):
+        await self.send(text_data=json.dumps({
+            'type': 'message_failed',
+            'message_id': message_id,
+            'timestamp': timestamp,
+            'message': 'Message could not be saved, please resend'
+        }))
+
     async def handle_call_initiation(self, data):
         """Handle call initiation"""
         call_type = data.get('call_type', 'audio')
@@ -401,7 +549,7 @@ class SessionConsumer(AsyncWebsocketConsumer):
         
         # Notify professional about incoming call
         await self.channel_layer.group_send(
-            f'professional_{self.professional_id}',
+            professional_group(self.professional_id),
             {
                 'type': 'incoming_call',
                 'client_id': self.client_id,
@@ -429,7 +577,7 @@ class SessionConsumer(AsyncWebsocketConsumer):
         
         # Notify professional about call end
         await self.channel_layer.group_send(
-            f'professional_{self.professional_id}',
+            professional_group(self.professional_id),
             {
                 'type': 'call_ended',
                 'client_id': self.client_id,
@@ -461,7 +609,7 @@ class SessionConsumer(AsyncWebsocketConsumer):
         
         # Notify professional about session end
         await self.channel_layer.group_send(
-            f'professional_{self.professional_id}',
+            professional_group(self.professional_id),
             {
                 'type': 'session_ended',
                 'client_id': self.client_id,
@@ -480,7 +628,7 @@ class SessionConsumer(AsyncWebsocketConsumer):
     async def handle_client_paused(self, data):
         """Handle client app going to background"""
         await self.channel_layer.group_send(
-            f'professional_{self.professional_id}',
+            professional_group(self.professional_id),
             {
                 'type': 'client_paused',
                 'client_id': self.client_id,
@@ -526,81 +674,308 @@ class SessionConsumer(AsyncWebsocketConsumer):
             'reason': event.get('reason', 'Session completed')
         }))
 
+    def handshake_session_id(self):
+        """``?session_id=`` from the connect URL, if given"""
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        return query.get('session_id', [None])[0]
+
     # Database operations
     @sync_to_async
-    def create_session(self):
-        """Create a new session record"""
+    def attach_session(self, session_id, professional_id, client_id):
+        """The open session this socket is for, and whether it already existed"""
+        sessions = Session.objects.select_related('professional').filter(status__in=OPEN_STATUSES)
+        if session_id is not None:
+            session = sessions.filter(id=session_id).first()
+            if session is not None and professional_id is not None and (
+                    (str(session.professional_id), str(session.client_id)) != (professional_id, client_id)):
+                session = None
+        else:
+            # Pair route without an id: reconnects pick up where they left off
+            session = sessions.filter(
+                professional_id=professional_id, client_id=client_id
+            ).order_by('-created_at').first()
+            if session is None:
+                professional = Professional.objects.filter(id=professional_id).first()
+                if professional is None:
+                    return None, False
+                session = Session.objects.create(
+                    professional=professional,
+                    client_id=client_id,
+                    status='active',
+                    session_type='pending'
+                )
+                logger.info("Session record created", extra={"event": "session.created", "session_id": session.id, "professional_id": professional_id, "client_id": client_id})
+                return session, False
+        
+        if session is None:
+            return None, False
+        if session.status == 'disconnected':
+            try:
+                # Back to where it was: an accepted call has started
+                transition(session, 'in_progress' if session.actual_start else 'active')
+            except InvalidTransition:
+                # Settled or resumed elsewhere in the meantime
+                session = Session.objects.select_related('professional').filter(
+                    id=session.id, status__in=OPEN_STATUSES
+                ).first()
+        return session, session is not None
+
+    def apply_transition(self, status, **fields):
+        """transition() the cached session, reloading it once if its row moved on"""
         try:
-            professional = Professional.objects.get(id=self.professional_id)
-            Session.objects.create(
-                professional=professional,
-                client_id=self.client_id,
-                status='active',
-                session_type='pending'
-            )
-            print(f"✅ Session record created for {self.client_id} with {self.professional_id}")
-        except Professional.DoesNotExist:
-            print(f"❌ Professional {self.professional_id} not found")
-        except Exception as e:
-            print(f"❌ Session creation error: {str(e)}")
+            return transition(self.session, status, **fields)
+        except InvalidTransition as e:
+            if not can_transition(e.current, status):
+                raise
+        # Changed over HTTP or by another socket since we loaded it
+        self.session = Session.objects.select_related('professional').get(id=self.session_id)
+        return transition(self.session, status, **fields)
 
     @sync_to_async
     def update_session_type(self, session_type):
         """Update session type"""
-        try:
-            session = Session.objects.get(
-                professional_id=self.professional_id,
-                client_id=self.client_id,
-                status='active'
-            )
-            session.session_type = session_type
-            session.save()
-            print(f"✅ Session type updated to: {session_type}")
-        except Session.DoesNotExist:
-            print(f"❌ Active session not found for type update")
-
-    @sync_to_async
-    def save_chat_message(self, message_text, message_id, timestamp):
-        """Save chat message to database"""
-        try:
-            # You might want to create a ChatMessage model for this
-            # For now, we'll just log it
-            print(f"💬 Chat message saved: {message_text} (ID: {message_id})")
-        except Exception as e:
-            print(f"❌ Error saving chat message: {str(e)}")
+        if self.session is None:
+            return
+        self.session.session_type = session_type
+        self.session.save(update_fields=['session_type', 'updated_at'])
+        logger.info("Session type updated", extra={"event": "session.type", "session_id": self.session_id, "session_type": session_type})
 
     @sync_to_async
     def update_session(self, duration, cost):
         """Update session with final details"""
+        if self.session is None:
+            return
         try:
-            session = Session.objects.get(
-                professional_id=self.professional_id,
-                client_id=self.client_id,
-                status='active'
-            )
-            session.duration = duration
-            session.cost = cost
-            session.status = 'completed'
-            session.save()
-            print(f"✅ Session updated: {duration}min, KSH{cost}")
-        except Session.DoesNotExist:
-            print(f"❌ Active session not found for update")
-        except Exception as e:
-            print(f"❌ Error updating session: {str(e)}")
+            self.apply_transition('completed', duration=duration, cost=cost)
+            logger.info("Session completed", extra={"event": "session.completed", "session_id": self.session_id, "duration": duration, "cost": cost})
+        except InvalidTransition as e:
+            logger.warning("Session already closed", extra={"event": "session.closed", "session_id": self.session_id, "status": e.current})
+        except Exception:
+            logger.exception("Error updating session", extra={"event": "session.error", "session_id": self.session_id})
 
     @sync_to_async
     def end_session(self):
         """End session on disconnect"""
+        if self.session is None:
+            return
         try:
-            session = Session.objects.get(
-                professional_id=self.professional_id,
-                client_id=self.client_id,
-                status='active'
-            )
-            session.status = 'disconnected'
-            session.save()
-            print(f"🔌 Session marked as disconnected")
-        except Session.DoesNotExist:
+            self.apply_transition('disconnected')
+            logger.info("Session marked as disconnected", extra={"event": "session.disconnected", "session_id": self.session_id})
+        except InvalidTransition:
             pass  # Session might already be ended
+        except Exception:
+            logger.exception("Error ending session", extra={"event": "session.error", "session_id": self.session_id})
+
+
+class ProfessionalConsumer(AsyncWebsocketConsumer):
+    """Dashboard socket for one professional (see professional_feed.py)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.professional_id = None
+        self.group_name = None
+        self.pending_acks = set()  # tasks acknowledging chat messages once stored
+
+    async def connect(self):
+        self.professional_id = self.scope['url_route']['kwargs']['professional_id']
+        if not await self.professional_exists():
+            logger.warning("Professional not found", extra={"event": "ws.rejected", "consumer": "professional", "professional_id": self.professional_id})
+            await self.close()
+            return
+        
+        # Only the professional's own account (or staff) may follow their requests and chats
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        if not await self.may_follow((query.get('token') or [None])[0]):
+            logger.warning("Professional socket refused", extra={"event": "ws.rejected", "consumer": "professional", "professional_id": self.professional_id})
+            await self.close(code=4403)
+            return
+        
+        # Join the group before the snapshot so no request falls in between
+        self.group_name = professional_group(self.professional_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send_pending_requests()
+        logger.info("Professional socket connected", extra={"event": "ws.connect", "consumer": "professional", "professional_id": self.professional_id})
+
+    async def disconnect(self, close_code):
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if self.pending_acks:
+            await asyncio.gather(*self.pending_acks, return_exceptions=True)
+        logger.info("Professional socket disconnected", extra={"event": "ws.disconnect", "consumer": "professional", "professional_id": self.professional_id, "code": close_code})
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+            message_type = data.get('type')
+            logger.info("Professional message received", extra={"event": "ws.receive", "consumer": "professional", "type": message_type, "professional_id": self.professional_id})
+            
+            handlers = {
+                'call_accepted': self.handle_call_accepted,
+                'call_rejected': self.handle_call_rejected,
+                'chat_message': self.handle_chat_message,
+                'get_pending_requests': self.handle_get_pending_requests,
+            }
+            
+            handler = handlers.get(message_type)
+            if handler:
+                await handler(data)
+            else:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': f'Unknown message type: {message_type}'
+                }))
+
+        except json.JSONDecodeError:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Invalid message format'
+            }))
+        except Exception as e:
+            logger.exception("Professional receive error", extra={"event": "professional.error", "professional_id": self.professional_id})
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Server error: {str(e)}'
+            }))
+
+    async def send_pending_requests(self):
+        requests = await self.get_pending_requests()
+        await self.send(text_data=json.dumps({
+            'type': 'pending_requests',
+            'requests': requests,
+            'count': len(requests)
+        }))
+
+    async def handle_get_pending_requests(self, data):
+        await self.send_pending_requests()
+
+    async def handle_call_accepted(self, data):
+        """Tell the client's session socket the call was picked up"""
+        await self.answer_call(data, {'type': 'call_accepted'})
+
+    async def handle_call_rejected(self, data):
+        """Tell the client's session socket the call was declined"""
+        await self.answer_call(data, {'type': 'call_rejected', 'reason': data.get('reason', 'Busy')})
+
+    async def answer_call(self, data, event):
+        client_id = data.get('client_id')
+        if not client_id:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f"{event['type']} needs a client_id"
+            }))
+            return
+        
+        await self.channel_layer.group_send(session_group(self.professional_id, client_id), {
+            **event,
+            'professional_id': self.professional_id,
+            'timestamp': data.get('timestamp')
+        })
+        await self.send(text_data=json.dumps({
+            'type': f"{event['type']}_sent",
+            'client_id': client_id,
+            'timestamp': data.get('timestamp')
+        }))
+
+    async def handle_chat_message(self, data):
+        """Chat from the professional to the client in an active session"""
+        client_id = data.get('client_id')
+        message_text = data.get('text', '').strip()
+        if not client_id or not message_text:
+            return
+        
+        message_id = data.get('message_id', str(uuid.uuid4()))
+        timestamp = data.get('timestamp')
+        
+        session_id = await self.get_active_session_id(client_id)
+        if session_id is None:
+            await self.send(text_data=json.dumps({
+                'type': 'message_failed',
+                'message_id': message_id,
+                'timestamp': timestamp,
+                'message': 'No active session with this client'
+            }))
+            return
+        
+        # Stored through the same batched writer as the client's messages
+        stored = chat_writer.submit(session_id, message_text, 'professional', message_id=message_id)
+        task = asyncio.ensure_future(self.deliver_chat_message(stored, client_id, message_text, message_id, timestamp))
+        self.pending_acks.add(task)
+        task.add_done_callback(self.pending_acks.discard)
+
+    async def deliver_chat_message(self, stored, client_id, message_text, message_id, timestamp):
+        """Forward and acknowledge a chat message once its batch committed"""
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(stored), WRITE_TIMEOUT_SECONDS)
         except Exception as e:
-            print(f"❌ Error ending session: {str(e)}")
\ No newline at end of file
+            logger.error("Error saving professional chat message", extra={"event": "chat.error", "professional_id": self.professional_id, "message_id": message_id, "error": str(e)})
+            await self.send(text_data=json.dumps({
+                'type': 'message_failed',
+                'message_id': message_id,
+                'timestamp': timestamp,
+                'message': 'Message could not be saved, please resend'
+            }))
+            return
+        
+        await self.channel_layer.group_send(session_group(self.professional_id, client_id), {
+            'type': 'professional_chat_message',
+            'message': message_text,
+            'message_id': message_id,
+            'timestamp': timestamp
+        })
+        await self.send(text_data=json.dumps({
+            'type': 'message_sent',
+            'client_id': client_id,
+            'message_id': message_id,
+            'timestamp': timestamp
+        }))
+
+    # Session events from SessionConsumer and new requests
+    async def forward(self, event):
+        await self.send(text_data=json.dumps(event))
+
+    session_request = forward
+    incoming_call = forward
+    session_confirmed = forward
+    session_ended = forward
+    call_ended = forward
+    client_paused = forward
+
+    async def professional_chat_message(self, event):
+        """Chat message from the client"""
+        await self.send(text_data=json.dumps({
+            'type': 'chat_message',
+            'text': event['message'],
+            'client_id': event['client_id'],
+            'message_id': event.get('message_id'),
+            'timestamp': event.get('timestamp'),
+            'sender': 'client'
+        }))
+
+    # Database operations
+    @sync_to_async
+    def professional_exists(self):
+        return Professional.objects.filter(id=self.professional_id).exists()
+
+    @sync_to_async
+    def may_follow(self, token_key):
+        """Is the socket's user (session login or ?token=) this professional or staff?"""
+        user = self.scope.get('user')
+        if token_key:
+            token = Token.objects.select_related('user').filter(key=token_key).first()
+            user = token.user if token else None
+        if user is None or not user.is_authenticated:
+            return False
+        return user.is_staff or Professional.objects.filter(id=self.professional_id, user_id=user.id).exists()
+
+    @sync_to_async
+    def get_pending_requests(self):
+        return pending_requests(self.professional_id)
+
+    @sync_to_async
+    def get_active_session_id(self, client_id):
+        return Session.objects.filter(
+            professional_id=self.professional_id,
+            client_id=client_id,
+            status__in=LIVE_STATUSES
+        ).order_by('-created_at').values_list('id', flat=True).first()
@@ -0,0 +1,90 @@
+"""
+Admin dashboard statistics.
+
+Each table is read once with conditional aggregation (``Count``/``Sum``
+with ``filter=``) instead of one COUNT/SUM/AVG query per number, and the
+result is served from a short-lived ``Snapshot`` so every open admin screen
+polling the dashboard shares one computation per ``DASHBOARD_STATS_TTL``.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+from .models import Category, Dispute, Professional, Session
+from .snapshots import Snapshot
+
+STATS_TTL_SECONDS = getattr(settings, 'DASHBOARD_STATS_TTL', 5)
+
+
+def compute_dashboard_stats(now=None):
+    """Dashboard numbers in five queries, one per table"""
+    now = now or timezone.now()
+    month_start = now - timedelta(days=30)
+    last_month_start = now - timedelta(days=60)
+
+    professionals = Professional.objects.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+        approved=Count('id', filter=Q(status='approved')),
+    )
+    users = User.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+    )
+
+    completed = Q(status='completed')
+    sessions = Session.objects.aggregate(
+        total=Count('id'),
+        completed=Count('id', filter=completed),
+        active=Count('id', filter=Q(status='active')),
+        total_revenue=Sum('cost', filter=completed),
+        average_session_value=Avg('cost', filter=completed),
+        monthly_revenue=Sum('cost', filter=completed & Q(ended_at__gte=month_start)),
+        last_month_revenue=Sum(
+            'cost', filter=completed & Q(ended_at__gte=last_month_start, ended_at__lt=month_start)
+        ),
+    )
+    disputes = Dispute.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(status='open')),
+    )
+    categories = Category.objects.aggregate(
+        total=Count('id'),
+        enabled=Count('id', filter=Q(enabled=True)),
+    )
+
+    total_revenue = sessions['total_revenue'] or 0
+    monthly_revenue = sessions['monthly_revenue'] or 0
+    last_month_revenue = sessions['last_month_revenue'] or 0
+    average_session_value = sessions['average_session_value'] or 0
+
+    if last_month_revenue > 0:
+        monthly_growth = ((monthly_revenue - last_month_revenue) / last_month_revenue) * 100
+    else:
+        monthly_growth = 100 if monthly_revenue > 0 else 0
+
+    return {
+        'total_professionals': professionals['total'],
+        'pending_approvals': professionals['pending'],
+        'approved_professionals': professionals['approved'],
+        'total_revenue': float(total_revenue),
+        'active_disputes': disputes['active'],
+        'monthly_growth': round(float(monthly_growth), 2),
+        'completed_sessions': sessions['completed'],
+        'total_users': users['total'],
+        'active_users': users['active'],
+        'monthly_revenue': float(monthly_revenue),
+        'average_session_value': float(average_session_value),
+        'total_sessions': sessions['total'],
+        'active_sessions': sessions['active'],
+        'total_disputes': disputes['total'],
+        'total_categories': categories['total'],
+        'enabled_categories': categories['enabled'],
+    }
+
+
+dashboard_snapshot = Snapshot('admin_dashboard_stats', compute_dashboard_stats, ttl=STATS_TTL_SECONDS)
@@ -0,0 +1,309 @@
+"""
+Server-side dispatch for instant matching.
+
+Instead of every client fetching the roster and racing to lock the same
+professional, clients join a per-category queue over ``ws/quick-connect/``
+(``{"type": "request_match", ...}``). The dispatcher hands the best free
+professional to the client at the head of the queue as capacity frees up:
+
+- queues are ordered by a virtual arrival time, ``enqueued_at`` minus the
+  head start configured for the session's urgency in
+  ``DISPATCH_URGENCY_HEAD_START``. Urgent clients jump ahead, but nobody
+  waits behind later arrivals forever. ``DISPATCH_QUEUE_MODE = 'fifo'``
+  ignores urgency. Each queue is a sorted list holding only waiting
+  tickets: a new ticket's position is found by binary search, and matched
+  or cancelled tickets are removed straight away
+- the professional is chosen with the matching scorer over the free
+  candidates in the category (from the candidate index when it is warm)
+- the lease and the pending ``Session`` are created in one transaction, so a
+  client is never left holding a lock without a session or vice versa
+- the result is pushed to the waiting client's channel as
+  ``dispatch_matched``
+
+The queues live in this process. With several worker processes each one
+dispatches its own clients; the lock is still taken in the database, so
+two processes never hand out the same professional.
+"""
+
+import bisect
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from . import locking, session_lifecycle
+from .candidate_index import candidate_index, feature_rows as index_feature_rows
+from .matching import feature_rows, rank_candidates
+from .models import Professional, Session
+
+logger = logging.getLogger(__name__)
+
+URGENCY_HEAD_START = getattr(settings, 'DISPATCH_URGENCY_HEAD_START', {'high': 120, 'medium': 30, 'low': 0})
+QUEUE_MODE = getattr(settings, 'DISPATCH_QUEUE_MODE', 'priority')
+POLL_INTERVAL_SECONDS = getattr(settings, 'DISPATCH_POLL_INTERVAL', 1)
+CANDIDATES_PER_ATTEMPT = 5
+WAIT_SAMPLES = 1000
+
+
+class Ticket:
+    """A client waiting for a professional"""
+
+    def __init__(self, client_id, category_id, channel_name, session_type='chat', urgency='medium', preferences=None):
+        self.ticket_id = str(uuid.uuid4())
+        self.client_id = client_id
+        self.category_id = category_id
+        self.channel_name = channel_name
+        self.session_type = session_type
+        self.urgency = urgency if urgency in URGENCY_HEAD_START else 'medium'
+        self.preferences = preferences or {}
+        self.enqueued_at = time.monotonic()
+        self.seq = None  # arrival order, set by the dispatcher
+        self.closed = False  # matched or cancelled
+
+    @property
+    def sort_key(self):
+        if QUEUE_MODE == 'fifo':
+            return self.enqueued_at
+        return self.enqueued_at - URGENCY_HEAD_START[self.urgency]
+
+    def waited_ms(self, now=None):
+        return int(((now or time.monotonic()) - self.enqueued_at) * 1000)
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def free_candidates(category_id):
+    """FEATURE_FIELDS rows of approved, available, unlocked professionals in a category"""
+    indexed = candidate_index.candidates_for_category(category_id)
+    if indexed is not None:
+        return index_feature_rows(c for c in indexed[1] if not c.locked_by)
+    return list(feature_rows(Professional.objects.filter(
+        Q(primary_category_id=category_id) | Q(categories__id=category_id),
+        Q(locked_by__isnull=True) | Q(locked_by=''),
+        status='approved',
+        available=True
+    ).distinct()))
+
+
+def claim(ticket, professional_id):
+    """Lock the professional and open a pending Session in one transaction"""
+    with transaction.atomic():
+        lease = locking.acquire(professional_id, str(ticket.client_id))
+        if lease is None:
+            return None, None
+        session = Session.objects.create(
+            professional_id=professional_id,
+            client_id=ticket.client_id,
+            category_id=ticket.category_id,
+            session_type=ticket.session_type,
+            urgency=ticket.urgency,
+            status='pending'
+        )
+    return lease, session
+
+
+class Dispatcher:
+    """Per-category queues of waiting clients"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # category id -> sorted list of (sort key, seq, ticket), waiting tickets only
+        self._queues = defaultdict(list)
+        self._tickets = {}
+        self._seq = itertools.count()
+        self._waits = defaultdict(lambda: deque(maxlen=WAIT_SAMPLES))  # matched wait times, ms
+        self._matched = defaultdict(int)
+        self._conflicts = defaultdict(int)
+        self._wake = threading.Event()
+        self._thread = None
+
+    # Queue --------------------------------------------------------------
+
+    def enqueue(self, ticket):
+        """Add a ticket and return its position in the category queue"""
+        with self._lock:
+            ticket.seq = next(self._seq)
+            queue = self._queues[ticket.category_id]
+            # Binary search: the position is the insertion point
+            index = bisect.bisect_right(queue, (ticket.sort_key, ticket.seq))
+            queue.insert(index, (ticket.sort_key, ticket.seq, ticket))
+            self._tickets[ticket.ticket_id] = ticket
+        self.wake()
+        return index + 1
+
+    def cancel(self, ticket_id=None, channel_name=None):
+        """Cancel the tickets matching every given filter. Returns the cancelled ids"""
+        if ticket_id is None and channel_name is None:
+            return []
+        with self._lock:
+            cancelled = [
+                t for t in list(self._tickets.values())
+                if (ticket_id is None or t.ticket_id == ticket_id)
+                and (channel_name is None or t.channel_name == channel_name)
+            ]
+            for ticket in cancelled:
+                self._close(ticket)
+        return [t.ticket_id for t in cancelled]
+
+    def _close(self, ticket):
+        """Take a ticket out of its queue; the caller holds the lock"""
+        ticket.closed = True
+        self._tickets.pop(ticket.ticket_id, None)
+        queue = self._queues[ticket.category_id]
+        index = bisect.bisect_left(queue, (ticket.sort_key, ticket.seq))
+        if index < len(queue) and queue[index][2] is ticket:
+            del queue[index]
+
+    def _head(self, category_id):
+        queue = self._queues.get(category_id)
+        return queue[0][2] if queue else None
+
+    def wake(self):
+        """Capacity may have freed up; run a dispatch round soon"""
+        self._wake.set()
+
+    # Dispatch -----------------------------------------------------------
+
+    def dispatch(self):
+        """Match as many waiting clients as there are free professionals. Returns matches made"""
+        with self._lock:
+            categories = [c for c in self._queues if self._head(c) is not None]
+
+        matched = 0
+        for category_id in categories:
+            matched += self._dispatch_category(category_id)
+        return matched
+
+    def _dispatch_category(self, category_id):
+        matched = 0
+        while True:
+            with self._lock:
+                ticket = self._head(category_id)
+            if ticket is None:
+                return matched
+
+            rows = free_candidates(category_id)
+            if not rows:
+                return matched
+
+            ranked, _ = rank_candidates(rows, ticket.preferences, k=CANDIDATES_PER_ATTEMPT)
+            for result in ranked:
+                lease, session = claim(ticket, result['professional_id'])
+                if lease is not None:
+                    break
+                # Somebody else took this professional since we read the candidates
+                self._conflicts[category_id] += 1
+            else:
+                # Every candidate went between reading and locking; try again next round
+                return matched
+
+            with self._lock:
+                still_waiting = not ticket.closed
+                self._close(ticket)
+            if not still_waiting:
+                # Cancelled while we were claiming: give the professional back
+                session_lifecycle.transition(session, 'cancelled')
+                locking.release(lease.professional_id, lease.holder, lease.token)
+                continue
+
+            waited_ms = ticket.waited_ms()
+            with self._lock:
+                self._waits[category_id].append(waited_ms)
+                self._matched[category_id] += 1
+            self._notify(ticket, lease, session, result, waited_ms)
+            matched += 1
+
+    def _notify(self, ticket, lease, session, result, waited_ms):
+        professional = Professional.objects.get(id=lease.professional_id)
+        async_to_sync(get_channel_layer().send)(ticket.channel_name, {
+            'type': 'dispatch_matched',
+            'ticket_id': ticket.ticket_id,
+            'session_id': session.id,
+            'waited_ms': waited_ms,
+            'matching_score': result['total_score'],
+            'token': lease.token,
+            'expires_at': lease.expires_at.isoformat(),
+            'professional': {
+                'id': str(professional.id),
+                'name': professional.name,
+                'specialization': professional.specialization,
+                'rate': float(professional.rate),
+                'rating': float(professional.average_rating),
+                'experience': professional.total_sessions,
+            },
+        })
+        logger.info("Professional dispatched", extra={
+            "event": "match.dispatched",
+            "professional_id": professional.id,
+            "client_id": ticket.client_id,
+            "waited_ms": waited_ms
+        })
+
+    # Metrics ------------------------------------------------------------
+
+    def stats(self):
+        """Queue depth and wait-time percentiles per category"""
+        now = time.monotonic()
+        with self._lock:
+            categories = set(self._queues) | set(self._waits)
+            report = {}
+            for category_id in sorted(categories):
+                waiting = [t for _, _, t in self._queues.get(category_id, ())]
+                waits = sorted(self._waits.get(category_id, ()))
+                report[str(category_id)] = {
+                    'depth': len(waiting),
+                    'depth_by_urgency': {
+                        urgency: sum(1 for t in waiting if t.urgency == urgency) for urgency in URGENCY_HEAD_START
+                    },
+                    'oldest_wait_ms': max((t.waited_ms(now) for t in waiting), default=0),
+                    'matched': self._matched.get(category_id, 0),
+                    'lock_conflicts': self._conflicts.get(category_id, 0),
+                    'wait_ms': {
+                        'p50': _percentile(waits, 0.50),
+                        'p90': _percentile(waits, 0.90),
+                        'p99': _percentile(waits, 0.99),
+                        'max': waits[-1] if waits else None,
+                        'samples': len(waits),
+                    },
+                }
+            return {'mode': QUEUE_MODE, 'categories': report}
+
+    # Background loop ----------------------------------------------------
+
+    def _run(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL_SECONDS)
+            self._wake.clear()
+            try:
+                self.dispatch()
+            except Exception:
+                logger.exception("Dispatch round failed", extra={"event": "match.error"})
+            finally:
+                close_old_connections()
+
+    def start(self):
+        """Start the process-wide dispatch thread once"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='dispatcher', daemon=True)
+                self._thread.start()
+        return self._thread
+
+
+dispatcher = Dispatcher()
+
+
+def start_dispatcher():
+    return dispatcher.start()
@@ -0,0 +1,250 @@
+"""
+Resized copies of profile pictures, made in a process pool.
+
+``Professional.profile_picture`` and ``UserProfile.avatar`` used to be sent
+to every roster, listing and favorites screen at the size they were
+uploaded. When either field changes, the picture is now handed to a pool of
+worker processes once the transaction commits. Pillow decodes it there (off
+the request path and outside the server's GIL) and writes one WebP per size
+in ``IMAGE_VARIANTS``:
+
+- JPEGs are decoded at a reduced scale (``draft``) when the largest variant
+  is much smaller than the original
+- EXIF orientation is applied, then every piece of metadata (EXIF, GPS, ICC,
+  comments) is left behind, since only pixels are re-encoded
+- sizes are the longest side; smaller pictures are never upscaled
+
+The parent saves the variants next to the original under ``variants/`` and
+records them in ``profile_picture_variants`` / ``avatar_variants``:
+
+    {"small": {"name": "professional_profiles/variants/ab12_small.webp", "width": 256, "height": 192}, ...}
+
+The record is only written if the picture is still the one processed, so a
+slow job can't overwrite a newer upload. Listings read it with
+``variant_url()`` and fall back to the original while the variants are
+being made.
+
+``render()`` runs in the workers, which are spawned rather than forked (the
+server process has threads holding locks), so it only uses Pillow.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+WEBP_QUALITY = 80
+
+# Refuse to decode anything larger (pixels); Pillow's default only warns
+MAX_PIXELS = 40_000_000
+
+
+def render(source, sizes, quality=WEBP_QUALITY, max_pixels=MAX_PIXELS):
+    """
+    Decode ``source`` (a path or the file's bytes) and encode a WebP of
+    each size. Returns {size name: (bytes, width, height)}.
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    largest = max(sizes.values())
+    with Image.open(source) as image:
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = {}
+    # Largest first, so each smaller size is resampled from a smaller image
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, 'WEBP', quality=quality, method=4)
+        variants[name] = (output.getvalue(), image.width, image.height)
+    return variants
+
+
+def variant_url(variants, size, original=None):
+    """Media URL of one variant, or of the original picture until it exists"""
+    variant = (variants or {}).get(size)
+    if variant:
+        return settings.MEDIA_URL + variant['name']
+    if original:
+        return settings.MEDIA_URL + str(original)
+    return None
+
+
+def _fields():
+    from .models import Professional, UserProfile
+    return {
+        Professional: ('profile_picture', 'profile_picture_variants'),
+        UserProfile: ('avatar', 'avatar_variants'),
+    }
+
+
+def _variant_name(source_name, size):
+    folder, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return f'{folder}/variants/{stem}_{size}.webp'
+
+
+class ImagePipeline:
+    """Hands pictures to worker processes and records what they produce"""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.stale = 0
+        self.render_seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def submit(self, model, pk, source_name):
+        """Make the variants of ``source_name`` for ``model`` row ``pk``"""
+        try:
+            try:
+                source = default_storage.path(source_name)
+                size = os.path.getsize(source)
+            except NotImplementedError:
+                # Remote storage: ship the bytes to the worker instead
+                with default_storage.open(source_name) as file:
+                    source = file.read()
+                size = len(source)
+            future = self.executor().submit(render, source, settings.IMAGE_VARIANTS)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            logger.exception("Image processing failed", extra={
+                "event": "images.error", "model": model.__name__, "pk": pk, "source": source_name
+            })
+            return None
+
+        started = time.monotonic()
+        with self._lock:
+            self.submitted += 1
+            self.bytes_in += size
+        future.add_done_callback(lambda done: self._finished(done, model, pk, source_name, started))
+        return future
+
+    def _finished(self, future, model, pk, source_name, started):
+        picture_field, variants_field = _fields()[model]
+        try:
+            rendered = future.result()
+            record = {}
+            for size, (data, width, height) in rendered.items():
+                name = default_storage.save(_variant_name(source_name, size), ContentFile(data))
+                record[size] = {'name': name, 'width': width, 'height': height}
+
+            rows = model.objects.filter(pk=pk, **{picture_field: source_name})
+            previous = rows.values_list(variants_field, flat=True).first()
+            from .models import Professional
+            with transaction.atomic():
+                updated = rows.update(**{variants_field: record})
+                if updated and model is Professional:
+                    # Numbered with the update (see roster.py)
+                    from .roster import publish_upsert
+                    publish_upsert(pk)
+            if not updated:
+                # Replaced or deleted while we worked
+                self._delete(record)
+                with self._lock:
+                    self.stale += 1
+                return
+            self._delete({
+                size: variant for size, variant in (previous or {}).items()
+                if variant['name'] not in {v['name'] for v in record.values()}
+            })
+
+            elapsed = time.monotonic() - started
+            produced = sum(len(data) for data, _, _ in rendered.values())
+            with self._lock:
+                self.completed += 1
+                self.render_seconds += elapsed
+                self.bytes_out += produced
+            logger.info("Image variants made", extra={
+                "event": "images.rendered", "model": model.__name__, "pk": pk,
+                "sizes": {size: v['width'] for size, v in record.items()},
+                "bytes": produced, "elapsed_ms": round(elapsed * 1000),
+            })
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+                if isinstance(e, BrokenProcessPool):
+                    # A worker died (e.g. out of memory); start a fresh pool next time
+                    self._executor = None
+            logger.exception("Image processing failed", extra={
+                "event": "images.error", "model": model.__name__, "pk": pk, "source": source_name
+            })
+        finally:
+            close_old_connections()
+
+    def clear(self, model, pk, variants):
+        """The picture was removed: drop its variants"""
+        _, variants_field = _fields()[model]
+        model.objects.filter(pk=pk).update(**{variants_field: {}})
+        self._delete(variants)
+
+    def _delete(self, variants):
+        for variant in (variants or {}).values():
+            try:
+                default_storage.delete(variant['name'])
+            except Exception:
+                logger.warning("Could not delete image variant", extra={
+                    "event": "images.delete_failed", "variant": variant['name']
+                })
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'stale': self.stale,
+                'pending': self.submitted - self.completed - self.failed - self.stale,
+                'avg_ms': round(self.render_seconds / self.completed * 1000, 1) if self.completed else None,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+            }
+
+
+image_pipeline = ImagePipeline()
+
+
+def picture_changed(instance, created):
+    """post_save hook: queue the picture if it changed, once the save commits"""
+    model = type(instance)
+    picture_field, variants_field = _fields()[model]
+    name = getattr(instance, picture_field).name or ''
+    variants = getattr(instance, variants_field)
+    if not name:
+        if variants:
+            setattr(instance, variants_field, {})
+            transaction.on_commit(lambda: image_pipeline.clear(model, instance.pk, variants))
+    elif created or name != getattr(instance, '_picture_name', None):
+        transaction.on_commit(lambda: image_pipeline.submit(model, instance.pk, name))
+    instance._picture_name = name
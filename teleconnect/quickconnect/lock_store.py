@@ -0,0 +1,286 @@
+"""
+TTL-aware lock store for generic resources.
+
+Backs the ``api/locks/acquire/`` and ``api/locks/release/`` endpoints. The
+backend is chosen with the ``LOCK_STORE`` setting, the same way
+``CHANNEL_LAYERS`` picks a channel layer:
+
+    LOCK_STORE = {
+        'BACKEND': 'quickconnect.lock_store.RedisLockStore',
+        'OPTIONS': {'url': 'redis://localhost:6379/0'},
+    }
+
+Backends:
+    InProcessLockStore  - a dict guarded by a mutex; one process only
+    DatabaseLockStore   - the ResourceLock table; shared by every worker
+    RedisLockStore      - any Redis-protocol server (see redis_standin.py)
+
+Every backend counts contention: how many acquisitions were refused because
+somebody else held the lock.
+"""
+
+import threading
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+LockResult = namedtuple('LockResult', ['acquired', 'resource', 'owner', 'expires_at', 'contention'])
+
+DEFAULT_LOCK_STORE = 'quickconnect.lock_store.DatabaseLockStore'
+
+
+class BaseLockStore:
+    """Interface shared by all lock store backends"""
+
+    def acquire(self, resource, owner, ttl_ms):
+        """Take or extend the lock. Re-acquiring your own lock refreshes its TTL"""
+        raise NotImplementedError
+
+    def release(self, resource, owner=None):
+        """Drop the lock. Without an owner the lock is removed unconditionally"""
+        raise NotImplementedError
+
+    def get(self, resource):
+        """Current holder as a LockResult, or None if the resource is free"""
+        raise NotImplementedError
+
+    def contention(self, resource=None):
+        """Refused acquisitions for one resource, or in total"""
+        raise NotImplementedError
+
+
+class InProcessLockStore(BaseLockStore):
+    """Locks held in this process only. Fine for tests and runserver"""
+
+    def __init__(self, **options):
+        self._mutex = threading.Lock()
+        self._locks = {}  # resource -> (owner, expires_at)
+        self._contention = Counter()
+
+    def _current(self, resource, now):
+        held = self._locks.get(resource)
+        if held and held[1] <= now:
+            del self._locks[resource]
+            return None
+        return held
+
+    def acquire(self, resource, owner, ttl_ms):
+        now = timezone.now()
+        with self._mutex:
+            held = self._current(resource, now)
+            if held and held[0] != owner:
+                self._contention[resource] += 1
+                return LockResult(False, resource, held[0], held[1], self._contention[resource])
+            expires_at = now + timedelta(milliseconds=ttl_ms)
+            self._locks[resource] = (owner, expires_at)
+            return LockResult(True, resource, owner, expires_at, self._contention[resource])
+
+    def release(self, resource, owner=None):
+        with self._mutex:
+            held = self._current(resource, timezone.now())
+            if held is None or (owner is not None and held[0] != owner):
+                return False
+            del self._locks[resource]
+            return True
+
+    def get(self, resource):
+        with self._mutex:
+            held = self._current(resource, timezone.now())
+            if held is None:
+                return None
+            return LockResult(True, resource, held[0], held[1], self._contention[resource])
+
+    def contention(self, resource=None):
+        with self._mutex:
+            if resource is None:
+                return sum(self._contention.values())
+            return self._contention[resource]
+
+
+class DatabaseLockStore(BaseLockStore):
+    """Locks in the ResourceLock table, visible to every worker process"""
+
+    def __init__(self, **options):
+        from .models import ResourceLock
+        self.model = ResourceLock
+
+    def acquire(self, resource, owner, ttl_ms):
+        now = timezone.now()
+        expires_at = now + timedelta(milliseconds=ttl_ms)
+        rows = self.model.objects.filter(resource=resource)
+
+        # Take the row if it is free, expired or already ours
+        taken = rows.filter(Q(expires_at__lte=now) | Q(owner=owner)).update(
+            owner=owner, expires_at=expires_at, acquired_at=now
+        )
+        if not taken:
+            try:
+                with transaction.atomic():
+                    self.model.objects.create(
+                        resource=resource, owner=owner, expires_at=expires_at, acquired_at=now
+                    )
+                taken = 1
+            except IntegrityError:
+                pass  # Row exists and somebody else holds it
+
+        if taken:
+            contention = rows.values_list('contention_count', flat=True).first() or 0
+            return LockResult(True, resource, owner, expires_at, contention)
+
+        rows.update(contention_count=F('contention_count') + 1)
+        held = rows.values('owner', 'expires_at', 'contention_count').first()
+        if held is None:
+            # Released between our UPDATE and the read; let the caller retry
+            return LockResult(False, resource, None, None, 0)
+        return LockResult(False, resource, held['owner'], held['expires_at'], held['contention_count'])
+
+    def release(self, resource, owner=None):
+        now = timezone.now()
+        rows = self.model.objects.filter(resource=resource, expires_at__gt=now)
+        if owner is not None:
+            rows = rows.filter(owner=owner)
+        # Keep the row so its contention counter survives
+        return bool(rows.update(owner='', expires_at=now))
+
+    def get(self, resource):
+        held = self.model.objects.filter(
+            resource=resource, expires_at__gt=timezone.now()
+        ).values('owner', 'expires_at', 'contention_count').first()
+        if held is None:
+            return None
+        return LockResult(True, resource, held['owner'], held['expires_at'], held['contention_count'])
+
+    def contention(self, resource=None):
+        if resource is not None:
+            return self.model.objects.filter(resource=resource).values_list(
+                'contention_count', flat=True
+            ).first() or 0
+        return self.model.objects.aggregate(total=Sum('contention_count'))['total'] or 0
+
+    def purge_expired(self, older_than=timedelta(days=1)):
+        """Delete rows that have been free for a while"""
+        return self.model.objects.filter(expires_at__lte=timezone.now() - older_than).delete()[0]
+
+
+class RedisLockStore(BaseLockStore):
+    """Locks in a Redis-protocol server, shared across hosts"""
+
+    # Rounds of SET NX / WATCH before giving up on a key that keeps changing
+    ACQUIRE_ATTEMPTS = 5
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='quickconnect:lock:', **options):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisLockStore requires the 'redis' package")
+        self.client = redis.Redis.from_url(url, **options)
+        self.prefix = prefix
+
+    def _key(self, resource):
+        return f'{self.prefix}{resource}'
+
+    def _contention_key(self, resource=None):
+        return f'{self.prefix}contention:{resource}' if resource else f'{self.prefix}contention'
+
+    def _expires_at(self, key):
+        ttl_ms = self.client.pttl(key)
+        return timezone.now() + timedelta(milliseconds=ttl_ms) if ttl_ms and ttl_ms > 0 else None
+
+    def acquire(self, resource, owner, ttl_ms):
+        key = self._key(resource)
+        ttl_ms = int(ttl_ms)
+
+        for _ in range(self.ACQUIRE_ATTEMPTS):
+            if self.client.set(key, owner, nx=True, px=ttl_ms):
+                return LockResult(True, resource, owner, self._expires_at(key), self.contention(resource))
+
+            # Held already: refresh it if it is ours, otherwise count the conflict
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    holder = pipe.get(key)
+                    if holder is None:
+                        # Expired or released since the SET; try again
+                        continue
+                    if holder.decode() == owner:
+                        pipe.multi()
+                        pipe.set(key, owner, px=ttl_ms)
+                        pipe.execute()
+                        return LockResult(True, resource, owner, self._expires_at(key), self.contention(resource))
+                    pipe.unwatch()
+                    break
+                except self._watch_error():
+                    continue
+        else:
+            # The key kept changing hands; report whoever holds it now
+            holder = self.client.get(key)
+            if holder is None:
+                return LockResult(False, resource, None, None, self.contention(resource))
+
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.incr(self._contention_key(resource))
+            pipe.incr(self._contention_key())
+            contention, _ = pipe.execute()
+        return LockResult(False, resource, holder.decode(), self._expires_at(key), contention)
+
+    def release(self, resource, owner=None):
+        key = self._key(resource)
+        if owner is None:
+            return bool(self.client.delete(key))
+
+        # Compare-and-delete so we never drop a lock someone else re-acquired
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                holder = pipe.get(key)
+                if holder is None or holder.decode() != owner:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.delete(key)
+                return bool(pipe.execute()[0])
+            except self._watch_error():
+                return False
+
+    def get(self, resource):
+        key = self._key(resource)
+        holder = self.client.get(key)
+        if holder is None:
+            return None
+        return LockResult(True, resource, holder.decode(), self._expires_at(key), self.contention(resource))
+
+    def contention(self, resource=None):
+        return int(self.client.get(self._contention_key(resource)) or 0)
+
+    @staticmethod
+    def _watch_error():
+        import redis
+        return redis.WatchError
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_lock_store():
+    """Process-wide lock store configured by settings.LOCK_STORE"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = getattr(settings, 'LOCK_STORE', {})
+            backend = import_string(config.get('BACKEND', DEFAULT_LOCK_STORE))
+            _store = backend(**config.get('OPTIONS', {}))
+    return _store
+
+
+def reset_lock_store():
+    """Forget the configured store, e.g. after overriding settings in tests"""
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,195 @@
+"""
+Lease-based professional locking.
+
+A lock is a lease on ``Professional.locked_by`` / ``locked_until``. Every
+state change is a single conditional UPDATE, so two clients can never both
+win the same professional. Each successful acquisition bumps
+``Professional.lock_token``; the new value is the fencing token the holder
+must present to renew or release the lease.
+
+Leases that are not renewed expire on their own. ``LeaseSweeper`` releases
+them in bulk in the background.
+
+Every change is also applied to the in-memory candidate index, since these
+UPDATEs send no model signals. The roster delta announcing a change is
+numbered in the same transaction as its UPDATE (see roster.py).
+"""
+
+import logging
+import threading
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .candidate_index import candidate_index
+from .models import Professional
+from .roster import publish_lock_changed, publish_upserts
+
+logger = logging.getLogger(__name__)
+
+Lease = namedtuple('Lease', ['professional_id', 'holder', 'token', 'expires_at'])
+
+DEFAULT_TTL_SECONDS = getattr(settings, 'PROFESSIONAL_LOCK_TTL_SECONDS', 60)
+SWEEP_INTERVAL_SECONDS = getattr(settings, 'PROFESSIONAL_LOCK_SWEEP_INTERVAL', 15)
+
+
+def _free_or_held_by(holder, now):
+    """Rows a holder may take: unlocked, expired, or already theirs"""
+    return (
+        Q(locked_by__isnull=True) |
+        Q(locked_by='') |
+        Q(locked_until__isnull=True) |
+        Q(locked_until__lte=now) |
+        Q(locked_by=holder)
+    )
+
+
+def _capacity_freed():
+    """Let the dispatcher hand freed professionals to waiting clients"""
+    from .dispatch import dispatcher
+    transaction.on_commit(dispatcher.wake)
+
+
+def _expired(now):
+    return Q(locked_by__isnull=False) & (Q(locked_until__isnull=True) | Q(locked_until__lte=now))
+
+
+def acquire(professional_id, holder, ttl=None):
+    """Take a lease on a professional. Returns a Lease, or None if someone else holds it"""
+    if not holder:
+        return None
+
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl or DEFAULT_TTL_SECONDS)
+
+    with transaction.atomic():
+        updated = Professional.objects.filter(
+            _free_or_held_by(holder, now), id=professional_id
+        ).update(
+            locked_by=holder,
+            locked_until=expires_at,
+            available=False,
+            lock_token=F('lock_token') + 1,
+        )
+        if not updated:
+            return None
+        token = Professional.objects.filter(id=professional_id).values_list('lock_token', flat=True).get()
+        publish_lock_changed(professional_id, holder, False)
+
+    candidate_index.after_commit(candidate_index.set_lock_state, professional_id, holder, False)
+    return Lease(professional_id, holder, token, expires_at)
+
+
+def renew(professional_id, holder, token, ttl=None):
+    """Extend a lease. Returns the new expiry, or None if the lease was lost"""
+    expires_at = timezone.now() + timedelta(seconds=ttl or DEFAULT_TTL_SECONDS)
+
+    # The token only matches if nobody else acquired the row in the meantime,
+    # so a slightly late heartbeat can still revive its own lease.
+    updated = Professional.objects.filter(
+        id=professional_id, locked_by=holder, lock_token=token
+    ).update(locked_until=expires_at)
+    return expires_at if updated else None
+
+
+def release(professional_id, holder=None, token=None):
+    """Release a lease. Without a holder the lock is cleared unconditionally"""
+    rows = Professional.objects.filter(id=professional_id)
+    if holder is not None:
+        rows = rows.filter(locked_by=holder)
+    if token is not None:
+        rows = rows.filter(lock_token=token)
+
+    with transaction.atomic():
+        released = rows.update(locked_by=None, locked_until=None, available=True)
+        if released:
+            publish_lock_changed(professional_id, None, True)
+    if released:
+        candidate_index.after_commit(candidate_index.set_lock_state, professional_id, None, True)
+        _capacity_freed()
+    return bool(released)
+
+
+def release_all(holder):
+    """Release every lease held by one client. Returns the released ids"""
+    if not holder:
+        return []
+
+    with transaction.atomic():
+        ids = list(
+            Professional.objects.select_for_update()
+            .filter(locked_by=holder).values_list('id', flat=True)
+        )
+        if ids:
+            Professional.objects.filter(id__in=ids, locked_by=holder).update(
+                locked_by=None, locked_until=None, available=True
+            )
+        for professional_id in ids:
+            publish_lock_changed(professional_id, None, True)
+
+    for professional_id in ids:
+        candidate_index.after_commit(candidate_index.set_lock_state, professional_id, None, True)
+    if ids:
+        _capacity_freed()
+    return ids
+
+
+def sweep_expired():
+    """Release all expired leases in one UPDATE. Returns the affected ids"""
+    now = timezone.now()
+    ids = list(Professional.objects.filter(_expired(now)).values_list('id', flat=True))
+    if not ids:
+        return []
+
+    with transaction.atomic():
+        # Re-check the expiry in the UPDATE itself so a lease renewed between
+        # the two statements survives
+        Professional.objects.filter(_expired(now), id__in=ids).update(
+            locked_by=None, locked_until=None, available=True
+        )
+        # Publish what the rows look like now rather than assuming every id was released
+        publish_upserts(ids)
+    candidate_index.after_commit(candidate_index.refresh, ids)
+    _capacity_freed()
+    return ids
+
+
+class LeaseSweeper(threading.Thread):
+    """Daemon thread that periodically releases expired leases"""
+
+    def __init__(self, interval=SWEEP_INTERVAL_SECONDS):
+        super().__init__(name='professional-lease-sweeper', daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                released = sweep_expired()
+                if released:
+                    logger.info("Released expired professional locks", extra={"event": "lock.swept", "released": len(released)})
+            except Exception:
+                logger.exception("Lease sweep failed", extra={"event": "lock.error"})
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def start_sweeper():
+    """Start the process-wide sweeper once"""
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = LeaseSweeper()
+            _sweeper.start()
+    return _sweeper
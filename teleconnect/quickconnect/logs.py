@@ -0,0 +1,128 @@
+"""
+Structured, non-blocking logging for the WebSocket hot paths.
+
+Consumers used to print() a line to stdout for every event, synchronously,
+from the event loop. Records now go through a queue instead:
+
+- ``QueueLogHandler`` copies the record onto a bounded queue and returns. A
+  background ``QueueListener`` thread formats and writes it. When the queue
+  is full the record is dropped and counted instead of blocking the loop.
+- ``JsonFormatter`` writes one JSON object per line: time, level, logger,
+  message and any ``extra={...}`` fields such as ``event`` or ``client_id``.
+- ``SamplingFilter`` keeps 1 in N records of high-volume events, per
+  ``event`` name in ``LOG_SAMPLE_RATES``. Kept records carry ``sampled=N``.
+- levels are set per module in ``LOG_LEVELS``.
+- ``LOG_PROCESS_INFO = False`` in settings stops records from collecting
+  thread and process names, which none of these formatters print. The app
+  applies it with ``drop_process_info()`` at startup; left at True, the
+  ``logging`` module is not touched.
+
+All of it is wired up by ``LOGGING`` in settings:
+
+    logger = logging.getLogger(__name__)
+    logger.info("Session started", extra={'event': 'session.connect', 'client_id': client_id})
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+QUEUE_SIZE = 10000
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the ``extra`` fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep 1 in round(1 / rate) records for each event listed in ``rates``"""
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+        self._seen = Counter()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        rate = self.rates.get(event)
+        if rate is None or rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        every = round(1 / rate)
+        with self._lock:
+            seen = self._seen[event]
+            self._seen[event] += 1
+        if seen % every:
+            return False
+        record.sampled = every
+        return True
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """Hands records to a background writer thread; never blocks the caller"""
+
+    def __init__(self, stream=None, maxsize=QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.target.setFormatter(JsonFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+        # Write out whatever is still queued when the process exits
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the writer thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Only merge the arguments now (they may change later); everything
+        # else is formatted on the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def drop_process_info():
+    """Stop every record in the process from collecting thread and process names"""
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from quickconnect import blobs
+
+
+class Command(BaseCommand):
+    help = 'Repair document blob ref counts, delete orphaned blobs and report deduplication savings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=None,
+            help='Seconds a blob may stay unreferenced (default: BLOB_ORPHAN_GRACE)'
+        )
+
+    def handle(self, *args, **options):
+        removed, freed, repaired = blobs.collect(options['grace'])
+        saved = blobs.savings()
+        self.stdout.write(self.style.SUCCESS(
+            f"🧹 Removed {removed} orphaned blobs ({freed / 1024:.0f} KB), repaired {repaired} ref counts"
+        ))
+        self.stdout.write(
+            f"📦 {saved['blobs']} blobs, {saved['stored_bytes'] / 1024:.0f} KB stored for "
+            f"{saved['uploaded_bytes'] / 1024:.0f} KB uploaded: {saved['saved_bytes'] / 1024:.0f} KB saved"
+        )
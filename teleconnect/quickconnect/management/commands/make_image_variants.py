@@ -0,0 +1,34 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from quickconnect.images import image_pipeline
+from quickconnect.models import Professional, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Resize profile pictures and avatars that have no variants yet (--all redoes every one)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Also redo pictures that already have variants')
+
+    def handle(self, *args, **options):
+        futures = []
+        for model, picture_field, variants_field in (
+            (Professional, 'profile_picture', 'profile_picture_variants'),
+            (UserProfile, 'avatar', 'avatar_variants'),
+        ):
+            rows = model.objects.exclude(**{picture_field: ''}).exclude(**{f'{picture_field}__isnull': True})
+            if not options['all']:
+                rows = rows.filter(**{variants_field: {}})
+            for pk, name in rows.values_list('pk', picture_field):
+                futures.append(image_pipeline.submit(model, pk, name))
+
+        wait([future for future in futures if future is not None])
+        # Let the last done-callbacks record their variants
+        image_pipeline.executor().shutdown(wait=True)
+        metrics = image_pipeline.metrics()
+        self.stdout.write(self.style.SUCCESS(
+            f"🖼️ Resized {metrics['completed']} pictures ({metrics['failed']} failed): "
+            f"{metrics['bytes_in'] / 1024:.0f} KB of originals, {metrics['bytes_out'] / 1024:.0f} KB of variants"
+        ))
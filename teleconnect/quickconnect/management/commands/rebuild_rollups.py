@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from quickconnect import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the analytics rollup buckets from sessions and payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Only rebuild buckets from this many days ago on (default: everything)'
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help=f'Also drop hourly buckets older than {rollups.HOURLY_RETENTION_DAYS} days'
+        )
+
+    def handle(self, *args, **options):
+        written = rollups.rebuild(days=options['days'])
+        scope = f"the last {options['days']} days" if options['days'] is not None else 'all history'
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 Rebuilt rollups for {scope}: "
+            + ', '.join(f'{count} {table}' for table, count in written.items())
+        ))
+
+        if options['prune']:
+            deleted = rollups.prune_hourly()
+            self.stdout.write(f"🧹 Pruned {deleted} hourly buckets")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from quickconnect import search
+
+
+class Command(BaseCommand):
+    help = 'Drop and repopulate the professional full-text search index'
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"🔎 Indexed {indexed} professionals ({search.backend().__class__.__name__})"
+        ))
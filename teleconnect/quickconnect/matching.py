@@ -0,0 +1,251 @@
+"""
+Professional matching scores.
+
+``calculate_matching_score`` scores one professional at a time and is the
+reference definition of the score. ``score_candidates`` computes the same
+scores for a whole candidate set at once: the features are loaded into NumPy
+arrays with a single query (decimals are cast to floats in SQL, so no
+Decimal objects are built per row) and every component is computed column-wise, in
+the same order of floating-point operations as the scalar version, so both
+produce bit-identical results.
+
+``rank_candidates`` then picks the top ``k`` with ``argpartition`` instead of
+sorting every candidate, keeping the same tie order as a stable sort.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+RESPONSE_TIME_SCORES = {
+    '< 1 hour': 1.0,
+    '< 2 hours': 0.9,
+    '< 4 hours': 0.7,
+    '< 8 hours': 0.5,
+    '< 24 hours': 0.3
+}
+DEFAULT_RESPONSE_TIME = '< 4 hours'
+UNKNOWN_RESPONSE_TIME_SCORE = 0.2
+
+FEATURE_FIELDS = ('id', 'online_status', 'available', 'average_rating', 'experience_years', 'avg_response_time', 'rate')
+
+Scores = namedtuple('Scores', ['ids', 'total', 'availability', 'rating', 'experience', 'response_time', 'price_match'])
+
+
+def _preferred_rate(preferences):
+    preferred_rate = (preferences or {}).get('max_rate')
+    return float(preferred_rate) if preferred_rate else None
+
+
+def calculate_matching_score(professional, preferences):
+    """Calculate matching score for a professional based on preferences"""
+    breakdown = {}
+    total_score = 0.0
+
+    # Availability score (30%)
+    availability_score = 0.0
+    if professional.online_status:
+        availability_score += 0.7
+    if professional.available:
+        availability_score += 0.3
+    breakdown['availability'] = availability_score
+    total_score += availability_score * 0.3
+
+    # Rating score (25%)
+    rating_score = (float(professional.average_rating) / 5.0) if professional.average_rating else 0.5
+    breakdown['rating'] = rating_score
+    total_score += rating_score * 0.25
+
+    # Experience score (20%)
+    experience_score = min((professional.experience_years or 1) / 10.0, 1.0)
+    breakdown['experience'] = experience_score
+    total_score += experience_score * 0.2
+
+    # Response time score (15%)
+    response_score = RESPONSE_TIME_SCORES.get(
+        professional.avg_response_time or DEFAULT_RESPONSE_TIME, UNKNOWN_RESPONSE_TIME_SCORE
+    )
+    breakdown['response_time'] = response_score
+    total_score += response_score * 0.15
+
+    # Price match score (10%)
+    preferred_rate = _preferred_rate(preferences)
+    if preferred_rate and professional.rate:
+        price_score = max(0.0, 1 - (float(professional.rate) / preferred_rate))
+        breakdown['price_match'] = price_score
+        total_score += price_score * 0.1
+    else:
+        breakdown['price_match'] = 0.5
+        total_score += 0.05
+
+    # Generate recommendation reason
+    reason = generate_recommendation_reason(professional, breakdown)
+
+    return {
+        'total_score': round(total_score, 3),
+        'breakdown': breakdown,
+        'reason': reason
+    }
+
+
+def generate_recommendation_reason(professional, breakdown):
+    """Generate human-readable recommendation reason"""
+    reasons = []
+
+    if breakdown['availability'] >= 0.8:
+        reasons.append("Highly available")
+    elif breakdown['availability'] >= 0.5:
+        reasons.append("Good availability")
+
+    if breakdown['rating'] >= 0.9:
+        reasons.append("Excellent ratings")
+    elif breakdown['rating'] >= 0.7:
+        reasons.append("Great reviews")
+
+    if breakdown['experience'] >= 0.8:
+        reasons.append("Extensive experience")
+    elif breakdown['experience'] >= 0.5:
+        reasons.append("Good experience level")
+
+    if breakdown['response_time'] >= 0.8:
+        reasons.append("Quick responder")
+
+    if not reasons:
+        reasons.append("Good overall match")
+
+    return ", ".join(reasons)
+
+
+def load_features(rows):
+    """Turn FEATURE_FIELDS tuples into column arrays"""
+    rows = list(rows)
+    if not rows:
+        columns = [()] * len(FEATURE_FIELDS)
+    else:
+        columns = list(zip(*rows))
+
+    ids, online, available, rating, experience, response_time, rate = columns
+    count = len(ids)
+
+    return {
+        'ids': np.fromiter(ids, dtype=np.int64, count=count),
+        'online_status': np.fromiter(online, dtype=bool, count=count),
+        'available': np.fromiter(available, dtype=bool, count=count),
+        'average_rating': np.fromiter(rating, dtype=np.float64, count=count),
+        'experience_years': np.fromiter(experience, dtype=np.float64, count=count),
+        'response_time': np.fromiter(
+            (RESPONSE_TIME_SCORES.get(label or DEFAULT_RESPONSE_TIME, UNKNOWN_RESPONSE_TIME_SCORE)
+             for label in response_time),
+            dtype=np.float64, count=count
+        ),
+        'rate': np.fromiter(rate, dtype=np.float64, count=count),
+    }
+
+
+def feature_rows(queryset):
+    """FEATURE_FIELDS for a Professional queryset, with the decimals read as floats by the database"""
+    return queryset.annotate(
+        rating_value=Cast('average_rating', FloatField()),
+        rate_value=Cast('rate', FloatField()),
+    ).values_list(
+        'id', 'online_status', 'available', 'rating_value', 'experience_years', 'avg_response_time', 'rate_value'
+    )
+
+
+def score_candidates(features, preferences):
+    """Score every candidate at once. ``features`` comes from load_features"""
+    online = features['online_status']
+    available = features['available']
+
+    availability = np.where(online, 0.7, 0.0)
+    availability = np.where(available, availability + 0.3, availability)
+    total = availability * 0.3
+
+    rating = features['average_rating']
+    rating = np.where(rating != 0, rating / 5.0, 0.5)
+    total = total + rating * 0.25
+
+    experience = features['experience_years']
+    experience = np.minimum(np.where(experience != 0, experience, 1.0) / 10.0, 1.0)
+    total = total + experience * 0.2
+
+    response_time = features['response_time']
+    total = total + response_time * 0.15
+
+    rate = features['rate']
+    preferred_rate = _preferred_rate(preferences)
+    if preferred_rate:
+        priced = rate != 0
+        price_match = np.where(priced, np.maximum(0.0, 1 - (rate / preferred_rate)), 0.5)
+        total = total + np.where(priced, price_match * 0.1, 0.05)
+    else:
+        price_match = np.full(rate.shape, 0.5)
+        total = total + 0.05
+
+    return Scores(features['ids'], total, availability, rating, experience, response_time, price_match)
+
+
+def top_k(total, k):
+    """
+    Indices of the k best scores, best first.
+
+    Ranks on the rounded score like the scalar path does, with ties kept in
+    candidate order. Only the rows that can make the cut are rounded and sorted.
+    """
+    count = len(total)
+    if count == 0 or k <= 0:
+        return []
+
+    if count > k:
+        # k-th best raw score; anything that could round to the same value is
+        # within half a unit of the third decimal below it
+        kth = total[np.argpartition(total, count - k)[count - k]]
+        candidates = np.flatnonzero(total >= kth - 0.001)
+        cutoff = round(float(kth), 3)
+    else:
+        candidates = np.arange(count)
+        cutoff = None
+
+    ranked = []
+    for index in candidates.tolist():
+        score = round(float(total[index]), 3)
+        if cutoff is None or score >= cutoff:
+            ranked.append((-score, index))
+    ranked.sort()
+    return [index for _, index in ranked[:k]]
+
+
+def result_for(scores, index):
+    """Score, breakdown and reason for one candidate, shaped like calculate_matching_score"""
+    breakdown = {
+        'availability': float(scores.availability[index]),
+        'rating': float(scores.rating[index]),
+        'experience': float(scores.experience[index]),
+        'response_time': float(scores.response_time[index]),
+        'price_match': float(scores.price_match[index]),
+    }
+    return {
+        'total_score': round(float(scores.total[index]), 3),
+        'breakdown': breakdown,
+        'reason': generate_recommendation_reason(None, breakdown)
+    }
+
+
+def rank_candidates(rows, preferences, k=10):
+    """
+    Score FEATURE_FIELDS rows and return (top k results, candidate count).
+
+    ``rows`` comes from feature_rows(queryset) or from the candidate index.
+    Each result is ``calculate_matching_score``'s dict plus ``professional_id``.
+    """
+    features = load_features(rows)
+    scores = score_candidates(features, preferences)
+
+    results = []
+    for index in top_k(scores.total, k):
+        result = result_for(scores, index)
+        result['professional_id'] = int(scores.ids[index])
+        results.append(result)
+    return results, len(scores.ids)
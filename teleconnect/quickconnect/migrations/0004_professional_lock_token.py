@@ -0,0 +1,23 @@
+# Generated by Django 4.0.3 on 2026-10-17 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickconnect', '0003_rename_client_review_session_review_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='professional',
+            name='lock_token',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='professional',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
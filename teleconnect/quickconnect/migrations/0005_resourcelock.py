@@ -0,0 +1,25 @@
+# Generated by Django 4.0.3 on 2026-10-17 04:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickconnect', '0004_professional_lock_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=200, unique=True)),
+                ('owner', models.CharField(blank=True, max_length=100)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('acquired_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('contention_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
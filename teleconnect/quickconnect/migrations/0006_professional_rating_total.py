@@ -0,0 +1,34 @@
+# Generated by Django 4.0.3 on 2026-10-17 04:29
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_totals(apps, schema_editor):
+    """Seed the counters that incremental rating updates build on"""
+    Professional = apps.get_model('quickconnect', 'Professional')
+    Session = apps.get_model('quickconnect', 'Session')
+
+    rows = Session.objects.filter(rating__isnull=False).values('professional').annotate(
+        reviews=Count('id'), rating_sum=Sum('rating')
+    ).order_by()
+    for row in rows:
+        Professional.objects.filter(id=row['professional']).update(
+            total_reviews=row['reviews'], rating_total=row['rating_sum']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickconnect', '0005_resourcelock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='professional',
+            name='rating_total',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.0.3 on 2026-10-17 05:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+import django.db.models.deletion
+
+
+def backfill_client_stats(apps, schema_editor):
+    """Seed the per-client totals that incremental session updates build on"""
+    ClientStats = apps.get_model('quickconnect', 'ClientStats')
+    Session = apps.get_model('quickconnect', 'Session')
+
+    completed = Q(status='completed')
+    rows = Session.objects.values('client_id').annotate(
+        sessions=Count('id'), completed=Count('id', filter=completed),
+        spent=Sum('cost', filter=completed), last=Max('created_at')
+    ).order_by()
+    ClientStats.objects.bulk_create([
+        ClientStats(client_id=row['client_id'], sessions_count=row['sessions'], completed_sessions=row['completed'],
+                    total_spent=row['spent'] or 0, last_session_at=row['last'])
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('quickconnect', '0007_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientStats',
+            fields=[
+                ('client', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='client_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('sessions_count', models.IntegerField(default=0)),
+                ('completed_sessions', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_session_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Client stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['client_id', 'status', 'created_at'], name='session_client_status_idx'),
+        ),
+        migrations.RunPython(backfill_client_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    # The index table is raw SQL per database (FTS5 / tsvector), not a model
+    from quickconnect import search
+    search.rebuild()
+
+
+def drop_index(apps, schema_editor):
+    from quickconnect import search
+    with schema_editor.connection.cursor() as cursor:
+        for statement in search.backend(schema_editor.connection.vendor).drop_sql():
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickconnect', '0009_chatmessage_session_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.3 on 2026-10-17 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickconnect', '0011_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='professional',
+            name='profile_picture_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.3 on 2026-10-17 06:02
+
+from django.db import migrations, models
+import django.utils.timezone
+import quickconnect.blobs
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickconnect', '0012_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('name', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.BigIntegerField()),
+                ('writes', models.IntegerField(default=1)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('touched_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='professionaldocument',
+            name='file',
+            field=models.FileField(storage=quickconnect.blobs.blob_storage, upload_to='professional_docs/'),
+        ),
+        migrations.AddIndex(
+            model_name='blob',
+            index=models.Index(fields=['ref_count', 'touched_at'], name='blob_orphan_idx'),
+        ),
+    ]
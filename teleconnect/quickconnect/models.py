@@ -5,6 +5,8 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 import uuid
 
+from .blobs import blob_storage
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -29,32 +31,6 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['sort_order', 'name']
-    
-    def update_stats(self):
-        """Update calculated statistics for this category"""
-        # Update professional count
-        self.professional_count = Professional.objects.filter(
-            Q(category=self) | Q(categories=self) | Q(primary_category=self),
-            status='approved'
-        ).distinct().count()
-        
-        # Update session count
-        self.session_count = Session.objects.filter(category=self).count()
-        
-        # Calculate average response time
-        if self.session_count > 0:
-            if self.session_count > 100:
-                self.avg_response_time = 1
-            elif self.session_count > 50:
-                self.avg_response_time = 2
-            elif self.session_count > 20:
-                self.avg_response_time = 3
-            else:
-                self.avg_response_time = 5
-        else:
-            self.avg_response_time = 5
-            
-        self.save()
 
 
 class SubCategory(models.Model):
@@ -108,7 +84,8 @@ class Professional(models.Model):
     locked_by = models.CharField(max_length=100, null=True, blank=True)
     
     # Enhanced locking with timeout
-    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True, db_index=True)
+    lock_token = models.PositiveBigIntegerField(default=0)  # Fencing token, bumped on every acquisition
     max_simultaneous_sessions = models.IntegerField(default=1)
     
     # Status management
@@ -128,6 +105,8 @@ class Professional(models.Model):
     # Enhanced professional details
     title = models.CharField(max_length=100, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='professional_profiles/', blank=True, null=True)
+    # Resized WebP copies of profile_picture by size name (see images.py)
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
     languages = models.JSONField(default=list, blank=True)
     education = models.JSONField(default=list, blank=True)
     certifications = models.JSONField(default=list, blank=True)
@@ -136,6 +115,7 @@ class Professional(models.Model):
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
     total_sessions = models.IntegerField(default=0)
     total_reviews = models.IntegerField(default=0)
+    rating_total = models.IntegerField(default=0)  # Sum of session ratings, keeps average_rating exact
     
     # Response time tracking
     avg_response_time = models.CharField(max_length=20, default='< 4 hours')
@@ -160,15 +140,40 @@ class Professional(models.Model):
     class Meta:
         ordering = ['name']
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted state so signals can apply counter deltas
+        instance._stats_snapshot = instance.stats_snapshot()
+        instance._search_snapshot = instance.search_snapshot()
+        instance._picture_name = instance.__dict__.get('profile_picture') or ''
+        return instance
+    
+    def stats_snapshot(self):
+        """Fields that feed Category.professional_count"""
+        return (
+            self.__dict__.get('status'),
+            self.__dict__.get('category_id'),
+            self.__dict__.get('primary_category_id'),
+        )
+    
+    def search_snapshot(self):
+        """Fields that feed the search index document"""
+        return (
+            self.__dict__.get('name'),
+            self.__dict__.get('specialization'),
+            self.__dict__.get('title'),
+            self.__dict__.get('bio'),
+            self.__dict__.get('primary_category_id'),
+        )
+    
     def save(self, *args, **kwargs):
         # Ensure primary category is set if not provided
-        if not self.primary_category and self.category:
-            self.primary_category = self.category
+        if not self.primary_category_id and self.category_id:
+            self.primary_category_id = self.category_id
         
-        # Ensure the professional is in their primary category
-        if self.primary_category and self.primary_category not in self.categories.all():
-            self.categories.add(self.primary_category)
-            
+        # The post_save signal adds the primary category to self.categories;
+        # doing it here would fail for new rows that have no id yet
         super().save(*args, **kwargs)
     
     @property
@@ -208,18 +213,29 @@ class Professional(models.Model):
     
     def lock_for_session(self, client_id, duration_minutes=5):
         """Lock professional for a session"""
-        if self.is_available_for_session:
-            self.locked_by = client_id
-            self.locked_until = timezone.now() + timezone.timedelta(minutes=duration_minutes)
-            self.save()
-            return True
-        return False
+        from .locking import acquire
+        
+        if not self.is_available_for_session:
+            return False
+        
+        lease = acquire(self.id, client_id, ttl=duration_minutes * 60)
+        if lease is None:
+            return False
+        
+        self.locked_by = client_id
+        self.locked_until = lease.expires_at
+        self.lock_token = lease.token
+        self.available = False
+        return True
     
     def release_lock(self):
         """Release professional lock"""
+        from .locking import release
+        
+        release(self.id)
         self.locked_by = None
         self.locked_until = None
-        self.save()
+        self.available = True
     
     @property
     def average_call_duration(self):
@@ -299,10 +315,18 @@ class ProfessionalDocument(models.Model):
     
     professional = models.ForeignKey(Professional, on_delete=models.CASCADE, related_name='documents')
     document_type = models.CharField(max_length=50, choices=DOCUMENT_TYPES)
-    file = models.FileField(upload_to='professional_docs/')
+    # Stored once per distinct content and reference-counted (see blobs.py)
+    file = models.FileField(upload_to='professional_docs/', storage=blob_storage)
     verified = models.BooleanField(default=False)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored blob so signals can move its reference
+        instance._blob_name = instance.__dict__.get('file') or ''
+        return instance
+    
     def __str__(self):
         return f"{self.professional.name} - {self.get_document_type_display()}"
 
@@ -383,6 +407,42 @@ class Session(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Per-client session lookups (users_list, user_detail, client history)
+            models.Index(fields=['client_id', 'status', 'created_at'], name='session_client_status_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted state so signals can apply counter deltas
+        instance._stats_snapshot = instance.stats_snapshot()
+        instance._rollup_snapshot = instance.rollup_snapshot()
+        return instance
+    
+    def stats_snapshot(self):
+        """Fields that feed the category, professional and client counters"""
+        return (
+            self.__dict__.get('category_id'),
+            self.__dict__.get('professional_id'),
+            self.__dict__.get('rating'),
+            self.__dict__.get('client_id'),
+            self.__dict__.get('status'),
+            self.__dict__.get('cost'),
+            self.__dict__.get('created_at'),
+        )
+    
+    def rollup_snapshot(self):
+        """Fields that feed the analytics rollups"""
+        return (
+            self.__dict__.get('client_id'),
+            self.__dict__.get('created_at'),
+            self.__dict__.get('ended_at'),
+            self.__dict__.get('status'),
+            self.__dict__.get('session_type'),
+            self.__dict__.get('duration'),
+            self.__dict__.get('cost'),
+        )
     
     def save(self, *args, **kwargs):
         # Auto-set category from professional if not set
@@ -463,6 +523,22 @@ class Payment(models.Model):
     def __str__(self):
         return f"Payment #{self.id} - ${self.amount}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted state so signals can apply rollup deltas
+        instance._rollup_snapshot = instance.rollup_snapshot()
+        return instance
+    
+    def rollup_snapshot(self):
+        """Fields that feed the analytics rollups"""
+        return (
+            self.__dict__.get('created_at'),
+            self.__dict__.get('status'),
+            self.__dict__.get('payment_method'),
+            self.__dict__.get('amount'),
+        )
+    
     @property
     def is_successful(self):
         return self.status == 'completed'
@@ -524,6 +600,10 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Cursor reads of a session's messages (chat_feed.py)
+            models.Index(fields=['session', 'id'], name='chatmessage_session_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender_type}: {self.message[:50]}..."
@@ -559,6 +639,8 @@ class UserProfile(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     date_of_birth = models.DateField(blank=True, null=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Resized WebP copies of avatar by size name (see images.py)
+    avatar_variants = models.JSONField(default=dict, blank=True)
     favorite_professionals = models.JSONField(default=list)
     
     # Enhanced user profile fields
@@ -574,6 +656,13 @@ class UserProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored avatar so a new one gets resized (images.py)
+        instance._picture_name = instance.__dict__.get('avatar') or ''
+        return instance
+    
     def __str__(self):
         return f"Profile: {self.user.username}"
 
@@ -750,6 +839,13 @@ class CallRecording(models.Model):
     class Meta:
         ordering = ['-created_at']
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored blob so signals can move its reference
+        instance._blob_name = instance.__dict__.get('file_path') or ''
+        return instance
+    
     def __str__(self):
         return f"Recording - {self.session} - {self.status}"
     
@@ -896,54 +992,506 @@ class SupportTicket(models.Model):
         return f"Ticket #{self.id} - {self.subject}"
 
 
+class ResourceLock(models.Model):
+    """Shared TTL lock on an arbitrary resource name (see lock_store.py)"""
+    resource = models.CharField(max_length=200, unique=True)
+    owner = models.CharField(max_length=100, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    acquired_at = models.DateTimeField(default=timezone.now)
+    
+    # Acquisitions refused because someone else held the lock
+    contention_count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Lock {self.resource} - {self.owner or 'free'}"
+    
+    @property
+    def is_held(self):
+        return bool(self.owner) and self.expires_at > timezone.now()
+
+
+# Pre-aggregated analytics buckets (see rollups.py). Every fact is counted
+# twice: once in its hour and once in its day.
+ROLLUP_GRANULARITY_CHOICES = [
+    ('hour', 'Hour'),
+    ('day', 'Day'),
+]
+
+
+class SessionRollup(models.Model):
+    """Sessions by creation time, status and type"""
+    granularity = models.CharField(max_length=4, choices=ROLLUP_GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    status = models.CharField(max_length=12)
+    session_type = models.CharField(max_length=10)
+
+    sessions = models.IntegerField(default=0)
+    duration_total = models.BigIntegerField(default=0)
+    cost_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['granularity', 'bucket', 'status', 'session_type']
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:00} {self.status}/{self.session_type}: {self.sessions}"
+
+
+class RevenueRollup(models.Model):
+    """Completed sessions by end time"""
+    granularity = models.CharField(max_length=4, choices=ROLLUP_GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+
+    sessions = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['granularity', 'bucket']
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:00}: ${self.revenue}"
+
+
+class PaymentRollup(models.Model):
+    """Payments by creation time, status and method"""
+    granularity = models.CharField(max_length=4, choices=ROLLUP_GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    status = models.CharField(max_length=10)
+    payment_method = models.CharField(max_length=50)
+
+    payments = models.IntegerField(default=0)
+    amount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['granularity', 'bucket', 'status', 'payment_method']
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:00} {self.status}/{self.payment_method}: {self.payments}"
+
+
+class ClientActivityRollup(models.Model):
+    """Sessions each client started per day, for distinct-client metrics"""
+    day = models.DateField()
+    client_id = models.IntegerField()
+    sessions = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['day', 'client_id']
+
+    def __str__(self):
+        return f"{self.day} client {self.client_id}: {self.sessions}"
+
+
+class ClientStats(models.Model):
+    """Denormalized session totals per client, maintained by stats.py"""
+    # Session.client_id is a plain integer, so sessions can belong to ids
+    # without a User row: no database constraint
+    client = models.OneToOneField(
+        User, on_delete=models.DO_NOTHING, primary_key=True, db_constraint=False, related_name='client_stats'
+    )
+    sessions_count = models.IntegerField(default=0)
+    completed_sessions = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_session_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name_plural = "Client stats"
+    
+    def __str__(self):
+        return f"Client {self.client_id}: {self.sessions_count} sessions, ${self.total_spent}"
+
+
+
+class UploadSession(models.Model):
+    """A chunked upload in progress (see uploads.py)"""
+    UPLOAD_KIND_CHOICES = [
+        ('license', 'License'),
+        ('profile_image', 'Profile image'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=UPLOAD_KIND_CHOICES)
+    file_name = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField()
+    # SHA-256 the client expects the assembled file to have, if it sent one
+    checksum = models.CharField(max_length=64, blank=True)
+    received = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"Upload {self.id} ({self.kind}): {self.received}/{self.size} bytes"
+
+
+class Blob(models.Model):
+    """A file in BlobStorage, named by the SHA-256 of its content (see blobs.py)"""
+    name = models.CharField(max_length=200, primary_key=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField()
+    
+    # Times this content was uploaded; all but the first were deduplicated
+    writes = models.IntegerField(default=1)
+    # ProfessionalDocument and CallRecording rows pointing at it
+    ref_count = models.IntegerField(default=0)
+    # Last write, retain or release; orphans are collected after a grace period
+    touched_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['ref_count', 'touched_at'], name='blob_orphan_idx')]
+    
+    def __str__(self):
+        return f"{self.name} ({self.size} bytes, {self.ref_count} refs)"
+
+
+class Sequence(models.Model):
+    """A named counter shared by every process, e.g. roster versions (see roster.py)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
 # Signals to maintain data integrity
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 from django.db.models import Q, Count, Sum, Avg
 
 @receiver(post_save, sender=Professional)
 def update_professional_categories(sender, instance, created, **kwargs):
     """Ensure professional is in their categories and update stats"""
-    if instance.primary_category and instance.primary_category not in instance.categories.all():
+    from . import stats
+    
+    # Count status/FK changes first so the M2M add below is seen as FK-linked
+    new = instance.stats_snapshot()
+    stats.apply_professional_change(instance.id, None if created else getattr(instance, '_stats_snapshot', new), new)
+    instance._stats_snapshot = new
+    
+    if instance.primary_category_id and not instance.categories.filter(id=instance.primary_category_id).exists():
         instance.categories.add(instance.primary_category)
+
+@receiver(post_delete, sender=Professional)
+def remove_professional_from_roster(sender, instance, **kwargs):
+    """Tell connected roster clients the professional is gone"""
+    from .roster import publish_remove
+    publish_remove(instance.id)
+
+@receiver(post_delete, sender=Professional)
+def remove_professional_stats(sender, instance, **kwargs):
+    """Drop a deleted professional from its categories' counts"""
+    from . import stats
     
-    # Update category stats
-    if instance.primary_category:
-        instance.primary_category.update_stats()
+    # ProfessionalCategory rows were already deleted (and counted) by the cascade
+    stats.apply_professional_change(instance.id, getattr(instance, '_stats_snapshot', instance.stats_snapshot()), None)
 
 @receiver(post_save, sender=Session)
+def update_session_stats(sender, instance, created, **kwargs):
+    """Move category and professional counters by this session's change"""
+    from . import stats
+    
+    new = instance.stats_snapshot()
+    if created:
+        stats.apply_session_change(None, new)
+    elif hasattr(instance, '_stats_snapshot'):
+        stats.apply_session_change(instance._stats_snapshot, new)
+    # Instances not loaded from the database have no known previous state;
+    # the periodic reconciliation picks those up.
+    instance._stats_snapshot = new
+
 @receiver(post_delete, sender=Session)
-def update_category_session_stats(sender, instance, **kwargs):
-    """Update category session statistics"""
-    if instance.category:
-        instance.category.update_stats()
+def remove_session_stats(sender, instance, **kwargs):
+    """Remove a deleted session from the counters"""
+    from . import stats
+    
+    stats.apply_session_change(getattr(instance, '_stats_snapshot', instance.stats_snapshot()), None)
 
 @receiver(post_save, sender=ProfessionalCategory)
+def add_category_membership_stats(sender, instance, created, **kwargs):
+    """Count a professional joining a category through the through model"""
+    from . import stats
+    
+    if created:
+        professional = instance.professional
+        snapshot = getattr(professional, '_stats_snapshot', professional.stats_snapshot())
+        stats.apply_membership_change(snapshot, [instance.category_id], 1)
+
 @receiver(post_delete, sender=ProfessionalCategory)
-def update_category_professional_stats(sender, instance, **kwargs):
-    """Update category professional statistics"""
-    instance.category.update_stats()
+def remove_category_membership_stats(sender, instance, **kwargs):
+    """Count a professional leaving a category through the through model"""
+    from . import stats
+    
+    professional = Professional.objects.filter(id=instance.professional_id).first()
+    if professional is not None:
+        stats.apply_membership_change(professional._stats_snapshot, [instance.category_id], -1)
 
-@receiver(post_save, sender=Session)
-def update_professional_session_stats(sender, instance, **kwargs):
-    """Update professional session statistics"""
-    if instance.professional:
-        professional = instance.professional
-        # Update total sessions
-        professional.total_sessions = professional.sessions.count()
-        
-        # Update average rating if session has rating
-        if instance.rating:
-            avg_rating = professional.sessions.filter(
-                rating__isnull=False
-            ).aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
-            professional.average_rating = avg_rating
-        
-        professional.save()
+@receiver(m2m_changed, sender=Professional.categories.through)
+def update_category_membership_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    """Count categories.add(), which bulk-creates through rows without post_save"""
+    from . import stats
+    
+    # remove()/clear() delete through rows one by one and are counted by
+    # remove_category_membership_stats
+    if action != 'post_add' or not pk_set:
+        return
+    
+    if reverse:
+        # category.multi_category_professionals.add(...): pk_set holds professionals
+        for professional in Professional.objects.filter(id__in=pk_set):
+            stats.apply_membership_change(professional._stats_snapshot, [instance.id], 1)
+    else:
+        stats.apply_membership_change(getattr(instance, '_stats_snapshot', None), pk_set, 1)
 
 @receiver(post_save, sender=Payment)
 def update_session_payment_status(sender, instance, **kwargs):
     """Update session cost when payment is completed"""
     if instance.status == 'completed' and instance.session.cost == 0:
         instance.session.cost = instance.amount
-        instance.session.save()
\ No newline at end of file
+        instance.session.save()
+
+@receiver(post_save, sender=Session)
+def update_session_rollups(sender, instance, created, **kwargs):
+    """Move this session's change into the analytics buckets"""
+    from . import rollups
+    
+    new = instance.rollup_snapshot()
+    if created:
+        rollups.apply_session_change(None, new)
+    elif hasattr(instance, '_rollup_snapshot'):
+        rollups.apply_session_change(instance._rollup_snapshot, new)
+    # As with the counters, rows saved without a known previous state are
+    # left for rebuild_rollups
+    instance._rollup_snapshot = new
+
+@receiver(post_delete, sender=Session)
+def remove_session_rollups(sender, instance, **kwargs):
+    """Take a deleted session out of the analytics buckets"""
+    from . import rollups
+    
+    rollups.apply_session_change(getattr(instance, '_rollup_snapshot', instance.rollup_snapshot()), None)
+
+@receiver(post_save, sender=Payment)
+def update_payment_rollups(sender, instance, created, **kwargs):
+    """Move this payment's change into the analytics buckets"""
+    from . import rollups
+    
+    new = instance.rollup_snapshot()
+    if created:
+        rollups.apply_payment_change(None, new)
+    elif hasattr(instance, '_rollup_snapshot'):
+        rollups.apply_payment_change(instance._rollup_snapshot, new)
+    instance._rollup_snapshot = new
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_rollups(sender, instance, **kwargs):
+    """Take a deleted payment out of the analytics buckets"""
+    from . import rollups
+    
+    rollups.apply_payment_change(getattr(instance, '_rollup_snapshot', instance.rollup_snapshot()), None)
+
+@receiver(post_save, sender=Professional)
+def refresh_candidate_index(sender, instance, **kwargs):
+    """Re-index a professional once the save commits"""
+    from .candidate_index import candidate_index
+    candidate_index.after_commit(candidate_index.refresh, [instance.id])
+
+@receiver(post_delete, sender=Professional)
+def remove_from_candidate_index(sender, instance, **kwargs):
+    """Drop a deleted professional from the candidate index"""
+    from .candidate_index import candidate_index
+    candidate_index.after_commit(candidate_index.remove, instance.id)
+
+@receiver(post_save, sender=ProfessionalCategory)
+@receiver(post_delete, sender=ProfessionalCategory)
+def refresh_candidate_index_membership(sender, instance, **kwargs):
+    """Re-index a professional whose category membership changed"""
+    from .candidate_index import candidate_index
+    candidate_index.after_commit(candidate_index.refresh, [instance.professional_id])
+
+@receiver(m2m_changed, sender=Professional.categories.through)
+def refresh_candidate_index_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    """Re-index professionals after categories.add()/remove()/clear()"""
+    from .candidate_index import candidate_index
+    
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        candidate_index.after_commit(candidate_index.refresh, [instance.id])
+    elif pk_set:
+        candidate_index.after_commit(candidate_index.refresh, set(pk_set))
+    else:
+        # category.multi_category_professionals.clear()
+        candidate_index.after_commit(candidate_index.refresh_category_members, instance.id)
+
+@receiver(post_save, sender=Category)
+def refresh_candidate_index_category(sender, instance, **kwargs):
+    """Pick up renamed, enabled or disabled categories"""
+    from .candidate_index import candidate_index
+    candidate_index.after_commit(candidate_index.refresh_categories, [instance.id])
+    candidate_index.after_commit(candidate_index.refresh_category_members, instance.id)
+
+@receiver(post_delete, sender=Category)
+def remove_candidate_index_category(sender, instance, **kwargs):
+    """Forget a deleted category and re-index the professionals filed under it"""
+    from .candidate_index import candidate_index
+    candidate_index.after_commit(candidate_index.refresh_category_members, instance.id)
+    candidate_index.after_commit(candidate_index.refresh_categories, [instance.id])
+
+@receiver(post_save, sender=Professional)
+def update_search_index(sender, instance, created, **kwargs):
+    """Re-index a professional whose name, specialization, bio or category changed"""
+    from . import search
+    
+    new = instance.search_snapshot()
+    # Availability, rating and lock changes are read from the professional row at query time
+    if created or getattr(instance, '_search_snapshot', None) != new:
+        search.index_professionals([instance.id])
+    instance._search_snapshot = new
+
+@receiver(post_delete, sender=Professional)
+def remove_from_search_index(sender, instance, **kwargs):
+    from . import search
+    search.remove_professionals([instance.id])
+
+@receiver(post_save, sender=ProfessionalCategory)
+@receiver(post_delete, sender=ProfessionalCategory)
+def update_search_index_membership(sender, instance, **kwargs):
+    """Category names are part of the document"""
+    from . import search
+    if Professional.objects.filter(id=instance.professional_id).exists():
+        search.index_professionals([instance.professional_id])
+
+@receiver(m2m_changed, sender=Professional.categories.through)
+def update_search_index_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    """Re-index after categories.add()/remove()/clear()"""
+    from . import search
+    
+    if action == 'pre_clear' and reverse:
+        # category.multi_category_professionals.clear(): remember who was in it
+        instance._search_members = search.category_members(instance.id)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.index_professionals([instance.id])
+    elif pk_set:
+        search.index_professionals(pk_set)
+    else:
+        search.index_professionals(getattr(instance, '_search_members', ()))
+
+@receiver(post_save, sender=Category)
+def update_search_index_category(sender, instance, created, **kwargs):
+    """Pick up a renamed category in its members' documents"""
+    from . import search
+    if not created:
+        search.index_professionals(search.category_members(instance.id))
+
+@receiver(pre_delete, sender=Category)
+def collect_search_index_category(sender, instance, **kwargs):
+    from . import search
+    instance._search_members = search.category_members(instance.id)
+
+@receiver(post_delete, sender=Category)
+def update_search_index_deleted_category(sender, instance, **kwargs):
+    """Drop a deleted category's name from its former members' documents"""
+    from . import search
+    search.index_professionals(getattr(instance, '_search_members', ()))
+
+@receiver(post_save, sender=Professional)
+@receiver(post_delete, sender=Professional)
+def update_autocomplete(sender, instance, **kwargs):
+    """Names, specializations and category weights follow approved professionals"""
+    from .autocomplete import autocomplete_index, professional_entry
+    if kwargs.get('signal') is post_delete:
+        autocomplete_index.after_commit(
+            autocomplete_index.professional_changed, instance.id, None,
+            getattr(instance, '_autocomplete_subcategories', None)
+        )
+    else:
+        autocomplete_index.after_commit(autocomplete_index.professional_changed, instance.id, professional_entry(instance))
+
+@receiver(pre_delete, sender=Professional)
+def collect_autocomplete_subcategories(sender, instance, **kwargs):
+    """The subcategory links are gone by post_delete"""
+    from .autocomplete import autocomplete_index
+    if autocomplete_index.ready or autocomplete_index.loading:
+        instance._autocomplete_subcategories = list(instance.subcategories.values_list('id', flat=True))
+
+@receiver(post_save, sender=ProfessionalCategory)
+@receiver(post_delete, sender=ProfessionalCategory)
+def update_autocomplete_membership(sender, instance, **kwargs):
+    from .autocomplete import autocomplete_index
+    autocomplete_index.after_commit(autocomplete_index.refresh_categories, [instance.category_id])
+
+@receiver(m2m_changed, sender=Professional.categories.through)
+@receiver(m2m_changed, sender=Professional.subcategories.through)
+def update_autocomplete_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    """Re-weight categories and subcategories after add()/remove()/clear()"""
+    from .autocomplete import autocomplete_index
+    
+    if sender is Professional.categories.through:
+        refresh, related = autocomplete_index.refresh_categories, 'categories'
+    else:
+        refresh, related = autocomplete_index.refresh_subcategories, 'subcategories'
+    if action == 'pre_clear' and not reverse:
+        # professional.categories.clear(): remember what it was in
+        instance._autocomplete_cleared = list(getattr(instance, related).values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        autocomplete_index.after_commit(refresh, [instance.id])
+    else:
+        autocomplete_index.after_commit(refresh, pk_set or getattr(instance, '_autocomplete_cleared', ()))
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def update_autocomplete_category(sender, instance, **kwargs):
+    from .autocomplete import autocomplete_index
+    autocomplete_index.after_commit(autocomplete_index.refresh_categories, [instance.id])
+
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def update_autocomplete_subcategory(sender, instance, **kwargs):
+    from .autocomplete import autocomplete_index
+    autocomplete_index.after_commit(autocomplete_index.refresh_subcategories, [instance.id])
+
+@receiver(post_save, sender=Professional)
+@receiver(post_save, sender=UserProfile)
+def process_profile_picture(sender, instance, created, **kwargs):
+    """Resize a new profile picture or avatar in the image pool"""
+    from .images import picture_changed
+    picture_changed(instance, created)
+
+@receiver(post_save, sender=ProfessionalDocument)
+@receiver(post_save, sender=CallRecording)
+def move_blob_reference(sender, instance, created, **kwargs):
+    """Point the blob reference at the file the row now has"""
+    from . import blobs
+    
+    name = str(instance.file if sender is ProfessionalDocument else instance.file_path or '')
+    previous = '' if created else getattr(instance, '_blob_name', '')
+    if name != previous:
+        blobs.retain(name)
+        blobs.release(previous)
+    instance._blob_name = name
+
+@receiver(post_delete, sender=ProfessionalDocument)
+@receiver(post_delete, sender=CallRecording)
+def release_blob_reference(sender, instance, **kwargs):
+    from . import blobs
+    blobs.release(getattr(instance, '_blob_name', ''))
+
+@receiver(post_save, sender=ChatMessage)
+def wake_message_pollers(sender, instance, created, **kwargs):
+    """Release long-polls waiting for this session's next message"""
+    from django.db import transaction
+    from .chat_feed import message_signal
+    
+    if created:
+        session_id = instance.session_id
+        transaction.on_commit(lambda: message_signal.notify(session_id))
+
+@receiver(post_save, sender=Session)
+def announce_session_request(sender, instance, created, **kwargs):
+    """Push new sessions to the professional's dashboard socket"""
+    from .professional_feed import publish_session_request
+    
+    if created:
+        publish_session_request(instance.id)
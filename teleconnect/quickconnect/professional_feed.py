@@ -0,0 +1,82 @@
+"""
+Real-time feed for the professional dashboard.
+
+Professionals connect to ``ws/professional/<professional_id>/?token=<key>``
+(the key ``api_login`` returns; a logged-in session works too) and join the
+``professional_<id>`` channel-layer group that SessionConsumer publishes to.
+Only the professional's own account and staff are let in.
+Instead of polling ``professional_pending_requests`` the dashboard gets:
+
+- a ``pending_requests`` snapshot when it connects (and again on
+  ``{"type": "get_pending_requests"}``)
+- ``session_request`` as soon as a new session with the professional commits
+- the events SessionConsumer pushes while a session runs:
+  ``incoming_call``, ``chat_message``, ``session_confirmed``,
+  ``session_ended``, ``call_ended`` and ``client_paused``
+
+Answers (``call_accepted`` / ``call_rejected``) and the professional's chat
+go back to the client's ``session_<professional>_<client>`` group.
+"""
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F
+
+from .models import Session
+
+PENDING_STATUSES = ('pending', 'active')
+
+REQUEST_FIELDS = ('id', 'client_id', 'session_type', 'created_at')
+
+
+def professional_group(professional_id):
+    return f'professional_{professional_id}'
+
+
+def session_group(professional_id, client_id):
+    return f'session_{professional_id}_{client_id}'
+
+
+def _request_rows(sessions, *extra):
+    return sessions.values(*REQUEST_FIELDS, *extra, category_name=F('professional__primary_category__name'))
+
+
+def request_row(row):
+    """Pending request entry from a ``_request_rows()`` dict"""
+    return {
+        'id': row['id'],
+        'client_id': row['client_id'],
+        'category': row['category_name'] or 'General',
+        'mode': row['session_type'],
+        'created_at': row['created_at'].isoformat(),
+        'urgency': 'medium'
+    }
+
+
+def pending_requests(professional_id):
+    """Sessions waiting on the professional, newest first, in one query"""
+    sessions = Session.objects.filter(
+        professional_id=professional_id,
+        status__in=PENDING_STATUSES
+    ).order_by('-created_at')
+    return [request_row(row) for row in _request_rows(sessions)]
+
+
+def publish_session_request(session_id):
+    """Push a newly opened session to its professional's dashboards"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    def send():
+        row = _request_rows(Session.objects.filter(id=session_id), 'professional_id').first()
+        if row is None:
+            return
+        async_to_sync(channel_layer.group_send)(professional_group(row['professional_id']), {
+            'type': 'session_request',
+            'request': request_row(row),
+        })
+
+    # Only announce sessions that actually committed
+    transaction.on_commit(send)
@@ -0,0 +1,201 @@
+"""
+Bulk serialization of professional listings.
+
+Listing views used to walk model instances and touch ``pro.primary_category``
+and ``pro.categories.all()`` per row, costing one or two extra queries per
+professional. ``fetch_rows()`` reads the listing in a constant number of
+queries instead:
+
+- one ``values()`` query for the professionals, with the primary category
+  name joined in
+- with ``categories=True``, one more query for every linked category of
+  every professional in the listing
+
+The ``*_row()`` builders turn those dicts into the JSON shapes the views
+have always returned. ``with_session_stats()`` adds per-professional session
+counts and revenue to a listing as one grouped query.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .images import variant_url
+from .models import ProfessionalCategory
+
+
+def fetch_rows(queryset, fields, categories=False):
+    """
+    ``values()`` dicts for ``queryset`` with ``primary_category_name`` added.
+
+    With ``categories`` each row also gets ``category_links``: the
+    (id, name) pairs of the professional's linked categories, in category
+    order.
+    """
+    rows = list(queryset.values(*fields, 'primary_category_id', primary_category_name=F('primary_category__name')))
+    if not categories:
+        return rows
+
+    links = defaultdict(list)
+    if rows:
+        for professional_id, category_id, name in (
+            ProfessionalCategory.objects.filter(professional_id__in=queryset.values('id'))
+            .order_by('category__sort_order', 'category__name')
+            .values_list('professional_id', 'category_id', 'category__name')
+        ):
+            links[professional_id].append((category_id, name))
+    for row in rows:
+        row['category_links'] = links.get(row['id'], [])
+    return rows
+
+
+def _category_name(row, default):
+    return row['primary_category_name'] if row['primary_category_id'] else default
+
+
+LISTING_FIELDS = (
+    'id', 'name', 'specialization', 'rate', 'available', 'online_status', 'average_rating',
+    'total_sessions', 'experience_years', 'email', 'phone', 'avg_response_time',
+    'profile_picture', 'profile_picture_variants',
+)
+
+
+def listing_row(row, favorites=None):
+    """professional_list entry; needs LISTING_FIELDS fetched with categories=True"""
+    all_categories = []
+    if row['primary_category_id']:
+        all_categories.append({
+            'id': row['primary_category_id'],
+            'name': row['primary_category_name'],
+            'is_primary': True
+        })
+    for category_id, name in row['category_links']:
+        if category_id != row['primary_category_id']:
+            all_categories.append({
+                'id': category_id,
+                'name': name,
+                'is_primary': False
+            })
+
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'specialization': row['specialization'],
+        'rate': float(row['rate']),
+        'available': row['available'],
+        'online_status': row['online_status'],
+        'category': _category_name(row, 'General'),
+        'categories': all_categories,
+        'average_rating': float(row['average_rating']),
+        'total_sessions': row['total_sessions'],
+        'experience_years': row['experience_years'],
+        'email': row['email'],
+        'phone': row['phone'],
+        'is_favorite': row['id'] in favorites if favorites is not None else False,
+        'avg_response_time': row['avg_response_time'],
+        'profile_picture': variant_url(row['profile_picture_variants'], 'small', row['profile_picture'])
+    }
+
+
+ADMIN_FIELDS = ('id', 'name', 'email', 'specialization', 'online_status', 'available', 'status', 'rate')
+
+
+def admin_row(row):
+    """admin_professionals_api entry; needs ADMIN_FIELDS"""
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'email': row['email'],
+        'specialization': row['specialization'],
+        'is_online': row['online_status'],
+        'is_available': row['available'],
+        'status': row['status'],
+        'rate': float(row['rate']) if row['rate'] else 0,
+        'category': _category_name(row, 'General')
+    }
+
+
+PENDING_FIELDS = ('id', 'name', 'specialization', 'rate', 'email', 'phone', 'created_at', 'experience_years', 'bio')
+
+
+def pending_row(row):
+    """pending_professionals entry; needs PENDING_FIELDS"""
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'specialization': row['specialization'],
+        'rate': float(row['rate']),
+        'email': row['email'],
+        'phone': row['phone'],
+        'created_at': row['created_at'].isoformat(),
+        'category': _category_name(row, 'Not specified'),
+        'experience_years': row['experience_years'],
+        'bio': row['bio']
+    }
+
+
+DEBUG_FIELDS = ('id', 'name', 'email', 'status', 'available', 'online_status', 'specialization', 'rate')
+
+
+def debug_row(row):
+    """debug_all_professionals entry; needs DEBUG_FIELDS"""
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'email': row['email'],
+        'status': row['status'],
+        'available': row['available'],
+        'online_status': row['online_status'],
+        'specialization': row['specialization'],
+        'rate': float(row['rate']) if row['rate'] else 0,
+        'category': _category_name(row, 'None')
+    }
+
+
+def with_session_stats(queryset):
+    """Annotate sessions_count, completed_sessions and total_revenue in the listing query"""
+    completed = Q(sessions__status='completed')
+    return queryset.annotate(
+        sessions_count=Count('sessions'),
+        completed_sessions=Count('sessions', filter=completed),
+        total_revenue=Coalesce(
+            Sum('sessions__cost', filter=completed), Value(Decimal('0')),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        ),
+    )
+
+
+STATS_FIELDS = (
+    'id', 'name', 'specialization', 'rate', 'status', 'available', 'online_status', 'email', 'phone',
+    'average_rating', 'total_sessions', 'sessions_count', 'completed_sessions', 'total_revenue', 'created_at',
+)
+
+# Columns all_professionals can sort by
+STATS_SORT_FIELDS = (
+    'name', 'rate', 'status', 'average_rating', 'total_sessions', 'sessions_count',
+    'completed_sessions', 'total_revenue', 'created_at',
+)
+
+
+def stats_row(row):
+    """all_professionals entry; needs STATS_FIELDS from a with_session_stats() queryset"""
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'specialization': row['specialization'],
+        'rate': float(row['rate']),
+        'status': row['status'],
+        'available': row['available'],
+        'online_status': row['online_status'],
+        'email': row['email'],
+        'phone': row['phone'],
+        'category': _category_name(row, 'General'),
+        'average_rating': float(row['average_rating']),
+        'total_sessions': row['total_sessions'],
+        'sessions_count': row['sessions_count'],
+        'completed_sessions': row['completed_sessions'],
+        'total_revenue': float(row['total_revenue']),
+        'created_at': row['created_at'].isoformat(),
+    }
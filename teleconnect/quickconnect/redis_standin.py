@@ -0,0 +1,448 @@
+"""
+In-memory stand-in for a Redis server.
+
+Speaks enough of the RESP2 protocol for the Redis-backed lock store and
+channel layer to run against it in tests and local development, without a
+real Redis install:
+
+    server = StandInRedisServer()
+    server.start()
+    LOCK_STORE = {'BACKEND': '...RedisLockStore', 'OPTIONS': {'url': server.url}}
+    ...
+    server.stop()
+
+Supported commands: PING, ECHO, SELECT, GET, SET (NX/XX/EX/PX), DEL, EXISTS,
+INCR, INCRBY, PTTL, TTL, PEXPIRE, EXPIRE, KEYS, FLUSHDB, FLUSHALL, WATCH,
+UNWATCH, MULTI, EXEC, DISCARD, lists (RPUSH, LPUSH, LPOP, BLPOP, LLEN) and
+sorted sets (ZADD, ZREM, ZCARD, ZRANGE, ZREMRANGEBYSCORE). Anything else
+returns an error reply.
+"""
+
+import fnmatch
+import socketserver
+import threading
+import time
+from collections import deque
+
+
+class _Error(Exception):
+    pass
+
+
+class _Store:
+    """Keyspace shared by every connection, with lazy expiry"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.pushed = threading.Condition(self.lock)  # wakes BLPOP
+        self.data = {}
+        self.expires = {}  # key -> monotonic deadline
+        self.versions = {}  # key -> write counter, for WATCH
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+            self._touch(key)
+        return key in self.data
+
+    def get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def typed(self, key, kind, create=False):
+        """The bytes, deque or dict stored at key, optionally creating it"""
+        value = self.get(key)
+        if value is None:
+            if not create:
+                return None
+            value = self.data[key] = kind()
+        elif not isinstance(value, kind):
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def drop_if_empty(self, key):
+        if key in self.data and not self.data[key]:
+            self.delete(key)
+
+    def set(self, key, value, ttl_ms=None):
+        self.data[key] = value
+        if ttl_ms is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + ttl_ms / 1000
+        self._touch(key)
+
+    def delete(self, key):
+        existed = self._alive(key)
+        self.data.pop(key, None)
+        self.expires.pop(key, None)
+        if existed:
+            self._touch(key)
+        return existed
+
+    def pttl(self, key):
+        if not self._alive(key):
+            return -2
+        deadline = self.expires.get(key)
+        if deadline is None:
+            return -1
+        return max(0, int((deadline - time.monotonic()) * 1000))
+
+    def expire(self, key, ttl_ms):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + ttl_ms / 1000
+        self._touch(key)
+        return 1
+
+    def keys(self, pattern):
+        return [k for k in list(self.data) if self._alive(k) and fnmatch.fnmatchcase(k.decode(), pattern.decode())]
+
+    def flush(self):
+        for key in list(self.data):
+            self._touch(key)
+        self.data.clear()
+        self.expires.clear()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self.store = self.server.store
+        self.watched = {}
+        self.queued = None  # list of commands while inside MULTI
+
+    # RESP encoding ------------------------------------------------------
+
+    def _write(self, reply):
+        self.wfile.write(self._encode(reply))
+
+    def _encode(self, reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, _Error):
+            return b"-ERR " + str(reply).encode() + b"\r\n"
+        if isinstance(reply, bool):
+            return b":1\r\n" if reply else b":0\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, str):
+            return b"+" + reply.encode() + b"\r\n"
+        if isinstance(reply, float):
+            return self._encode(repr(reply).encode())
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(self._encode(item) for item in reply)
+        raise TypeError(type(reply))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, e.g. from telnet
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                break
+            if not args:
+                continue
+            self._write(self.dispatch(args))
+
+    # Commands -----------------------------------------------------------
+
+    def dispatch(self, args):
+        name = args[0].upper().decode()
+        if self.queued is not None and name not in ("EXEC", "DISCARD", "MULTI", "WATCH"):
+            self.queued.append(args)
+            return "QUEUED"
+        handler = getattr(self, "cmd_" + name.lower(), None)
+        if handler is None:
+            return _Error(f"unknown command '{name}'")
+        try:
+            with self.store.lock:
+                return handler(*args[1:])
+        except _Error as e:
+            return e
+        except (TypeError, ValueError):
+            return _Error(f"wrong arguments for '{name}' command")
+
+    def cmd_ping(self, message=None):
+        return message if message is not None else "PONG"
+
+    def cmd_echo(self, message):
+        return message
+
+    def cmd_select(self, index):
+        return "OK"
+
+    def cmd_client(self, *args):
+        return "OK"
+
+    def cmd_get(self, key):
+        return self.store.typed(key, bytes)
+
+    def cmd_set(self, key, value, *options):
+        ttl_ms = None
+        nx = xx = False
+        options = list(options)
+        while options:
+            option = options.pop(0).upper()
+            if option == b"NX":
+                nx = True
+            elif option == b"XX":
+                xx = True
+            elif option == b"PX":
+                ttl_ms = int(options.pop(0))
+            elif option == b"EX":
+                ttl_ms = int(options.pop(0)) * 1000
+            else:
+                raise _Error("syntax error")
+        exists = self.store._alive(key)
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.store.set(key, value, ttl_ms)
+        return "OK"
+
+    def cmd_del(self, *keys):
+        return sum(self.store.delete(key) for key in keys)
+
+    def cmd_exists(self, *keys):
+        return sum(self.store._alive(key) for key in keys)
+
+    def cmd_incrby(self, key, amount):
+        current = self.store.typed(key, bytes)
+        try:
+            value = int(current or 0) + int(amount)
+        except ValueError:
+            raise _Error("value is not an integer or out of range")
+        ttl = self.store.pttl(key)
+        self.store.set(key, str(value).encode(), ttl if ttl >= 0 else None)
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, b"1")
+
+    def cmd_pttl(self, key):
+        return self.store.pttl(key)
+
+    def cmd_ttl(self, key):
+        ttl = self.store.pttl(key)
+        return ttl if ttl < 0 else ttl // 1000
+
+    def cmd_pexpire(self, key, ttl_ms):
+        return self.store.expire(key, int(ttl_ms))
+
+    def cmd_expire(self, key, ttl):
+        return self.store.expire(key, int(ttl) * 1000)
+
+    def cmd_keys(self, pattern):
+        return self.store.keys(pattern)
+
+    # Lists --------------------------------------------------------------
+
+    def _push(self, key, values, left):
+        items = self.store.typed(key, deque, create=True)
+        for value in values:
+            if left:
+                items.appendleft(value)
+            else:
+                items.append(value)
+        self.store._touch(key)
+        self.store.pushed.notify_all()
+        return len(items)
+
+    def cmd_rpush(self, key, *values):
+        return self._push(key, values, left=False)
+
+    def cmd_lpush(self, key, *values):
+        return self._push(key, values, left=True)
+
+    def cmd_llen(self, key):
+        items = self.store.typed(key, deque)
+        return len(items) if items else 0
+
+    def _lpop(self, key):
+        items = self.store.typed(key, deque)
+        if not items:
+            return None
+        value = items.popleft()
+        self.store._touch(key)
+        self.store.drop_if_empty(key)
+        return value
+
+    def cmd_lpop(self, key, count=None):
+        if count is None:
+            return self._lpop(key)
+        popped = [self._lpop(key) for _ in range(int(count))]
+        return [value for value in popped if value is not None] or None
+
+    def cmd_blpop(self, *args):
+        # Runs with the store lock held; waiting on the condition releases it
+        keys, timeout = args[:-1], float(args[-1])
+        deadline = time.monotonic() + timeout if timeout > 0 else None
+        while True:
+            for key in keys:
+                value = self._lpop(key)
+                if value is not None:
+                    return [key, value]
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return None
+            self.store.pushed.wait(remaining)
+
+    # Sorted sets --------------------------------------------------------
+
+    def cmd_zadd(self, key, *args):
+        members = self.store.typed(key, dict, create=True)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            added += member not in members
+            members[member] = float(score)
+        self.store._touch(key)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        current = self.store.typed(key, dict)
+        if not current:
+            return 0
+        removed = sum(current.pop(member, None) is not None for member in members)
+        self.store._touch(key)
+        self.store.drop_if_empty(key)
+        return removed
+
+    def cmd_zcard(self, key):
+        members = self.store.typed(key, dict)
+        return len(members) if members else 0
+
+    def cmd_zrange(self, key, start, stop, *options):
+        members = self.store.typed(key, dict)
+        if not members:
+            return []
+        ordered = sorted(members.items(), key=lambda item: (item[1], item[0]))
+        start, stop = int(start), int(stop)
+        stop = len(ordered) + stop if stop < 0 else stop
+        selected = ordered[start:stop + 1]
+        if any(option.upper() == b"WITHSCORES" for option in options):
+            return [value for member, score in selected for value in (member, score)]
+        return [member for member, _ in selected]
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        members = self.store.typed(key, dict)
+        if not members:
+            return 0
+        low = float("-inf") if low == b"-inf" else float(low)
+        high = float("inf") if high in (b"+inf", b"inf") else float(high)
+        doomed = [member for member, score in members.items() if low <= score <= high]
+        for member in doomed:
+            del members[member]
+        if doomed:
+            self.store._touch(key)
+            self.store.drop_if_empty(key)
+        return len(doomed)
+
+    def cmd_flushdb(self, *args):
+        self.store.flush()
+        return "OK"
+
+    cmd_flushall = cmd_flushdb
+
+    def cmd_watch(self, *keys):
+        if self.queued is not None:
+            raise _Error("WATCH inside MULTI is not allowed")
+        for key in keys:
+            self.store._alive(key)
+            self.watched[key] = self.store.versions.get(key, 0)
+        return "OK"
+
+    def cmd_unwatch(self):
+        self.watched = {}
+        return "OK"
+
+    def cmd_multi(self):
+        if self.queued is not None:
+            raise _Error("MULTI calls can not be nested")
+        self.queued = []
+        return "OK"
+
+    def cmd_discard(self):
+        if self.queued is None:
+            raise _Error("DISCARD without MULTI")
+        self.queued = None
+        self.watched = {}
+        return "OK"
+
+    def cmd_exec(self):
+        if self.queued is None:
+            raise _Error("EXEC without MULTI")
+        queued, self.queued = self.queued, None
+        watched, self.watched = self.watched, {}
+        for key, version in watched.items():
+            self.store._alive(key)
+            if self.store.versions.get(key, 0) != version:
+                return None  # Aborted: a watched key changed
+        return [self.dispatch(args) for args in queued]
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128  # connection pools open many sockets at once
+
+
+class StandInRedisServer:
+    """Run the stand-in on a background thread. Port 0 picks a free port"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = _Server((host, port), _Handler)
+        self._server.store = _Store()
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @property
+    def url(self):
+        host, port = self.address
+        return f'redis://{host}:{port}/0'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='redis-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import logging
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 6379
+    server = StandInRedisServer(port=port)
+    logging.getLogger(__name__).info("Stand-in Redis listening on %s", server.url)
+    server._server.serve_forever()
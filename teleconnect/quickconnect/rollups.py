@@ -0,0 +1,316 @@
+"""
+Time-bucketed rollups for the analytics endpoints.
+
+Sessions and payments are counted into hourly and daily buckets as they are
+written, so the revenue, session, payment and engagement endpoints sum a few
+hundred pre-aggregated rows instead of scanning every ``Session`` and
+``Payment`` in the window:
+
+- ``SessionRollup``: sessions by ``created_at`` hour/day, status and type,
+  with total duration and cost
+- ``RevenueRollup``: completed sessions by ``ended_at`` hour/day
+- ``PaymentRollup``: payments by ``created_at`` hour/day, status and method
+- ``ClientActivityRollup``: sessions per client per day
+
+The model signals diff each row's ``rollup_snapshot()`` before and after a
+save and move the difference between buckets once the transaction commits.
+A window such as "the last 30 days" reads hourly buckets for the partial
+first and last day and daily buckets in between, so it is exact to the hour
+at the far edge and exact up to now at the near one.
+
+Writes that bypass signals (``QuerySet.update()``, raw SQL, fixtures) are not
+seen; ``python manage.py rebuild_rollups`` recomputes the buckets from the
+raw rows, for everything or just the last ``--days``.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncDay, TruncHour, TruncMonth
+from django.utils import timezone
+
+from .models import ClientActivityRollup, Payment, PaymentRollup, RevenueRollup, Session, SessionRollup
+
+GRANULARITIES = ('hour', 'day')
+# Hourly buckets are only read at the first day of a window (at most a year back)
+HOURLY_RETENTION_DAYS = getattr(settings, 'ROLLUP_HOURLY_RETENTION_DAYS', 400)
+
+
+def bucket_start(moment, granularity):
+    """Start of the hour or day containing ``moment``, in the current time zone"""
+    moment = timezone.localtime(moment)
+    if granularity == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _decimal(value):
+    return Decimal(str(value or 0))
+
+
+# Writing ----------------------------------------------------------------
+
+class RollupDeltas:
+    """Net changes per bucket row, written after commit"""
+
+    def __init__(self):
+        self._rows = defaultdict(lambda: defaultdict(int))  # (model, key items) -> field -> delta
+
+    def add(self, model, keys, sign, **values):
+        row = self._rows[(model, tuple(sorted(keys.items())))]
+        for field, value in values.items():
+            row[field] += sign * value
+
+    def write(self):
+        for (model, keys), deltas in self._rows.items():
+            deltas = {field: delta for field, delta in deltas.items() if delta}
+            if deltas:
+                _bump(model, dict(keys), deltas)
+
+    def write_on_commit(self):
+        if self._rows:
+            transaction.on_commit(self.write)
+
+
+def _bump(model, keys, deltas):
+    """Add ``deltas`` to one bucket row, creating it on first use"""
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**keys).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Someone else created the bucket between our UPDATE and INSERT
+        model.objects.filter(**keys).update(**increments)
+
+
+def _add_session(deltas, snapshot, sign):
+    client_id, created_at, ended_at, status, session_type, duration, cost = snapshot
+    cost = _decimal(cost)
+    for granularity in GRANULARITIES:
+        if created_at:
+            deltas.add(SessionRollup, {
+                'granularity': granularity,
+                'bucket': bucket_start(created_at, granularity),
+                'status': status,
+                'session_type': session_type,
+            }, sign, sessions=1, duration_total=int(duration or 0), cost_total=cost)
+        if status == 'completed' and ended_at:
+            deltas.add(RevenueRollup, {
+                'granularity': granularity,
+                'bucket': bucket_start(ended_at, granularity),
+            }, sign, sessions=1, revenue=cost)
+    if created_at and client_id is not None:
+        deltas.add(ClientActivityRollup, {
+            'day': bucket_start(created_at, 'day').date(),
+            'client_id': client_id,
+        }, sign, sessions=1)
+
+
+def apply_session_change(old, new):
+    """
+    Move a session between buckets.
+
+    ``old`` / ``new`` are ``Session.rollup_snapshot()`` tuples; ``None`` means
+    the row did not exist before (create) or no longer exists (delete).
+    """
+    if old == new:
+        return
+    deltas = RollupDeltas()
+    if old is not None:
+        _add_session(deltas, old, -1)
+    if new is not None:
+        _add_session(deltas, new, 1)
+    deltas.write_on_commit()
+
+
+def _add_payment(deltas, snapshot, sign):
+    created_at, status, payment_method, amount = snapshot
+    if not created_at:
+        return
+    for granularity in GRANULARITIES:
+        deltas.add(PaymentRollup, {
+            'granularity': granularity,
+            'bucket': bucket_start(created_at, granularity),
+            'status': status,
+            'payment_method': payment_method,
+        }, sign, payments=1, amount_total=_decimal(amount))
+
+
+def apply_payment_change(old, new):
+    """Move a payment between buckets; see apply_session_change()"""
+    if old == new:
+        return
+    deltas = RollupDeltas()
+    if old is not None:
+        _add_payment(deltas, old, -1)
+    if new is not None:
+        _add_payment(deltas, new, 1)
+    deltas.write_on_commit()
+
+
+# Reading ----------------------------------------------------------------
+
+def _window(start=None):
+    """
+    Buckets covering ``start`` until now.
+
+    Whole days come from daily buckets; the partial first day and today come
+    from hourly ones. Without ``start`` every daily bucket is selected.
+    """
+    if start is None:
+        return Q(granularity='day')
+
+    first_hour = bucket_start(start, 'hour')
+    first_day = bucket_start(start, 'day')
+    if first_day < first_hour:
+        first_day += timedelta(days=1)
+    today = bucket_start(timezone.now(), 'day')
+
+    if first_day >= today:
+        return Q(granularity='hour', bucket__gte=first_hour)
+    return (
+        Q(granularity='hour', bucket__gte=first_hour, bucket__lt=first_day)
+        | Q(granularity='day', bucket__gte=first_day, bucket__lt=today)
+        | Q(granularity='hour', bucket__gte=today)
+    )
+
+
+def session_totals(start=None):
+    """Sessions created since ``start``, as rows of status, session_type, sessions, duration_total, cost_total"""
+    return list(
+        SessionRollup.objects.filter(_window(start))
+        .values('status', 'session_type')
+        .annotate(sessions=Sum('sessions'), duration_total=Sum('duration_total'), cost_total=Sum('cost_total'))
+        .filter(sessions__gt=0)
+        .order_by('status', 'session_type')
+    )
+
+
+def revenue_since(start=None):
+    """Revenue of sessions completed since ``start``"""
+    totals = RevenueRollup.objects.filter(_window(start)).aggregate(revenue=Sum('revenue'))
+    return totals['revenue'] or Decimal('0')
+
+
+def payment_totals(start=None):
+    """Payments created since ``start``, as rows of status, payment_method, payments, amount_total"""
+    return list(
+        PaymentRollup.objects.filter(_window(start))
+        .values('status', 'payment_method')
+        .annotate(payments=Sum('payments'), amount_total=Sum('amount_total'))
+        .filter(payments__gt=0)
+        .order_by('status', 'payment_method')
+    )
+
+
+def client_activity(start):
+    """(distinct clients, sessions) for sessions created on or after ``start``'s day"""
+    totals = ClientActivityRollup.objects.filter(
+        day__gte=bucket_start(start, 'day').date(),
+        sessions__gt=0
+    ).aggregate(clients=Count('client_id', distinct=True), sessions=Sum('sessions'))
+    return totals['clients'], totals['sessions'] or 0
+
+
+def month_starts(count, now=None):
+    """The first moment of the last ``count`` calendar months, oldest first"""
+    month = bucket_start(now or timezone.now(), 'day').replace(day=1)
+    starts = [month]
+    for _ in range(count - 1):
+        month = (month - timedelta(days=1)).replace(day=1)
+        starts.insert(0, month)
+    return starts
+
+
+def monthly_revenue(count=6, now=None):
+    """(month start, revenue) for the last ``count`` calendar months, oldest first"""
+    starts = month_starts(count, now)
+    totals = {
+        timezone.localtime(row['month']).date(): row['revenue']
+        for row in RevenueRollup.objects.filter(granularity='day', bucket__gte=starts[0])
+        .annotate(month=TruncMonth('bucket'))
+        .values('month')
+        .annotate(revenue=Sum('revenue'))
+        .order_by()
+    }
+    return [(start, totals.get(start.date()) or Decimal('0')) for start in starts]
+
+
+# Backfill ---------------------------------------------------------------
+
+def _rebuild_table(model, queryset, time_field, since, values, aggregates):
+    if since is not None:
+        model.objects.filter(bucket__gte=since).delete()
+        queryset = queryset.filter(**{f'{time_field}__gte': since})
+    else:
+        model.objects.all().delete()
+
+    created = 0
+    for granularity, trunc in (('hour', TruncHour), ('day', TruncDay)):
+        rows = (
+            queryset.annotate(bucket=trunc(time_field))
+            .values('bucket', *values)
+            .annotate(**aggregates)
+            .order_by()
+        )
+        created += len(model.objects.bulk_create(
+            [model(granularity=granularity, **row) for row in rows], batch_size=1000
+        ))
+    return created
+
+
+def rebuild(days=None):
+    """
+    Recompute the buckets from the raw rows.
+
+    With ``days`` only the buckets from that many days ago on are replaced.
+    Returns the number of bucket rows written per table.
+    """
+    since = bucket_start(timezone.now() - timedelta(days=days), 'day') if days is not None else None
+
+    with transaction.atomic():
+        written = {
+            'sessions': _rebuild_table(
+                SessionRollup, Session.objects.all(), 'created_at', since,
+                ('status', 'session_type'),
+                {'sessions': Count('id'), 'duration_total': Sum('duration'), 'cost_total': Sum('cost')},
+            ),
+            'revenue': _rebuild_table(
+                RevenueRollup, Session.objects.filter(status='completed', ended_at__isnull=False), 'ended_at', since,
+                (),
+                {'sessions': Count('id'), 'revenue': Sum('cost')},
+            ),
+            'payments': _rebuild_table(
+                PaymentRollup, Payment.objects.all(), 'created_at', since,
+                ('status', 'payment_method'),
+                {'payments': Count('id'), 'amount_total': Sum('amount')},
+            ),
+        }
+
+        sessions = Session.objects.all()
+        if since is not None:
+            ClientActivityRollup.objects.filter(day__gte=since.date()).delete()
+            sessions = sessions.filter(created_at__gte=since)
+        else:
+            ClientActivityRollup.objects.all().delete()
+        rows = sessions.annotate(day=TruncDate('created_at')).values('day', 'client_id').annotate(sessions=Count('id')).order_by()
+        written['clients'] = len(ClientActivityRollup.objects.bulk_create(
+            [ClientActivityRollup(**row) for row in rows], batch_size=1000
+        ))
+
+    return written
+
+
+def prune_hourly(retention_days=HOURLY_RETENTION_DAYS):
+    """Drop hourly buckets older than any window reads. Returns rows deleted"""
+    cutoff = bucket_start(timezone.now() - timedelta(days=retention_days), 'day')
+    deleted = 0
+    for model in (SessionRollup, RevenueRollup, PaymentRollup):
+        deleted += model.objects.filter(granularity='hour', bucket__lt=cutoff).delete()[0]
+    return deleted
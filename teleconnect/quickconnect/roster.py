@@ -0,0 +1,144 @@
+"""
+Professional roster broadcasting.
+
+Clients on ``ws/quick-connect/`` receive one versioned snapshot of the roster
+when they connect. After that every change is pushed as a small delta over a
+shared channel-layer group:
+
+    {"type": "roster_delta", "op": "upsert", "version": 12, "professional": {...}}
+    {"type": "roster_delta", "op": "remove", "version": 13, "id": "7"}
+    {"type": "roster_delta", "op": "lock_changed", "version": 14, "id": "7",
+     "lockedBy": "client-1", "available": false}
+
+Versions come from a ``Sequence`` row in the database, incremented in the
+same transaction as the change being announced. The row stays locked until
+that transaction commits, so versions follow commit order across every
+worker process and survive restarts; a rolled-back change gives its number
+back. Callers must run ``publish_*`` inside the transaction that makes the
+change, or the number is taken in a transaction of its own and no longer
+follows the change's commit. The price is that every roster change in the
+service (each lock and release included) queues on that one row until the
+transaction holding it commits, so keep those transactions short.
+
+Each delta carries a number one higher than the previous one, and a
+consumer that sees a gap has missed deltas (or received them out of order
+from two processes) and sends the client a fresh snapshot instead.
+
+Clients that connected before this protocol existed expect a bare JSON array
+of professionals. ``ws/quick-connect/`` still sends that unless the client
+connects with ``?protocol=delta`` (see consumers.py).
+"""
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .images import variant_url
+from .models import Professional, Sequence
+
+ROSTER_GROUP = 'professional_roster'
+ROSTER_SEQUENCE = 'roster_version'
+
+ROSTER_FIELDS = (
+    "id", "name", "specialization", "rate", "available",
+    "average_rating", "total_sessions", "status", "locked_by",
+    "profile_picture", "profile_picture_variants",
+)
+
+
+def current_version():
+    """Return the latest committed roster version"""
+    return Sequence.objects.filter(name=ROSTER_SEQUENCE).values_list('value', flat=True).first() or 0
+
+
+def next_version():
+    """Allocate the next roster version inside the caller's transaction"""
+    sequence = Sequence.objects.filter(name=ROSTER_SEQUENCE)
+    with transaction.atomic():
+        if not sequence.update(value=F('value') + 1):
+            try:
+                with transaction.atomic():
+                    Sequence.objects.create(name=ROSTER_SEQUENCE, value=1)
+                    return 1
+            except IntegrityError:
+                # Another process created it first
+                sequence.update(value=F('value') + 1)
+        return sequence.values_list('value', flat=True).get()
+
+
+def serialize_professional(pro):
+    """Build the client-facing row from a ``values()`` dict"""
+    # Ensure consistency: if locked_by exists, available should be False
+    is_locked = pro["locked_by"] is not None and pro["locked_by"] != ""
+    return {
+        "id": str(pro["id"]),
+        "name": pro["name"],
+        "specialization": pro["specialization"],
+        "rate": float(pro["rate"]),
+        "available": pro["available"] and not is_locked,
+        "lockedBy": pro["locked_by"],
+        "experience": pro.get("total_sessions", 0),
+        "rating": float(pro.get("average_rating", 0.0)),
+        "status": pro.get("status", "unknown"),
+        "picture": variant_url(pro.get("profile_picture_variants"), "thumb", pro.get("profile_picture")),
+    }
+
+
+def build_snapshot():
+    """Full roster with the version it is consistent with"""
+    # Read the version before the rows: any delta published in between is
+    # already reflected in the rows and re-applying it is harmless.
+    version = current_version()
+    professionals = [
+        serialize_professional(pro)
+        for pro in Professional.objects.all().values(*ROSTER_FIELDS)
+    ]
+    return {
+        "type": "roster_snapshot",
+        "version": version,
+        "professionals": professionals,
+    }
+
+
+def _broadcast(op, **payload):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    # Numbered now, in the change's transaction, so the order is the commit order
+    event = {"type": "roster_delta", "op": op, "version": next_version(), **payload}
+
+    # Only announce changes that actually committed
+    transaction.on_commit(lambda: async_to_sync(channel_layer.group_send)(ROSTER_GROUP, event))
+
+
+def publish_upsert(professional_id):
+    """Broadcast the current row of one professional"""
+    row = Professional.objects.filter(id=professional_id).values(*ROSTER_FIELDS).first()
+    if row is None:
+        publish_remove(professional_id)
+        return
+    _broadcast("upsert", professional=serialize_professional(row))
+
+
+def publish_upserts(professional_ids):
+    """Broadcast the current rows of several professionals in one query"""
+    rows = Professional.objects.filter(id__in=professional_ids).values(*ROSTER_FIELDS)
+    for row in rows:
+        _broadcast("upsert", professional=serialize_professional(row))
+
+
+def publish_remove(professional_id):
+    """Broadcast that a professional left the roster"""
+    _broadcast("remove", id=str(professional_id))
+
+
+def publish_lock_changed(professional_id, locked_by, available):
+    """Broadcast a lock or availability flip without resending the row"""
+    _broadcast(
+        "lock_changed",
+        id=str(professional_id),
+        lockedBy=locked_by or None,
+        available=bool(available) and not locked_by,
+    )
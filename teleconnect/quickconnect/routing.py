@@ -1,8 +1,10 @@
 # routing.py
 from django.urls import re_path
-from .consumers import QuickConnectConsumer, SessionConsumer
+from .consumers import ProfessionalConsumer, QuickConnectConsumer, SessionConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/quick-connect/$', QuickConnectConsumer.as_asgi()),
+    re_path(r'ws/session/(?P<session_id>\d+)/$', SessionConsumer.as_asgi()),
     re_path(r'ws/session/(?P<professional_id>[^/]+)/(?P<client_id>[^/]+)/$', SessionConsumer.as_asgi()),
+    re_path(r'ws/professional/(?P<professional_id>[^/]+)/$', ProfessionalConsumer.as_asgi()),
 ]
\ No newline at end of file
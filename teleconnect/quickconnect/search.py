@@ -0,0 +1,323 @@
+"""
+Full-text search over professionals.
+
+``search_professionals`` used to OR three ``icontains`` filters together:
+a ``LIKE '%q%'`` scan of every row per keystroke, with results in table
+order. Searches now go through a separate index table,
+``quickconnect_professional_search``, with one document per professional:
+name, specialization (and title), category names and bio.
+
+- SQLite: an FTS5 table with prefix indexes, ranked by ``bm25`` with the
+  columns weighted by ``WEIGHTS``
+- PostgreSQL: a weighted ``tsvector`` under a GIN index, plus a trigram
+  index on name and specialization so misspelt names still match; ranked
+  by ``ts_rank_cd`` + ``similarity``
+- other databases: ``LIKE`` per term, ranked by rating
+
+Every query term is matched as a prefix, so a half-typed word finds
+completions; a lone one- or two-letter prefix matches names only. The rating, rate, availability and category filters are
+applied in the same statement as the match, joined to the professional
+table, and pages come back in (score, id) order with a cursor for the next
+one.
+
+The index is written in the same transaction as the change by model
+signals (see models.py): a professional whose indexed fields changed,
+category membership changes and category renames. ``rebuild()`` (and
+``manage.py rebuild_search_index``) repopulates it from scratch, e.g. after
+``QuerySet.update`` calls that send no signals.
+"""
+
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Category, Professional, ProfessionalCategory
+
+SEARCH_TABLE = 'quickconnect_professional_search'
+
+PAGE_SIZE = getattr(settings, 'SEARCH_PAGE_SIZE', 20)
+MAX_PAGE_SIZE = 100
+MAX_TERMS = 8
+
+# A lone prefix shorter than this (the first keystrokes) only matches names:
+# it would match a large share of every column and ranking costs per match
+SHORT_PREFIX = 3
+
+# Column weights, in index column order
+WEIGHTS = {'name': 10.0, 'specialization': 5.0, 'categories': 3.0, 'bio': 1.0}
+
+_PROFESSIONALS = Professional._meta.db_table
+_CATEGORIES = Category._meta.db_table
+_MEMBERSHIPS = ProfessionalCategory._meta.db_table
+
+
+def terms(query):
+    """Lower-cased words of a query; punctuation and FTS syntax are dropped"""
+    return re.findall(r'[^\W_]+', (query or '').lower())[:MAX_TERMS]
+
+
+def names_only(words):
+    return len(words) == 1 and len(words[0]) < SHORT_PREFIX
+
+
+def documents(professional_ids):
+    """(id, name, specialization, categories, bio) for each professional, in two queries"""
+    rows = Professional.objects.filter(id__in=professional_ids).values_list(
+        'id', 'name', 'specialization', 'title', 'bio', 'primary_category__name'
+    )
+    names = defaultdict(list)
+    for professional_id, name in ProfessionalCategory.objects.filter(
+        professional_id__in=professional_ids
+    ).values_list('professional_id', 'category__name'):
+        names[professional_id].append(name)
+
+    return [
+        (
+            professional_id,
+            name,
+            ' '.join(filter(None, [specialization, title])),
+            ' '.join(dict.fromkeys(filter(None, [primary, *names[professional_id]]))),
+            bio or '',
+        )
+        for professional_id, name, specialization, title, bio, primary in rows
+    ]
+
+
+class SqliteBackend:
+    """FTS5 table keyed by rowid = professional id"""
+
+    def create_sql(self):
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            f"{', '.join(WEIGHTS)}, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+        ]
+
+    def drop_sql(self):
+        return [f"DROP TABLE IF EXISTS {SEARCH_TABLE}"]
+
+    def write(self, cursor, docs):
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(WEIGHTS)}) VALUES (%s, %s, %s, %s, %s)", docs
+        )
+
+    def delete(self, cursor, professional_ids):
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(professional_ids))})",
+            list(professional_ids)
+        )
+
+    def match(self, words):
+        """(FROM/JOIN clause, WHERE clause, score expression, params) for a non-empty query"""
+        expression = ' '.join(f'"{word}"*' for word in words)
+        if names_only(words):
+            expression = f'name : {expression}'
+        weights = ', '.join(str(weight) for weight in WEIGHTS.values())
+        return (
+            # FTS5 only knows the table by its own name in MATCH and bm25()
+            f"{SEARCH_TABLE} JOIN {_PROFESSIONALS} p ON p.id = {SEARCH_TABLE}.rowid",
+            f"{SEARCH_TABLE} MATCH %s",
+            f"bm25({SEARCH_TABLE}, {weights})",  # lower is better
+            {'where': [expression], 'score': []},
+        )
+
+
+class PostgresBackend:
+    """Weighted tsvector with a GIN index, and a trigram index over the names"""
+
+    def create_sql(self):
+        return [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            f"professional_id integer PRIMARY KEY REFERENCES {_PROFESSIONALS} (id) ON DELETE CASCADE "
+            f"DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL, names text NOT NULL)",
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)",
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_names ON {SEARCH_TABLE} USING gin (names gin_trgm_ops)",
+        ]
+
+    def drop_sql(self):
+        return [f"DROP TABLE IF EXISTS {SEARCH_TABLE}"]
+
+    def write(self, cursor, docs):
+        # setweight labels A-D follow WEIGHTS order
+        vector = ' || '.join(
+            f"setweight(to_tsvector('simple', %s), '{label}')" for label in 'ABCD'
+        )
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (professional_id, document, names) VALUES (%s, {vector}, %s) "
+            f"ON CONFLICT (professional_id) DO UPDATE SET document = EXCLUDED.document, names = EXCLUDED.names",
+            [(pid, name, specialization, categories, bio, f'{name} {specialization}')
+             for pid, name, specialization, categories, bio in docs]
+        )
+
+    def delete(self, cursor, professional_ids):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE professional_id = ANY(%s)", [list(professional_ids)])
+
+    def match(self, words):
+        # Weight A is the name
+        tsquery = ' & '.join(f"{word}:*{'A' if names_only(words) else ''}" for word in words)
+        text = ' '.join(words)
+        # ts_rank_cd weights are listed D, C, B, A
+        weights = '{' + ', '.join(str(weight / 10) for weight in reversed(WEIGHTS.values())) + '}'
+        return (
+            f"{SEARCH_TABLE} s JOIN {_PROFESSIONALS} p ON p.id = s.professional_id",
+            "(s.document @@ to_tsquery('simple', %s) OR s.names %% %s)",
+            f"-(ts_rank_cd('{weights}', s.document, to_tsquery('simple', %s)) + similarity(s.names, %s))",
+            {'where': [tsquery, text], 'score': [tsquery, text]},
+        )
+
+
+class LikeBackend:
+    """No index: every term must appear in name, specialization or bio"""
+
+    def create_sql(self):
+        return []
+
+    def drop_sql(self):
+        return []
+
+    def write(self, cursor, docs):
+        pass
+
+    def delete(self, cursor, professional_ids):
+        pass
+
+    def match(self, words):
+        if names_only(words):
+            return _PROFESSIONALS + ' p', "LOWER(p.name) LIKE %s", '-p.average_rating', {
+                'where': [f'%{words[0]}%'], 'score': []
+            }
+        clause = "(LOWER(p.name) LIKE %s OR LOWER(p.specialization) LIKE %s OR LOWER(p.bio) LIKE %s)"
+        params = []
+        for word in words:
+            params += [f'%{word}%'] * 3
+        return _PROFESSIONALS + ' p', ' AND '.join([clause] * len(words)), '-p.average_rating', {
+            'where': params, 'score': []
+        }
+
+
+BACKENDS = {'sqlite': SqliteBackend, 'postgresql': PostgresBackend}
+
+
+def backend(vendor=None):
+    return BACKENDS.get(vendor or connection.vendor, LikeBackend)()
+
+
+# Index maintenance ----------------------------------------------------------
+
+def index_professionals(professional_ids):
+    """(Re)write the documents of these professionals"""
+    professional_ids = list(professional_ids)
+    if not professional_ids:
+        return
+    engine = backend()
+    docs = documents(professional_ids)
+    with transaction.atomic(), connection.cursor() as cursor:
+        engine.delete(cursor, professional_ids)
+        engine.write(cursor, docs)
+
+
+def remove_professionals(professional_ids):
+    professional_ids = list(professional_ids)
+    if professional_ids:
+        with connection.cursor() as cursor:
+            backend().delete(cursor, professional_ids)
+
+
+def category_members(category_id):
+    """Ids of professionals filed under a category, as primary or extra"""
+    primary = Professional.objects.filter(primary_category_id=category_id).values_list('id', flat=True)
+    extra = ProfessionalCategory.objects.filter(category_id=category_id).values_list('professional_id', flat=True)
+    return set(primary) | set(extra)
+
+
+def rebuild(batch_size=2000):
+    """Drop and repopulate the whole index; returns the number of documents"""
+    engine = backend()
+    ids = list(Professional.objects.order_by('id').values_list('id', flat=True))
+    with transaction.atomic(), connection.cursor() as cursor:
+        for statement in engine.drop_sql() + engine.create_sql():
+            cursor.execute(statement)
+        for start in range(0, len(ids), batch_size):
+            engine.write(cursor, documents(ids[start:start + batch_size]))
+    return len(ids)
+
+
+# Queries --------------------------------------------------------------------
+
+def parse_cursor(cursor):
+    """(score, id) from a ``next_cursor`` value"""
+    try:
+        score, professional_id = cursor.rsplit(':', 1)
+        return float(score), int(professional_id)
+    except ValueError:
+        raise ValueError(f"Invalid search cursor '{cursor}'")
+
+
+def page_size(value):
+    return min(max(int(value), 1), MAX_PAGE_SIZE) if value else PAGE_SIZE
+
+
+def _filters(category, min_rating, max_rate, available_only, online_only):
+    clauses, params = ["p.status = %s"], ['approved']
+    if min_rating:
+        clauses.append("p.average_rating >= %s")
+        params.append(min_rating)
+    if max_rate is not None:
+        clauses.append("p.rate <= %s")
+        params.append(max_rate)
+    if available_only:
+        clauses.append("p.available = %s")
+        params.append(True)
+    if online_only:
+        clauses.append("p.online_status = %s")
+        params.append(True)
+    if category:
+        clauses.append(
+            f"(p.primary_category_id IN (SELECT id FROM {_CATEGORIES} WHERE LOWER(name) = LOWER(%s))"
+            f" OR p.id IN (SELECT m.professional_id FROM {_MEMBERSHIPS} m JOIN {_CATEGORIES} c"
+            f" ON c.id = m.category_id WHERE LOWER(c.name) = LOWER(%s)))"
+        )
+        params += [category, category]
+    return clauses, params
+
+
+def search(query='', category=None, min_rating=0, max_rate=None, available_only=False,
+           online_only=False, cursor=None, limit=PAGE_SIZE):
+    """
+    One page of approved professionals matching ``query``, best first.
+
+    Returns (hits, next_cursor): hits are (professional_id, score) pairs and
+    next_cursor is None on the last page. Without a query professionals come
+    back by rating.
+    """
+    words = terms(query)
+    if words:
+        tables, match, score, match_params = backend().match(words)
+        clauses, params = [match], list(match_params['where'])
+    else:
+        tables, score, match_params = f'{_PROFESSIONALS} p', '-p.average_rating', {'score': []}
+        clauses, params = [], []
+
+    filter_clauses, filter_params = _filters(category, min_rating, max_rate, available_only, online_only)
+    clauses += filter_clauses
+    params += filter_params
+
+    # Score the matches in a subquery so the cursor can compare against it
+    sql = f"SELECT id, score FROM (SELECT p.id AS id, {score} AS score FROM {tables} WHERE {' AND '.join(clauses)}) hits"
+    params = match_params['score'] + params
+    if cursor:
+        after_score, after_id = parse_cursor(cursor)
+        sql += " WHERE (score > %s OR (score = %s AND id > %s))"
+        params += [after_score, after_score, after_id]
+    sql += " ORDER BY score, id LIMIT %s"
+    params.append(limit + 1)
+
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        rows = [(professional_id, float(score)) for professional_id, score in db_cursor.fetchall()]
+
+    hits = rows[:limit]
+    next_cursor = f'{hits[-1][1]!r}:{hits[-1][0]}' if len(rows) > limit else None
+    return hits, next_cursor
@@ -0,0 +1,113 @@
+"""
+Session lifecycle: the allowed status transitions and the one place that
+applies them.
+
+Status used to be changed with get / modify / ``save()`` from views, the
+session socket and the dispatcher. Two requests racing on the same session
+(the professional accepting while the client hangs up) both wrote the full
+row and the last one won, whatever the other had done. ``transition()``
+instead runs
+
+    UPDATE session SET status = <new>, <changed fields>, updated_at = <now>
+     WHERE id = <id> AND status = <status the caller read>
+
+and only when ``TRANSITIONS`` allows moving from that status. If another
+writer got there first no row matches and ``InvalidTransition`` is raised
+with the status the session really has, so the caller can answer 409
+instead of overwriting it.
+
+The counters and rollups are kept by ``post_save`` receivers that compare
+the instance with the state it was loaded in; a queryset update does not
+send ``post_save``, so ``transition()`` sends it with ``update_fields``
+after the row changed. Once the transaction commits, ``session_transitioned``
+is sent exactly once per applied transition with the session, the previous
+status and the new one.
+"""
+
+import logging
+
+from django.db import router, transaction
+from django.db.models.signals import post_save
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Session
+
+logger = logging.getLogger(__name__)
+
+# New status: the statuses a session may reach it from. Sessions start as
+# 'pending' (requests, the dispatcher) or 'active' (calls and session sockets
+# opened by the client); both are waiting for the professional to answer
+TRANSITIONS = {
+    'active': ('disconnected',),                                           # reconnected before an answer
+    'in_progress': ('pending', 'active', 'disconnected'),                  # accepted, or resumed after a drop
+    'declined': ('pending', 'active'),                                     # professional declined
+    'cancelled': ('pending', 'active'),                                    # withdrawn before it ran
+    'expired': ('pending', 'active'),                                      # nobody picked it up
+    'completed': ('pending', 'active', 'in_progress', 'disconnected'),     # ended normally
+    'disconnected': ('active', 'in_progress'),                             # socket dropped mid-session
+}
+
+# Sessions a socket may (re)attach to
+OPEN_STATUSES = ('pending', 'active', 'in_progress', 'disconnected')
+
+# Sessions a participant is connected to and may chat in
+LIVE_STATUSES = ('active', 'in_progress')
+
+# Sent on commit with session, previous and status
+session_transitioned = Signal()
+
+
+class InvalidTransition(ValueError):
+    """The session's current status does not allow the requested one"""
+
+    def __init__(self, session_id, current, status):
+        self.session_id = session_id
+        self.current = current
+        self.status = status
+        if status not in TRANSITIONS:
+            message = f"Unknown session status '{status}'"
+        else:
+            message = f"Session {session_id} cannot go from '{current}' to '{status}'"
+        super().__init__(message)
+
+
+def can_transition(current, status):
+    return current in TRANSITIONS.get(status, ())
+
+
+def transition(session, status, **fields):
+    """
+    Move ``session`` to ``status``, writing only ``status``, ``updated_at``
+    and ``fields``. Raises InvalidTransition if the status the session was
+    loaded with does not allow it, or if the row changed status since.
+    """
+    previous = session.status
+    if not can_transition(previous, status):
+        raise InvalidTransition(session.id, previous, status)
+
+    fields['status'] = status
+    fields['updated_at'] = timezone.now()
+    using = router.db_for_write(Session, instance=session)
+    with transaction.atomic(using=using):
+        updated = Session.objects.using(using).filter(id=session.id, status=previous).update(**fields)
+        if not updated:
+            current = Session.objects.using(using).filter(id=session.id).values_list('status', flat=True).first()
+            raise InvalidTransition(session.id, current, status)
+
+        for name, value in fields.items():
+            setattr(session, name, value)
+        # Let the counter and rollup receivers apply the change
+        post_save.send(
+            sender=Session, instance=session, created=False,
+            update_fields=frozenset(fields), raw=False, using=using
+        )
+
+    logger.info("Session status changed", extra={
+        "event": "session.transition", "session_id": session.id, "previous": previous, "status": status
+    })
+    transaction.on_commit(
+        lambda: session_transitioned.send(sender=Session, session=session, previous=previous, status=status),
+        using=using
+    )
+    return session
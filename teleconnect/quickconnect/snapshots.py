@@ -0,0 +1,108 @@
+"""
+Short-lived cached snapshots with request coalescing.
+
+Expensive read-only payloads that many clients poll (the admin dashboard)
+are computed at most once per TTL:
+
+    dashboard = Snapshot('admin_dashboard_stats', compute_dashboard_stats, ttl=5)
+    data = dashboard.get()
+
+Within a process, concurrent callers that find the snapshot expired share a
+single computation; everyone else waits for it instead of running the same
+queries. The result is also stored in Django's default cache, which
+settings.CACHES points at a backend every worker process shares (files on
+one host, Redis across hosts), so other workers reuse it too.
+"""
+
+import threading
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+
+class Snapshot:
+    """A payload recomputed at most once per ``ttl`` seconds"""
+
+    def __init__(self, key, compute, ttl=5):
+        self.key = f'snapshot:{key}'
+        self.compute = compute
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._inflight = None  # Event set when the running computation finishes
+        self._local = None  # (expires_at, payload)
+        self._error = None
+
+        self.hits = 0
+        self.computations = 0
+        self.coalesced = 0
+
+    def _fresh_local(self):
+        if self._local and self._local[0] > time.monotonic():
+            return self._local[1]
+        return None
+
+    def get(self, force=False):
+        """The current payload, computing it if it expired (or ``force``)"""
+        with self._lock:
+            payload = None if force else self._fresh_local()
+            if payload is not None:
+                self.hits += 1
+                return payload
+
+            if self._inflight is not None:
+                # Somebody is already computing: wait for their result
+                waiter = self._inflight
+                self.coalesced += 1
+            else:
+                waiter = None
+                self._inflight = threading.Event()
+
+        if waiter is not None:
+            waiter.wait()
+            with self._lock:
+                if self._error is not None:
+                    raise self._error
+                return self._local[1]
+
+        try:
+            payload = None if force else cache.get(self.key)
+            if payload is None:
+                payload = self.compute()
+                payload['generated_at'] = timezone.now().isoformat()
+                cache.set(self.key, payload, self.ttl)
+                computed = True
+            else:
+                computed = False
+            error = None
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            event, self._inflight = self._inflight, None
+            self._error = error
+            if error is None:
+                self._local = (time.monotonic() + self.ttl, payload)
+                if computed:
+                    self.computations += 1
+                else:
+                    self.hits += 1
+        event.set()
+
+        if error is not None:
+            raise error
+        return payload
+
+    def invalidate(self):
+        with self._lock:
+            self._local = None
+        cache.delete(self.key)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'computations': self.computations,
+                'coalesced': self.coalesced,
+            }
@@ -0,0 +1,564 @@
+"""
+Denormalized counters for categories and professionals.
+
+``Category.professional_count``, ``Category.session_count``,
+``Professional.total_sessions`` / ``total_reviews`` / ``rating_total`` /
+``average_rating`` and the per-client ``ClientStats`` rows are kept up to date
+with F-expression deltas from the model signals instead of being recounted on
+every save. The deltas are coalesced
+by ``stats_queue`` and written once per ``STATS_FLUSH_WINDOW``.
+
+Updates that bypass signals (``QuerySet.update()``, raw SQL, fixtures) can
+still make the counters drift, so ``reconcile()`` recomputes everything in a
+handful of grouped queries and repairs what differs. ``StatsReconciler``
+runs it periodically in the background, in every worker process.
+
+Other processes keep flushing deltas while reconciliation runs, so a repair
+is only written if the row still holds the values that were read, and the
+rows are read before the sessions they are compared with. A delta that lands
+in between makes the repair miss rather than be overwritten; the row is
+looked at again on the next run. A change still waiting in another process's
+queue during a run can be counted twice until the next run.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Case, Count, DecimalField, F, FloatField, Max, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.db.models.lookups import GreaterThan
+
+from .candidate_index import candidate_index
+from .models import Category, ClientStats, Professional, ProfessionalCategory, Session
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = getattr(settings, 'STATS_RECONCILE_INTERVAL', 3600)
+
+# Columns reconcile() reads and repairs
+CATEGORY_COUNTERS = ('professional_count', 'session_count', 'avg_response_time')
+PROFESSIONAL_COUNTERS = ('total_sessions', 'total_reviews', 'rating_total', 'average_rating')
+CLIENT_COUNTERS = ('sessions_count', 'completed_sessions', 'total_spent', 'last_session_at')
+
+
+def response_time_for(session_count):
+    """Category.avg_response_time bucket for a session count"""
+    if session_count > 100:
+        return 1
+    if session_count > 50:
+        return 2
+    if session_count > 20:
+        return 3
+    return 5
+
+
+def _response_time_expression(new_count):
+    # Same buckets as response_time_for(), evaluated inside the UPDATE
+    return Case(
+        When(GreaterThan(new_count, 100), then=Value(1)),
+        When(GreaterThan(new_count, 50), then=Value(2)),
+        When(GreaterThan(new_count, 20), then=Value(3)),
+        default=Value(5),
+    )
+
+
+def _update_categories(category_ids, sessions=0, professionals=0):
+    """One UPDATE applying the same deltas to several categories"""
+    updates = {}
+    if sessions:
+        new_count = F('session_count') + sessions
+        updates['session_count'] = new_count
+        updates['avg_response_time'] = _response_time_expression(new_count)
+    if professionals:
+        updates['professional_count'] = F('professional_count') + professionals
+    if updates:
+        Category.objects.filter(id__in=category_ids).update(**updates)
+
+
+def _update_professionals(professional_ids, sessions=0, reviews=0, rating=0):
+    """Apply session/review deltas and re-derive the average in the same UPDATE"""
+    new_reviews = F('total_reviews') + reviews
+    new_total = F('rating_total') + rating
+    Professional.objects.filter(id__in=professional_ids).update(
+        total_sessions=F('total_sessions') + sessions,
+        total_reviews=new_reviews,
+        rating_total=new_total,
+        average_rating=Case(
+            When(GreaterThan(new_reviews, 0), then=Cast(new_total, FloatField()) / new_reviews),
+            default=Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+    )
+
+
+def _update_client(client_id, sessions=0, completed=0, spent=0, last_session_at=None):
+    """Apply deltas to one client's stats row, creating it on first use"""
+    updates = {
+        'sessions_count': F('sessions_count') + sessions,
+        'completed_sessions': F('completed_sessions') + completed,
+        'total_spent': F('total_spent') + spent,
+    }
+    if last_session_at is not None:
+        latest = Value(last_session_at)
+        # GREATEST() is NULL on SQLite when either side is
+        updates['last_session_at'] = Coalesce(Greatest(F('last_session_at'), latest), latest)
+
+    if ClientStats.objects.filter(client_id=client_id).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            ClientStats.objects.create(
+                client_id=client_id, sessions_count=sessions, completed_sessions=completed,
+                total_spent=spent, last_session_at=last_session_at
+            )
+    except IntegrityError:
+        # Created by someone else between the UPDATE and the INSERT
+        ClientStats.objects.filter(client_id=client_id).update(**updates)
+
+
+class StatsQueue:
+    """
+    Coalesces counter deltas and writes them once per window.
+
+    Signals only add to in-memory per-id totals; a background thread flushes
+    them ``window`` seconds after the first pending change, so a burst of
+    session saves costs one UPDATE per dirty category/professional. Ids that
+    end up with identical net deltas share a single UPDATE. With a window of
+    0 every change is written immediately.
+    """
+
+    def __init__(self, window=0):
+        self.window = window
+        self._lock = threading.Lock()
+        self._categories = defaultdict(lambda: [0, 0])  # id -> sessions, professionals
+        self._professionals = defaultdict(lambda: [0, 0, 0])  # id -> sessions, reviews, rating
+        self._clients = defaultdict(lambda: [0, 0, Decimal('0')])  # id -> sessions, completed, spent
+        self._client_last = {}  # id -> latest session created_at
+        self._pending = threading.Event()
+        self._thread = None
+
+        # Counters for metrics()
+        self.changes = 0
+        self.updates = 0
+        self.flushes = 0
+
+    def add_category(self, category_id, sessions=0, professionals=0):
+        if category_id and (sessions or professionals):
+            transaction.on_commit(lambda: self._add(self._categories, category_id, (sessions, professionals)))
+
+    def add_professional(self, professional_id, sessions=0, reviews=0, rating=0):
+        if professional_id and (sessions or reviews or rating):
+            transaction.on_commit(lambda: self._add(self._professionals, professional_id, (sessions, reviews, rating)))
+
+    def add_client(self, client_id, sessions=0, completed=0, spent=0, last_session_at=None):
+        if client_id is None or not (sessions or completed or spent or last_session_at):
+            return
+
+        def add():
+            if last_session_at is not None:
+                with self._lock:
+                    seen = self._client_last.get(client_id)
+                    self._client_last[client_id] = max(seen, last_session_at) if seen else last_session_at
+            self._add(self._clients, client_id, (sessions, completed, spent))
+
+        transaction.on_commit(add)
+
+    def _add(self, pending, key, deltas):
+        # Runs after commit, so rolled-back changes are never counted
+        with self._lock:
+            totals = pending[key]
+            for i, delta in enumerate(deltas):
+                totals[i] += delta
+            self.changes += 1
+        if self.window <= 0:
+            self.flush()
+        else:
+            self._ensure_thread()
+            self._pending.set()
+
+    def flush(self):
+        """
+        Write all pending deltas now. Returns the number of UPDATEs issued.
+
+        If a write fails, whatever wasn't written yet goes back on the queue
+        for the next flush and the error is raised.
+        """
+        with self._lock:
+            categories, self._categories = self._categories, defaultdict(lambda: [0, 0])
+            professionals, self._professionals = self._professionals, defaultdict(lambda: [0, 0, 0])
+            clients, self._clients = self._clients, defaultdict(lambda: [0, 0, Decimal('0')])
+            client_last, self._client_last = self._client_last, {}
+
+        updates = 0
+        touched = []
+        try:
+            # Each write commits on its own, so ids are dropped as they are written
+            for deltas, ids in self._group(categories).items():
+                _update_categories(ids, *deltas)
+                updates += 1
+                for category_id in ids:
+                    del categories[category_id]
+            for deltas, ids in self._group(professionals).items():
+                _update_professionals(ids, *deltas)
+                updates += 1
+                touched.extend(ids)
+                for professional_id in ids:
+                    del professionals[professional_id]
+            # Client rows also carry a timestamp, so they are written one by one
+            for client_id, deltas in list(clients.items()):
+                if any(deltas) or client_id in client_last:
+                    _update_client(client_id, *deltas, client_last.get(client_id))
+                    updates += 1
+                del clients[client_id]
+                client_last.pop(client_id, None)
+        except Exception:
+            self._requeue(categories, professionals, clients, client_last)
+            raise
+        finally:
+            with self._lock:
+                self.updates += updates
+                self.flushes += 1
+            # Matching reads total_sessions and average_rating from the candidate index
+            candidate_index.refresh(touched)
+        return updates
+
+    def _requeue(self, categories, professionals, clients, client_last):
+        """Merge deltas a failed flush didn't write with those queued since"""
+        with self._lock:
+            for pending, unwritten in (
+                (self._categories, categories), (self._professionals, professionals), (self._clients, clients)
+            ):
+                for key, deltas in unwritten.items():
+                    # A client may only have a newer last_session_at to write
+                    if any(deltas) or key in client_last:
+                        totals = pending[key]
+                        for i, delta in enumerate(deltas):
+                            totals[i] += delta
+            for client_id, last in client_last.items():
+                seen = self._client_last.get(client_id)
+                self._client_last[client_id] = max(seen, last) if seen else last
+
+    @staticmethod
+    def _group(pending):
+        """Ids keyed by their net deltas, dropping changes that cancelled out"""
+        groups = defaultdict(list)
+        for key, deltas in pending.items():
+            if any(deltas):
+                groups[tuple(deltas)].append(key)
+        return groups
+
+    def metrics(self):
+        """How much coalescing saved: changes received vs UPDATEs written"""
+        with self._lock:
+            return {
+                'changes': self.changes,
+                'updates': self.updates,
+                'saved': self.changes - self.updates,
+                'flushes': self.flushes,
+                'pending': len(self._categories) + len(self._professionals) + len(self._clients),
+            }
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stats-queue', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            # Let the burst accumulate before writing it
+            time.sleep(self.window)
+            self._pending.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Stats flush failed", extra={"event": "stats.error"})
+                # The unwritten deltas were requeued; try them again next window
+                self._pending.set()
+            finally:
+                close_old_connections()
+
+
+stats_queue = StatsQueue(window=getattr(settings, 'STATS_FLUSH_WINDOW', 0))
+# Don't lose deltas still sitting in memory when the process exits
+atexit.register(stats_queue.flush)
+
+
+def adjust_category_sessions(category_id, delta):
+    stats_queue.add_category(category_id, sessions=delta)
+
+
+def adjust_category_professionals(category_ids, delta):
+    for category_id in category_ids:
+        stats_queue.add_category(category_id, professionals=delta)
+
+
+def adjust_professional_sessions(professional_id, sessions=0, reviews=0, rating=0):
+    stats_queue.add_professional(professional_id, sessions, reviews, rating)
+
+
+def adjust_client_sessions(client_id, sessions=0, completed=0, spent=0, last_session_at=None):
+    stats_queue.add_client(client_id, sessions, completed, spent, last_session_at)
+
+
+def apply_session_change(old, new):
+    """
+    Move counters from a session's previous state to its new one.
+
+    ``old`` / ``new`` are ``Session.stats_snapshot()`` tuples of
+    (category_id, professional_id, rating, client_id, status, cost,
+    created_at); ``None`` means the row did not exist before (create) or no
+    longer exists (delete).
+    """
+    old_category, old_professional, old_rating = (old or (None,) * 7)[:3]
+    new_category, new_professional, new_rating = (new or (None,) * 7)[:3]
+
+    if old_category != new_category:
+        adjust_category_sessions(old_category, -1)
+        adjust_category_sessions(new_category, 1)
+
+    deltas = defaultdict(lambda: [0, 0, 0])  # professional -> sessions, reviews, rating
+    if old_professional:
+        deltas[old_professional][0] -= 1
+        if old_rating:
+            deltas[old_professional][1] -= 1
+            deltas[old_professional][2] -= old_rating
+    if new_professional:
+        deltas[new_professional][0] += 1
+        if new_rating:
+            deltas[new_professional][1] += 1
+            deltas[new_professional][2] += new_rating
+
+    for professional_id, (sessions, reviews, rating) in deltas.items():
+        adjust_professional_sessions(professional_id, sessions, reviews, rating)
+
+    _apply_client_change(old, new)
+
+
+def _client_totals(snapshot):
+    client_id, status, cost, _ = snapshot[3:]
+    completed = status == 'completed'
+    return client_id, (1, int(completed), Decimal(str(cost or 0)) if completed else Decimal('0'))
+
+
+def _apply_client_change(old, new):
+    """Move ClientStats totals from a session's previous state to its new one"""
+    deltas = defaultdict(lambda: [0, 0, Decimal('0')])  # client -> sessions, completed, spent
+    if old is not None:
+        client_id, totals = _client_totals(old)
+        for i, value in enumerate(totals):
+            deltas[client_id][i] -= value
+    if new is not None:
+        client_id, totals = _client_totals(new)
+        for i, value in enumerate(totals):
+            deltas[client_id][i] += value
+
+    # A session only moves last_session_at when it is new to the client.
+    # Deleting the latest session cannot move it back; reconcile() does.
+    arrived = new[3] if new is not None and (old is None or old[3] != new[3]) else None
+    for client_id, (sessions, completed, spent) in deltas.items():
+        last_session_at = new[6] if client_id == arrived else None
+        adjust_client_sessions(client_id, sessions, completed, spent, last_session_at)
+
+
+def _fk_categories(snapshot):
+    """Categories a professional reaches through its own FKs"""
+    _, category_id, primary_category_id = snapshot
+    return {cid for cid in (category_id, primary_category_id) if cid}
+
+
+def apply_professional_change(professional_id, old, new):
+    """
+    Adjust professional_count after a professional's status or FK categories changed.
+
+    ``old`` / ``new`` are ``Professional.stats_snapshot()`` tuples of
+    (status, category_id, primary_category_id).
+    """
+    if old == new:
+        return
+
+    was_approved = old is not None and old[0] == 'approved'
+    is_approved = new is not None and new[0] == 'approved'
+    if not (was_approved or is_approved):
+        return
+
+    linked = set(
+        ProfessionalCategory.objects.filter(professional_id=professional_id)
+        .values_list('category_id', flat=True)
+    )
+    before = (_fk_categories(old) | linked) if was_approved else set()
+    after = (_fk_categories(new) | linked) if is_approved else set()
+
+    adjust_category_professionals(before - after, -1)
+    adjust_category_professionals(after - before, 1)
+
+
+def apply_membership_change(professional_snapshot, category_ids, delta):
+    """
+    Count categories joined or left through ProfessionalCategory rows.
+
+    Categories the professional already reaches through its FKs are counted
+    by apply_professional_change() and skipped here.
+    """
+    if professional_snapshot is None or professional_snapshot[0] != 'approved':
+        return
+    adjust_category_professionals(set(category_ids) - _fk_categories(professional_snapshot), delta)
+
+
+def reconcile(category_ids=None):
+    """
+    Recompute every counter from scratch and fix the rows that drifted.
+
+    Returns the number of categories, professionals and clients that were
+    repaired.
+    """
+    # Write pending deltas first so they are not applied on top of fresh totals
+    stats_queue.flush()
+
+    # The counters as they are now, read before what they are checked against
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(id__in=category_ids)
+    category_counts = {row[0]: row[1:] for row in categories.values_list('id', *CATEGORY_COUNTERS)}
+    if category_ids is None:
+        professional_counts = {
+            row[0]: row[1:] for row in Professional.objects.values_list('id', *PROFESSIONAL_COUNTERS)
+        }
+
+    # Categories ---------------------------------------------------------
+    sessions_by_category = dict(
+        Session.objects.filter(category__isnull=False)
+        .values_list('category').annotate(n=Count('id')).order_by()
+    )
+
+    approved = Professional.objects.filter(status='approved')
+    members = set(approved.filter(category__isnull=False).values_list('id', 'category_id'))
+    members |= set(approved.filter(primary_category__isnull=False).values_list('id', 'primary_category_id'))
+    members |= set(
+        ProfessionalCategory.objects.filter(professional__status='approved')
+        .values_list('professional_id', 'category_id')
+    )
+    professionals_by_category = Counter(category_id for _, category_id in members)
+
+    fixed_categories = 0
+    for category_id, current in category_counts.items():
+        session_count = sessions_by_category.get(category_id, 0)
+        expected = (
+            professionals_by_category.get(category_id, 0),
+            session_count,
+            response_time_for(session_count),
+        )
+        if current != expected:
+            fixed_categories += _repair(Category, category_id, CATEGORY_COUNTERS, current, expected)
+
+    if category_ids is not None:
+        return fixed_categories, 0, 0
+
+    # Professionals ------------------------------------------------------
+    session_stats = {
+        row['professional']: row
+        for row in Session.objects.values('professional').annotate(
+            sessions=Count('id'), reviews=Count('rating'), rating_sum=Sum('rating')
+        ).order_by()
+    }
+
+    fixed_professionals = []
+    for professional_id, current in professional_counts.items():
+        row = session_stats.get(professional_id, {})
+        sessions = row.get('sessions', 0)
+        reviews = row.get('reviews', 0)
+        rating_total = row.get('rating_sum') or 0
+        average = round(rating_total / reviews, 2) if reviews else 0
+        if current[:3] != (sessions, reviews, rating_total) or round(float(current[3]), 2) != average:
+            expected = (sessions, reviews, rating_total, average)
+            if _repair(Professional, professional_id, PROFESSIONAL_COUNTERS, current, expected):
+                fixed_professionals.append(professional_id)
+    candidate_index.refresh(fixed_professionals)
+
+    return fixed_categories, len(fixed_professionals), reconcile_clients()
+
+
+def _repair(model, pk, fields, current, expected, key='id'):
+    """Write ``expected`` only if the row still holds ``current``. Returns 1 if it did"""
+    return model.objects.filter(**{key: pk}, **dict(zip(fields, current))).update(**dict(zip(fields, expected)))
+
+
+def reconcile_clients():
+    """Recompute ClientStats from sessions. Returns the number of clients repaired"""
+    current = {row[0]: row[1:] for row in ClientStats.objects.values_list('client_id', *CLIENT_COUNTERS)}
+
+    completed = Q(status='completed')
+    expected = {
+        row['client_id']: (row['sessions'], row['completed'], row['spent'] or 0, row['last'])
+        for row in Session.objects.values('client_id').annotate(
+            sessions=Count('id'), completed=Count('id', filter=completed),
+            spent=Sum('cost', filter=completed), last=Max('created_at')
+        ).order_by()
+    }
+
+    repaired = 0
+    for client_id, values in current.items():
+        totals = expected.pop(client_id, None)
+        if totals is None:
+            # No sessions left; only drop the row if no delta arrived since
+            deleted, _ = ClientStats.objects.filter(client_id=client_id, **dict(zip(CLIENT_COUNTERS, values))).delete()
+            repaired += bool(deleted)
+        elif values != totals:
+            repaired += _repair(ClientStats, client_id, CLIENT_COUNTERS, values, totals, key='client_id')
+    missing = [
+        ClientStats(client_id=client_id, **dict(zip(CLIENT_COUNTERS, totals)))
+        for client_id, totals in expected.items()
+    ]
+
+    # A row created by a concurrent flush wins; the next run checks it
+    ClientStats.objects.bulk_create(missing, batch_size=500, ignore_conflicts=True)
+    return repaired + len(missing)
+
+
+class StatsReconciler(threading.Thread):
+    """Daemon thread that periodically repairs counter drift"""
+
+    def __init__(self, interval=RECONCILE_INTERVAL_SECONDS):
+        super().__init__(name='stats-reconciler', daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                categories, professionals, clients = reconcile()
+                if categories or professionals or clients:
+                    logger.info("Repaired stats drift", extra={
+                        "event": "stats.repaired",
+                        "categories": categories,
+                        "professionals": professionals,
+                        "clients": clients
+                    })
+            except Exception:
+                logger.exception("Stats reconciliation failed", extra={"event": "stats.error"})
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_reconciler = None
+_reconciler_lock = threading.Lock()
+
+
+def start_reconciler():
+    """Start the process-wide reconciler once"""
+    global _reconciler
+    with _reconciler_lock:
+        if _reconciler is None or not _reconciler.is_alive():
+            _reconciler = StatsReconciler()
+            _reconciler.start()
+    return _reconciler
@@ -1,3 +1,1361 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from . import (
+    blobs, chat_feed, dispatch, images, locking, matching, professional_feed, roster, rollups, session_lifecycle, stats,
+    uploads, views,
+)
+from .autocomplete import autocomplete_index
+from .candidate_index import candidate_index
+from .channel_layer import RedisChannelLayer
+from .chat_writer import ChatWriter
+from .lock_store import DatabaseLockStore, InProcessLockStore, RedisLockStore
+from .models import (
+    Blob, Category, ChatMessage, ClientActivityRollup, ClientStats, Payment, PaymentRollup, Professional,
+    ProfessionalCategory, ProfessionalDocument, RevenueRollup, Session, SessionRollup, UploadSession,
+)
+from .redis_standin import StandInRedisServer
+from .routing import websocket_urlpatterns
+from .snapshots import Snapshot
+
+
+def converse(path, *messages):
+    """Connect to ``path``, send ``messages`` and return every reply (the greeting, then one per message)"""
+    async def talk():
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        connected, _ = await communicator.connect()
+        assert connected, path
+        replies = [await communicator.receive_json_from()]
+        for message in messages:
+            await communicator.send_json_to(message)
+            replies.append(await communicator.receive_json_from())
+        await communicator.disconnect()
+        return replies
+    return async_to_sync(talk)()
+
+
+class ProfessionalListingQueryTests(TestCase):
+    """Listing endpoints must cost the same number of queries for any number of rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(3)]
+        for i in range(30):
+            professional = Professional.objects.create(
+                name=f'Professional {i}',
+                specialization='Testing',
+                primary_category=categories[i % 3] if i % 5 else None,
+                status='pending' if i % 4 == 0 else 'approved',
+                available=True,
+            )
+            for category in categories[:i % 3 + 1]:
+                ProfessionalCategory.objects.get_or_create(professional=professional, category=category)
+
+    def test_professional_list(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('professional-list'))
+        data = response.json()
+        self.assertEqual(data['count'], 22)
+        listed = next(p for p in data['professionals'] if p['name'] == 'Professional 2')
+        self.assertEqual(listed['category'], 'Category 2')
+        self.assertEqual(
+            [(c['name'], c['is_primary']) for c in listed['categories']],
+            [('Category 2', True), ('Category 0', False), ('Category 1', False)]
+        )
+
+    def test_professional_list_by_category(self):
+        category = Category.objects.get(name='Category 2')
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('professional-list'), {'category_id': category.id})
+        self.assertEqual(response.json()['count'], 8)
+
+    def test_admin_listings(self):
+        for name in ('admin-professionals-api', 'pending-professionals', 'debug-professionals'):
+            with self.subTest(name), self.assertNumQueries(1):
+                response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+
+    def test_paginated_listings_validate_page_params(self):
+        for name in ('all-professionals', 'users-list'):
+            with self.subTest(name):
+                url = reverse(name)
+                self.assertEqual(self.client.get(url, {'page': 'x'}).status_code, 400)
+                self.assertEqual(self.client.get(url, {'page_size': 'big'}).status_code, 400)
+                data = self.client.get(url, {'page_size': 10_000, 'page': 0}).json()
+                self.assertEqual((data['page'], data['page_size']), (1, 100))
+
+    def test_search_professionals(self):
+        seen, cursor = [], None
+        while True:
+            params = {'q': 'profess test', 'limit': 10, **({'cursor': cursor} if cursor else {})}
+            with self.assertNumQueries(2):
+                data = self.client.get(reverse('search-professionals'), params).json()
+            seen += [p['id'] for p in data['professionals']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 22)
+        self.assertEqual(len(set(seen)), 22)
+
+        response = self.client.get(reverse('search-professionals'), {'q': 'prof', 'category': 'category 2'})
+        self.assertEqual(response.json()['count'], 8)
+
+    def test_search_index_follows_renames(self):
+        professional = Professional.objects.get(name='Professional 7')
+        professional.name = 'Zelda Quux'
+        professional.save()
+        data = self.client.get(reverse('search-professionals'), {'q': 'quu'}).json()
+        self.assertEqual([p['id'] for p in data['professionals']], [professional.id])
+
+    def test_autocomplete(self):
+        autocomplete_index.build()
+        with self.assertNumQueries(0):
+            data = self.client.get(reverse('autocomplete'), {'q': 'cat', 'limit': 3}).json()
+        self.assertEqual(
+            [(s['text'], s['kind']) for s in data['suggestions']],
+            [('Category 0', 'category'), ('Category 1', 'category'), ('Category 2', 'category')]
+        )
+
+        professional = Professional.objects.get(name='Professional 7')
+        with self.captureOnCommitCallbacks(execute=True):
+            professional.name = 'Zelda Quux'
+            professional.save()
+        data = self.client.get(reverse('autocomplete'), {'q': 'quu'}).json()
+        self.assertEqual([(s['text'], s['id']) for s in data['suggestions']], [('Zelda Quux', professional.id)])
+
+
+class UserListingTests(TestCase):
+    """users_list sorts and filters on the maintained ClientStats, at a fixed query count"""
+
+    @classmethod
+    def setUpTestData(cls):
+        professional = Professional.objects.create(name='Ada', specialization='Testing', status='approved')
+        cls.alice, cls.bob, cls.carol = (User.objects.create_user(name) for name in ('alice', 'bob', 'carol'))
+        for client, status, cost in (
+            (cls.alice, 'completed', 30), (cls.alice, 'completed', 20), (cls.alice, 'cancelled', 0),
+            (cls.bob, 'completed', 100),
+        ):
+            with cls.captureOnCommitCallbacks(execute=True):
+                Session.objects.create(professional=professional, client_id=client.id, status=status, cost=cost)
+        stats.stats_queue.flush()
+
+    def usernames(self, **params):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('users-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [user['username'] for user in response.json()['users']]
+
+    def test_sort(self):
+        self.assertEqual(self.usernames(sort='-session_count'), ['alice', 'bob', 'carol'])
+        self.assertEqual(self.usernames(sort='-total_spent'), ['bob', 'alice', 'carol'])
+        self.assertEqual(self.usernames(sort='completed_sessions'), ['carol', 'bob', 'alice'])
+        # Users without sessions have no last session, which sorts last when descending
+        self.assertEqual(self.usernames(sort='-last_session_at')[-1], 'carol')
+        self.assertEqual(self.client.get(reverse('users-list'), {'sort': 'password'}).status_code, 400)
+
+    def test_filters(self):
+        self.assertEqual(self.usernames(min_sessions=2), ['alice'])
+        self.assertEqual(self.usernames(min_sessions=1, sort='username'), ['alice', 'bob'])
+        self.assertEqual(self.usernames(min_spent='50.00'), ['alice', 'bob'])
+        self.assertEqual(self.usernames(min_spent='50.01'), ['bob'])
+        self.assertEqual(self.usernames(min_sessions=2, min_spent=60), [])
+        self.assertEqual(self.client.get(reverse('users-list'), {'min_spent': 'lots'}).status_code, 400)
+
+        alice = next(u for u in self.client.get(reverse('users-list')).json()['users'] if u['username'] == 'alice')
+        self.assertEqual((alice['session_count'], alice['completed_sessions'], alice['total_spent']), (3, 2, 50.0))
+
+
+class RosterTests(TestCase):
+    """Roster versions come from the database and both socket formats keep working"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.professional = Professional.objects.create(name='Ada', specialization='Testing', status='approved')
+
+    def test_versions_follow_commits(self):
+        start = roster.current_version()
+        self.assertEqual(roster.next_version(), start + 1)
+        try:
+            with transaction.atomic():
+                self.assertEqual(roster.next_version(), start + 2)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        # The rolled-back change gave its number back
+        self.assertEqual(roster.current_version(), start + 1)
+        self.assertEqual(roster.build_snapshot()['version'], start + 1)
+
+    def test_original_clients_get_a_bare_array(self):
+        greeting, refreshed = converse('ws/quick-connect/', {'type': 'get_available_professionals'})
+        self.assertEqual([p['name'] for p in greeting], ['Ada'])
+        self.assertIsInstance(refreshed, list)
+
+    def test_delta_clients_get_a_versioned_snapshot(self):
+        snapshot, = converse('ws/quick-connect/?protocol=delta')
+        self.assertEqual(snapshot['type'], 'roster_snapshot')
+        self.assertEqual(snapshot['version'], roster.current_version())
+
+
+class RosterOrderingTests(TransactionTestCase):
+    """A lock delta is numbered in the transaction that changes the lock"""
+
+    def test_versions_follow_commit_order_across_writers(self):
+        professional = Professional.objects.create(name='Ada', specialization='Testing', status='approved')
+        sent, acquiring, released_tried = [], threading.Event(), threading.Event()
+
+        class Layer:
+            async def group_send(self, group, event):
+                sent.append(event)
+
+        next_version = roster.next_version
+
+        def slow_next_version():
+            # The acquiring writer pauses between its UPDATE and its commit
+            if threading.current_thread() is threading.main_thread() and not acquiring.is_set():
+                acquiring.set()
+                released_tried.wait(2)
+            return next_version()
+
+        def release():
+            acquiring.wait(2)
+            try:
+                while True:
+                    try:
+                        return locking.release(professional.id)
+                    except OperationalError:
+                        # Locked by the acquiring writer; wait for it like another process would
+                        time.sleep(0.01)
+                    finally:
+                        released_tried.set()
+            finally:
+                connection.close()
+
+        with mock.patch.object(roster, 'get_channel_layer', return_value=Layer()), \
+                mock.patch.object(roster, 'next_version', slow_next_version):
+            releaser = threading.Thread(target=release)
+            releaser.start()
+            locking.acquire(professional.id, 'client-1')
+            releaser.join()
+
+        latest = max(sent, key=lambda event: event['version'])
+        professional.refresh_from_db()
+        self.assertEqual(len(sent), 2)
+        self.assertEqual((latest['lockedBy'], latest['available']), (professional.locked_by, professional.available))
+        self.assertIsNone(professional.locked_by)
+
+
+class LeaseTests(TestCase):
+    """Professional leases: one holder at a time, kept alive by heartbeats, swept when they lapse"""
+
+    def setUp(self):
+        self.ada = Professional.objects.create(name='Ada', specialization='Testing', status='approved', available=True)
+        self.bob = Professional.objects.create(name='Bob', specialization='Testing', status='approved', available=True)
+
+    def test_acquire_renew_release(self):
+        lease = locking.acquire(self.ada.id, 'client-1')
+        self.assertIsNotNone(lease)
+        self.assertIsNone(locking.acquire(self.ada.id, 'client-2'))
+        self.assertIsNotNone(locking.renew(self.ada.id, 'client-1', lease.token))
+        # A stale token can't renew or release
+        self.assertIsNone(locking.renew(self.ada.id, 'client-1', lease.token - 1))
+        self.assertFalse(locking.release(self.ada.id, 'client-1', lease.token - 1))
+        self.assertTrue(locking.release(self.ada.id, 'client-1', lease.token))
+        self.assertIsNotNone(locking.acquire(self.ada.id, 'client-2'))
+
+    def test_expired_leases_are_swept(self):
+        lease = locking.acquire(self.ada.id, 'client-1')
+        locking.acquire(self.bob.id, 'client-1')
+        Professional.objects.filter(id=self.ada.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(locking.sweep_expired(), [self.ada.id])
+        self.assertIsNone(locking.renew(self.ada.id, 'client-1', lease.token))
+        self.assertIsNotNone(locking.acquire(self.ada.id, 'client-2'))
+        self.assertEqual(locking.release_all('client-1'), [self.bob.id])
+        self.assertFalse(Professional.objects.filter(locked_by='client-1').exists())
+
+    def test_heartbeat_without_client_id_renews(self):
+        _, locked, ack = converse(
+            'ws/quick-connect/?protocol=delta',
+            {'type': 'lock', 'professional_id': self.ada.id, 'client_id': 'client-1'},
+            {'type': 'heartbeat'},
+        )
+        self.assertEqual(locked['type'], 'locked')
+        self.assertEqual([r['id'] for r in ack['renewed']], [str(self.ada.id)])
+        self.assertEqual(ack['lost'], [])
+        # Disconnecting released the lease of the client the socket identified
+        self.ada.refresh_from_db()
+        self.assertIsNone(self.ada.locked_by)
+
+
+class LockStoreContract:
+    """What every LOCK_STORE backend must do; subclasses provide make_store()"""
+
+    def setUp(self):
+        super().setUp()
+        self.store = self.make_store()
+
+    def test_acquire_renew_release(self):
+        first = self.store.acquire('room-1', 'alice', 5000)
+        self.assertTrue(first.acquired)
+        refused = self.store.acquire('room-1', 'bob', 5000)
+        self.assertFalse(refused.acquired)
+        self.assertEqual(refused.owner, 'alice')
+        self.assertEqual(self.store.contention('room-1'), 1)
+
+        renewed = self.store.acquire('room-1', 'alice', 60000)
+        self.assertTrue(renewed.acquired)
+        self.assertGreater(renewed.expires_at, first.expires_at)
+
+        self.assertFalse(self.store.release('room-1', 'bob'))
+        self.assertTrue(self.store.release('room-1', 'alice'))
+        self.assertIsNone(self.store.get('room-1'))
+        self.assertTrue(self.store.acquire('room-1', 'bob', 5000).acquired)
+
+    def test_expiry(self):
+        self.assertTrue(self.store.acquire('room-2', 'alice', 50).acquired)
+        time.sleep(0.1)
+        self.assertIsNone(self.store.get('room-2'))
+        self.assertTrue(self.store.acquire('room-2', 'bob', 5000).acquired)
+
+
+class InProcessLockStoreTests(LockStoreContract, SimpleTestCase):
+    def make_store(self):
+        return InProcessLockStore()
+
+
+class DatabaseLockStoreTests(LockStoreContract, TestCase):
+    def make_store(self):
+        return DatabaseLockStore()
+
+
+class RedisLockStoreTests(LockStoreContract, SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StandInRedisServer().start()
+        cls.addClassCleanup(cls.server.stop)
+
+    def make_store(self):
+        store = RedisLockStore(url=self.server.url)
+        store.client.flushdb()
+        return store
+
+
+class RedisChannelLayerTests(SimpleTestCase):
+    """Two layers on one server stand in for two worker processes"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StandInRedisServer().start()
+        cls.addClassCleanup(cls.server.stop)
+
+    def test_send_and_group_send(self):
+        async def exchange():
+            first, second = RedisChannelLayer(url=self.server.url), RedisChannelLayer(url=self.server.url)
+            await first.flush()
+            try:
+                a, b = await first.new_channel(), await first.new_channel()
+                c = await second.new_channel()
+                for channel, layer in ((a, first), (b, first), (c, second)):
+                    await layer.group_add('roster', channel)
+
+                await second.send(a, {'type': 'direct', 'n': 1})
+                self.assertEqual(await first.receive(a), {'type': 'direct', 'n': 1})
+
+                await first.group_send('roster', {'type': 'fanout'})
+                for channel, layer in ((a, first), (b, first), (c, second)):
+                    self.assertEqual(await asyncio.wait_for(layer.receive(channel), 2), {'type': 'fanout'})
+
+                await first.group_discard('roster', b)
+                await first.group_send('roster', {'type': 'after_discard'})
+                self.assertEqual(await first.receive(a), {'type': 'after_discard'})
+                self.assertEqual(await second.receive(c), {'type': 'after_discard'})
+                self.assertTrue(first._queues[b].empty())
+
+                await first.send('plain.channel', {'type': 'named'})
+                self.assertEqual(await second.receive('plain.channel'), {'type': 'named'})
+            finally:
+                await first.close()
+                await second.close()
+        async_to_sync(exchange)()
+
+
+class StatsReconcileTests(TestCase):
+    """reconcile() repairs drifted counters but never overwrites a delta written after its read"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Cardiology')
+        self.professional = Professional.objects.create(
+            name='Ada', specialization='Testing', status='approved', category=self.category
+        )
+        for rating in (4, 5):
+            Session.objects.create(
+                professional=self.professional, client_id=7, category=self.category, status='completed', rating=rating
+            )
+        stats.stats_queue.flush()
+
+    def test_repairs_drift(self):
+        Category.objects.filter(id=self.category.id).update(session_count=40, professional_count=0)
+        Professional.objects.filter(id=self.professional.id).update(total_sessions=9, rating_total=1)
+        ClientStats.objects.filter(client_id=7).delete()
+        ClientStats.objects.create(client_id=8, sessions_count=3)
+
+        self.assertEqual(stats.reconcile(), (1, 1, 2))
+        self.category.refresh_from_db()
+        self.professional.refresh_from_db()
+        self.assertEqual((self.category.professional_count, self.category.session_count), (1, 2))
+        self.assertEqual((self.professional.total_sessions, self.professional.rating_total), (2, 9))
+        self.assertEqual(float(self.professional.average_rating), 4.5)
+        self.assertEqual(list(ClientStats.objects.values_list('client_id', 'sessions_count')), [(7, 2)])
+        self.assertEqual(stats.reconcile(), (0, 0, 0))
+
+    def test_repair_misses_a_row_changed_since_the_read(self):
+        read = (5, 0, 0, 0)
+        Professional.objects.filter(id=self.professional.id).update(total_sessions=6)
+        self.assertEqual(
+            stats._repair(Professional, self.professional.id, stats.PROFESSIONAL_COUNTERS, read, (2, 2, 9, 4.5)), 0
+        )
+        self.professional.refresh_from_db()
+        self.assertEqual(self.professional.total_sessions, 6)
+
+
+class CandidateIndexTests(TestCase):
+    """The index follows locks, approvals and counter flushes, and check() finds and repairs drift"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Cardiology')
+        self.ada = Professional.objects.create(
+            name='Ada', specialization='Testing', status='approved', primary_category=self.category
+        )
+        self.grace = Professional.objects.create(
+            name='Grace', specialization='Testing', status='pending', primary_category=self.category
+        )
+        stats.stats_queue.flush()
+        candidate_index.warm()
+        # Other tests expect the index cold, reading through to the database
+        self.addCleanup(candidate_index.__init__)
+
+    def record(self, professional):
+        _, records = candidate_index.candidates_for_category(self.category.id, available_only=False)
+        return next((record for record in records if record.id == professional.id), None)
+
+    def test_follows_lock_approve_and_stats_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            locking.acquire(self.ada.id, 'client-1')
+        self.assertEqual((self.record(self.ada).locked_by, self.record(self.ada).available), ('client-1', False))
+        with self.captureOnCommitCallbacks(execute=True):
+            locking.release(self.ada.id, 'client-1')
+        self.assertEqual((self.record(self.ada).locked_by, self.record(self.ada).available), (None, True))
+
+        self.assertIsNone(self.record(self.grace))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('approve-professional', args=[self.grace.id]))
+        self.assertIsNotNone(self.record(self.grace))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Session.objects.create(professional=self.ada, client_id=7, category=self.category, status='completed', rating=4)
+        stats.stats_queue.flush()
+        self.assertEqual((self.record(self.ada).total_sessions, float(self.record(self.ada).average_rating)), (1, 4.0))
+
+        self.assertEqual(candidate_index.check()['stale_ratio'], 0)
+
+    def test_check_finds_and_repairs_drift(self):
+        # Writes that send no signals
+        Professional.objects.filter(id=self.ada.id).update(rate=99)
+        Professional.objects.filter(id=self.grace.id).update(status='approved')
+
+        report = candidate_index.check(repair=False)
+        self.assertEqual((report['missing'], report['stale'], report['repaired']), ([self.grace.id], [self.ada.id], False))
+        self.assertEqual(self.record(self.ada).rate, 50)
+
+        candidate_index.check()
+        self.assertEqual(self.record(self.ada).rate, 99)
+        self.assertIsNotNone(self.record(self.grace))
+        report = candidate_index.check(repair=False)
+        self.assertEqual((report['missing'], report['extra'], report['stale']), ([], [], []))
+
+    def test_only_staff_can_check_over_http(self):
+        url = reverse('debug-candidate-index') + '?check=true&repair=true'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('user', password='x'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertIsNone(candidate_index.last_check)
+
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['last_check']['repaired'])
+
+
+class ClientStatsTests(TestCase):
+    """ClientStats follows a client's sessions as they are created, completed and deleted"""
+
+    def setUp(self):
+        self.professional = Professional.objects.create(name='Ada', specialization='Testing', status='approved')
+        self.client_user = User.objects.create_user('alice')
+
+    def stats(self):
+        stats.stats_queue.flush()
+        row = ClientStats.objects.filter(client=self.client_user).first()
+        return row and (row.sessions_count, row.completed_sessions, row.total_spent, row.last_session_at)
+
+    def test_follows_sessions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session = Session.objects.create(professional=self.professional, client_id=self.client_user.id)
+        self.assertEqual(self.stats(), (1, 0, 0, session.created_at))
+
+        session = Session.objects.get(id=session.id)
+        session.status, session.cost = 'completed', 40
+        with self.captureOnCommitCallbacks(execute=True):
+            session.save()
+        self.assertEqual(self.stats(), (1, 1, 40, session.created_at))
+
+        # Spend is the cost of completed sessions; payments don't count it again
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = Payment.objects.create(session=session, amount=40, payment_method='card')
+            payment.status = 'completed'
+            payment.save()
+        self.assertEqual(self.stats(), (1, 1, 40, session.created_at))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            later = Session.objects.create(
+                professional=self.professional, client_id=self.client_user.id, status='completed', cost=15
+            )
+        self.assertEqual(self.stats(), (2, 2, 55, later.created_at))
+
+        session.status = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            session.save()
+        self.assertEqual(self.stats()[:3], (2, 1, 15))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Session.objects.filter(client_id=self.client_user.id).delete()
+        self.assertEqual(self.stats()[:3], (0, 0, 0))
+
+
+class StatsQueueTests(TestCase):
+    """Deltas for the same row are coalesced, and a failed flush keeps what it didn't write"""
+
+    def setUp(self):
+        self.cardiology = Category.objects.create(name='Cardiology')
+        self.dermatology = Category.objects.create(name='Dermatology')
+        self.professional = Professional.objects.create(name='Ada', specialization='Testing')
+        stats.stats_queue.flush()
+        self.queue = stats.StatsQueue(window=60)
+        # Flushed by hand below instead of by the background thread
+        patcher = mock.patch.object(self.queue, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def queue_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                self.queue.add_category(self.cardiology.id, sessions=1)
+            self.queue.add_category(self.dermatology.id, sessions=3)
+            self.queue.add_category(self.dermatology.id, professionals=1)
+            self.queue.add_category(self.dermatology.id, professionals=-1)
+            self.queue.add_professional(self.professional.id, sessions=1, reviews=1, rating=4)
+            self.queue.add_professional(self.professional.id, sessions=1, reviews=1, rating=5)
+
+    def updates_to(self, queries, table):
+        return [q for q in queries if q['sql'].startswith(f'UPDATE "{table}"')]
+
+    def test_coalesces_changes_per_row(self):
+        self.queue_changes()
+        self.assertEqual(self.queue.metrics()['pending'], 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.queue.flush(), 2)
+        # Both categories net +3 sessions, so they share one UPDATE
+        self.assertEqual(len(self.updates_to(queries, Category._meta.db_table)), 1)
+        self.assertEqual(len(self.updates_to(queries, Professional._meta.db_table)), 1)
+
+        self.assertEqual(
+            list(Category.objects.order_by('name').values_list('session_count', 'professional_count', 'avg_response_time')),
+            [(3, 0, 5), (3, 0, 5)]
+        )
+        self.professional.refresh_from_db()
+        self.assertEqual((self.professional.total_sessions, self.professional.total_reviews), (2, 2))
+        self.assertEqual(float(self.professional.average_rating), 4.5)
+        self.assertEqual(
+            self.queue.metrics(), {'changes': 8, 'updates': 2, 'saved': 6, 'flushes': 1, 'pending': 0}
+        )
+
+    def test_failed_flush_requeues_what_it_did_not_write(self):
+        self.queue_changes()
+        with mock.patch.object(stats, '_update_professionals', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.queue.flush()
+        self.assertEqual(self.queue.metrics()['pending'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queue.add_professional(self.professional.id, sessions=1)
+        self.assertEqual(self.queue.flush(), 1)
+
+        self.professional.refresh_from_db()
+        self.assertEqual((self.professional.total_sessions, self.professional.total_reviews), (3, 2))
+        # The categories were written by the failed flush and not again
+        self.assertEqual(list(Category.objects.values_list('session_count', flat=True)), [3, 3])
+
+
+class CounterWriteTests(TestCase):
+    """Views and admin actions write only what they change, so counter deltas survive"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Cardiology')
+        self.professional = Professional.objects.create(
+            name='Ada', specialization='Testing', status='pending', primary_category=self.category
+        )
+        stats.stats_queue.flush()
+
+    def test_views_keep_counters_flushed_after_their_read(self):
+        stale_professional = Professional.objects.get(id=self.professional.id)
+        stale_category = Category.objects.get(id=self.category.id)
+        Professional.objects.filter(id=self.professional.id).update(total_sessions=F('total_sessions') + 3)
+        Category.objects.filter(id=self.category.id).update(session_count=F('session_count') + 3)
+
+        with mock.patch.object(views, 'get_object_or_404', return_value=stale_professional):
+            self.client.patch(
+                reverse('update-professional-profile', args=[self.professional.id]),
+                {'bio': 'Cardiologist'}, content_type='application/json'
+            )
+            self.client.post(reverse('approve-professional', args=[self.professional.id]))
+        with mock.patch.object(Category.objects, 'get', return_value=stale_category):
+            self.client.post(reverse('update-category', args=[self.category.id]), {'color': '#fff'}, content_type='application/json')
+
+        self.professional.refresh_from_db()
+        self.category.refresh_from_db()
+        self.assertEqual((self.professional.bio, self.professional.status), ('Cardiologist', 'approved'))
+        self.assertEqual((self.professional.total_sessions, self.category.session_count), (3, 3))
+        self.assertEqual(self.category.color, '#fff')
+
+    def test_admin_approval_goes_through_the_signals(self):
+        from django.contrib.admin.sites import site
+        admin = site._registry[Professional]
+        request = RequestFactory().post('/')
+        with mock.patch.object(admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+            admin.approve_professionals(request, Professional.objects.filter(id=self.professional.id))
+        stats.stats_queue.flush()
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.professional_count, 1)
+        self.assertEqual(Professional.objects.get().status, 'approved')
+
+
+class MatchingTests(TestCase):
+    """The vectorized scores and top-k match calculate_matching_score and a stable sort"""
+
+    def setUp(self):
+        def professional(name, **fields):
+            return Professional.objects.create(name=name, specialization='Testing', status='approved', **fields)
+
+        tied = dict(online_status=True, available=True, average_rating='4.20', experience_years=5, avg_response_time='< 1 hour')
+        professional('Zero', average_rating=0, rate=0, experience_years=0, online_status=False, available=False)
+        professional('Unknown response', average_rating='4.50', experience_years=3, rate=30, avg_response_time='whenever')
+        professional('Default response', average_rating='3.00', experience_years=15, rate=20, avg_response_time='')
+        professional('At max rate', average_rating='4.80', experience_years=8, rate=80, online_status=True)
+        # Rounds to the tied score but is a hair lower before rounding
+        professional('Near tie', rate='40.01', **tied)
+        for name in ('Tie A', 'Tie B', 'Tie C'):
+            professional(name, rate=40, **tied)
+        professional('Best', online_status=True, available=True, average_rating='5.00', experience_years=12, rate=10)
+
+    def scalar_ranking(self, preferences, k):
+        results = []
+        for professional in Professional.objects.order_by('id'):
+            result = matching.calculate_matching_score(professional, preferences)
+            result['professional_id'] = professional.id
+            results.append(result)
+        # Stable, so equal scores stay in candidate order
+        return sorted(results, key=lambda result: -result['total_score'])[:k]
+
+    def test_scores_match_the_scalar_version(self):
+        rows = matching.feature_rows(Professional.objects.order_by('id'))
+        for preferences in ({'max_rate': 80}, {}):
+            scores = matching.score_candidates(matching.load_features(rows), preferences)
+            for index, professional in enumerate(Professional.objects.order_by('id')):
+                expected = matching.calculate_matching_score(professional, preferences)
+                self.assertEqual(matching.result_for(scores, index), expected, professional.name)
+
+    def test_top_k_matches_a_stable_sort(self):
+        rows = matching.feature_rows(Professional.objects.order_by('id'))
+        names = dict(Professional.objects.values_list('id', 'name'))
+        for preferences in ({'max_rate': 80}, {}):
+            for k in (1, 3, 5, 20):
+                ranked, count = matching.rank_candidates(rows, preferences, k=k)
+                self.assertEqual(count, 9)
+                self.assertEqual(ranked, self.scalar_ranking(preferences, k), (preferences, k))
+
+        # The cutoff falls inside the tie, which is broken by candidate order
+        ranked, _ = matching.rank_candidates(rows, {'max_rate': 80}, k=3)
+        self.assertEqual([names[result['professional_id']] for result in ranked], ['Best', 'Near tie', 'Tie A'])
+
+
+@mock.patch.object(dispatch.candidate_index, 'candidates_for_category', return_value=None)
+class DispatcherTests(TestCase):
+    """Urgent clients go first, a claim is all or nothing, and cancelling mid-claim gives the professional back"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Cardiology')
+        self.professional = Professional.objects.create(
+            name='Ada', specialization='Testing', status='approved', available=True, primary_category=self.category
+        )
+        self.dispatcher = dispatch.Dispatcher()
+
+    def ticket(self, client_id, urgency):
+        return dispatch.Ticket(client_id, self.category.id, f'test.dispatch!{client_id}', urgency=urgency)
+
+    def test_urgency_ordering(self, _):
+        low, medium, high = self.ticket(1, 'low'), self.ticket(2, 'medium'), self.ticket(3, 'high')
+        self.assertEqual([self.dispatcher.enqueue(t) for t in (low, medium, high)], [1, 1, 1])
+        self.assertEqual(self.dispatcher.enqueue(self.ticket(4, 'low')), 4)
+
+        self.dispatcher.cancel(ticket_id=medium.ticket_id)
+        depth = self.dispatcher.stats()['categories'][str(self.category.id)]
+        self.assertEqual((depth['depth'], depth['depth_by_urgency']['medium']), (3, 0))
+
+        self.assertEqual(self.dispatcher.dispatch(), 1)
+        session = Session.objects.get()
+        self.assertEqual(session.client_id, high.client_id)
+        event = async_to_sync(get_channel_layer().receive)(high.channel_name)
+        self.assertEqual((event['type'], event['session_id']), ('dispatch_matched', session.id))
+        self.assertEqual(self.dispatcher._head(self.category.id), low)
+
+    def test_claim_is_all_or_nothing(self, _):
+        with mock.patch.object(Session.objects, 'create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                dispatch.claim(self.ticket(1, 'high'), self.professional.id)
+        self.professional.refresh_from_db()
+        self.assertIsNone(self.professional.locked_by)
+
+        locking.acquire(self.professional.id, 'someone-else')
+        self.assertEqual(dispatch.claim(self.ticket(1, 'high'), self.professional.id), (None, None))
+        self.assertFalse(Session.objects.exists())
+
+    def test_cancel_during_claim(self, _):
+        ticket = self.ticket(1, 'medium')
+        self.dispatcher.enqueue(ticket)
+        claim = dispatch.claim
+
+        def claim_then_cancel(ticket, professional_id):
+            claimed = claim(ticket, professional_id)
+            self.dispatcher.cancel(ticket_id=ticket.ticket_id)
+            return claimed
+
+        with mock.patch.object(dispatch, 'claim', claim_then_cancel):
+            self.assertEqual(self.dispatcher.dispatch(), 0)
+        self.assertEqual(Session.objects.get().status, 'cancelled')
+        self.professional.refresh_from_db()
+        self.assertIsNone(self.professional.locked_by)
+        self.assertIsNone(self.dispatcher._head(self.category.id))
+
+
+class DashboardSnapshotTests(TestCase):
+    """The dashboard snapshot is shared through the cache and only staff can skip it"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot_is_shared_through_the_cache(self):
+        computed = []
+        def compute():
+            computed.append(1)
+            return {'n': len(computed)}
+        # Two instances with one key behave like the same snapshot in two workers
+        first, second = Snapshot('test', compute, ttl=60), Snapshot('test', compute, ttl=60)
+        self.assertEqual(first.get()['n'], 1)
+        self.assertEqual(second.get()['n'], 1)
+        self.assertEqual(second.get(force=True)['n'], 2)
+
+    def test_only_staff_can_force_a_fresh_snapshot(self):
+        url = reverse('admin-dashboard-stats')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url, {'fresh': 'true'}).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        self.assertEqual(self.client.get(url, {'fresh': 'true'}).status_code, 200)
+
+
+class RollupTests(TestCase):
+    """Signals move sessions and payments between buckets; reads cover the window exactly"""
+
+    NOW = datetime(2026, 3, 15, 10, 30, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.professional = Professional.objects.create(name='Ada', specialization='Testing', status='approved')
+        patcher = mock.patch('django.utils.timezone.now', return_value=self.NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The sessions also queue counter deltas; write them while the test database exists
+        self.addCleanup(stats.stats_queue.flush)
+
+    def buckets(self, model, granularity='day'):
+        """Non-empty bucket rows of one granularity, keyed by everything but the totals"""
+        totals = {
+            SessionRollup: ('sessions', 'duration_total', 'cost_total'),
+            RevenueRollup: ('sessions', 'revenue'),
+            PaymentRollup: ('payments', 'amount_total'),
+        }[model]
+        keys = [f.name for f in model._meta.fields if f.name not in ('id', 'granularity', *totals)]
+        return {
+            tuple(row[key] for key in keys): tuple(row[total] for total in totals)
+            for row in model.objects.filter(granularity=granularity, **{f'{totals[0]}__gt': 0}).values()
+        }
+
+    def all_buckets(self):
+        return (
+            {(model, granularity): self.buckets(model, granularity)
+             for model in (SessionRollup, RevenueRollup, PaymentRollup) for granularity in rollups.GRANULARITIES},
+            set(ClientActivityRollup.objects.filter(sessions__gt=0).values_list('day', 'client_id', 'sessions')),
+        )
+
+    def session(self, ended_at=None, cost=0, status='completed', client_id=7):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Session.objects.create(
+                professional=self.professional, client_id=client_id, status=status,
+                ended_at=ended_at, cost=cost, duration=60
+            )
+
+    def test_changes_move_between_buckets(self):
+        today = self.NOW.replace(hour=0, minute=30)
+        session = self.session(status='pending')
+        self.assertEqual(self.buckets(SessionRollup), {(today.replace(minute=0), 'pending', 'chat'): (1, 60, 0)})
+
+        # Status change, then a move to another day
+        session = Session.objects.get(id=session.id)
+        session.status, session.ended_at, session.cost = 'completed', self.NOW, 25
+        with self.captureOnCommitCallbacks(execute=True):
+            session.save()
+        self.assertEqual(self.buckets(SessionRollup), {(today.replace(minute=0), 'completed', 'chat'): (1, 60, 25)})
+        self.assertEqual(self.buckets(RevenueRollup, 'hour'), {(self.NOW.replace(minute=0),): (1, 25)})
+
+        yesterday = today.replace(minute=0) - timedelta(days=1)
+        session.created_at = yesterday + timedelta(hours=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            session.save()
+            payment = Payment.objects.create(session=session, amount=25, payment_method='card')
+        self.assertEqual(self.buckets(SessionRollup), {(yesterday, 'completed', 'chat'): (1, 60, 25)})
+        self.assertEqual(self.buckets(PaymentRollup), {(today.replace(minute=0), 'pending', 'card'): (1, 25)})
+
+        payment = Payment.objects.get(id=payment.id)
+        payment.status = 'completed'
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.save()
+        self.assertEqual(self.buckets(PaymentRollup), {(today.replace(minute=0), 'completed', 'card'): (1, 25)})
+
+        # Deleting the session takes its payment with it
+        with self.captureOnCommitCallbacks(execute=True):
+            Session.objects.get(id=session.id).delete()
+        self.assertEqual(self.all_buckets(), ({key: {} for key in self.all_buckets()[0]}, set()))
+
+    def test_rebuild_matches_the_live_buckets(self):
+        for days, cost in ((0, 10), (1, 20), (40, 40)):
+            session = self.session(ended_at=self.NOW - timedelta(days=days), cost=cost, client_id=days)
+            with self.captureOnCommitCallbacks(execute=True):
+                Payment.objects.create(session=session, amount=cost, payment_method='mpesa')
+        self.session(status='cancelled')
+        live = self.all_buckets()
+
+        rollups.rebuild()
+        self.assertEqual(self.all_buckets(), live)
+        rollups.rebuild(days=1)
+        self.assertEqual(self.all_buckets(), live)
+
+    def test_windows(self):
+        for ended_at, cost in (
+            (self.NOW.replace(hour=9, minute=10), 10),
+            (datetime(2026, 3, 14, 12, tzinfo=dt_timezone.utc), 20),
+            # 30 days back starts at 2026-02-13 10:00
+            (datetime(2026, 2, 13, 12, tzinfo=dt_timezone.utc), 40),
+            (datetime(2026, 2, 13, 9, tzinfo=dt_timezone.utc), 80),
+            (datetime(2025, 12, 31, 23, 30, tzinfo=dt_timezone.utc), 160),
+            # Before the six months shown
+            (datetime(2025, 9, 1, tzinfo=dt_timezone.utc), 320),
+        ):
+            self.session(ended_at=ended_at, cost=cost)
+
+        self.assertEqual(rollups.revenue_since(self.NOW - timedelta(days=30)), 70)
+        self.assertEqual(rollups.revenue_since(self.NOW - timedelta(days=7)), 30)
+        self.assertEqual(rollups.revenue_since(self.NOW - timedelta(hours=1)), 10)
+        self.assertEqual(rollups.revenue_since(), 630)
+        start = self.NOW - timedelta(days=30)
+        self.assertEqual(
+            rollups.revenue_since(start),
+            Session.objects.filter(ended_at__gte=rollups.bucket_start(start, 'hour')).aggregate(total=Sum('cost'))['total']
+        )
+
+        months = [datetime(year, month, 1, tzinfo=dt_timezone.utc) for year, month in (
+            (2025, 10), (2025, 11), (2025, 12), (2026, 1), (2026, 2), (2026, 3)
+        )]
+        self.assertEqual(rollups.monthly_revenue(6), list(zip(months, [0, 0, 160, 0, 120, 30])))
+
+
+class ChatWriterTests(TestCase):
+    """Messages are stored in one batch, and flushes never overlap"""
+
+    def setUp(self):
+        professional = Professional.objects.create(name='Ada', specialization='Testing', status='approved')
+        self.session = Session.objects.create(professional=professional, client_id=1)
+        self.writer = ChatWriter(batch_size=10, interval=60)
+        self.writer._ensure_thread = lambda: None  # flush by hand
+
+    def test_pending_messages_are_stored_in_one_batch(self):
+        futures = [self.writer.submit(self.session.id, f'm{i}', 'client') for i in range(3)]
+        self.assertEqual(self.writer.flush(), 3)
+        stored = list(ChatMessage.objects.order_by('id').values_list('id', 'message'))
+        self.assertEqual([f.result(0) for f in futures], [pk for pk, _ in stored])
+        self.assertEqual([m for _, m in stored], ['m0', 'm1', 'm2'])
+        self.assertEqual((self.writer.metrics()['flushes'], self.writer.flush()), (1, 0))
+
+    def test_flushes_run_one_at_a_time(self):
+        active, overlaps, ids = [0], [], iter(range(1, 100))
+
+        def slow_bulk_create(messages):
+            active[0] += 1
+            overlaps.append(active[0])
+            time.sleep(0.05)
+            for message in messages:
+                message.id = next(ids)
+            active[0] -= 1
+            return messages
+
+        def submit_and_flush(text):
+            self.writer.submit(self.session.id, text, 'client')
+            self.writer.flush()
+
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=slow_bulk_create):
+            threads = [threading.Thread(target=submit_and_flush, args=(f'm{i}',)) for i in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(max(overlaps), 1)
+        self.assertEqual(self.writer.metrics()['messages'], 3)
+
+    def test_slow_batch_is_reported_as_queued(self):
+        request = RequestFactory().post('/', '{"content": "hi"}', content_type='application/json')
+        with mock.patch.object(views.chat_writer, 'write_sync', side_effect=FutureTimeout):
+            response = views.send_message_api(request, self.session.id)
+        self.assertEqual(response.status_code, 202)
+
+
+class ChatFeedTests(TestCase):
+    """Cursor paging, late-committing messages and long-poll limits"""
+
+    def setUp(self):
+        professional = Professional.objects.create(name='Ada', specialization='Testing', status='approved')
+        self.session = Session.objects.create(professional=professional, client_id=1)
+        self.url = reverse('session-messages', args=[self.session.id])
+
+    def message(self, text, **fields):
+        return ChatMessage.objects.create(session=self.session, message=text, sender_type='client', **fields)
+
+    def test_paging_and_since(self):
+        ids = [self.message(f'm{i}').id for i in range(5)]
+        latest = self.client.get(self.url, {'limit': 2}).json()
+        self.assertEqual(([m['id'] for m in latest['messages']], latest['has_more']), (ids[3:], True))
+        older = self.client.get(self.url, {'before': latest['prev_before'], 'limit': 2}).json()
+        self.assertEqual([m['id'] for m in older['messages']], ids[1:3])
+
+        newer = self.message('m5').id
+        page = self.client.get(self.url, {'since': latest['next_since']}).json()
+        self.assertEqual([m['id'] for m in page['messages']], [newer])
+        self.assertEqual(self.client.get(self.url, {'since': str(ids[-1])}).json()['messages'][0]['id'], newer)
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+
+    def test_late_commit_below_the_cursor_is_delivered_once(self):
+        self.message('first', id=100)
+        self.message('third', id=120)
+        page = self.client.get(self.url, {'since': '99'}).json()
+        self.assertEqual([m['id'] for m in page['messages']], [100, 120])
+
+        # A batch from another process commits after ours, with a lower id
+        self.message('second', id=110)
+        page = self.client.get(self.url, {'since': page['next_since']}).json()
+        self.assertEqual([m['id'] for m in page['messages']], [110])
+        page = self.client.get(self.url, {'since': page['next_since']}).json()
+        self.assertEqual(page['messages'], [])
+
+    def test_long_poll_waits_only_with_a_free_slot(self):
+        since = str(self.message('seen').id)
+        started = time.monotonic()
+        self.assertEqual(chat_feed.wait_for_page(self.session.id, since, timeout=0.3), ([], False))
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+        with mock.patch.object(chat_feed, 'waiter_slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            started = time.monotonic()
+            self.assertEqual(chat_feed.wait_for_page(self.session.id, since, timeout=5), ([], False))
+            self.assertLess(time.monotonic() - started, 1)
+
+
+class ProfessionalSocketTests(TestCase):
+    """Only the professional's own account or staff may join their dashboard group"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ada', password='x')
+        self.professional = Professional.objects.create(name='Ada', specialization='Testing', user=self.user)
+        self.path = f'ws/professional/{self.professional.id}/'
+
+    def connects(self, query=''):
+        async def talk():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), self.path + query)
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+        return async_to_sync(talk)()
+
+    def test_anonymous_and_other_users_are_refused(self):
+        self.assertFalse(self.connects())
+        self.assertFalse(self.connects('?token=nope'))
+        other = Token.objects.create(user=User.objects.create_user('bob', password='x'))
+        self.assertFalse(self.connects(f'?token={other.key}'))
+
+    def test_chat_after_accepting(self):
+        session = Session.objects.create(professional=self.professional, client_id=7, status='active')
+        self.client.post(
+            reverse('accept-session-request', args=[session.id]),
+            {'professional_id': self.professional.id}, content_type='application/json'
+        )
+        stored = Future()
+        stored.set_result(1)
+        token = Token.objects.create(user=self.user).key
+        with mock.patch.object(views.chat_writer, 'submit', return_value=stored) as submit:
+            _, sent = converse(self.path + f'?token={token}', {
+                'type': 'chat_message', 'client_id': '7', 'text': 'hello', 'message_id': 'm1'
+            })
+        self.assertEqual(Session.objects.get().status, 'in_progress')
+        self.assertEqual((sent['type'], sent['message_id']), ('message_sent', 'm1'))
+        self.assertEqual(submit.call_args.args[:2], (session.id, 'hello'))
+
+    def test_own_token_and_staff_are_let_in(self):
+        self.assertTrue(self.connects(f'?token={Token.objects.create(user=self.user).key}'))
+        staff = Token.objects.create(user=User.objects.create_user('root', password='x', is_staff=True))
+        self.assertTrue(self.connects(f'?token={staff.key}'))
+
+
+class SessionLifecycleTests(TestCase):
+    """The transition table, and that sessions opened as 'active' can still be answered"""
+
+    def setUp(self):
+        self.professional = Professional.objects.create(name='Ada', specialization='Testing')
+
+    def session(self, status):
+        return Session.objects.create(professional=self.professional, client_id=1, status=status)
+
+    def test_transition_table(self):
+        allowed = [
+            ('pending', 'in_progress'), ('active', 'in_progress'), ('pending', 'declined'), ('active', 'declined'),
+            ('active', 'cancelled'), ('active', 'expired'), ('in_progress', 'completed'),
+            ('in_progress', 'disconnected'), ('disconnected', 'active'), ('disconnected', 'in_progress'),
+        ]
+        refused = [
+            ('in_progress', 'declined'), ('completed', 'in_progress'), ('declined', 'in_progress'),
+            ('pending', 'active'), ('cancelled', 'completed'), ('pending', 'unknown'),
+        ]
+        for current, status in allowed:
+            self.assertTrue(session_lifecycle.can_transition(current, status), (current, status))
+        for current, status in refused:
+            self.assertFalse(session_lifecycle.can_transition(current, status), (current, status))
+
+    def test_stale_status_is_refused(self):
+        session = self.session('pending')
+        Session.objects.filter(id=session.id).update(status='cancelled')
+        with self.assertRaises(session_lifecycle.InvalidTransition) as raised:
+            session_lifecycle.transition(session, 'in_progress')
+        self.assertEqual(raised.exception.current, 'cancelled')
+
+    def answer(self, name, session):
+        return self.client.post(
+            reverse(name, args=[session.id]), {'professional_id': self.professional.id}, content_type='application/json'
+        )
+
+    def test_active_sessions_can_be_accepted_and_declined(self):
+        accepted, declined = self.session('active'), self.session('active')
+        self.assertEqual(self.answer('accept-session-request', accepted).status_code, 200)
+        self.assertEqual(self.answer('decline-session-request', declined).status_code, 200)
+        self.assertEqual(
+            list(Session.objects.order_by('id').values_list('status', flat=True)), ['in_progress', 'declined']
+        )
+        self.assertEqual(self.answer('accept-session-request', accepted).status_code, 409)
+
+
+class UploadTestMixin:
+    """Uploads into a temporary MEDIA_ROOT, with helpers for the resumable endpoints"""
+
+    PDF = b'%PDF-1.4\n' + b'x' * 11
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media, UPLOAD_PART_DIR=os.path.join(media, 'parts'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def start(self, kind='license', data=PDF, checksum=''):
+        response = self.client.post(reverse('start-upload-session'), {
+            'kind': kind, 'file_name': 'license.pdf', 'size': len(data), 'checksum': checksum
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload_id']
+
+    def put(self, upload_id, offset, data):
+        return self.client.put(
+            reverse('upload-session', args=[upload_id]) + f'?offset={offset}', data, content_type='application/octet-stream'
+        )
+
+    def commit(self, upload_id):
+        return self.client.post(reverse('commit-upload-session', args=[upload_id]))
+
+
+class ResumableUploadTests(UploadTestMixin, TestCase):
+    """Chunks may overlap but not leave gaps or overrun, and a commit checks what arrived"""
+
+    def test_chunks_overlap_but_never_gap_or_overrun(self):
+        upload_id, data = self.start(checksum=hashlib.sha256(self.PDF).hexdigest()), self.PDF
+        self.assertEqual(self.put(upload_id, 0, data[:10]).json()['offset'], 10)
+        # A retried chunk overlapping what already arrived
+        self.assertEqual(self.put(upload_id, 5, data[5:15]).json()['offset'], 15)
+
+        gap = self.put(upload_id, 18, data[18:])
+        self.assertEqual((gap.status_code, gap.json()['offset']), (409, 15))
+        self.assertEqual(self.put(upload_id, 15, data[15:] + b'extra').status_code, 416)
+        self.assertEqual(self.commit(upload_id).status_code, 409)
+
+        self.assertEqual(self.put(upload_id, 15, data[15:]).json()['offset'], len(data))
+        stored = self.commit(upload_id).json()
+        self.assertEqual((stored['content_type'], stored['file_size']), ('application/pdf', len(data)))
+        self.assertEqual(self.commit(upload_id).status_code, 404)
+
+    def test_commit_checks_checksum_and_type(self):
+        mismatch = self.start(checksum='0' * 64)
+        self.put(mismatch, 0, self.PDF)
+        self.assertEqual(self.commit(mismatch).status_code, 422)
+        # Still there to be discarded
+        self.assertEqual(self.client.delete(reverse('upload-session', args=[mismatch])).status_code, 200)
+
+        wrong_type = self.start(kind='profile_image')
+        self.put(wrong_type, 0, self.PDF)
+        self.assertEqual(self.commit(wrong_type).status_code, 400)
+
+    def test_missing_uploads_and_parts(self):
+        unknown = uuid.uuid4()
+        self.assertEqual(self.client.get(reverse('upload-session', args=[unknown])).status_code, 404)
+        self.assertEqual(self.commit(unknown).status_code, 404)
+
+        # A concurrent commit has already taken the part file
+        upload_id = self.start()
+        self.put(upload_id, 0, self.PDF)
+        path = uploads.part_path(UploadSession.objects.get(id=upload_id))
+        os.rename(path, f'{path}.commit')
+        self.assertEqual(self.commit(upload_id).status_code, 409)
+        self.assertEqual(self.put(upload_id, 0, self.PDF).status_code, 409)
+
+
+class BlobTests(UploadTestMixin, TestCase):
+    """Blobs are counted by the documents pointing at them; unattached licenses stay out of blobs/"""
+
+    def setUp(self):
+        super().setUp()
+        self.professional = Professional.objects.create(name='Ada', specialization='Testing')
+
+    def upload(self, **fields):
+        return self.client.post(reverse('upload-license'), {
+            'file': SimpleUploadedFile('license.pdf', self.PDF, content_type='application/pdf'), **fields
+        }).json()
+
+    def exists(self, name):
+        return os.path.exists(blobs.blob_storage().path(name))
+
+    def test_documents_share_and_release_a_blob(self):
+        first = self.upload(professional_id=self.professional.id)
+        second = self.upload(professional_id=self.professional.id, document_type='certificate')
+        blob = Blob.objects.get()
+        self.assertTrue(first['file_url'].endswith(blob.name) and second['file_url'].endswith(blob.name))
+        self.assertEqual((blob.writes, blob.ref_count), (2, 2))
+
+        ProfessionalDocument.objects.get(id=first['document_id']).delete()
+        self.assertEqual(blobs.collect(grace=0), (0, 0, 0))
+        ProfessionalDocument.objects.get(id=second['document_id']).delete()
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+        self.assertEqual(blobs.collect(grace=0), (1, len(self.PDF), 0))
+        self.assertFalse(Blob.objects.exists() or self.exists(blob.name))
+
+    def test_collect_repairs_drifted_counts(self):
+        self.upload(professional_id=self.professional.id)
+        Blob.objects.update(ref_count=5)
+        self.assertEqual(blobs.collect(grace=0), (0, 0, 1))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+        blobs.record_write('blobs/aa/bb/orphan.pdf', 'aabb', 3)
+        blobs.retain('blobs/aa/bb/orphan.pdf')
+        blobs.release('blobs/aa/bb/orphan.pdf')
+        self.assertEqual(Blob.objects.get(name='blobs/aa/bb/orphan.pdf').ref_count, 0)
+        # Still in its grace period
+        self.assertEqual(blobs.collect(grace=60)[0], 0)
+
+    def test_unattached_license_is_never_collected(self):
+        path = self.upload()['file_url'].split(settings.MEDIA_URL, 1)[1]
+        self.assertFalse(blobs.is_blob(path))
+        self.assertEqual(blobs.collect(grace=0), (0, 0, 0))
+        self.assertTrue(self.exists(path))
+
+    def test_chunked_upload_can_be_attached(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.PDF)
+        committed = self.client.post(
+            reverse('commit-upload-session', args=[upload_id]),
+            {'professional_id': self.professional.id, 'document_type': 'license'}, content_type='application/json'
+        ).json()
+        document = ProfessionalDocument.objects.get(id=committed['document_id'])
+        self.assertEqual(Blob.objects.get(name=document.file.name).ref_count, 1)
+
+
+class InlineExecutor:
+    """Runs submitted work right away, in the calling thread"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class ImagePipelineTests(UploadTestMixin, TestCase):
+    """Profile pictures get resized variants, and old variants are removed with the picture"""
+
+    def setUp(self):
+        super().setUp()
+        self.professional = Professional.objects.create(name='Ada', specialization='Testing', status='approved')
+        # Render in this thread instead of a spawned worker, and keep the test transaction open
+        for patcher in (
+            mock.patch.object(images.image_pipeline, 'executor', return_value=InlineExecutor()),
+            mock.patch.object(images, 'close_old_connections'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def picture(self, name, size=(800, 600)):
+        from PIL import Image
+        data = io.BytesIO()
+        Image.new('RGB', size, (200, 40, 40)).save(data, 'JPEG')
+        return SimpleUploadedFile(name, data.getvalue(), content_type='image/jpeg')
+
+    def set_picture(self, picture):
+        self.professional.profile_picture = picture
+        with self.captureOnCommitCallbacks(execute=True):
+            self.professional.save()
+        self.professional.refresh_from_db()
+        return self.professional.profile_picture_variants
+
+    def stored(self, variants):
+        return [default_storage.exists(variant['name']) for variant in variants.values()]
+
+    def test_variants(self):
+        variants = self.set_picture(self.picture('ada.jpg'))
+        self.assertEqual(
+            {size: (v['width'], v['height']) for size, v in variants.items()},
+            {'thumb': (96, 72), 'small': (256, 192), 'medium': (640, 480)}
+        )
+        self.assertEqual(self.stored(variants), [True] * 3)
+        with default_storage.open(variants['small']['name']) as file:
+            self.assertEqual(file.read(4), b'RIFF')
+
+        # Smaller pictures are not upscaled
+        variants = self.set_picture(self.picture('small.jpg', size=(120, 60)))
+        self.assertEqual(variants['medium'], {**variants['medium'], 'width': 120, 'height': 60})
+        self.assertEqual(variants['thumb'], {**variants['thumb'], 'width': 96, 'height': 48})
+
+    def test_variant_url_falls_back_to_the_original(self):
+        original = 'professional_profiles/ada.jpg'
+        self.assertEqual(images.variant_url({}, 'small', original), '/media/professional_profiles/ada.jpg')
+        self.assertEqual(images.variant_url(None, 'small'), None)
+        variants = {'small': {'name': 'professional_profiles/variants/ada_small.webp', 'width': 256, 'height': 192}}
+        self.assertEqual(images.variant_url(variants, 'small', original), '/media/professional_profiles/variants/ada_small.webp')
+        self.assertEqual(images.variant_url(variants, 'thumb', original), '/media/professional_profiles/ada.jpg')
+
+    def test_replacing_or_removing_the_picture_removes_its_variants(self):
+        first = self.set_picture(self.picture('ada.jpg'))
+        second = self.set_picture(self.picture('grace.jpg'))
+        self.assertEqual(self.stored(first), [False] * 3)
+        self.assertEqual(self.stored(second), [True] * 3)
+
+        self.assertEqual(self.set_picture(None), {})
+        self.assertEqual(self.stored(second), [False] * 3)
+
+    def test_variants_of_a_replaced_picture_are_discarded(self):
+        current = self.set_picture(self.picture('ada.jpg'))
+        # A slow job for the picture this one replaced
+        older = default_storage.save('professional_profiles/older.jpg', self.picture('older.jpg'))
+
+        stale = images.image_pipeline.metrics()['stale']
+        images.image_pipeline.submit(Professional, self.professional.id, older)
+        self.assertEqual(images.image_pipeline.metrics()['stale'], stale + 1)
+
+        self.professional.refresh_from_db()
+        self.assertEqual(self.professional.profile_picture_variants, current)
+        self.assertEqual(self.stored(current), [True] * 3)
+        self.assertEqual(sorted(default_storage.listdir('professional_profiles/variants')[1]), sorted(
+            os.path.basename(variant['name']) for variant in current.values()
+        ))
+
+
+class SessionSocketTests(TestCase):
+    """Session sockets attach to one session and resume it in the status it had"""
+
+    def setUp(self):
+        self.professional = Professional.objects.create(name='Ada', specialization='Testing', status='approved')
+
+    def test_pair_route_reuses_the_open_session(self):
+        path = f'ws/session/{self.professional.id}/7/'
+        first, = converse(path)
+        self.assertFalse(first['resumed'])
+        self.assertEqual(Session.objects.get().status, 'disconnected')
+
+        second, = converse(path)
+        self.assertEqual((second['session_id'], second['resumed'], second['status']), (first['session_id'], True, 'active'))
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_accepted_session_resumes_in_progress(self):
+        session = Session.objects.create(professional=self.professional, client_id=7, status='active')
+        session_lifecycle.transition(session, 'in_progress', actual_start=timezone.now())
+        session_lifecycle.transition(session, 'disconnected')
+
+        connected, = converse(f'ws/session/{session.id}/')
+        self.assertEqual((connected['session_id'], connected['status']), (session.id, 'in_progress'))
+        self.assertEqual(professional_feed.pending_requests(self.professional.id), [])
+
+    def test_unknown_or_finished_sessions_are_refused(self):
+        finished = Session.objects.create(professional=self.professional, client_id=7, status='completed')
+        for path in ('ws/session/999/', f'ws/session/{finished.id}/'):
+            async def talk():
+                communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+                connected, _ = await communicator.connect()
+                return connected
+            self.assertFalse(async_to_sync(talk)())
@@ -0,0 +1,270 @@
+"""
+Streaming and resumable uploads for licenses and profile images.
+
+The upload views used to save ``ContentFile(uploaded_file.read())``, which
+holds the whole file in memory on top of the copy Django already kept (the
+in-memory upload limit was as large as the files). Now:
+
+- ``store()`` hands the uploaded file to storage, which copies it chunk by
+  chunk, hashing it (SHA-256) on the way. Django spools anything over
+  ``FILE_UPLOAD_MAX_MEMORY_SIZE`` to a temporary file, so neither copy
+  needs the whole file in memory.
+- The type is sniffed from the first bytes, not taken from the client's
+  ``content_type``, and decides the stored extension.
+- A ``checksum`` sent by the client must match what was stored.
+- Licenses attached to a ``ProfessionalDocument`` go to the
+  content-addressed ``BlobStorage`` (blobs.py), so uploading the same file
+  again stores nothing new. A license uploaded without a professional is
+  stored under its own name instead: no row would reference the blob, and
+  the collector would delete it while the client still holds its URL.
+
+For flaky mobile connections the same files can be sent in pieces:
+
+    POST api/upload/sessions/                  {kind, file_name, size, checksum}
+    PUT  api/upload/sessions/<id>/?offset=N    raw bytes of the next chunk
+    GET  api/upload/sessions/<id>/             how many bytes arrived, to resume
+    POST api/upload/sessions/<id>/commit/      verify, sniff and store
+                                               {professional_id, document_type}
+
+Chunks are written at their offset into a part file under
+``UPLOAD_PART_DIR``, so resending a chunk after a dropped response is
+harmless. A chunk starting past the received bytes is refused with the
+offset to resume from. A commit first moves the part file aside, so when a
+commit is retried while the first is still running only one stores the
+file; the other is told the upload is gone. Sessions idle for
+``UPLOAD_SESSION_TTL`` are removed when new ones start.
+"""
+
+import hashlib
+import logging
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .blobs import blob_storage
+from .models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+COPY_SIZE = 64 * 1024
+
+# Kind: storage folder, size limit, accepted types
+KINDS = {
+    'license': ('licenses', 10 * MB, ('application/pdf', 'image/jpeg', 'image/png')),
+    'profile_image': ('profile_images', 5 * MB, ('image/jpeg', 'image/png', 'image/gif')),
+}
+
+# Stored once per distinct content, named by hash (see blobs.py)
+BLOB_KINDS = {'license'}
+
+EXTENSIONS = {
+    'application/pdf': '.pdf',
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+SNIFF_BYTES = 16
+
+
+class UploadError(ValueError):
+    """The upload was refused; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def sniff(head):
+    """Content type from a file's first bytes, or None if it isn't one we know"""
+    if head.startswith(b'%PDF-'):
+        return 'application/pdf'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def kind_of(kind):
+    if kind not in KINDS:
+        raise UploadError(f"Unknown upload kind '{kind}'")
+    return KINDS[kind]
+
+
+def check_size(kind, size):
+    _, max_size, _ = kind_of(kind)
+    if size > max_size:
+        raise UploadError(f'File size too large. Maximum {max_size // MB}MB allowed.')
+
+
+def check_type(kind, head):
+    _, _, allowed = kind_of(kind)
+    content_type = sniff(head)
+    if content_type not in allowed:
+        names = ', '.join(EXTENSIONS[t][1:].upper() for t in allowed)
+        raise UploadError(f'Invalid file type. Only {names} files are allowed.')
+    return content_type
+
+
+class _HashingFile(File):
+    """Hashes the chunks storage reads from it"""
+
+    def __init__(self, file, name):
+        super().__init__(file, name)
+        self.sha256 = hashlib.sha256()
+        self.size_read = 0
+
+    def chunks(self, chunk_size=None):
+        for chunk in super().chunks(chunk_size or COPY_SIZE):
+            self.sha256.update(chunk)
+            self.size_read += len(chunk)
+            yield chunk
+
+
+def store(kind, file, size=None, checksum=None, attached=False):
+    """
+    Check ``file`` (anything with read/seek) and copy it into storage.
+    ``attached`` says a row will reference the file, which lets BLOB_KINDS
+    be deduplicated. Returns a dict with the stored path, size, content type
+    and checksum.
+    """
+    folder, _, _ = kind_of(kind)
+    if size is not None:
+        check_size(kind, size)
+    file.seek(0)
+    content_type = check_type(kind, file.read(SNIFF_BYTES))
+    file.seek(0)
+
+    storage = blob_storage() if kind in BLOB_KINDS and attached else default_storage
+    name = f'{folder}/{uuid.uuid4()}{EXTENSIONS[content_type]}'
+    hashing = _HashingFile(file, name)
+    path = storage.save(name, hashing)
+    digest = hashing.sha256.hexdigest()
+
+    # (A rejected blob is left unreferenced for the collector)
+    if checksum and checksum.lower() != digest:
+        storage.delete(path)
+        raise UploadError('Checksum mismatch', status=422, checksum=digest)
+    if size is None:
+        try:
+            check_size(kind, hashing.size_read)
+        except UploadError:
+            storage.delete(path)
+            raise
+
+    logger.info("Upload stored", extra={
+        "event": "upload.stored", "kind": kind, "path": path, "size": hashing.size_read, "content_type": content_type
+    })
+    return {'path': path, 'size': hashing.size_read, 'content_type': content_type, 'checksum': digest}
+
+
+# Resumable uploads ------------------------------------------------------
+
+def part_path(upload):
+    return os.path.join(settings.UPLOAD_PART_DIR, f'{upload.id}.part')
+
+
+def begin(kind, file_name, size, checksum=''):
+    """Start a chunked upload of ``size`` bytes"""
+    check_size(kind, size)
+    if size <= 0:
+        raise UploadError('size must be positive')
+    purge_stale()
+
+    upload = UploadSession.objects.create(kind=kind, file_name=file_name[:255], size=size, checksum=checksum.lower())
+    os.makedirs(settings.UPLOAD_PART_DIR, exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def append(upload, offset, stream, length):
+    """
+    Write ``length`` bytes read from ``stream`` at ``offset``. Chunks may
+    overlap what was already received (a retry) but not leave a gap.
+    Returns the number of bytes received so far.
+    """
+    if length > settings.UPLOAD_CHUNK_SIZE:
+        raise UploadError(f'Chunks are limited to {settings.UPLOAD_CHUNK_SIZE} bytes', status=413)
+    if offset > upload.received:
+        raise UploadError('Chunk does not start where the upload left off', status=409, offset=upload.received)
+    if offset + length > upload.size:
+        raise UploadError('Chunk runs past the declared size', status=416, offset=upload.received)
+
+    written = 0
+    try:
+        part = open(part_path(upload), 'r+b')
+    except FileNotFoundError:
+        raise _gone()
+    with part:
+        part.seek(offset)
+        while written < length:
+            chunk = stream.read(min(COPY_SIZE, length - written))
+            if not chunk:
+                break
+            part.write(chunk)
+            written += len(chunk)
+
+    # Another request may have extended it concurrently; never move backwards
+    end = offset + written
+    UploadSession.objects.filter(id=upload.id, received__lt=end).update(received=end, updated_at=timezone.now())
+    upload.refresh_from_db(fields=['received', 'updated_at'])
+    if written < length:
+        raise UploadError('Chunk ended early', status=400, offset=upload.received)
+    return upload.received
+
+
+def commit(upload, attached=False):
+    """Verify the assembled file and move it into storage (see store())"""
+    if upload.received < upload.size:
+        raise UploadError('Upload is incomplete', status=409, offset=upload.received)
+
+    path = part_path(upload)
+    committing = f'{path}.commit'
+    try:
+        # Only one concurrent commit gets to move the part file
+        os.rename(path, committing)
+    except FileNotFoundError:
+        raise _gone()
+    try:
+        with open(committing, 'rb') as part:
+            stored = store(upload.kind, part, size=upload.size, checksum=upload.checksum or None, attached=attached)
+    except Exception:
+        # Refused or failed: put it back so the upload can be retried or discarded
+        os.rename(committing, path)
+        raise
+    discard(upload)
+    return stored
+
+
+def _gone():
+    return UploadError('Upload was already committed or discarded', status=409)
+
+
+def discard(upload):
+    path = part_path(upload)
+    for leftover in (path, f'{path}.commit'):
+        try:
+            os.remove(leftover)
+        except FileNotFoundError:
+            pass
+    upload.delete()
+
+
+def purge_stale():
+    """Drop sessions nobody has written to within UPLOAD_SESSION_TTL"""
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    for upload in UploadSession.objects.filter(updated_at__lt=cutoff)[:100]:
+        discard(upload)
@@ -2,7 +2,9 @@ from django.shortcuts import get_object_or_404
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.db.models import Count, Sum, Avg, Q, F
+from django.db import transaction
+from django.db.models import Count, Sum, Avg, Q, F, Value, DecimalField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
@@ -12,18 +14,38 @@ import os
 import uuid
 import time
 import random
-from decimal import Decimal
-from django.http import JsonResponse
+from concurrent.futures import TimeoutError as FutureTimeout
+from decimal import Decimal, InvalidOperation
+from django.http import Http404, JsonResponse, HttpResponseNotModified
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.utils.http import parse_etags, quote_etag
 from django.conf import settings
 
 # ADD THIS IMPORT for token authentication
 from rest_framework.authtoken.models import Token
 
-from .models import Professional, Session, Payment, Dispute, Category, UserProfile, ChatMessage, Notification, ProfessionalCategory, SubCategory, ProfessionalAvailability, ProfessionalDocument, CallLog, CallAnalytics, CallRecording, CallIssueReport, SessionBooking
+from .models import Professional, Session, Payment, Dispute, Category, ClientStats, UserProfile, ChatMessage, Notification, ProfessionalCategory, SubCategory, ProfessionalAvailability, ProfessionalDocument, CallLog, CallAnalytics, CallRecording, CallIssueReport, SessionBooking, UploadSession
+from .roster import publish_lock_changed, publish_upsert
+from . import locking
+from .lock_store import get_lock_store
+from .stats import stats_queue
+from .dispatch import dispatcher
+from .chat_writer import chat_writer
+from .dashboard import dashboard_snapshot
+from . import rollups
+from . import professional_rows
+from . import chat_feed
+from . import professional_feed
+from . import search
+from . import uploads
+from . import blobs
+from .images import image_pipeline, variant_url
+from .session_lifecycle import TRANSITIONS, InvalidTransition, transition
+from .matching import calculate_matching_score, feature_rows, rank_candidates
+from .candidate_index import candidate_index, load_records, professional_skills
+from .candidate_index import feature_rows as index_feature_rows
+from .autocomplete import autocomplete_index, TOP_K as AUTOCOMPLETE_LIMIT
 
 # =====================
 # AUTHENTICATION VIEWS
@@ -110,7 +132,7 @@ def api_register(request):
                     category = Category.objects.get(id=data['category_id'])
                     professional.category = category
                     professional.primary_category = category
-                    professional.save()
+                    professional.save(update_fields=['category', 'primary_category', 'updated_at'])
                     
                     # Add to categories through model
                     ProfessionalCategory.objects.create(
@@ -313,46 +335,16 @@ def professional_list(request):
             except (User.DoesNotExist, UserProfile.DoesNotExist):
                 pass
 
-        professionals_data = []
-        for pro in professionals:
-            # Get all categories for this professional
-            all_categories = []
-            if pro.primary_category:
-                all_categories.append({
-                    'id': pro.primary_category.id,
-                    'name': pro.primary_category.name,
-                    'is_primary': True
-                })
-            
-            for cat in pro.categories.all():
-                if cat != pro.primary_category:
-                    all_categories.append({
-                        'id': cat.id,
-                        'name': cat.name,
-                        'is_primary': False
-                    })
-            
-            professionals_data.append({
-                'id': pro.id,
-                'name': pro.name,
-                'specialization': pro.specialization,
-                'rate': float(pro.rate),
-                'available': pro.available,
-                'online_status': pro.online_status,
-                'category': pro.primary_category.name if pro.primary_category else 'General',
-                'categories': all_categories,
-                'average_rating': float(pro.average_rating),
-                'total_sessions': pro.total_sessions,
-                'experience_years': pro.experience_years,
-                'email': pro.email,
-                'phone': pro.phone,
-                'is_favorite': pro.id in user_favorites if user_id else False,
-                'avg_response_time': pro.avg_response_time
-            })
+        # Two queries for the whole listing: the rows and every linked category
+        rows = professional_rows.fetch_rows(professionals, professional_rows.LISTING_FIELDS, categories=True)
+        professionals_data = [
+            professional_rows.listing_row(row, user_favorites if user_id else None)
+            for row in rows
+        ]
             
         return JsonResponse({
             'professionals': professionals_data,
-            'count': professionals.count()
+            'count': len(professionals_data)
         })
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -596,23 +588,8 @@ def professional_pending_requests(request, professional_id):
     try:
         professional = get_object_or_404(Professional, id=professional_id)
         
-        # Get active sessions that are pending professional acceptance
-        pending_sessions = Session.objects.filter(
-            professional=professional,
-            status__in=['pending', 'active']
-        ).order_by('-created_at')
-        
-        requests_data = []
-        for session in pending_sessions:
-            requests_data.append({
-                'id': session.id,
-                'client_id': session.client_id,
-                'category': professional.primary_category.name if professional.primary_category else 'General',
-                'mode': session.session_type,
-                'created_at': session.created_at.isoformat(),
-                'client_id': session.client_id,
-                'urgency': 'medium'
-            })
+        # Sessions waiting on the professional, with the category joined in
+        requests_data = professional_feed.pending_requests(professional.id)
         
         return JsonResponse({
             'requests': requests_data,
@@ -639,10 +616,8 @@ def accept_session_request(request, session_id):
                 'error': 'Unauthorized access to session'
             }, status=403)
         
-        # Update session status and start time
-        session.status = 'in_progress'
-        session.actual_start = timezone.now()
-        session.save()
+        # Only a request still waiting for an answer can be accepted
+        transition(session, 'in_progress', actual_start=timezone.now())
         
         return JsonResponse({
             'success': True,
@@ -652,6 +627,12 @@ def accept_session_request(request, session_id):
             'message': 'Session request accepted successfully'
         })
         
+    except InvalidTransition as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e),
+            'status': e.current
+        }, status=409)
     except json.JSONDecodeError:
         return JsonResponse({
             'success': False,
@@ -680,10 +661,8 @@ def decline_session_request(request, session_id):
                 'error': 'Unauthorized access to session'
             }, status=403)
         
-        # Update session status to declined
-        session.status = 'declined'
-        session.ended_at = timezone.now()
-        session.save()
+        # Only a request still waiting for an answer can be declined
+        transition(session, 'declined', ended_at=timezone.now())
         
         return JsonResponse({
             'success': True,
@@ -691,6 +670,12 @@ def decline_session_request(request, session_id):
             'message': 'Session request declined successfully'
         })
         
+    except InvalidTransition as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e),
+            'status': e.current
+        }, status=409)
     except json.JSONDecodeError:
         return JsonResponse({
             'success': False,
@@ -714,7 +699,7 @@ def update_professional_online_status(request, professional_id):
         
         if is_online is not None:
             professional.online_status = is_online
-            professional.save()
+            professional.save(update_fields=['online_status', 'updated_at'])
         
         return JsonResponse({
             'success': True,
@@ -745,7 +730,9 @@ def update_professional_availability(request, professional_id):
         
         if is_available is not None:
             professional.available = is_available
-            professional.save()
+            with transaction.atomic():
+                professional.save(update_fields=['available', 'updated_at'])
+                publish_lock_changed(professional.id, professional.locked_by, professional.available)
         
         return JsonResponse({
             'success': True,
@@ -964,6 +951,12 @@ def professional_profile(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+# Professional fields update_professional_profile copies from the request
+PROFILE_FIELDS = (
+    'specialization', 'rate', 'chat_rate', 'voice_rate', 'video_rate', 'bio', 'experience_years',
+    'phone', 'name', 'email', 'title', 'languages', 'education', 'certifications',
+)
+
 @csrf_exempt
 @require_http_methods(["PATCH"])
 def update_professional_profile(request, professional_id):
@@ -1011,7 +1004,11 @@ def update_professional_profile(request, professional_id):
         if 'certifications' in data:
             professional.certifications = data['certifications']
         
-        professional.save()
+        # Only what was sent: the counters on this instance may be stale (stats.py)
+        changed = [field for field in PROFILE_FIELDS if field in data]
+        if 'category_id' in data:
+            changed.append('primary_category')
+        professional.save(update_fields=[*changed, 'updated_at'])
         
         # Get updated categories
         all_categories = []
@@ -1110,12 +1107,14 @@ def create_session(request):
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_session_detail(request, session_id):
-    """Get session details and messages"""
+    """Get session details and the latest page of messages"""
     try:
-        session = get_object_or_404(Session, id=session_id)
+        session = get_object_or_404(Session.objects.select_related('professional__primary_category'), id=session_id)
         
-        # Get messages for this session
-        messages = ChatMessage.objects.filter(session=session).order_by('created_at')
+        # Latest page of messages; older ones via the messages endpoint's ?before= cursor
+        messages, has_more = chat_feed.fetch_page(
+            session.id, before=request.GET.get('before'), limit=chat_feed.page_size(request.GET.get('limit'))
+        )
         
         session_data = {
             'session': {
@@ -1132,15 +1131,9 @@ def get_session_detail(request, session_id):
                 'actual_start': session.actual_start.isoformat() if session.actual_start else None,
                 'ended_at': session.ended_at.isoformat() if session.ended_at else None,
             },
-            'messages': [
-                {
-                    'id': msg.id,
-                    'content': msg.message,
-                    'sender': msg.sender_type,
-                    'timestamp': msg.created_at.isoformat(),
-                }
-                for msg in messages
-            ]
+            'messages': [chat_feed.serialize_message(msg) for msg in messages],
+            'has_more_messages': has_more,
+            **chat_feed.cursors(messages),
         }
         
         return JsonResponse(session_data)
@@ -1153,27 +1146,43 @@ def get_session_detail(request, session_id):
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_session_messages_api(request, session_id):
-    """Get messages for a session (for polling)"""
+    """Get messages for a session (for polling)
+
+    ?since=<message id or ISO timestamp> returns only newer messages, and
+    with ?wait=<seconds> waits for them to arrive. ?before=<message id> pages
+    back through history. Responses carry an ETag; a poll that finds nothing
+    new since the client's If-None-Match gets 304.
+    """
     try:
-        session = get_object_or_404(Session, id=session_id)
-        messages = ChatMessage.objects.filter(session=session).order_by('created_at')
-        
-        messages_data = {
-            'messages': [
-                {
-                    'id': msg.id,
-                    'content': msg.message,
-                    'sender': msg.sender_type,
-                    'timestamp': msg.created_at.isoformat(),
-                }
-                for msg in messages
-            ]
-        }
-        
-        return JsonResponse(messages_data)
+        if not Session.objects.filter(id=session_id).exists():
+            return JsonResponse({'error': 'Session not found'}, status=404)
+        
+        since = request.GET.get('since')
+        limit = chat_feed.page_size(request.GET.get('limit'))
+        if since is not None:
+            messages, has_more = chat_feed.wait_for_page(
+                session_id, since, limit=limit, timeout=float(request.GET.get('wait', 0))
+            )
+        else:
+            messages, has_more = chat_feed.fetch_page(session_id, before=request.GET.get('before'), limit=limit)
+        
+        cursors = chat_feed.cursors(messages, since)
+        etag = quote_etag(f"{session_id}:{cursors['prev_before']}:{cursors['next_since']}:{int(has_more)}")
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        
+        response = JsonResponse({
+            'messages': [chat_feed.serialize_message(msg) for msg in messages],
+            'has_more': has_more,
+            **cursors,
+        })
+        response['ETag'] = etag
+        return response
         
-    except Session.DoesNotExist:
-        return JsonResponse({'error': 'Session not found'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -1185,19 +1194,26 @@ def send_message_api(request, session_id):
         data = json.loads(request.body)
         session = get_object_or_404(Session, id=session_id)
         
-        # Create new message
-        message = ChatMessage.objects.create(
-            session=session,
-            message=data['content'],
-            sender_type=data.get('sender', 'professional'),
+        # Create new message (batched with concurrent writes, returns once stored)
+        message_id = chat_writer.write_sync(
+            session.id,
+            data['content'],
+            data.get('sender', 'professional'),
             message_type='text'
         )
         
         return JsonResponse({
             'success': True,
-            'message_id': message.id
+            'message_id': message_id
         })
         
+    except FutureTimeout:
+        # Still queued and will be stored with its batch; a resend would duplicate it
+        return JsonResponse({
+            'success': True,
+            'message_id': None,
+            'queued': True
+        }, status=202)
     except Session.DoesNotExist:
         return JsonResponse({'error': 'Session not found'}, status=404)
     except Exception as e:
@@ -1211,30 +1227,30 @@ def end_session_api(request, session_id):
         data = json.loads(request.body)
         session = get_object_or_404(Session, id=session_id)
         
-        # Update session status
-        session.status = 'completed'
-        session.ended_at = timezone.now()
+        ended = {'ended_at': timezone.now()}
         
         # Calculate duration and cost if not provided
+        duration = session.duration
         if session.actual_start and not data.get('duration'):
-            duration = (session.ended_at - session.actual_start).total_seconds() / 60
-            session.duration = int(duration)
+            duration = ended['duration'] = int((ended['ended_at'] - session.actual_start).total_seconds() / 60)
         
-        if not data.get('cost') and session.duration:
+        if not data.get('cost') and duration:
             # Calculate cost based on professional's rate and duration
             rate = session.professional.get_rate_for_session_type(session.session_type)
-            session.cost = (session.duration / 60) * float(rate)
+            ended['cost'] = (duration / 60) * float(rate)
         
-        session.save()
+        transition(session, 'completed', **ended)
         
         # Update professional's current call
         professional = session.professional
         if professional.current_call == session:
             professional.current_call = None
-            professional.save()
+            professional.save(update_fields=['current_call', 'updated_at'])
         
         return JsonResponse({'success': True, 'message': 'Session ended successfully'})
         
+    except InvalidTransition as e:
+        return JsonResponse({'error': str(e), 'status': e.current}, status=409)
     except Session.DoesNotExist:
         return JsonResponse({'error': 'Session not found'}, status=404)
     except Exception as e:
@@ -1394,14 +1410,15 @@ def end_video_call(request, session_id):
         cost_per_minute = session.professional.get_rate_for_session_type('video')
         cost = (call_duration_seconds / 60) * float(cost_per_minute)
         
-        # Update session with call fields
-        session.status = 'completed'
-        session.duration = int(call_duration_seconds / 60)
-        session.cost = cost
-        session.ended_at = call_end_time
-        session.call_ended_at = call_end_time
-        session.call_duration = int(call_duration_seconds)
-        session.save()
+        # Complete the session with the call fields
+        transition(
+            session, 'completed',
+            duration=int(call_duration_seconds / 60),
+            cost=cost,
+            ended_at=call_end_time,
+            call_ended_at=call_end_time,
+            call_duration=int(call_duration_seconds)
+        )
         
         # Create payment record
         payment = Payment.objects.create(
@@ -1421,6 +1438,12 @@ def end_video_call(request, session_id):
             'payment_id': payment.id
         })
         
+    except InvalidTransition as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e),
+            'status': e.current
+        }, status=409)
     except Session.DoesNotExist:
         return JsonResponse({
             'success': False,
@@ -1516,14 +1539,15 @@ def end_voice_call(request, session_id):
         cost_per_minute = session.professional.get_rate_for_session_type('audio')
         cost = (call_duration_seconds / 60) * float(cost_per_minute)
         
-        # Update session with call fields
-        session.status = 'completed'
-        session.duration = int(call_duration_seconds / 60)
-        session.cost = cost
-        session.ended_at = call_end_time
-        session.call_ended_at = call_end_time
-        session.call_duration = int(call_duration_seconds)
-        session.save()
+        # Complete the session with the call fields
+        transition(
+            session, 'completed',
+            duration=int(call_duration_seconds / 60),
+            cost=cost,
+            ended_at=call_end_time,
+            call_ended_at=call_end_time,
+            call_duration=int(call_duration_seconds)
+        )
         
         # Create payment record
         payment = Payment.objects.create(
@@ -1543,6 +1567,12 @@ def end_voice_call(request, session_id):
             'payment_id': payment.id
         })
         
+    except InvalidTransition as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e),
+            'status': e.current
+        }, status=409)
     except Session.DoesNotExist:
         return JsonResponse({
             'success': False,
@@ -1593,7 +1623,10 @@ def user_profile(request):
                     'average_rating': float(professional.average_rating),
                     'total_sessions': professional.total_sessions,
                     'email': professional.email,
-                    'phone': professional.phone
+                    'phone': professional.phone,
+                    'profile_picture': variant_url(
+                        professional.profile_picture_variants, 'small', professional.profile_picture
+                    )
                 })
             except Professional.DoesNotExist:
                 # Remove invalid professional ID from favorites
@@ -1613,6 +1646,7 @@ def user_profile(request):
             'timezone': user_profile.timezone,
             'favorite_professionals': favorite_professionals,
             'favorite_professionals_details': favorite_pros_data,
+            'avatar': variant_url(user_profile.avatar_variants, 'medium', user_profile.avatar),
             'created_at': user.date_joined.isoformat(),
         })
     except Exception as e:
@@ -1851,6 +1885,11 @@ def admin_categories_list(request):
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
+# Category fields update_category copies from the request
+CATEGORY_FIELDS = (
+    'name', 'description', 'base_price', 'enabled', 'icon', 'color', 'avg_response_time', 'is_featured', 'sort_order',
+)
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def update_category(request, category_id):
@@ -1883,7 +1922,8 @@ def update_category(request, category_id):
         if 'sort_order' in data:
             category.sort_order = data['sort_order']
         
-        category.save()
+        # Only what was sent: professional_count and session_count are kept by F() deltas
+        category.save(update_fields=[*(field for field in CATEGORY_FIELDS if field in data), 'updated_at'])
         
         # Calculate updated statistics
         professional_count = Professional.objects.filter(
@@ -1945,82 +1985,26 @@ def delete_category(request, category_id):
 # ADMIN DASHBOARD VIEWS
 # =====================
 
+def request_user(request):
+    """The user of an ``Authorization: Token`` header or of the session, or None"""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Token '):
+        token = Token.objects.select_related('user').filter(key=auth_header.split(' ', 1)[1]).first()
+        return token.user if token else None
+    return request.user if request.user.is_authenticated else None
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def admin_dashboard_stats(request):
     """Admin dashboard statistics with real database data"""
     try:
-        # Professional statistics - using status field
-        total_professionals = Professional.objects.count()
-        pending_approvals = Professional.objects.filter(status='pending').count()
-        approved_professionals = Professional.objects.filter(status='approved').count()
-        
-        # User statistics
-        total_users = User.objects.count()
-        active_users = User.objects.filter(is_active=True).count()
-        
-        # Session statistics
-        completed_sessions = Session.objects.filter(status='completed').count()
-        total_sessions = Session.objects.count()
-        active_sessions = Session.objects.filter(status='active').count()
-        
-        # Revenue statistics
-        revenue_agg = Session.objects.filter(status='completed').aggregate(total_revenue=Sum('cost'))
-        total_revenue = revenue_agg['total_revenue'] or 0
-        
-        # Monthly revenue (last 30 days)
-        monthly_revenue_agg = Session.objects.filter(
-            status='completed',
-            ended_at__gte=timezone.now() - timedelta(days=30)
-        ).aggregate(total_revenue=Sum('cost'))
-        monthly_revenue = monthly_revenue_agg['total_revenue'] or 0
-        
-        # Average session value
-        avg_agg = Session.objects.filter(status='completed').aggregate(avg_value=Avg('cost'))
-        average_session_value = avg_agg['avg_value'] or 0
-        
-        # Dispute statistics
-        active_disputes = Dispute.objects.filter(status='open').count()
-        total_disputes = Dispute.objects.count()
-        
-        # Category statistics
-        total_categories = Category.objects.count()
-        enabled_categories = Category.objects.filter(enabled=True).count()
-        
-        # Monthly growth calculation
-        last_month_start = timezone.now() - timedelta(days=60)
-        last_month_end = timezone.now() - timedelta(days=30)
-        
-        last_month_revenue_agg = Session.objects.filter(
-            status='completed',
-            ended_at__gte=last_month_start,
-            ended_at__lt=last_month_end
-        ).aggregate(total_revenue=Sum('cost'))
-        last_month_revenue = last_month_revenue_agg['total_revenue'] or 0
-        
-        if last_month_revenue > 0:
-            monthly_growth = ((monthly_revenue - last_month_revenue) / last_month_revenue) * 100
-        else:
-            monthly_growth = 100 if monthly_revenue > 0 else 0
-
-        return JsonResponse({
-            'total_professionals': total_professionals,
-            'pending_approvals': pending_approvals,
-            'approved_professionals': approved_professionals,
-            'total_revenue': float(total_revenue),
-            'active_disputes': active_disputes,
-            'monthly_growth': round(monthly_growth, 2),
-            'completed_sessions': completed_sessions,
-            'total_users': total_users,
-            'active_users': active_users,
-            'monthly_revenue': float(monthly_revenue),
-            'average_session_value': float(average_session_value),
-            'total_sessions': total_sessions,
-            'active_sessions': active_sessions,
-            'total_disputes': total_disputes,
-            'total_categories': total_categories,
-            'enabled_categories': enabled_categories,
-        })
+        # Shared, short-lived snapshot; staff may recompute it with ?fresh=true
+        fresh = request.GET.get('fresh', 'false').lower() == 'true'
+        if fresh:
+            user = request_user(request)
+            if user is None or not user.is_staff:
+                return JsonResponse({'error': 'Only staff can request a fresh snapshot'}, status=403)
+        return JsonResponse(dashboard_snapshot.get(force=fresh))
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -2030,27 +2014,12 @@ def admin_dashboard_stats(request):
 def revenue_chart_data(request):
     """Revenue chart data from actual payment records"""
     try:
-        # Get revenue data for the last 6 months
-        months = []
-        revenue_data = []
-        
-        for i in range(5, -1, -1):
-            month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            target_month = month_start - timedelta(days=30*i)
-            
-            month_revenue_agg = Session.objects.filter(
-                status='completed',
-                ended_at__year=target_month.year,
-                ended_at__month=target_month.month
-            ).aggregate(total_revenue=Sum('cost'))
-            month_revenue = month_revenue_agg['total_revenue'] or 0
-            
-            months.append(target_month.strftime('%b %Y'))
-            revenue_data.append(float(month_revenue))
+        # Revenue for the last 6 calendar months, summed from daily rollups
+        months = rollups.monthly_revenue(6)
         
         return JsonResponse({
-            'labels': months,
-            'data': revenue_data
+            'labels': [month.strftime('%b %Y') for month, _ in months],
+            'data': [float(revenue) for _, revenue in months]
         })
         
     except Exception as e:
@@ -2121,18 +2090,8 @@ def recent_activity(request):
 def admin_professionals_api(request):
     """Admin professionals API endpoint"""
     try:
-        professionals = Professional.objects.all()
-        data = [{
-            'id': prof.id,
-            'name': prof.name,
-            'email': prof.email,
-            'specialization': prof.specialization,
-            'is_online': prof.online_status,
-            'is_available': prof.available,
-            'status': prof.status,
-            'rate': float(prof.rate) if prof.rate else 0,
-            'category': prof.primary_category.name if prof.primary_category else 'General'
-        } for prof in professionals]
+        rows = professional_rows.fetch_rows(Professional.objects.all(), professional_rows.ADMIN_FIELDS)
+        data = [professional_rows.admin_row(row) for row in rows]
         
         return JsonResponse({'professionals': data})
     except Exception as e:
@@ -2148,25 +2107,12 @@ def pending_professionals(request):
     """Get all pending professional approvals from database"""
     try:
         pending_pros = Professional.objects.filter(status='pending')
-        professionals_data = []
-        
-        for pro in pending_pros:
-            professionals_data.append({
-                'id': pro.id,
-                'name': pro.name,
-                'specialization': pro.specialization,
-                'rate': float(pro.rate),
-                'email': pro.email,
-                'phone': pro.phone,
-                'created_at': pro.created_at.isoformat(),
-                'category': pro.primary_category.name if pro.primary_category else 'Not specified',
-                'experience_years': pro.experience_years,
-                'bio': pro.bio
-            })
+        rows = professional_rows.fetch_rows(pending_pros, professional_rows.PENDING_FIELDS)
+        professionals_data = [professional_rows.pending_row(row) for row in rows]
             
         return JsonResponse({
             'professionals': professionals_data,
-            'count': pending_pros.count()
+            'count': len(professionals_data)
         })
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -2180,7 +2126,9 @@ def approve_professional(request, professional_id):
         professional.status = 'approved'
         professional.approved_at = timezone.now()
         professional.available = True
-        professional.save()
+        with transaction.atomic():
+            professional.save(update_fields=['status', 'approved_at', 'available', 'updated_at'])
+            publish_upsert(professional.id)
         
         return JsonResponse({
             "message": f"Professional {professional.name} approved successfully",
@@ -2207,7 +2155,9 @@ def reject_professional(request, professional_id):
         professional.rejection_reason = rejection_reason
         professional.rejected_at = timezone.now()
         professional.available = False
-        professional.save()
+        with transaction.atomic():
+            professional.save(update_fields=['status', 'rejection_reason', 'rejected_at', 'available', 'updated_at'])
+            publish_upsert(professional.id)
         
         return JsonResponse({
             "message": f"Professional {professional_name} rejected",
@@ -2218,68 +2168,79 @@ def reject_professional(request, professional_id):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+# Largest page the paginated admin listings return
+MAX_PAGE_SIZE = 100
+
+def page_params(request, default_size=20):
+    """``page`` and ``page_size`` from the query string, clamped; ValueError if not numbers"""
+    page = max(int(request.GET.get('page', 1)), 1)
+    page_size = min(max(int(request.GET.get('page_size', default_size)), 1), MAX_PAGE_SIZE)
+    return page, page_size
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def all_professionals(request):
-    """Get all professionals with filters"""
+    """Get a page of professionals with their session stats, filtered and sorted"""
     try:
         # Get query parameters
         status_filter = request.GET.get('status', 'all')
         search_query = request.GET.get('search', '')
+        page, page_size = page_params(request)
+        sort = request.GET.get('sort', 'name')
         
-        professionals = Professional.objects.all()
+        sort_field = sort.lstrip('-')
+        if sort_field not in professional_rows.STATS_SORT_FIELDS:
+            return JsonResponse({
+                'error': f"Cannot sort by '{sort_field}'",
+                'sortable': list(professional_rows.STATS_SORT_FIELDS)
+            }, status=400)
+        
+        filters = Q()
         
         # Apply filters using status field
-        if status_filter == 'approved':
-            professionals = professionals.filter(status='approved')
-        elif status_filter == 'pending':
-            professionals = professionals.filter(status='pending')
-        elif status_filter == 'rejected':
-            professionals = professionals.filter(status='rejected')
+        if status_filter in ('approved', 'pending', 'rejected'):
+            filters &= Q(status=status_filter)
         
         if search_query:
-            professionals = professionals.filter(
+            filters &= (
                 Q(name__icontains=search_query) |
                 Q(specialization__icontains=search_query) |
                 Q(email__icontains=search_query)
             )
         
-        professionals_data = []
-        for pro in professionals:
-            # Calculate real stats for each professional
-            sessions_count = Session.objects.filter(professional=pro).count()
-            completed_sessions = Session.objects.filter(professional=pro, status='completed').count()
-
-            revenue_agg = Session.objects.filter(professional=pro, status='completed').aggregate(total_revenue=Sum('cost'))
-            total_revenue = revenue_agg['total_revenue'] or 0
-            
-            professionals_data.append({
-                'id': pro.id,
-                'name': pro.name,
-                'specialization': pro.specialization,
-                'rate': float(pro.rate),
-                'status': pro.status,
-                'available': pro.available,
-                'online_status': pro.online_status,
-                'email': pro.email,
-                'phone': pro.phone,
-                'category': pro.primary_category.name if pro.primary_category else 'General',
-                'average_rating': float(pro.average_rating),
-                'total_sessions': pro.total_sessions,
-                'sessions_count': sessions_count,
-                'completed_sessions': completed_sessions,
-                'total_revenue': float(total_revenue),
-                'created_at': pro.created_at.isoformat(),
-            })
+        # Status counts and the filtered total in one query
+        counts = Professional.objects.aggregate(
+            total=Count('id', filter=filters),
+            approved=Count('id', filter=Q(status='approved')),
+            pending=Count('id', filter=Q(status='pending')),
+            rejected=Count('id', filter=Q(status='rejected')),
+        )
         
+        # Session stats for the requested page in one grouped query
+        professionals = professional_rows.with_session_stats(
+            Professional.objects.filter(filters)
+        ).order_by(sort, 'id')
+        start_index = (page - 1) * page_size
+        rows = professional_rows.fetch_rows(
+            professionals[start_index:start_index + page_size], professional_rows.STATS_FIELDS
+        )
+        professionals_data = [professional_rows.stats_row(row) for row in rows]
+        
+        total_count = counts['total']
         return JsonResponse({
             'professionals': professionals_data,
-            'total_count': professionals.count(),
-            'approved_count': Professional.objects.filter(status='approved').count(),
-            'pending_count': Professional.objects.filter(status='pending').count(),
-            'rejected_count': Professional.objects.filter(status='rejected').count(),
+            'total_count': total_count,
+            'approved_count': counts['approved'],
+            'pending_count': counts['pending'],
+            'rejected_count': counts['rejected'],
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total_count + page_size - 1) // page_size,
+            'sort': sort,
         })
         
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid page or page_size: {e}'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -2373,30 +2334,24 @@ def session_analytics(request):
 def financial_analytics(request):
     """Financial analytics data"""
     try:
-        # Revenue statistics
-        revenue_agg = Session.objects.filter(status='completed').aggregate(total_revenue=Sum('cost'))
-        total_revenue = revenue_agg['total_revenue'] or 0
+        # Revenue statistics (from the analytics rollups)
+        completed = [row for row in rollups.session_totals() if row['status'] == 'completed']
+        total_revenue = sum(row['cost_total'] for row in completed)
+        completed_count = sum(row['sessions'] for row in completed)
         
-        monthly_revenue_agg = Session.objects.filter(
-            status='completed',
-            ended_at__gte=timezone.now() - timedelta(days=30)
-        ).aggregate(total_revenue=Sum('cost'))
-        monthly_revenue = monthly_revenue_agg['total_revenue'] or 0
-        
-        weekly_revenue_agg = Session.objects.filter(
-            status='completed',
-            ended_at__gte=timezone.now() - timedelta(days=7)
-        ).aggregate(total_revenue=Sum('cost'))
-        weekly_revenue = weekly_revenue_agg['total_revenue'] or 0
+        monthly_revenue = rollups.revenue_since(timezone.now() - timedelta(days=30))
+        weekly_revenue = rollups.revenue_since(timezone.now() - timedelta(days=7))
         
         # Average transaction value
-        avg_agg = Session.objects.filter(status='completed').aggregate(avg_value=Avg('cost'))
-        average_transaction_value = avg_agg['avg_value'] or 0
+        average_transaction_value = total_revenue / completed_count if completed_count else 0
         
         # Payment status distribution
-        completed_payments = Payment.objects.filter(status='completed').count()
-        pending_payments = Payment.objects.filter(status='pending').count()
-        failed_payments = Payment.objects.filter(status='failed').count()
+        payments_by_status = {}
+        for row in rollups.payment_totals():
+            payments_by_status[row['status']] = payments_by_status.get(row['status'], 0) + row['payments']
+        completed_payments = payments_by_status.get('completed', 0)
+        pending_payments = payments_by_status.get('pending', 0)
+        failed_payments = payments_by_status.get('failed', 0)
         
         return JsonResponse({
             'total_revenue': float(total_revenue),
@@ -2417,20 +2372,50 @@ def financial_analytics(request):
 # USER MANAGEMENT VIEWS
 # =====================
 
+# users_list sort keys and the columns behind them
+USER_SORT_FIELDS = {
+    'id': 'id',
+    'username': 'username',
+    'email': 'email',
+    'date_joined': 'date_joined',
+    'last_login': 'last_login',
+    'session_count': 'session_count',
+    'completed_sessions': 'completed_count',
+    'total_spent': 'total_spent',
+    'last_session_at': 'last_session_at',
+}
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def users_list(request):
     """Get paginated list of all users with filters"""
     try:
         # Get query parameters
-        page = int(request.GET.get('page', 1))
-        page_size = int(request.GET.get('page_size', 20))
+        page, page_size = page_params(request)
         status_filter = request.GET.get('status', 'all')
         role_filter = request.GET.get('role', 'all')
         search_query = request.GET.get('search', '')
+        min_sessions = request.GET.get('min_sessions')
+        min_spent = request.GET.get('min_spent')
+        sort = request.GET.get('sort', 'id')
         
-        # Start with all users
-        users = User.objects.all().select_related('userprofile')
+        sort_field = sort.lstrip('-')
+        if sort_field not in USER_SORT_FIELDS:
+            return JsonResponse({
+                'error': f"Cannot sort by '{sort_field}'",
+                'sortable': list(USER_SORT_FIELDS)
+            }, status=400)
+        
+        # Start with all users, joined with their maintained session stats
+        users = User.objects.all().select_related('userprofile').annotate(
+            session_count=Coalesce(F('client_stats__sessions_count'), 0),
+            completed_count=Coalesce(F('client_stats__completed_sessions'), 0),
+            total_spent=Coalesce(
+                F('client_stats__total_spent'), Value(Decimal('0')),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+            last_session_at=F('client_stats__last_session_at'),
+        )
         
         # Apply status filter
         if status_filter != 'all':
@@ -2448,6 +2433,16 @@ def users_list(request):
                 Q(last_name__icontains=search_query)
             )
         
+        # Apply session stats filters
+        if min_sessions:
+            users = users.filter(session_count__gte=int(min_sessions))
+        if min_spent:
+            users = users.filter(total_spent__gte=Decimal(min_spent))
+        
+        order = F(USER_SORT_FIELDS[sort_field])
+        order = order.desc(nulls_last=True) if sort.startswith('-') else order.asc(nulls_first=True)
+        users = users.order_by(order, 'id')
+        
         # Calculate pagination
         total_count = users.count()
         start_index = (page - 1) * page_size
@@ -2459,16 +2454,6 @@ def users_list(request):
             # Get user profile if exists
             user_profile = getattr(user, 'userprofile', None)
             
-            # Calculate user statistics
-            sessions_count = Session.objects.filter(client_id=user.id).count()
-            
-            # Calculate total spent
-            total_spent_agg = Session.objects.filter(
-                client_id=user.id, 
-                status='completed'
-            ).aggregate(total_spent=Sum('cost'))
-            total_spent = total_spent_agg['total_spent'] or 0
-            
             # Determine user role using user_type from UserProfile
             user_role = 'client'
             user_type = 'client'
@@ -2493,8 +2478,10 @@ def users_list(request):
                 'created_at': user.date_joined.isoformat(),
                 'last_login': user.last_login.isoformat() if user.last_login else None,
                 'location': getattr(user_profile, 'location', '') if user_profile else '',
-                'session_count': sessions_count,
-                'total_spent': float(total_spent),
+                'session_count': user.session_count,
+                'completed_sessions': user.completed_count,
+                'total_spent': float(user.total_spent),
+                'last_session_at': user.last_session_at.isoformat() if user.last_session_at else None,
                 'is_verified': getattr(user_profile, 'is_verified', False) if user_profile else False,
                 'date_joined': user.date_joined.isoformat(),
             })
@@ -2505,8 +2492,11 @@ def users_list(request):
             'page': page,
             'page_size': page_size,
             'total_pages': (total_count + page_size - 1) // page_size,
+            'sort': sort,
         })
         
+    except (ValueError, InvalidOperation) as e:
+        return JsonResponse({'error': f'Invalid number in query: {e}'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -2518,19 +2508,14 @@ def user_detail(request, user_id):
         user = get_object_or_404(User, id=user_id)
         user_profile = getattr(user, 'userprofile', None)
         
-        # Calculate detailed user statistics
-        sessions_count = Session.objects.filter(client_id=user.id).count()
-        completed_sessions = Session.objects.filter(client_id=user.id, status='completed').count()
-        
-        # Calculate total spent
-        total_spent_agg = Session.objects.filter(
-            client_id=user.id, 
-            status='completed'
-        ).aggregate(total_spent=Sum('cost'))
-        total_spent = total_spent_agg['total_spent'] or 0
+        # Detailed user statistics, maintained per client by stats.py
+        client_stats = ClientStats.objects.filter(client_id=user.id).first()
+        sessions_count = client_stats.sessions_count if client_stats else 0
+        completed_sessions = client_stats.completed_sessions if client_stats else 0
+        total_spent = client_stats.total_spent if client_stats else 0
         
         # Recent sessions
-        recent_sessions = Session.objects.filter(client_id=user.id).order_by('-created_at')[:10]
+        recent_sessions = Session.objects.filter(client_id=user.id).select_related('professional').order_by('-created_at')[:10]
         sessions_data = []
         for session in recent_sessions:
             sessions_data.append({
@@ -2694,44 +2679,61 @@ def delete_user(request, user_id):
 # FILE UPLOAD VIEWS
 # =====================
 
+def _store_upload(request, kind, attached=False):
+    """Stream request.FILES['file'] into storage as ``kind``; returns (path, response data)"""
+    if 'file' not in request.FILES:
+        raise uploads.UploadError('No file provided')
+
+    uploaded_file = request.FILES['file']
+    stored = uploads.store(
+        kind, uploaded_file, size=uploaded_file.size, checksum=request.POST.get('checksum') or None, attached=attached
+    )
+    return stored['path'], {
+        'success': True,
+        'file_url': request.build_absolute_uri(settings.MEDIA_URL + stored['path']),
+        'file_name': uploaded_file.name,
+        'file_size': stored['size'],
+        'content_type': stored['content_type'],
+        'checksum': stored['checksum']
+    }
+
+def _upload_error(error):
+    return JsonResponse({'error': str(error), **error.details}, status=error.status)
+
+def _document_target(professional_id, document_type):
+    """(professional or None, document type) a license upload is attached to"""
+    professional = get_object_or_404(Professional, id=professional_id) if professional_id else None
+    document_type = document_type or 'license'
+    if document_type not in dict(ProfessionalDocument.DOCUMENT_TYPES):
+        raise uploads.UploadError(f"Unknown document type '{document_type}'")
+    return professional, document_type
+
+def _attach_document(professional, document_type, path):
+    return ProfessionalDocument.objects.create(professional=professional, document_type=document_type, file=path).id
+
 @csrf_exempt
 @require_POST
 def upload_license_file(request):
     """
-    Handle license file uploads for professional registration
+    Handle license file uploads for professional registration (PDF, JPEG or
+    PNG, up to 10MB). An optional ``checksum`` (SHA-256) is verified.
+    With ``professional_id`` the file is attached as a ProfessionalDocument
+    (``document_type``, default license) and identical files are stored once
+    (blobs.py); without it the file is kept under its own name.
     """
     try:
-        if 'file' not in request.FILES:
-            return JsonResponse({'error': 'No file provided'}, status=400)
-
-        uploaded_file = request.FILES['file']
-
-        # Validate file size (max 10MB)
-        if uploaded_file.size > 10 * 1024 * 1024:
-            return JsonResponse({'error': 'File size too large. Maximum 10MB allowed.'}, status=400)
-
-        # Validate file type
-        allowed_types = ['application/pdf', 'image/jpeg', 'image/png', 'image/jpg']
-        if uploaded_file.content_type not in allowed_types:
-            return JsonResponse({'error': 'Invalid file type. Only PDF, JPEG, and PNG files are allowed.'}, status=400)
-
-        # Generate unique filename
-        file_extension = os.path.splitext(uploaded_file.name)[1]
-        unique_filename = f"licenses/{uuid.uuid4()}{file_extension}"
-
-        # Save file
-        file_path = default_storage.save(unique_filename, ContentFile(uploaded_file.read()))
-
-        # Return file URL
-        file_url = request.build_absolute_uri(settings.MEDIA_URL + file_path)
-
-        return JsonResponse({
-            'success': True,
-            'file_url': file_url,
-            'file_name': uploaded_file.name,
-            'file_size': uploaded_file.size
-        })
+        professional, document_type = _document_target(request.POST.get('professional_id'), request.POST.get('document_type'))
 
+        path, data = _store_upload(request, 'license', attached=professional is not None)
+        if professional:
+            data['document_id'] = _attach_document(professional, document_type, path)
+        return JsonResponse(data)
+    except Http404:
+        return JsonResponse({'error': 'Professional not found'}, status=404)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': f'Upload failed: {str(e)}'}, status=500)
 
@@ -2739,40 +2741,120 @@ def upload_license_file(request):
 @require_POST
 def upload_profile_image(request):
     """
-    Handle profile image uploads
+    Handle profile image uploads (JPEG, PNG or GIF, up to 5MB). An optional
+    ``checksum`` (SHA-256) is verified. With ``professional_id`` or
+    ``user_id`` the image becomes that profile picture or avatar, and is
+    resized in the background (images.py).
     """
     try:
-        if 'file' not in request.FILES:
-            return JsonResponse({'error': 'No file provided'}, status=400)
-
-        uploaded_file = request.FILES['file']
-
-        # Validate file size (max 5MB)
-        if uploaded_file.size > 5 * 1024 * 1024:
-            return JsonResponse({'error': 'File size too large. Maximum 5MB allowed.'}, status=400)
+        professional_id = request.POST.get('professional_id')
+        user_id = request.POST.get('user_id')
+        professional = get_object_or_404(Professional, id=professional_id) if professional_id else None
+        profile = UserProfile.objects.get_or_create(user=get_object_or_404(User, id=user_id))[0] if user_id else None
+
+        path, data = _store_upload(request, 'profile_image')
+        if professional:
+            professional.profile_picture = path
+            professional.save(update_fields=['profile_picture', 'updated_at'])
+        if profile:
+            profile.avatar = path
+            profile.save(update_fields=['avatar', 'updated_at'])
+        return JsonResponse(data)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    except Exception as e:
+        return JsonResponse({'error': f'Upload failed: {str(e)}'}, status=500)
 
-        # Validate file type
-        allowed_types = ['image/jpeg', 'image/png', 'image/jpg', 'image/gif']
-        if uploaded_file.content_type not in allowed_types:
-            return JsonResponse({'error': 'Invalid file type. Only image files are allowed.'}, status=400)
+def _upload_state(upload):
+    return {
+        'upload_id': str(upload.id),
+        'kind': upload.kind,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE
+    }
 
-        # Generate unique filename
-        file_extension = os.path.splitext(uploaded_file.name)[1]
-        unique_filename = f"profile_images/{uuid.uuid4()}{file_extension}"
+@csrf_exempt
+@require_POST
+def start_upload_session(request):
+    """
+    Start a resumable upload: {kind: license|profile_image, file_name, size,
+    checksum}. Send the bytes with PUT upload-sessions/<upload_id>/?offset=N.
+    """
+    try:
+        data = json.loads(request.body)
+        upload = uploads.begin(
+            data.get('kind', ''), data.get('file_name', ''), int(data.get('size', 0)), data.get('checksum', '')
+        )
+        return JsonResponse(_upload_state(upload), status=201)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Upload failed: {str(e)}'}, status=500)
 
-        # Save file
-        file_path = default_storage.save(unique_filename, ContentFile(uploaded_file.read()))
+@csrf_exempt
+@require_http_methods(["GET", "PUT", "DELETE"])
+def upload_session(request, upload_id):
+    """
+    GET: bytes received so far, to resume from. PUT: the raw bytes of the
+    next chunk, starting at ?offset= (defaults to the bytes received).
+    DELETE: abandon the upload.
+    """
+    try:
+        upload = get_object_or_404(UploadSession, id=upload_id)
+        if request.method == 'DELETE':
+            uploads.discard(upload)
+            return JsonResponse({'success': True})
+        if request.method == 'PUT':
+            offset = int(request.GET.get('offset', upload.received))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            uploads.append(upload, offset, request, length)
+        return JsonResponse(_upload_state(upload))
+    except Http404:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Upload failed: {str(e)}'}, status=500)
 
-        # Return file URL
-        file_url = request.build_absolute_uri(settings.MEDIA_URL + file_path)
-        
-        return JsonResponse({
+@csrf_exempt
+@require_POST
+def commit_upload_session(request, upload_id):
+    """
+    Check the assembled file's size, checksum and type, then store it. A
+    license is attached like upload_license_file does with optional
+    ``professional_id`` and ``document_type`` (JSON or form fields).
+    """
+    try:
+        upload = get_object_or_404(UploadSession, id=upload_id)
+        data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+        professional, document_type = _document_target(data.get('professional_id'), data.get('document_type'))
+        if professional and upload.kind != 'license':
+            raise uploads.UploadError('Only license uploads can be attached as documents')
+
+        file_name = upload.file_name
+        stored = uploads.commit(upload, attached=professional is not None)
+        response = {
             'success': True,
-            'file_url': file_url,
-            'file_name': uploaded_file.name,
-            'file_size': uploaded_file.size
-        })
-
+            'file_url': request.build_absolute_uri(settings.MEDIA_URL + stored['path']),
+            'file_name': file_name,
+            'file_size': stored['size'],
+            'content_type': stored['content_type'],
+            'checksum': stored['checksum']
+        }
+        if professional:
+            response['document_id'] = _attach_document(professional, document_type, stored['path'])
+        return JsonResponse(response)
+    except Http404:
+        return JsonResponse({'error': 'Upload or professional not found'}, status=404)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': f'Upload failed: {str(e)}'}, status=500)
 
@@ -2850,25 +2932,12 @@ def mark_all_notifications_read(request):
 def debug_all_professionals(request):
     """Debug endpoint to see all professionals"""
     try:
-        professionals = Professional.objects.all()
-        professionals_data = []
-        
-        for pro in professionals:
-            professionals_data.append({
-                'id': pro.id,
-                'name': pro.name,
-                'email': pro.email,
-                'status': pro.status,
-                'available': pro.available,
-                'online_status': pro.online_status,
-                'specialization': pro.specialization,
-                'rate': float(pro.rate) if pro.rate else 0,
-                'category': pro.primary_category.name if pro.primary_category else 'None'
-            })
+        rows = professional_rows.fetch_rows(Professional.objects.all(), professional_rows.DEBUG_FIELDS)
+        professionals_data = [professional_rows.debug_row(row) for row in rows]
         
         return JsonResponse({
             'professionals': professionals_data,
-            'total_count': professionals.count()
+            'total_count': len(professionals_data)
         })
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -2899,6 +2968,71 @@ def debug_all_sessions(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def debug_stats_queue(request):
+    """Debug endpoint showing how many counter writes the stats queue coalesced"""
+    return JsonResponse(stats_queue.metrics())
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def debug_chat_writer(request):
+    """Debug endpoint showing chat batch sizes and how long messages took to be stored"""
+    return JsonResponse(chat_writer.metrics())
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def dispatch_stats(request):
+    """Instant-match queue depth and wait-time percentiles per category"""
+    try:
+        return JsonResponse(dispatcher.stats())
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def debug_candidate_index(request):
+    """Candidate index hit rate and staleness; staff may compare it with the database with ?check=true"""
+    try:
+        if request.GET.get('check', 'false').lower() == 'true':
+            # A full scan of approved professionals, and by default a repair
+            user = request_user(request)
+            if user is None or not user.is_staff:
+                return JsonResponse({'error': 'Only staff can check the candidate index'}, status=403)
+            candidate_index.check(repair=request.GET.get('repair', 'true').lower() == 'true')
+        return JsonResponse(candidate_index.metrics())
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def debug_autocomplete(request):
+    """Autocomplete index size, build time and lookup latency"""
+    try:
+        if autocomplete_index.ready:
+            autocomplete_index.measure()
+        return JsonResponse(autocomplete_index.metrics())
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def debug_image_pipeline(request):
+    """Profile pictures resized so far, pending and failed, and bytes saved"""
+    try:
+        return JsonResponse(image_pipeline.metrics())
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def debug_blobs(request):
+    """Document blob storage: blobs, orphans and bytes saved by deduplication"""
+    try:
+        return JsonResponse(blobs.savings())
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def debug_professionals_direct(request):
@@ -2995,14 +3129,16 @@ def debug_users_and_professionals(request):
 def professionals_by_category(request, category):
     """Get professionals by category for algorithm matching"""
     try:
-        # Get professionals in the specified category
-        professionals = Professional.objects.filter(
-            Q(primary_category__name__iexact=category) |
-            Q(categories__name__iexact=category) |
-            Q(specialization__icontains=category),
-            status='approved',
-            available=True
-        ).distinct()
+        professionals = candidate_index.candidates_for_name(category)
+        if professionals is None:
+            # Index not warm yet: get professionals in the specified category
+            professionals = load_records(Professional.objects.filter(
+                Q(primary_category__name__iexact=category) |
+                Q(categories__name__iexact=category) |
+                Q(specialization__icontains=category),
+                status='approved',
+                available=True
+            ))
         
         professionals_data = []
         for pro in professionals:
@@ -3019,7 +3155,7 @@ def professionals_by_category(request, category):
                 'rate': float(pro.rate),
                 'available': pro.available,
                 'online_status': pro.online_status,
-                'category': pro.primary_category.name if pro.primary_category else 'General',
+                'category': pro.category_name or 'General',
                 'average_rating': float(pro.average_rating),
                 'total_sessions': pro.total_sessions,
                 'experience_years': pro.experience_years,
@@ -3030,7 +3166,7 @@ def professionals_by_category(request, category):
                 'current_workload': getattr(pro, 'current_workload', 0),
                 'max_workload': getattr(pro, 'max_workload', 10),
                 'last_active': pro.last_active.isoformat() if hasattr(pro, 'last_active') else timezone.now().isoformat(),
-                'skills': get_professional_skills(pro),
+                'skills': list(pro.skills),
                 'ai_scores': {
                     'availability': availability_score,
                     'rating': rating_score,
@@ -3041,7 +3177,7 @@ def professionals_by_category(request, category):
         
         return JsonResponse({
             'professionals': professionals_data,
-            'count': professionals.count(),
+            'count': len(professionals),
             'category': category
         })
     except Exception as e:
@@ -3050,7 +3186,12 @@ def professionals_by_category(request, category):
 @csrf_exempt
 @require_http_methods(["GET"])
 def search_professionals(request):
-    """Search professionals with advanced filters"""
+    """
+    Search professionals with advanced filters, ranked by relevance.
+    
+    Each word of ?q= matches as a prefix (typeahead). Pages of ?limit= come
+    back best first; pass ?cursor=<next_cursor> for the next one.
+    """
     try:
         query = request.GET.get('q', '')
         category = request.GET.get('category', '')
@@ -3058,37 +3199,26 @@ def search_professionals(request):
         max_rate = float(request.GET.get('max_rate', 1000))
         available_only = request.GET.get('available_only', 'false').lower() == 'true'
         online_only = request.GET.get('online_only', 'false').lower() == 'true'
-        
-        professionals = Professional.objects.filter(status='approved')
-        
-        # Apply filters
-        if query:
-            professionals = professionals.filter(
-                Q(name__icontains=query) |
-                Q(specialization__icontains=query) |
-                Q(bio__icontains=query)
-            )
-        
-        if category:
-            professionals = professionals.filter(
-                Q(primary_category__name__iexact=category) |
-                Q(categories__name__iexact=category)
-            )
-        
-        if min_rating > 0:
-            professionals = professionals.filter(average_rating__gte=min_rating)
-        
-        if max_rate < 1000:
-            professionals = professionals.filter(rate__lte=max_rate)
-        
-        if available_only:
-            professionals = professionals.filter(available=True)
-        
-        if online_only:
-            professionals = professionals.filter(online_status=True)
+        limit = search.page_size(request.GET.get('limit'))
+        
+        # Match, filters and ordering run as one indexed query
+        hits, next_cursor = search.search(
+            query,
+            category=category,
+            min_rating=min_rating,
+            max_rate=max_rate if max_rate < 1000 else None,
+            available_only=available_only,
+            online_only=online_only,
+            cursor=request.GET.get('cursor'),
+            limit=limit
+        )
+        professionals = Professional.objects.select_related('primary_category').in_bulk([pid for pid, _ in hits])
         
         professionals_data = []
-        for pro in professionals:
+        for professional_id, score in hits:
+            pro = professionals.get(professional_id)
+            if pro is None:
+                continue
             professionals_data.append({
                 'id': pro.id,
                 'name': pro.name,
@@ -3101,12 +3231,16 @@ def search_professionals(request):
                 'total_sessions': pro.total_sessions,
                 'experience_years': pro.experience_years,
                 'response_time': pro.avg_response_time,
-                'success_rate': getattr(pro, 'success_rate', 95)
+                'success_rate': getattr(pro, 'success_rate', 95),
+                'profile_picture': variant_url(pro.profile_picture_variants, 'small', pro.profile_picture),
+                'score': round(-score, 6) or 0.0
             })
         
         return JsonResponse({
             'professionals': professionals_data,
-            'count': professionals.count(),
+            'count': len(professionals_data),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
             'filters': {
                 'query': query,
                 'category': category,
@@ -3116,6 +3250,33 @@ def search_professionals(request):
                 'online_only': online_only
             }
         })
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def autocomplete(request):
+    """
+    Typeahead completions for the search box: professional names,
+    specializations, categories and subcategories, most used first.
+    Answered from memory, without touching the database.
+    """
+    try:
+        query = request.GET.get('q', '')
+        limit = min(max(int(request.GET.get('limit', AUTOCOMPLETE_LIMIT)), 1), AUTOCOMPLETE_LIMIT)
+        
+        suggestions = autocomplete_index.suggest(query, limit)
+        return JsonResponse({
+            'query': query,
+            'suggestions': [
+                {'text': s.text, 'kind': s.kind, 'id': s.id, 'weight': s.weight}
+                for s in suggestions
+            ]
+        })
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -3165,6 +3326,15 @@ def check_professional_availability(request, professional_id):
 # LOCKING MECHANISM
 # =====================
 
+def _professional_lock_target(data):
+    """Professional id addressed by a lock request, if any"""
+    if data.get('professional_id') is not None:
+        return data['professional_id']
+    resource = data.get('resource') or ''
+    if resource.startswith('professional:'):
+        return resource.split(':', 1)[1]
+    return None
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def acquire_lock(request):
@@ -3174,36 +3344,58 @@ def acquire_lock(request):
         resource = data.get('resource')
         ttl = data.get('ttl', 30000)  # Default 30 seconds
         
-        # Simple in-memory lock implementation
-        # In production, use Redis or database-based locking
-        current_time = timezone.now()
-        lock_expiry = current_time + timedelta(milliseconds=ttl)
-        
-        # Check if lock exists and is still valid
-        existing_lock = getattr(acquire_lock, 'locks', {}).get(resource)
-        if existing_lock and existing_lock['expires'] > current_time:
+        # Professional locks go through the lease manager
+        professional_id = _professional_lock_target(data)
+        if professional_id is not None:
+            holder = data.get('client_id') or data.get('holder')
+            if not holder:
+                return JsonResponse({'error': 'client_id is required'}, status=400)
+            
+            token = data.get('token')
+            if token is not None:
+                # Heartbeat: extend an existing lease
+                expires_at = locking.renew(professional_id, holder, token, ttl=ttl / 1000)
+                if expires_at is None:
+                    return JsonResponse({'success': False, 'is_locked': False, 'message': 'Lease lost'}, status=409)
+                return JsonResponse({
+                    'success': True,
+                    'is_locked': True,
+                    'locked_by': holder,
+                    'token': token,
+                    'locked_until': expires_at.isoformat()
+                })
+            
+            lease = locking.acquire(professional_id, holder, ttl=ttl / 1000)
+            if lease is None:
+                current = Professional.objects.filter(id=professional_id).values('locked_by', 'locked_until').first()
+                return JsonResponse({
+                    'success': False,
+                    'is_locked': True,
+                    'locked_by': current['locked_by'] if current else None,
+                    'locked_until': current['locked_until'].isoformat() if current and current['locked_until'] else None
+                })
             return JsonResponse({
-                'success': False,
+                'success': True,
                 'is_locked': True,
-                'locked_by': existing_lock['locked_by'],
-                'locked_until': existing_lock['expires'].isoformat()
+                'locked_by': holder,
+                'token': lease.token,
+                'locked_until': lease.expires_at.isoformat()
             })
         
-        # Acquire lock
-        if not hasattr(acquire_lock, 'locks'):
-            acquire_lock.locks = {}
+        if not resource:
+            return JsonResponse({'error': 'resource is required'}, status=400)
         
-        acquire_lock.locks[resource] = {
-            'locked_by': 'current_session',
-            'expires': lock_expiry,
-            'acquired_at': current_time
-        }
+        # Shared store so every worker process sees the same locks
+        owner = data.get('holder') or data.get('client_id') or data.get('lock_id') or str(uuid.uuid4())
+        result = get_lock_store().acquire(resource, owner, ttl)
         
         return JsonResponse({
-            'success': True,
+            'success': result.acquired,
             'is_locked': True,
-            'locked_by': 'current_session',
-            'locked_until': lock_expiry.isoformat()
+            'locked_by': result.owner,
+            'lock_id': owner if result.acquired else None,
+            'locked_until': result.expires_at.isoformat() if result.expires_at else None,
+            'contention': result.contention
         })
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -3216,12 +3408,46 @@ def release_lock(request):
         data = json.loads(request.body)
         resource = data.get('resource')
         
-        if hasattr(release_lock, 'locks') and resource in release_lock.locks:
-            del release_lock.locks[resource]
+        professional_id = _professional_lock_target(data)
+        if professional_id is not None:
+            holder = data.get('client_id') or data.get('holder')
+            released = locking.release(professional_id, holder or '', data.get('token'))
+            return JsonResponse({
+                'success': released,
+                'message': f'Lock released for {resource or professional_id}' if released else 'Lock not held by this client'
+            })
+        
+        if not resource:
+            return JsonResponse({'error': 'resource is required'}, status=400)
+        
+        # Only the owner may release when one is given
+        owner = data.get('holder') or data.get('client_id') or data.get('lock_id')
+        released = get_lock_store().release(resource, owner)
         
         return JsonResponse({
-            'success': True,
-            'message': f'Lock released for {resource}'
+            'success': released,
+            'message': f'Lock released for {resource}' if released else f'Lock for {resource} not held by this client'
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def lock_stats(request):
+    """Current holder and contention count for a resource, or overall contention"""
+    try:
+        store = get_lock_store()
+        resource = request.GET.get('resource')
+        if not resource:
+            return JsonResponse({'contention': store.contention()})
+        
+        held = store.get(resource)
+        return JsonResponse({
+            'resource': resource,
+            'is_locked': held is not None,
+            'locked_by': held.owner if held else None,
+            'locked_until': held.expires_at.isoformat() if held and held.expires_at else None,
+            'contention': store.contention(resource)
         })
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -3423,10 +3649,7 @@ def rate_session(request):
         # Update session rating
         session.rating = data['rating']
         session.review = data.get('review', '')
-        session.save()
-        
-        # Update professional's average rating
-        update_professional_rating(professional)
+        session.save()  # Session signals fold the rating into the professional's average
         
         return JsonResponse({
             'success': True,
@@ -3448,9 +3671,7 @@ def complete_session(request, session_id):
     try:
         session = get_object_or_404(Session, id=session_id)
         
-        session.status = 'completed'
-        session.ended_at = timezone.now()
-        session.save()
+        transition(session, 'completed', ended_at=timezone.now())
         
         return JsonResponse({
             'success': True,
@@ -3458,6 +3679,12 @@ def complete_session(request, session_id):
             'session_id': session.id,
             'ended_at': session.ended_at.isoformat()
         })
+    except InvalidTransition as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e),
+            'status': e.current
+        }, status=409)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -3472,16 +3699,15 @@ def update_session_status(request, session_id):
         data = json.loads(request.body)
         session = get_object_or_404(Session, id=session_id)
         
-        if 'status' in data:
-            session.status = data['status']
-        
-        if 'duration' in data:
-            session.duration = data['duration']
+        changes = {field: data[field] for field in ('duration', 'cost') if field in data}
         
-        if 'cost' in data:
-            session.cost = data['cost']
-        
-        session.save()
+        if 'status' in data and data['status'] != session.status:
+            # Status only moves along the lifecycle's transitions
+            transition(session, data['status'], **changes)
+        elif changes:
+            for field, value in changes.items():
+                setattr(session, field, value)
+            session.save(update_fields=[*changes, 'updated_at'])
         
         return JsonResponse({
             'success': True,
@@ -3491,6 +3717,12 @@ def update_session_status(request, session_id):
             'duration': session.duration,
             'cost': float(session.cost) if session.cost else 0
         })
+    except InvalidTransition as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e),
+            'status': e.current
+        }, status=409 if e.status in TRANSITIONS else 400)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -3923,7 +4155,8 @@ def real_time_availability(request, professional_id):
 def category_professionals(request, category_id):
     """Get professionals by category ID"""
     try:
-        category = get_object_or_404(Category, id=category_id)
+        indexed = candidate_index.candidates_for_category(category_id)
+        category = indexed[0] if indexed is not None else get_object_or_404(Category, id=category_id)
         return professionals_by_category(request, category.name)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -3933,16 +4166,20 @@ def category_professionals(request, category_id):
 def categories_with_professionals(request):
     """Get categories with professional counts"""
     try:
-        categories = Category.objects.filter(enabled=True)
-        categories_data = []
+        counts = candidate_index.category_counts()
+        if counts is None:
+            # Index not warm yet: count in the database
+            counts = [
+                (category, Professional.objects.filter(
+                    Q(primary_category=category) | Q(categories=category),
+                    status='approved',
+                    available=True
+                ).distinct().count())
+                for category in Category.objects.filter(enabled=True)
+            ]
         
-        for category in categories:
-            professional_count = Professional.objects.filter(
-                Q(primary_category=category) | Q(categories=category),
-                status='approved',
-                available=True
-            ).distinct().count()
-            
+        categories_data = []
+        for category, professional_count in counts:
             if professional_count > 0:
                 categories_data.append({
                     'id': category.id,
@@ -4212,21 +4449,30 @@ def run_matching_algorithm(request):
         client_id = data['client_id']
         preferences = data.get('preferences', {})
         
-        # Get category
-        category = get_object_or_404(Category, id=category_id)
-        
-        # Get available professionals in this category
-        professionals = Professional.objects.filter(
-            Q(primary_category=category) | Q(categories=category),
-            status='approved',
-            available=True
-        ).distinct()
+        indexed = candidate_index.candidates_for_category(category_id)
+        if indexed is not None:
+            # Served from the in-memory candidate index
+            category, candidates = indexed
+            ranked, total_matches = rank_candidates(index_feature_rows(candidates), preferences, k=10)
+            details = {candidate.id: candidate for candidate in candidates}
+        else:
+            # Get category
+            category = get_object_or_404(Category, id=category_id)
+            
+            # Get available professionals in this category
+            professionals = Professional.objects.filter(
+                Q(primary_category=category) | Q(categories=category),
+                status='approved',
+                available=True
+            ).distinct()
+            
+            # Score every candidate in one pass and keep the top 10
+            ranked, total_matches = rank_candidates(feature_rows(professionals), preferences, k=10)
+            details = Professional.objects.in_bulk([result['professional_id'] for result in ranked])
         
-        # Calculate matching scores for each professional
         matched_professionals = []
-        for professional in professionals:
-            score = calculate_matching_score(professional, preferences)
-            
+        for result in ranked:
+            professional = details[result['professional_id']]
             matched_professionals.append({
                 'professional': {
                     'id': professional.id,
@@ -4240,19 +4486,16 @@ def run_matching_algorithm(request):
                     'experience_years': professional.experience_years,
                     'response_time': professional.avg_response_time
                 },
-                'matching_score': score['total_score'],
-                'score_breakdown': score['breakdown'],
-                'recommendation_reason': score['reason']
+                'matching_score': result['total_score'],
+                'score_breakdown': result['breakdown'],
+                'recommendation_reason': result['reason']
             })
         
-        # Sort by matching score (descending)
-        matched_professionals.sort(key=lambda x: x['matching_score'], reverse=True)
-        
         return JsonResponse({
             'success': True,
             'category': category.name,
-            'matched_professionals': matched_professionals[:10],  # Top 10 matches
-            'total_matches': len(matched_professionals),
+            'matched_professionals': matched_professionals,
+            'total_matches': total_matches,
             'algorithm_version': 'v1.0'
         })
         
@@ -4311,88 +4554,6 @@ def calculate_matching_scores(request):
             'message': f'Failed to calculate scores: {str(e)}'
         }, status=500)
 
-def calculate_matching_score(professional, preferences):
-    """Calculate matching score for a professional based on preferences"""
-    breakdown = {}
-    total_score = 0
-    
-    # Availability score (30%)
-    availability_score = 0
-    if professional.online_status:
-        availability_score += 0.7
-    if professional.available:
-        availability_score += 0.3
-    breakdown['availability'] = availability_score
-    total_score += availability_score * 0.3
-    
-    # Rating score (25%)
-    rating_score = (professional.average_rating / 5.0) if professional.average_rating else 0.5
-    breakdown['rating'] = rating_score
-    total_score += rating_score * 0.25
-    
-    # Experience score (20%)
-    experience_score = min((professional.experience_years or 1) / 10.0, 1.0)
-    breakdown['experience'] = experience_score
-    total_score += experience_score * 0.2
-    
-    # Response time score (15%)
-    response_time_map = {
-        '< 1 hour': 1.0,
-        '< 2 hours': 0.9,
-        '< 4 hours': 0.7,
-        '< 8 hours': 0.5,
-        '< 24 hours': 0.3
-    }
-    response_score = response_time_map.get(professional.avg_response_time or '< 4 hours', 0.2)
-    breakdown['response_time'] = response_score
-    total_score += response_score * 0.15
-    
-    # Price match score (10%)
-    preferred_rate = preferences.get('max_rate')
-    if preferred_rate and professional.rate:
-        price_score = max(0, 1 - (professional.rate / preferred_rate))
-        breakdown['price_match'] = price_score
-        total_score += price_score * 0.1
-    else:
-        breakdown['price_match'] = 0.5
-        total_score += 0.05
-    
-    # Generate recommendation reason
-    reason = generate_recommendation_reason(professional, breakdown)
-    
-    return {
-        'total_score': round(total_score, 3),
-        'breakdown': breakdown,
-        'reason': reason
-    }
-
-def generate_recommendation_reason(professional, breakdown):
-    """Generate human-readable recommendation reason"""
-    reasons = []
-    
-    if breakdown['availability'] >= 0.8:
-        reasons.append("Highly available")
-    elif breakdown['availability'] >= 0.5:
-        reasons.append("Good availability")
-    
-    if breakdown['rating'] >= 0.9:
-        reasons.append("Excellent ratings")
-    elif breakdown['rating'] >= 0.7:
-        reasons.append("Great reviews")
-    
-    if breakdown['experience'] >= 0.8:
-        reasons.append("Extensive experience")
-    elif breakdown['experience'] >= 0.5:
-        reasons.append("Good experience level")
-    
-    if breakdown['response_time'] >= 0.8:
-        reasons.append("Quick responder")
-    
-    if not reasons:
-        reasons.append("Good overall match")
-    
-    return ", ".join(reasons)
-
 # =====================
 # USER PREFERENCES & SETTINGS
 # =====================
@@ -4668,22 +4829,22 @@ def session_metrics(request):
         else:  # 30d default
             start_date = timezone.now() - timedelta(days=30)
         
-        # Session statistics
-        total_sessions = Session.objects.filter(created_at__gte=start_date).count()
-        completed_sessions = Session.objects.filter(status='completed', created_at__gte=start_date).count()
-        active_sessions = Session.objects.filter(status='active', created_at__gte=start_date).count()
-        cancelled_sessions = Session.objects.filter(status='cancelled', created_at__gte=start_date).count()
+        # Session statistics (from the analytics rollups)
+        rows = rollups.session_totals(start_date)
+        sessions_by_status = {}
+        session_types = {}
+        for row in rows:
+            sessions_by_status[row['status']] = sessions_by_status.get(row['status'], 0) + row['sessions']
+            session_types[row['session_type']] = session_types.get(row['session_type'], 0) + row['sessions']
         
-        # Session types distribution
-        session_types = Session.objects.filter(created_at__gte=start_date).values('session_type').annotate(
-            count=Count('id')
-        )
+        total_sessions = sum(sessions_by_status.values())
+        completed_sessions = sessions_by_status.get('completed', 0)
+        active_sessions = sessions_by_status.get('active', 0)
+        cancelled_sessions = sessions_by_status.get('cancelled', 0)
         
         # Average session duration
-        avg_duration = Session.objects.filter(
-            status='completed', 
-            created_at__gte=start_date
-        ).aggregate(avg_duration=Avg('duration'))['avg_duration'] or 0
+        completed_duration = sum(row['duration_total'] for row in rows if row['status'] == 'completed')
+        avg_duration = completed_duration / completed_sessions if completed_sessions else 0
         
         # Completion rate
         completion_rate = (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0
@@ -4701,7 +4862,7 @@ def session_metrics(request):
                 'completion_rate': round(completion_rate, 2),
                 'average_duration_minutes': round(avg_duration, 2)
             },
-            'session_types': {item['session_type']: item['count'] for item in session_types},
+            'session_types': session_types,
             'summary': {
                 'total_sessions': total_sessions,
                 'success_rate': round(completion_rate, 2),
@@ -4732,38 +4893,28 @@ def payment_metrics(request):
         else:  # 30d default
             start_date = timezone.now() - timedelta(days=30)
         
-        # Payment statistics
-        total_revenue = Session.objects.filter(
-            status='completed',
-            created_at__gte=start_date
-        ).aggregate(total_revenue=Sum('cost'))['total_revenue'] or 0
-        
-        successful_payments = Payment.objects.filter(
-            status='completed',
-            created_at__gte=start_date
-        ).count()
-        
-        failed_payments = Payment.objects.filter(
-            status='failed',
-            created_at__gte=start_date
-        ).count()
-        
-        pending_payments = Payment.objects.filter(
-            status='pending',
-            created_at__gte=start_date
-        ).count()
-        
-        # Payment methods distribution
-        payment_methods = Payment.objects.filter(created_at__gte=start_date).values('payment_method').annotate(
-            count=Count('id'),
-            total_amount=Sum('amount')
+        # Payment statistics (from the analytics rollups)
+        total_revenue = sum(
+            row['cost_total'] for row in rollups.session_totals(start_date) if row['status'] == 'completed'
         )
         
+        payments_by_status = {}
+        payment_methods = {}
+        completed_amount = 0
+        for row in rollups.payment_totals(start_date):
+            payments_by_status[row['status']] = payments_by_status.get(row['status'], 0) + row['payments']
+            method = payment_methods.setdefault(row['payment_method'], {'count': 0, 'total_amount': 0})
+            method['count'] += row['payments']
+            method['total_amount'] += row['amount_total']
+            if row['status'] == 'completed':
+                completed_amount += row['amount_total']
+        
+        successful_payments = payments_by_status.get('completed', 0)
+        failed_payments = payments_by_status.get('failed', 0)
+        pending_payments = payments_by_status.get('pending', 0)
+        
         # Average transaction value
-        avg_transaction = Payment.objects.filter(
-            status='completed',
-            created_at__gte=start_date
-        ).aggregate(avg_amount=Avg('amount'))['avg_amount'] or 0
+        avg_transaction = completed_amount / successful_payments if successful_payments else 0
         
         return JsonResponse({
             'success': True,
@@ -4780,11 +4931,11 @@ def payment_metrics(request):
             },
             'payment_methods': [
                 {
-                    'method': item['payment_method'],
+                    'method': method,
                     'count': item['count'],
-                    'total_amount': float(item['total_amount'] or 0)
+                    'total_amount': float(item['total_amount'])
                 }
-                for item in payment_methods
+                for method, item in payment_methods.items()
             ],
             'summary': {
                 'total_revenue': float(total_revenue),
@@ -4825,12 +4976,9 @@ def user_engagement(request):
         # New registrations
         new_registrations = User.objects.filter(date_joined__gte=start_date).count()
         
-        # Session per user
-        sessions_per_user = Session.objects.filter(
-            created_at__gte=start_date
-        ).values('client_id').annotate(session_count=Count('id'))
-        
-        avg_sessions_per_user = sessions_per_user.aggregate(avg=Avg('session_count'))['avg'] or 0
+        # Session per user (daily client activity rollups, whole days)
+        clients, client_sessions = rollups.client_activity(start_date)
+        avg_sessions_per_user = client_sessions / clients if clients else 0
         
         # User retention (simplified)
         returning_users = User.objects.filter(
@@ -4913,27 +5061,10 @@ def calculate_experience_score(professional):
 
 def get_professional_skills(professional):
     """Extract skills from professional data"""
-    skills = []
-    if professional.specialization:
-        skills.append(professional.specialization)
-    if professional.bio:
-        # Simple keyword extraction from bio
-        bio_keywords = ['consulting', 'advice', 'expert', 'specialist', 'professional']
-        for keyword in bio_keywords:
-            if keyword in professional.bio.lower():
-                skills.append(keyword.title())
-    return skills[:5]  # Return max 5 skills
+    return professional_skills(professional.specialization, professional.bio)
 
 def calculate_estimated_wait_time(professional, current_workload):
     """Calculate estimated wait time for professional"""
     base_wait_time = 5  # minutes
     workload_multiplier = current_workload * 2
     return base_wait_time + workload_multiplier
-
-def update_professional_rating(professional):
-    """Update professional's average rating"""
-    sessions = Session.objects.filter(professional=professional, rating__isnull=False)
-    if sessions.exists():
-        avg_rating = sessions.aggregate(avg_rating=Avg('rating'))['avg_rating']
-        professional.average_rating = avg_rating
-        professional.save()
\ No newline at end of file
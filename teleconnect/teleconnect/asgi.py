@@ -9,6 +9,25 @@ django_asgi_app = get_asgi_application()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import quickconnect.routing
+from quickconnect.locking import start_sweeper
+from quickconnect.stats import start_reconciler
+from quickconnect.candidate_index import start_candidate_index
+from quickconnect.autocomplete import start_autocomplete
+from quickconnect.blobs import start_blob_collector
+from quickconnect.dispatch import start_dispatcher
+
+# Release professional leases whose clients stopped sending heartbeats
+start_sweeper()
+# Repair drift in the incrementally maintained category/professional counters
+start_reconciler()
+# Load approved professionals into the matching candidate index
+start_candidate_index()
+# Build the search box's typeahead trie; logs its size and build time
+start_autocomplete()
+# Delete document blobs nothing has referenced for BLOB_ORPHAN_GRACE
+start_blob_collector()
+# Hand free professionals to clients waiting in the instant-match queues
+start_dispatcher()
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
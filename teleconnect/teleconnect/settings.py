@@ -3,6 +3,8 @@ Django settings for teleconnect project.
 """
 
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -64,11 +66,134 @@ TEMPLATES = [
 WSGI_APPLICATION = 'teleconnect.wsgi.application'
 ASGI_APPLICATION = 'teleconnect.asgi.application'  # <-- needed for Channels
 
-# Channels layers (in-memory for dev; Redis recommended for production)
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+# Channels layers (in-memory for dev; Redis recommended for production).
+# The in-memory layer only reaches consumers in the same process: set
+# the CHANNEL_LAYER_REDIS_URL environment variable (e.g. 'redis://localhost:6379/0')
+# when running several ASGI workers so groups are shared (see quickconnect/channel_layer.py)
+CHANNEL_LAYER_REDIS_URL = os.environ.get('CHANNEL_LAYER_REDIS_URL') or None
+if CHANNEL_LAYER_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'quickconnect.channel_layer.RedisChannelLayer',
+            'CONFIG': {'url': CHANNEL_LAYER_REDIS_URL},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# Professional locking (see quickconnect/locking.py)
+PROFESSIONAL_LOCK_TTL_SECONDS = 60  # Lease length; clients renew with heartbeats
+PROFESSIONAL_LOCK_SWEEP_INTERVAL = 15  # How often expired leases are released
+
+# Counter deltas from session/professional saves are coalesced and written
+# this many seconds after the first change (0 writes immediately)
+STATS_FLUSH_WINDOW = 2
+
+# How often counter drift in Category/Professional stats is repaired (see quickconnect/stats.py)
+STATS_RECONCILE_INTERVAL = 3600
+
+# How often the in-memory candidate index is checked against the database (see quickconnect/candidate_index.py)
+CANDIDATE_INDEX_CHECK_INTERVAL = 60
+
+# Results per page of professional search (see quickconnect/search.py)
+SEARCH_PAGE_SIZE = 20
+
+# Instant-match dispatch queues (see quickconnect/dispatch.py). 'priority' orders
+# clients by arrival time minus the head start (seconds) for their urgency; 'fifo' ignores urgency.
+DISPATCH_QUEUE_MODE = 'priority'
+DISPATCH_URGENCY_HEAD_START = {'high': 120, 'medium': 30, 'low': 0}
+DISPATCH_POLL_INTERVAL = 1
+
+# Seconds the admin dashboard statistics snapshot is shared between polls (see quickconnect/dashboard.py)
+DASHBOARD_STATS_TTL = 5
+
+# Cached snapshots (quickconnect/snapshots.py) are shared between worker
+# processes through this cache. The file cache covers every worker on one
+# host; set the CACHE_REDIS_URL environment variable when running on several
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or None
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(tempfile.gettempdir(), 'teleconnect-cache'),
+        }
+    }
+
+# Days of hourly analytics buckets kept by `rebuild_rollups --prune` (see quickconnect/rollups.py)
+ROLLUP_HOURLY_RETENTION_DAYS = 400
+
+# Longest a chat poll with ?wait= is held open, in seconds (see quickconnect/chat_feed.py)
+CHAT_LONG_POLL_MAX_WAIT = 25
+# Each held poll occupies a worker thread for that long, so at most this many
+# wait at once per process; further polls are answered straight away
+CHAT_LONG_POLL_MAX_WAITERS = 16
+
+# Chat messages are stored in batches of up to CHAT_FLUSH_BATCH_SIZE, at most
+# CHAT_FLUSH_INTERVAL seconds after arriving (see quickconnect/chat_writer.py)
+CHAT_FLUSH_BATCH_SIZE = 100
+CHAT_FLUSH_INTERVAL = 0.05
+
+# Logging (see quickconnect/logs.py). Records are written by a background
+# thread as JSON lines; LOG_FORMAT = 'console' gives plain lines for local work.
+# LOG_LEVELS sets the level per module and LOG_SAMPLE_RATES keeps only that
+# fraction of each high-volume event
+LOG_FORMAT = 'json'
+LOG_LEVELS = {
+    'quickconnect': 'INFO',
+    'quickconnect.consumers': 'INFO',
+}
+LOG_SAMPLE_RATES = {
+    'ws.receive': 0.01,
+    'chat.saved': 0.01,
+}
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'quickconnect.logs.JsonFormatter'},
+        'console': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'filters': {
+        'sampling': {'()': 'quickconnect.logs.SamplingFilter', 'rates': LOG_SAMPLE_RATES},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'quickconnect.logs.QueueLogHandler',
+            'formatter': LOG_FORMAT,
+            'filters': ['sampling'],
+        },
+    },
+    'loggers': {name: {'level': level} for name, level in LOG_LEVELS.items()},
+}
+# Everything under quickconnect goes through the queue; the modules only set levels
+LOGGING['loggers'].setdefault('quickconnect', {}).update(handlers=['queue'], propagate=False)
+# Set to False to stop records collecting thread and process names, which
+# none of the formatters above print. It is a process-wide switch (every
+# library's records lose them), so it is applied once at startup by
+# QuickconnectConfig.ready() rather than here
+LOG_PROCESS_INFO = True
+# `manage.py test` would otherwise bury the test output in JSON lines
+if sys.argv[1:2] == ['test']:
+    LOGGING['handlers']['queue']['level'] = 'CRITICAL'
+
+# Log every professional in each roster snapshot sent over ws/quick-connect/
+ROSTER_DEBUG_DUMP = False
+
+# Resource locks for api/locks/ (see quickconnect/lock_store.py).
+# Use RedisLockStore with 'OPTIONS': {'url': 'redis://...'} when running several hosts.
+LOCK_STORE = {
+    'BACKEND': 'quickconnect.lock_store.DatabaseLockStore',
 }
 
 # Database
@@ -92,9 +217,28 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # File upload settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+# Uploads larger than this are spooled to a temporary file instead of RAM;
+# quickconnect/uploads.py streams them on to storage in chunks
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024  # 1MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Resumable uploads: where partial files are assembled, the largest chunk
+# accepted per request, and how long an idle upload is kept (seconds)
+UPLOAD_PART_DIR = os.path.join(BASE_DIR, 'upload_parts')
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+
+# Profile pictures and avatars are resized in this many worker processes
+# into one WebP per size (longest side, pixels); listings send 'small'
+IMAGE_WORKERS = 2
+IMAGE_VARIANTS = {'thumb': 96, 'small': 256, 'medium': 640}
+
+# Content-addressed document blobs (see quickconnect/blobs.py): how often
+# unreferenced blobs are collected, and how long one may stay unreferenced
+# (a replaced or deleted document) before it is deleted (seconds)
+BLOB_GC_INTERVAL = 3600
+BLOB_ORPHAN_GRACE = 7 * 24 * 60 * 60
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
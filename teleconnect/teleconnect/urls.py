@@ -73,6 +73,9 @@ urlpatterns = [
     # FILE UPLOAD ENDPOINTS
     path('api/upload/license/', views.upload_license_file, name='upload-license'),
     path('api/upload/profile-image/', views.upload_profile_image, name='upload-profile-image'),
+    path('api/upload/sessions/', views.start_upload_session, name='start-upload-session'),
+    path('api/upload/sessions/<uuid:upload_id>/', views.upload_session, name='upload-session'),
+    path('api/upload/sessions/<uuid:upload_id>/commit/', views.commit_upload_session, name='commit-upload-session'),
     
     # SESSION & CHAT ROUTES - FIXED: Use get_session_messages_api instead of get_session_messages
     path('api/sessions/create/', views.create_session, name='create-session'),
@@ -100,6 +103,12 @@ urlpatterns = [
     # DEBUG ROUTES
     path('api/debug/professionals/', views.debug_all_professionals, name='debug-professionals'),
     path('api/debug/sessions/', views.debug_all_sessions, name='debug-sessions'),
+    path('api/debug/stats-queue/', views.debug_stats_queue, name='debug-stats-queue'),
+    path('api/debug/candidate-index/', views.debug_candidate_index, name='debug-candidate-index'),
+    path('api/debug/autocomplete/', views.debug_autocomplete, name='debug-autocomplete'),
+    path('api/debug/images/', views.debug_image_pipeline, name='debug-image-pipeline'),
+    path('api/debug/blobs/', views.debug_blobs, name='debug-blobs'),
+    path('api/debug/chat-writer/', views.debug_chat_writer, name='debug-chat-writer'),
     path('debug/professionals-direct/', views.debug_professionals_direct, name='debug-professionals-direct'),
     
     # =========================================================================
@@ -109,11 +118,15 @@ urlpatterns = [
 	# ALGORITHM MATCHING & PROFESSIONAL SEARCH
     path('api/professionals/category/<str:category>/', views.professionals_by_category, name='professionals-by-category'),
     path('api/professionals/search/', views.search_professionals, name='search-professionals'),
+    path('api/search/professionals/', views.search_professionals, name='search-professionals-app'),
+    path('api/autocomplete/', views.autocomplete, name='autocomplete'),
     path('api/professionals/<int:professional_id>/availability/', views.check_professional_availability, name='check-professional-availability'),
     
     # LOCKING MECHANISM FOR ALGORITHM MATCHING
     path('api/locks/acquire/', views.acquire_lock, name='acquire-lock'),
     path('api/locks/release/', views.release_lock, name='release-lock'),
+    path('api/locks/stats/', views.lock_stats, name='lock-stats'),
+    path('api/dispatch/stats/', views.dispatch_stats, name='dispatch-stats'),
     
     # PAYMENT PROCESSING ENDPOINTS
     path('api/mpesa/stk-push/', views.initiate_mpesa_stk_push, name='mpesa-stk-push'),
@@ -14,3 +14,20 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'teleconnect.settings')
 
 application = get_wsgi_application()
+
+# Release professional leases whose clients stopped sending heartbeats
+from quickconnect.locking import start_sweeper  # noqa: E402
+from quickconnect.stats import start_reconciler  # noqa: E402
+from quickconnect.candidate_index import start_candidate_index  # noqa: E402
+from quickconnect.autocomplete import start_autocomplete  # noqa: E402
+from quickconnect.blobs import start_blob_collector  # noqa: E402
+
+start_sweeper()
+# Repair drift in the incrementally maintained category/professional counters
+start_reconciler()
+# Load approved professionals into the matching candidate index
+start_candidate_index()
+# Build the search box's typeahead trie; logs its size and build time
+start_autocomplete()
+# Delete document blobs nothing has referenced for BLOB_ORPHAN_GRACE
+start_blob_collector()